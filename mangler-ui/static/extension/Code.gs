@@ -228,22 +228,57 @@ function parseApiResponse(apiResponse) {
  * @return {Object} The API response
  */
 function callChatApi(userMessage, spreadsheetUrl, sheetTitle, sessionId) {
+  // The server keeps the history: send only the new message (delta mode)
+  // plus the id of the last message we saw
+  var message = {
+    id: generateMessageId(),
+    role: "user",
+    content: userMessage,
+  };
+  var apiResponse = postChatRequest(
+    message,
+    spreadsheetUrl,
+    sheetTitle,
+    sessionId,
+    getSessionCursor(sessionId)
+  );
+
+  if (apiResponse.resync) {
+    // Our cursor was stale (e.g. another sidebar advanced the session);
+    // adopt the server's cursor and send the message once more
+    Logger.log("Chat cursor stale, resyncing to " + apiResponse.cursor);
+    apiResponse = postChatRequest(
+      message,
+      spreadsheetUrl,
+      sheetTitle,
+      sessionId,
+      apiResponse.cursor
+    );
+  }
+
+  if (!apiResponse.resync) {
+    setSessionCursor(sessionId, apiResponse.cursor);
+  }
+  return apiResponse;
+}
+
+/**
+ * Posts one delta chat request.
+ * @return {Object} The parsed API response
+ */
+function postChatRequest(message, spreadsheetUrl, sheetTitle, sessionId, cursor) {
   var apiUrl = "https://fintech-hackathon-production.up.railway.app/chat";
 
   // Build the request payload
   var payload = {
-    messages: [
-      {
-        id: generateMessageId(),
-        role: "user",
-        content: userMessage,
-      },
-    ],
+    messages: [message],
     sheetContext: {
       spreadsheetId: spreadsheetUrl,
       sheetTitle: sheetTitle,
     },
     sessionId: sessionId,
+    delta: true,
+    cursor: cursor || null,
   };
 
   // Set up request options
@@ -301,6 +336,29 @@ function getOrCreateSessionId(spreadsheetId) {
   return sessionId;
 }
 
+/**
+ * Gets the id of the last chat message seen for a session, if any.
+ * @param {string} sessionId - The session ID
+ * @return {string|null} The cursor
+ */
+function getSessionCursor(sessionId) {
+  return PropertiesService.getScriptProperties().getProperty("cursor_" + sessionId);
+}
+
+/**
+ * Stores the id of the last chat message seen for a session.
+ * @param {string} sessionId - The session ID
+ * @param {string|null} cursor - The cursor returned by the server
+ */
+function setSessionCursor(sessionId, cursor) {
+  var properties = PropertiesService.getScriptProperties();
+  if (cursor) {
+    properties.setProperty("cursor_" + sessionId, cursor);
+  } else {
+    properties.deleteProperty("cursor_" + sessionId);
+  }
+}
+
 /**
  * Generates a unique message ID.
  * @return {string} A unique message ID
@@ -1,16 +1,14 @@
 from __future__ import annotations
 
 import datetime as _dt
+import hmac
 import json
 import os
 import re
 import time
 import uuid
-import urllib.error
-import urllib.parse
-import urllib.request
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Literal, Optional
 
 from importlib import resources
 
@@ -24,11 +22,30 @@ import asyncio
 from typing import AsyncIterator
 
 from .backend import PythonChatBackend
+from .call_budget import BUDGET_HEADERS, end_budget, start_budget
 from .logging_config import get_logger
 from .memory import ConversationStore
+from .memory_diagnostics import get_memory_profiler
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_DURATION, HTTP_REQUESTS, render_metrics
 from .models import ChatRequest, ChatResponse
+from .profiler import get_profiler, run_profiled
 from .service import ChatService
-from .sheets_client import ServiceAccountSheetsClient
+from .sheets_client import MeteredHttpRequest, ServiceAccountSheetsClient
+from .snapshot_pack import COLOR_RANGES_TABLE, VALUE_RANGES_TABLE, iter_color_runs, unpack_value_row
+from .snapshot_store import (
+    COLOR_TABLE,
+    RULE_TABLE,
+    VALUE_TABLE,
+    SnapshotStore,
+    SnapshotStoreError,
+    close_snapshot_store,
+    get_snapshot_store,
+    record_color_snapshot_async,
+    record_value_snapshot,
+)
+from .shared_cache import close_shared_cache
+from .supabase_rest import close_supabase_rest_client
+from .tracing import finish_trace, get_trace_buffer, start_trace
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -50,11 +67,6 @@ except ImportError:  # pragma: no cover - optional tools
     DEFAULT_SPREADSHEET_URL = ""  # type: ignore[assignment]
     GoogleSheetsFormulaValidator = None  # type: ignore[assignment]
 
-try:
-    from tools.visualize_formulas import visualize_formulas
-except ImportError:  # pragma: no cover - optional tools
-    visualize_formulas = None  # type: ignore[assignment]
-
 # * Environment
 from dotenv import load_dotenv
 load_dotenv(PROJECT_ROOT / ".env")
@@ -73,13 +85,11 @@ if env_spreadsheet:
 else:
     DEFAULT_SPREADSHEET_URL = DEFAULT_SPREADSHEET_URL or ""
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-
 # * Constants
 Color = Dict[str, float]
 WHITE: Color = {"red": 1.0, "green": 1.0, "blue": 1.0}
 
+
 # * Lazy initialization - only create when chat endpoint is called
 store = None
 backend = None
@@ -106,6 +116,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", *BUDGET_HEADERS],
 )
 
 _sheets_service = None
@@ -188,7 +199,7 @@ def _get_sheets_service():
 
     if GoogleSheetsFormulaValidator is not None and DEFAULT_CREDENTIALS_PATH:
         try:
-            _sheets_service = GoogleSheetsFormulaValidator(DEFAULT_CREDENTIALS_PATH)
+            _sheets_service = GoogleSheetsFormulaValidator(DEFAULT_CREDENTIALS_PATH, request_builder=MeteredHttpRequest)
             logger.info("Using GoogleSheetsFormulaValidator for sheet tools")
             return _sheets_service
         except Exception as exc:  # pragma: no cover - defensive logging
@@ -215,6 +226,25 @@ def _get_sheets_service():
 # * Request/Response Logging Middleware
 # * ============================================================================
 
+# Scrapes, trace/profile downloads and admin calls would otherwise push real requests out of the buffers
+_UNTRACED_PREFIXES = ("/metrics", "/traces", "/profiles", "/admin", "/health")
+
+
+def _route_template(request: Request) -> str:
+    """The matched route's path template, so ids in paths don't multiply keys."""
+    return getattr(request.scope.get("route"), "path", None) or "unmatched"
+
+
+def _record_http_metrics(request: Request, method: str, status_code: int, start_time: float) -> None:
+    """Count a request by its route template."""
+    try:
+        route_path = _route_template(request)
+        HTTP_REQUESTS.inc(method, route_path, str(status_code))
+        HTTP_DURATION.observe(time.time() - start_time, method, route_path)
+    except Exception:
+        pass  # Metrics must never fail a request
+
+
 @app.middleware("http")
 async def logging_middleware(request: Request, call_next):
     """
@@ -257,10 +287,37 @@ async def logging_middleware(request: Request, call_next):
         except Exception:
             pass  # Give up silently to prevent middleware crash
 
+    # Trace everything this request does; /traces/{request_id} serves the result.
+    # The root span is renamed to the route template once routing has matched.
+    trace_token = None if path.startswith(_UNTRACED_PREFIXES) else start_trace(request_id, f"{method} {path}")
+    # Count the Sheets/LLM/Supabase calls it makes, reported in X-* headers
+    budget, budget_token = start_budget()
+    # Sample its stacks when asked to with a signed X-Profile token, or at the sampling rate
+    profiler = get_profiler()
+    profile = None
+    if not path.startswith(_UNTRACED_PREFIXES) and profiler.should_profile(request.headers.get("X-Profile")):
+        profile = profiler.start(request_id)
+    # Diff tracemalloc snapshots around a sampled fraction of requests (off unless configured)
+    memory_profiler = get_memory_profiler()
+    memory_before = None
+    if not path.startswith(_UNTRACED_PREFIXES) and memory_profiler.should_sample():
+        memory_before = memory_profiler.begin()
+
     # Process request and handle errors
     try:
         response = await call_next(request)
         duration_ms = int((time.time() - start_time) * 1000)
+        _record_http_metrics(request, method, response.status_code, start_time)
+        finish_trace(trace_token, name=f"{method} {_route_template(request)}", status_code=response.status_code)
+        end_budget(budget_token)
+        if profile is not None:
+            profiler.stop(profile)
+            response.headers["X-Profiled"] = "1"
+        if memory_before is not None:
+            memory_profiler.end(f"{method} {_route_template(request)}", memory_before)
+        response.headers["X-Request-ID"] = request_id
+        response.headers.update(budget.headers())
+        calls = budget.summary()
 
         # Safely get status code
         try:
@@ -272,13 +329,17 @@ async def logging_middleware(request: Request, call_next):
         try:
             log_level = logger.info if status_code < 400 else logger.error
             log_level(
-                f"← {method} {path} - {status_code} ({duration_ms}ms)",
+                f"← {method} {path} - {status_code} ({duration_ms}ms, "
+                f"sheets={calls['sheets_calls']}, llm={calls['llm_calls']}, "
+                f"tokens={calls['llm_prompt_tokens'] + calls['llm_completion_tokens']}, "
+                f"supabase={calls['supabase_calls']})",
                 extra={
                     "request_id": request_id,
                     "method": method,
                     "endpoint": path,
                     "status_code": status_code,
                     "duration_ms": duration_ms,
+                    **calls,
                 }
             )
         except Exception:
@@ -292,6 +353,13 @@ async def logging_middleware(request: Request, call_next):
 
     except Exception as exc:
         duration_ms = int((time.time() - start_time) * 1000)
+        _record_http_metrics(request, method, 500, start_time)
+        finish_trace(trace_token, name=f"{method} {_route_template(request)}", error=f"{type(exc).__name__}: {exc}")
+        end_budget(budget_token)
+        if profile is not None:
+            profiler.stop(profile)
+        if memory_before is not None:
+            memory_profiler.end(f"{method} {_route_template(request)}", memory_before)
 
         # Log error (with fallback)
         try:
@@ -303,6 +371,7 @@ async def logging_middleware(request: Request, call_next):
                     "method": method,
                     "endpoint": path,
                     "duration_ms": duration_ms,
+                    **budget.summary(),
                 }
             )
         except Exception:
@@ -329,6 +398,8 @@ async def root():
         "status": "running",
         "endpoints": {
             "chat": "POST /chat",
+            "metrics": "GET /metrics",
+            "traces": "GET /traces/{request_id}",
             "detect_issues": "POST /chat (use detect_issues tool)",
             "color": "POST /tools/color",
             "restore": "POST /tools/restore",
@@ -343,6 +414,160 @@ async def health():
     return {"status": "healthy", "timestamp": _dt.datetime.utcnow().isoformat() + "Z"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint for this worker's counters and histograms."""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/traces")
+async def list_traces(request: Request, limit: int = 50) -> Dict[str, Any]:
+    """Recently traced requests, newest first (needs PROFILER_SECRET)."""
+    _require_profiler_admin(request)
+    buffer = get_trace_buffer()
+    traces = buffer.recent()[:limit] if buffer else []
+    return {
+        "traces": [
+            {
+                "request_id": trace.request_id,
+                "name": trace.root.name,
+                "started_at": trace.started_at,
+                "duration_ms": None if trace.duration is None else round(trace.duration * 1000, 1),
+                "spans": len(trace.spans),
+            }
+            for trace in traces
+        ]
+    }
+
+
+@app.get("/traces/{request_id}")
+async def get_trace(request_id: str, request: Request) -> JSONResponse:
+    """
+    One request's span waterfall as Chrome trace-event JSON; open it in
+    chrome://tracing or ui.perfetto.dev. The id is the X-Request-ID header.
+    Needs PROFILER_SECRET, like the profiles.
+    """
+    _require_profiler_admin(request)
+    buffer = get_trace_buffer()
+    trace = buffer.get(request_id) if buffer else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace buffered for request {request_id}")
+    return JSONResponse(
+        content=trace.to_chrome(),
+        headers={"Content-Disposition": f'attachment; filename="trace-{request_id}.json"'},
+    )
+
+
+def _require_profiler_admin(request: Request) -> None:
+    """Profiles expose code paths and timings; only holders of PROFILER_SECRET may read them."""
+    secret = get_profiler().secret
+    if not secret:
+        raise HTTPException(status_code=404, detail="Profiling is not configured (set PROFILER_SECRET)")
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied, secret):
+        raise HTTPException(status_code=403, detail="Invalid profiler credentials")
+
+
+class ProfilerSettings(BaseModel):
+    """Profiler settings; omitted fields are left unchanged."""
+    sample_rate: Optional[float] = None
+    token_ttl: float = 300.0
+
+
+@app.post("/admin/profiler")
+async def configure_profiler(settings: ProfilerSettings, request: Request) -> Dict[str, Any]:
+    """
+    Set the fraction of requests to profile and mint an X-Profile token that
+    profiles any request carrying it until it expires.
+    """
+    _require_profiler_admin(request)
+    profiler = get_profiler()
+    if settings.sample_rate is not None:
+        if not 0 <= settings.sample_rate <= 1:
+            raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+        profiler.sample_rate = settings.sample_rate
+        logger.info(f"Profiler sample rate set to {settings.sample_rate}")
+    return {
+        "sample_rate": profiler.sample_rate,
+        "token": profiler.sign_token(settings.token_ttl),
+        "token_ttl": settings.token_ttl,
+    }
+
+
+class MemoryProfilerSettings(BaseModel):
+    """Memory profiler settings; omitted fields are left unchanged."""
+    sample_rate: Optional[float] = None
+    frames: Optional[int] = None
+    reset: bool = False
+
+
+@app.get("/admin/memory")
+async def memory_report(request: Request, top: int = 20) -> Dict[str, Any]:
+    """
+    Process RSS, sizes of the in-process caches and stores, and the top
+    allocation sites per endpoint from sampled tracemalloc snapshot diffs.
+    """
+    _require_profiler_admin(request)
+    return get_memory_profiler().report(top)
+
+
+@app.post("/admin/memory")
+async def configure_memory_profiler(settings: MemoryProfilerSettings, request: Request) -> Dict[str, Any]:
+    """
+    Set the fraction of requests to snapshot (0 stops tracemalloc), the
+    traceback depth kept per allocation, or clear the aggregated diffs.
+    """
+    _require_profiler_admin(request)
+    if settings.sample_rate is not None and not 0 <= settings.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    memory_profiler = get_memory_profiler()
+    try:
+        memory_profiler.configure(sample_rate=settings.sample_rate, frames=settings.frames, reset=settings.reset)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"sample_rate": memory_profiler.sample_rate, "frames": memory_profiler.frames}
+
+
+@app.get("/profiles")
+async def list_profiles(request: Request) -> Dict[str, Any]:
+    """
+    Recently profiled requests, newest first.
+
+    `loop_samples` of a profile's samples were taken on the event-loop
+    thread, which serves every concurrent request, so they can include
+    other requests' stacks (filed under the "(event-loop)" root frame).
+    """
+    _require_profiler_admin(request)
+    return {
+        "profiles": [
+            {
+                "request_id": profile.request_id,
+                "started_at": profile.started_at,
+                "duration_ms": None if profile.duration is None else round(profile.duration * 1000, 1),
+                "samples": profile.samples,
+                "loop_samples": profile.loop_samples,
+                "peak_threads": profile.peak_threads,
+            }
+            for profile in get_profiler().recent()
+        ],
+        "note": "loop_samples come from the event-loop thread and include other concurrent requests' stacks",
+    }
+
+
+@app.get("/profiles/{request_id}")
+async def get_profile(request_id: str, request: Request) -> Response:
+    """One request's sampled stacks in collapsed format, ready for flamegraph.pl or speedscope."""
+    _require_profiler_admin(request)
+    profile = get_profiler().get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for request {request_id}")
+    return Response(
+        content=profile.collapsed(),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{request_id}.folded"'},
+    )
+
+
 @app.get("/mangler.png")
 async def get_logo():
     """Serve the mangler logo PNG file."""
@@ -359,6 +584,16 @@ async def get_logo():
     )
 
 
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    """Flush journaled snapshots and queued chat rows, then release pooled connections."""
+    await asyncio.to_thread(close_snapshot_store)
+    if service is not None:
+        await asyncio.to_thread(service.close)
+    close_shared_cache()
+    close_supabase_rest_client()
+
+
 # * ============================================================================
 # * Initialization Functions
 # * ============================================================================
@@ -418,6 +653,8 @@ class UpdateCellsResponse(BaseModel):
 class VisualizeFormulasRequest(BaseModel):
     """Request to visualize formulas and hard-coded values."""
     sheet_url: Optional[str] = None
+    # "cells" (per-cell colors) or "conditional" (conditional format rules); see visualize_tool.VISUALIZE_MODES
+    mode: Literal["cells", "conditional"] = "cells"
 
 
 # * ============================================================================
@@ -438,12 +675,16 @@ async def chat(request: ChatRequest) -> ChatResponse:
           "session_id": request.sessionId,
           "message_count": len(request.messages),
           "has_sheet_context": request.sheetContext is not None,
+          "delta": request.delta,
       }
   )
 
-  # This implementation assumes the client is sending the full message history.
-  # If you prefer CLI-style incremental messages, use ChatService.simple_chat
-  # directly or adapt this endpoint accordingly.
+  # Clients either send the full message history, or (delta=true) only new
+  # messages plus the id of the last message they saw. A delta request with a
+  # stale cursor gets resync=true and can catch up via GET /chat/{sessionId}/messages.
+  if request.delta and not request.sessionId:
+      raise HTTPException(status_code=400, detail="Delta chat requests require a sessionId")
+
   try:
       svc = _init_chat_service()
       response = svc.chat(request)
@@ -464,6 +705,21 @@ async def chat(request: ChatRequest) -> ChatResponse:
       raise
 
 
+@app.get("/chat/{session_id}/messages", response_model=ChatResponse)
+async def chat_messages(session_id: str, after: Optional[str] = None) -> ChatResponse:
+  """
+  Messages of a session after the message with id `after` (all of them when
+  omitted). Delta clients call this after a resync response.
+  """
+  svc = _init_chat_service()
+  response = svc.messages_after(session_id, after)
+  logger.info(
+      f"Chat catch-up: {len(response.messages)} message(s) after {after or '(start)'}, session={session_id}",
+      extra={"session_id": session_id, "cursor": response.cursor},
+  )
+  return response
+
+
 async def stream_chat_response(request: ChatRequest) -> AsyncIterator[str]:
     """
     Generator function that streams chat responses in Server-Sent Events format.
@@ -477,7 +733,10 @@ async def stream_chat_response(request: ChatRequest) -> AsyncIterator[str]:
         response = svc.chat(request)
 
         # Stream the session ID first
-        yield f"data: {json.dumps({'type': 'session', 'sessionId': response.sessionId})}\n\n"
+        yield f"data: {json.dumps({'type': 'session', 'sessionId': response.sessionId, 'cursor': response.cursor})}\n\n"
+
+        if response.resync:
+            yield f"data: {json.dumps({'type': 'resync', 'cursor': response.cursor})}\n\n"
 
         # Stream each message
         for msg in response.messages:
@@ -575,16 +834,21 @@ async def visualize_formulas_endpoint(
         extra={
             "has_custom_sheet_url": bool(request.sheet_url),
             "default_sheet_available": bool(DEFAULT_SPREADSHEET_URL),
+            "mode": request.mode,
         },
     )
 
-    if GoogleSheetsFormulaValidator is None or visualize_formulas is None:
-        logger.error(
-            "503 Service Unavailable: visualize_formulas tool not available",
-            extra={
-                "credentials_path": str(DEFAULT_CREDENTIALS_PATH) if DEFAULT_CREDENTIALS_PATH else "(missing)",
-            },
-        )
+    # The Sheets reads and writes and the snapshot insert block; keep them off the event loop
+    return await asyncio.to_thread(run_profiled, _visualize_formulas, request)
+
+
+def _visualize_formulas(request: VisualizeFormulasRequest) -> Dict[str, Any]:
+    """Color cells one by one, or install conditional format rules, and snapshot the sheet for undo."""
+    from .visualize_tool import visualize_formulas as viz_fn
+
+    validator = _get_sheets_service()
+    if validator is None:
+        logger.error("503 Service Unavailable: Sheets client not available for visualize_formulas")
         raise HTTPException(
             status_code=503,
             detail="Formula visualization tool is not available on this deployment.",
@@ -598,12 +862,27 @@ async def visualize_formulas_endpoint(
             detail="Sheet URL is required when no default spreadsheet is configured.",
         )
 
+    url_id_match = re.search(r"/spreadsheets/d/([a-zA-Z0-9-_]+)", sheet_url)
+    url_gid_match = re.search(r"[?&]gid=(\d+)", sheet_url)
+    spreadsheet_id = url_id_match.group(1) if url_id_match else sheet_url
+    gid = int(url_gid_match.group(1)) if url_gid_match else None
+
     try:
-        result = visualize_formulas(sheet_url)
+        spreadsheet = validator.fetch_spreadsheet(spreadsheet_id)
+        sheet = _resolve_sheet(spreadsheet, gid)
+        result = viz_fn(
+            validator=validator,
+            spreadsheet_id=spreadsheet_id,
+            sheet_title=sheet["properties"]["title"],
+            sheet_id=sheet["properties"]["sheetId"],
+            gid=gid,
+            mode=request.mode,
+        )
         logger.info(
             "Visualize formulas completed",
             extra={
                 "sheet_url": sheet_url,
+                "mode": request.mode,
                 "snapshot_batch_id": result.get("snapshot_batch_id"),
                 "colored_cells": result.get("count"),
                 "status": result.get("status"),
@@ -866,7 +1145,7 @@ async def apply_colors(requests: List[ColorRequest]) -> Dict[str, Any]:
         logger.info(f"[COLOR] Snapshotting {len(rows_to_insert)} cell(s) to Supabase")
 
         if rows_to_insert:
-            _post_to_supabase(rows_to_insert)
+            await record_color_snapshot_async(rows_to_insert)
             logger.info(f"[COLOR] ✓ Snapshot created with {len(rows_to_insert)} cell(s)")
 
         # Return the snapshot batch ID for restore
@@ -1094,88 +1373,175 @@ def _fetch_colors_for_range(
     return colors
 
 
-def _post_to_supabase(rows: List[Dict[str, Any]]) -> None:
-    """Send color snapshot rows to Supabase."""
-    if not rows:
-        raise ValueError("No rows to persist to Supabase.")
+# * ============================================================================
+# * Restore Tool Endpoints
+# * ============================================================================
 
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be configured.")
+async def _fetch_rule_snapshot(snapshot_batch_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the conditional format rule snapshot for a batch, if there is one."""
+    return await get_snapshot_store().first(RULE_TABLE, snapshot_batch_id, "spreadsheet_id,gid,sheet_id,formulas")
 
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots"
-    request = urllib.request.Request(
-        url,
-        method="POST",
-        data=json.dumps(rows).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "resolution=merge-duplicates",
-        },
-    )
+
+async def _restore_rule_snapshot(validator: Any, snapshot_batch_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Undo a conditional-mode visualization by removing its rules.
+
+    Returns None when the batch is not a rule snapshot, so the caller can fall
+    through to its regular "no snapshot" handling.
+    """
+    from .visualize_tool import remove_conditional_visualization
 
     try:
-        with urllib.request.urlopen(request) as response:
-            if response.status not in (200, 201, 204):
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Supabase insert failed: {exc.status} {body}") from exc
+        rule_snapshot = await _fetch_rule_snapshot(snapshot_batch_id)
+    except Exception as exc:
+        logger.warning(f"[RESTORE] Failed to look up rule snapshot: {exc}")
+        return None
 
+    if not rule_snapshot:
+        return None
+
+    spreadsheet_id = rule_snapshot.get("spreadsheet_id")
+    sheet_id = rule_snapshot.get("sheet_id")
+    formulas = rule_snapshot.get("formulas") or []
+    logger.info(f"[RESTORE] Removing conditional format rules from sheet id={sheet_id} in {spreadsheet_id}")
+
+    try:
+        removed = remove_conditional_visualization(validator, spreadsheet_id, sheet_id, formulas)
+    except Exception as exc:
+        logger.error(f"[RESTORE] Failed to remove conditional format rules: {exc}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to update spreadsheet: {exc}")
+
+    return {
+        "status": "success",
+        "message": f"Removed {removed} conditional format rule(s) from snapshot batch.",
+        "count": removed,
+    }
 
-# * ============================================================================
-# * Restore Tool Endpoints
-# * ============================================================================
 
-def _fetch_snapshot_rows(
+# Max requests per Sheets batchUpdate while streaming a restore
+RESTORE_WRITE_BATCH_SIZE = int(os.environ.get("RESTORE_WRITE_BATCH_SIZE", "1000"))
+
+
+def _iter_color_snapshot_pages(
+    table: str,
+    columns: str,
     snapshot_batch_id: str,
     spreadsheet_id: str,
     gid: Optional[int],
-) -> List[Dict[str, Any]]:
-    """Fetch color snapshot rows from Supabase."""
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be configured.")
-
-    params = {
-        "select": "cell,red,green,blue",
-        "snapshot_batch_id": f"eq.{snapshot_batch_id}",
-        "spreadsheet_id": f"eq.{spreadsheet_id}",
-    }
-    if gid is None:
-        params["gid"] = "is.null"
-    else:
-        params["gid"] = f"eq.{gid}"
-    query = urllib.parse.urlencode(params, doseq=True)
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots?{query}"
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream color snapshot rows for one sheet, one page at a time."""
+    return get_snapshot_store().select_pages(
+        table,
+        snapshot_batch_id,
+        columns,
+        {"spreadsheet_id": spreadsheet_id, "gid": gid},
+        key="id",
+    )
 
-    request = urllib.request.Request(
-        url,
-        method="GET",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Accept": "application/json",
-        },
+
+def _iter_snapshot_pages(
+    snapshot_batch_id: str,
+    spreadsheet_id: str,
+    gid: Optional[int],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream legacy per-cell color snapshot rows."""
+    return _iter_color_snapshot_pages(COLOR_TABLE, "id,cell,red,green,blue", snapshot_batch_id, spreadsheet_id, gid)
+
+
+def _iter_packed_snapshot_pages(
+    snapshot_batch_id: str,
+    spreadsheet_id: str,
+    gid: Optional[int],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream packed color snapshot ranges."""
+    return _iter_color_snapshot_pages(
+        COLOR_RANGES_TABLE, "id,origin_row,origin_col,n_rows,n_cols,palette,data", snapshot_batch_id, spreadsheet_id, gid
     )
 
-    try:
-        with urllib.request.urlopen(request) as response:
-            if response.status != 200:
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-            payload = response.read()
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Supabase fetch failed: {exc.status} {body}") from exc
-
-    rows = json.loads(payload)
-    if not isinstance(rows, list):
-        raise RuntimeError("Supabase response malformed; expected a list.")
-    return rows
-
-
-def _build_repeat_cell(sheet_id: int, row: int, col: int, color: Color) -> Dict[str, Any]:
-    """Build batch update request for cell color restoration."""
+
+async def _iter_value_snapshot_pages(
+    store: SnapshotStore,
+    snapshot_batch_id: str,
+    cells: Optional[set],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Stream value snapshot entries shaped like legacy per-cell rows.
+
+    Packed ranges are unpacked (and filtered to `cells`, if given) first,
+    followed by any legacy per-cell rows for the same batch. Deduplicated
+    batches are read from the batch that holds their rows.
+    """
+    snapshot_batch_id = await store.resolve_batch(snapshot_batch_id)
+
+    async for page in store.select_pages(
+        VALUE_RANGES_TABLE,
+        snapshot_batch_id,
+        "id,spreadsheet_id,gid,kind,range_ref,origin_row,origin_col,n_rows,n_cols,data",
+        key="id",
+    ):
+        entries: List[Dict[str, Any]] = []
+        for packed in page:
+            for entry in unpack_value_row(packed, cells):
+                entry["spreadsheet_id"] = packed["spreadsheet_id"]
+                entry["gid"] = packed["gid"]
+                entries.append(entry)
+        if entries:
+            yield entries
+
+    async for page in store.select_pages(
+        VALUE_TABLE,
+        snapshot_batch_id,
+        "cell,value,spreadsheet_id,gid",
+        key="cell",
+    ):
+        yield page
+
+
+class _PipelinedBatchWriter:
+    """
+    Buffer restore requests and send them to Sheets in fixed-size batches.
+
+    Each batch runs in a worker thread while the caller keeps fetching
+    snapshot pages; at most one batch is in flight, so memory stays bounded
+    by roughly two batches plus one page.
+    """
+
+    def __init__(self, send: Callable[[List[Dict[str, Any]]], Any], batch_size: int = RESTORE_WRITE_BATCH_SIZE) -> None:
+        self._send = send
+        self._batch_size = max(1, batch_size)
+        self._buffer: List[Dict[str, Any]] = []
+        self._in_flight: Optional[asyncio.Future] = None
+        self.written = 0
+        self.batches = 0
+
+    async def add(self, items: List[Dict[str, Any]]) -> None:
+        self._buffer.extend(items)
+        while len(self._buffer) >= self._batch_size:
+            chunk = self._buffer[:self._batch_size]
+            self._buffer = self._buffer[self._batch_size:]
+            await self._submit(chunk)
+
+    async def _submit(self, chunk: List[Dict[str, Any]]) -> None:
+        await self._wait()
+        self._in_flight = asyncio.ensure_future(asyncio.to_thread(run_profiled, self._send, chunk))
+        self.written += len(chunk)
+        self.batches += 1
+
+    async def _wait(self) -> None:
+        if self._in_flight is not None:
+            in_flight, self._in_flight = self._in_flight, None
+            await in_flight
+
+    async def close(self) -> None:
+        """Send whatever is buffered and wait for the last batch."""
+        if self._buffer:
+            chunk, self._buffer = self._buffer, []
+            await self._submit(chunk)
+        await self._wait()
+
+
+def _build_repeat_cell(sheet_id: int, row: int, col: int, color: Color, n_cols: int = 1) -> Dict[str, Any]:
+    """Build batch update request for cell color restoration (a run of n_cols cells)."""
     return {
         "repeatCell": {
             "range": {
@@ -1183,7 +1549,7 @@ def _build_repeat_cell(sheet_id: int, row: int, col: int, color: Color) -> Dict[
                 "startRowIndex": row,
                 "endRowIndex": row + 1,
                 "startColumnIndex": col,
-                "endColumnIndex": col + 1,
+                "endColumnIndex": col + n_cols,
             },
             "cell": {
                 "userEnteredFormat": {
@@ -1243,40 +1609,28 @@ async def restore_colors(request: RestoreRequest) -> Dict[str, Any]:
         logger.info(f"[RESTORE] Fetching snapshot for batch_id: {snapshot_batch_id}")
 
         # We need to fetch without filtering by spreadsheet_id/gid first
-        if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-            logger.error("[RESTORE] Supabase not configured")
-            raise HTTPException(status_code=500, detail="Supabase not configured")
-
-        params = {
-            "select": "cell,red,green,blue,spreadsheet_id,gid",
-            "snapshot_batch_id": f"eq.{snapshot_batch_id}",
-            "limit": "1",  # Just get one row to extract spreadsheet_id and gid
-        }
-        query = urllib.parse.urlencode(params, doseq=True)
-        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots?{query}"
-
-        req = urllib.request.Request(
-            url,
-            method="GET",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                "Accept": "application/json",
-            },
-        )
+        store = get_snapshot_store()
 
         try:
-            with urllib.request.urlopen(req) as response:
-                if response.status != 200:
-                    logger.error(f"[RESTORE] Supabase returned status {response.status}")
-                    raise HTTPException(status_code=500, detail=f"Supabase error: {response.status}")
-                payload = response.read()
-        except urllib.error.HTTPError as exc:
-            body = exc.read().decode("utf-8", errors="ignore")
-            logger.error(f"[RESTORE] Supabase HTTP error {exc.status}: {body}")
-            raise HTTPException(status_code=500, detail=f"Supabase fetch failed: {exc.status}")
-
-        sample_rows = json.loads(payload)
+            # Deduplicated batches share the rows of an earlier identical snapshot
+            data_batch_id = await store.resolve_batch(snapshot_batch_id)
+
+            # Just get one row to extract spreadsheet_id and gid (packed first, then legacy)
+            sample_rows = []
+            for table in (COLOR_RANGES_TABLE, COLOR_TABLE):
+                sample = await store.first(table, data_batch_id, "spreadsheet_id,gid")
+                if sample:
+                    sample_rows = [sample]
+                    break
+        except SnapshotStoreError as exc:
+            logger.error(f"[RESTORE] Snapshot fetch failed: {exc}")
+            raise HTTPException(status_code=500, detail=f"Snapshot fetch failed: {exc}")
+
+        # Conditional-mode visualizations keep no per-cell rows, only a rule snapshot
+        if not isinstance(sample_rows, list) or not sample_rows:
+            rule_result = await _restore_rule_snapshot(validator, data_batch_id)
+            if rule_result is not None:
+                return rule_result
 
         # GRACEFUL DEGRADATION: If snapshot doesn't exist, return success (not error)
         if not isinstance(sample_rows, list) or not sample_rows:
@@ -1333,15 +1687,87 @@ async def restore_colors(request: RestoreRequest) -> Dict[str, Any]:
 
         logger.info(f"[RESTORE] Restoring colors on sheet '{sheet_title}' (id={sheet_id})")
 
-        # Now fetch all snapshot rows for this spreadsheet
+        def _send_color_batch(batch: List[Dict[str, Any]]) -> None:
+            validator.service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={"requests": batch},
+            ).execute()
+
+        # Stream snapshot rows page by page; each full batch goes to Sheets
+        # while the next page is being fetched
+        writer = _PipelinedBatchWriter(_send_color_batch)
+        fetched = 0
+        skipped = 0
+        restored_cells = 0
+        seen_cells = set()
+
         try:
-            snapshot_rows = _fetch_snapshot_rows(snapshot_batch_id, spreadsheet_id, gid)
-            logger.debug(f"[RESTORE] Fetched {len(snapshot_rows) if snapshot_rows else 0} snapshot rows")
-        except Exception as exc:
+            # Packed ranges restore one request per same-colored run of cells
+            async for page in _iter_packed_snapshot_pages(data_batch_id, spreadsheet_id, gid):
+                fetched += len(page)
+                page_requests: List[Dict[str, Any]] = []
+                for packed in page:
+                    for row_index, col_index, n_cols, color in iter_color_runs(packed, expected_cells):
+                        page_requests.append(_build_repeat_cell(sheet_id, row_index, col_index, color, n_cols))
+                        restored_cells += n_cols
+                        if expected_cells is not None:
+                            seen_cells.update(_cell_address(row_index, c) for c in range(col_index, col_index + n_cols))
+                await writer.add(page_requests)
+
+            async for page in _iter_snapshot_pages(data_batch_id, spreadsheet_id, gid):
+                fetched += len(page)
+
+                # FILTER snapshot rows to only requested cells if cell_locations provided
+                if expected_cells is not None:
+                    seen_cells.update(row["cell"] for row in page if "cell" in row)
+                    page = [row for row in page if row.get("cell") in expected_cells]
+
+                # SKIP INVALID CELLS INSTEAD OF FAILING
+                page_requests: List[Dict[str, Any]] = []
+                for row in page:
+                    cell = row.get("cell")
+                    if not isinstance(cell, str):
+                        logger.warning("[RESTORE] Snapshot row missing 'cell' field, skipping")
+                        skipped += 1
+                        continue
+
+                    red = row.get("red")
+                    green = row.get("green")
+                    blue = row.get("blue")
+                    if not all(isinstance(v, (int, float)) for v in (red, green, blue)):
+                        logger.warning(f"[RESTORE] Snapshot row for '{cell}' has invalid color values, skipping")
+                        skipped += 1
+                        continue
+
+                    try:
+                        row_index, col_index = _parse_cell(cell)
+                        page_requests.append(
+                            _build_repeat_cell(
+                                sheet_id,
+                                row_index,
+                                col_index,
+                                {"red": float(red), "green": float(green), "blue": float(blue)},
+                            )
+                        )
+                        restored_cells += 1
+                    except Exception as exc:
+                        logger.warning(f"[RESTORE] Failed to parse cell '{cell}': {exc}")
+                        skipped += 1
+                        continue
+
+                await writer.add(page_requests)
+
+            await writer.close()
+        except SnapshotStoreError as exc:
             logger.error(f"[RESTORE] Failed to fetch snapshot rows: {exc}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Failed to fetch snapshot rows: {exc}")
+        except Exception as exc:
+            logger.error(f"[RESTORE] Failed to execute batchUpdate: {exc}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Failed to update spreadsheet: {exc}")
+
+        logger.debug(f"[RESTORE] Fetched {fetched} snapshot rows")
 
-        if not snapshot_rows:
+        if not fetched:
             logger.warning(f"[RESTORE] No snapshot rows for batch_id={snapshot_batch_id}")
             return {
                 "status": "success",
@@ -1349,53 +1775,13 @@ async def restore_colors(request: RestoreRequest) -> Dict[str, Any]:
                 "count": 0,
             }
 
-        # FILTER snapshot rows to only requested cells if cell_locations provided
         if expected_cells is not None:
-            actual_cells = {row["cell"] for row in snapshot_rows if "cell" in row}
-            missing = expected_cells - actual_cells
+            missing = expected_cells - seen_cells
             if missing:
                 logger.warning(f"[RESTORE] Snapshot missing {len(missing)} cell(s): {sorted(list(missing)[:5])}")
+            logger.info(f"[RESTORE] Filtered {fetched} snapshot row(s) to {restored_cells + skipped} cell(s) based on cell_locations")
 
-            # CRITICAL: Filter to only restore the requested cells
-            original_count = len(snapshot_rows)
-            snapshot_rows = [row for row in snapshot_rows if row.get("cell") in expected_cells]
-            logger.info(f"[RESTORE] Filtered from {original_count} to {len(snapshot_rows)} cell(s) based on cell_locations")
-
-        # SKIP INVALID CELLS INSTEAD OF FAILING
-        requests: List[Dict[str, Any]] = []
-        skipped = 0
-
-        for row in snapshot_rows:
-            cell = row.get("cell")
-            if not isinstance(cell, str):
-                logger.warning("[RESTORE] Snapshot row missing 'cell' field, skipping")
-                skipped += 1
-                continue
-
-            red = row.get("red")
-            green = row.get("green")
-            blue = row.get("blue")
-            if not all(isinstance(v, (int, float)) for v in (red, green, blue)):
-                logger.warning(f"[RESTORE] Snapshot row for '{cell}' has invalid color values, skipping")
-                skipped += 1
-                continue
-
-            try:
-                row_index, col_index = _parse_cell(cell)
-                requests.append(
-                    _build_repeat_cell(
-                        sheet_id,
-                        row_index,
-                        col_index,
-                        {"red": float(red), "green": float(green), "blue": float(blue)},
-                    )
-                )
-            except Exception as exc:
-                logger.warning(f"[RESTORE] Failed to parse cell '{cell}': {exc}")
-                skipped += 1
-                continue
-
-        if not requests:
+        if not writer.written:
             logger.warning("[RESTORE] No valid cells to restore")
             return {
                 "status": "success",
@@ -1403,22 +1789,12 @@ async def restore_colors(request: RestoreRequest) -> Dict[str, Any]:
                 "count": 0,
             }
 
-        logger.info(f"[RESTORE] Restoring {len(requests)} cell(s), skipped {skipped}")
-
-        try:
-            validator.service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={"requests": requests},
-            ).execute()
-            logger.info(f"[RESTORE] ✓ Successfully restored {len(requests)} cell color(s)")
-        except Exception as exc:
-            logger.error(f"[RESTORE] Failed to execute batchUpdate: {exc}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to update spreadsheet: {exc}")
+        logger.info(f"[RESTORE] ✓ Successfully restored {restored_cells} cell color(s) in {writer.batches} batch(es), skipped {skipped}")
 
         return {
             "status": "success",
-            "message": f"Restored {len(requests)} cell color(s) on '{sheet_title}' from snapshot batch.",
-            "count": len(requests),
+            "message": f"Restored {restored_cells} cell color(s) on '{sheet_title}' from snapshot batch.",
+            "count": restored_cells,
         }
 
     except HTTPException:
@@ -1494,61 +1870,14 @@ def _snapshot_cell_values(
         })
 
     if rows_to_insert:
-        logger.debug(f"Posting {len(rows_to_insert)} snapshot row(s) to Supabase")
-        _post_value_snapshot_to_supabase(rows_to_insert)
+        logger.debug(f"Recording {len(rows_to_insert)} snapshot row(s)")
+        record_value_snapshot(rows_to_insert)
     else:
         logger.warning("No snapshot rows to insert")
 
     return snapshot_batch_id
 
 
-def _post_value_snapshot_to_supabase(rows: List[Dict[str, Any]]) -> None:
-    """Send cell value snapshot rows to Supabase."""
-    if not rows:
-        logger.error("No rows to persist to Supabase")
-        raise ValueError("No rows to persist to Supabase.")
-
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        logger.error(
-            "Supabase not configured for snapshots",
-            extra={
-                "has_url": bool(SUPABASE_URL),
-                "has_key": bool(SUPABASE_SERVICE_KEY),
-            }
-        )
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be configured.")
-
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_value_snapshots"
-    logger.debug(f"Posting {len(rows)} row(s) to Supabase: {url}")
-
-    request = urllib.request.Request(
-        url,
-        method="POST",
-        data=json.dumps(rows).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "resolution=merge-duplicates",
-        },
-    )
-
-    try:
-        with urllib.request.urlopen(request) as response:
-            if response.status not in (200, 201, 204):
-                logger.error(f"Unexpected Supabase response status: {response.status}")
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-            logger.debug(f"Successfully posted snapshot to Supabase: {response.status}")
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        logger.error(
-            f"Supabase insert failed: {exc.status}",
-            exc_info=True,
-            extra={"status_code": exc.status, "response_body": body}
-        )
-        raise RuntimeError(f"Supabase insert failed: {exc.status} {body}") from exc
-
-
 def _update_cells_core(request: UpdateCellsRequest) -> Dict[str, Any]:
     """Core synchronous update_cells logic that can be called from anywhere."""
     logger.info(
@@ -1813,151 +2142,166 @@ async def restore_cell_values(request: RestoreRequest) -> Dict[str, Any]:
             logger.error("[RESTORE_CELLS] Missing snapshot_batch_id")
             raise HTTPException(status_code=400, detail="Missing snapshot_batch_id")
 
-        if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-            logger.error("[RESTORE_CELLS] Supabase not configured")
-            raise HTTPException(status_code=500, detail="Supabase not configured")
-
-        # Fetch snapshot rows from Supabase
+        # Fetch snapshot rows from the snapshot store
         logger.info(f"[RESTORE_CELLS] Fetching cell value snapshot for batch_id: {snapshot_batch_id}")
 
-        params = {
-            "select": "cell,value,spreadsheet_id,gid",
-            "snapshot_batch_id": f"eq.{snapshot_batch_id}",
-        }
-        query = urllib.parse.urlencode(params, doseq=True)
-        url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_value_snapshots?{query}"
-
-        req = urllib.request.Request(
-            url,
-            method="GET",
-            headers={
-                "apikey": SUPABASE_SERVICE_KEY,
-                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                "Accept": "application/json",
-            },
-        )
-
-        try:
-            with urllib.request.urlopen(req) as response:
-                if response.status != 200:
-                    logger.error(f"[RESTORE_CELLS] Supabase returned status {response.status}")
-                    raise HTTPException(status_code=500, detail=f"Supabase error: {response.status}")
-                payload = response.read()
-        except urllib.error.HTTPError as exc:
-            body = exc.read().decode("utf-8", errors="ignore")
-            logger.error(f"[RESTORE_CELLS] Supabase HTTP error {exc.status}: {body}")
-            raise HTTPException(status_code=500, detail=f"Supabase fetch failed: {exc.status}")
-
-        snapshot_rows = json.loads(payload)
+        expected_cells = set(request.cell_locations) if request.cell_locations else None
 
-        # GRACEFUL DEGRADATION: If snapshot doesn't exist, return success (not error)
-        if not isinstance(snapshot_rows, list) or not snapshot_rows:
-            logger.warning(f"[RESTORE_CELLS] No snapshot found for batch_id: {snapshot_batch_id}")
-            return {
-                "status": "success",
-                "message": f"No snapshot found (already restored or never created)",
-                "count": 0,
-            }
+        # Rows are streamed in keyset pages so snapshots larger than
+        # PostgREST's max-rows are restored in full
+        pages = _iter_value_snapshot_pages(get_snapshot_store(), snapshot_batch_id, expected_cells)
 
-        # Filter by cell_locations if provided
-        if request.cell_locations:
-            expected_cells = set(request.cell_locations)
-            snapshot_rows = [row for row in snapshot_rows if row.get("cell") in expected_cells]
-            logger.debug(f"[RESTORE_CELLS] Filtered to {len(snapshot_rows)} cells matching request")
+        try:
+            first_page = await pages.__anext__()
+        except StopAsyncIteration:
+            first_page = []
+        except SnapshotStoreError as exc:
+            logger.error(f"[RESTORE_CELLS] Snapshot fetch failed: {exc}")
+            raise HTTPException(status_code=500, detail=f"Snapshot fetch failed: {exc}")
 
-            if not snapshot_rows:
-                logger.warning("[RESTORE_CELLS] No matching cells found in snapshot")
+        try:
+            # GRACEFUL DEGRADATION: If snapshot doesn't exist, return success (not error)
+            if not first_page:
+                logger.warning(f"[RESTORE_CELLS] No snapshot found for batch_id: {snapshot_batch_id}")
                 return {
                     "status": "success",
-                    "message": "No matching cells found in snapshot",
+                    "message": f"No snapshot found (already restored or never created)",
                     "count": 0,
                 }
 
-        # Get spreadsheet info from first row
-        first_row = snapshot_rows[0]
-        spreadsheet_id = first_row.get("spreadsheet_id")
-        gid = first_row.get("gid")
-
-        if not spreadsheet_id:
-            logger.error("[RESTORE_CELLS] Snapshot missing spreadsheet_id")
-            raise HTTPException(status_code=500, detail="Snapshot missing spreadsheet_id")
-
-        logger.info(f"[RESTORE_CELLS] Extracted: spreadsheet_id={spreadsheet_id}, gid={gid}")
-
-        try:
-            spreadsheet = validator.fetch_spreadsheet(spreadsheet_id)
-            logger.debug(f"[RESTORE_CELLS] Fetched spreadsheet {spreadsheet_id}")
-        except Exception as exc:
-            logger.error(f"[RESTORE_CELLS] Failed to fetch spreadsheet {spreadsheet_id}: {exc}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to fetch spreadsheet: {exc}")
-
-        sheets = spreadsheet.get("sheets", [])
-        if not sheets:
-            logger.error("[RESTORE_CELLS] No sheets available")
-            raise HTTPException(status_code=500, detail="No sheets available in spreadsheet")
-
-        # Find sheet by gid
-        sheet = None
-        if gid is None:
-            sheet = sheets[0]
-            logger.debug(f"[RESTORE_CELLS] Using first sheet (no gid provided)")
-        else:
-            for candidate in sheets:
-                if candidate["properties"].get("sheetId") == gid:
-                    sheet = candidate
-                    logger.debug(f"[RESTORE_CELLS] Found sheet with gid={gid}")
-                    break
-
-        if sheet is None:
-            logger.error(f"[RESTORE_CELLS] No sheet found with gid={gid}")
-            raise HTTPException(status_code=404, detail=f"No sheet found with gid={gid}")
+            # Get spreadsheet info from first row
+            first_row = first_page[0]
+            spreadsheet_id = first_row.get("spreadsheet_id")
+            gid = first_row.get("gid")
 
-        sheet_props = sheet["properties"]
-        sheet_title = sheet_props["title"]
+            if not spreadsheet_id:
+                logger.error("[RESTORE_CELLS] Snapshot missing spreadsheet_id")
+                raise HTTPException(status_code=500, detail="Snapshot missing spreadsheet_id")
 
-        logger.info(f"[RESTORE_CELLS] Restoring cell values on sheet '{sheet_title}'")
-
-        # Build batch update - SKIP INVALID CELLS
-        batch_data: List[Dict[str, Any]] = []
-        skipped = 0
+            logger.info(f"[RESTORE_CELLS] Extracted: spreadsheet_id={spreadsheet_id}, gid={gid}")
 
-        for row in snapshot_rows:
-            cell = row.get("cell")
-            value_json = row.get("value")
-
-            if not cell:
-                logger.warning("[RESTORE_CELLS] Snapshot row missing 'cell', skipping")
-                skipped += 1
-                continue
-
-            # Deserialize value
-            if value_json is None:
-                value = None
+            try:
+                spreadsheet = validator.fetch_spreadsheet(spreadsheet_id)
+                logger.debug(f"[RESTORE_CELLS] Fetched spreadsheet {spreadsheet_id}")
+            except Exception as exc:
+                logger.error(f"[RESTORE_CELLS] Failed to fetch spreadsheet {spreadsheet_id}: {exc}", exc_info=True)
+                raise HTTPException(status_code=500, detail=f"Failed to fetch spreadsheet: {exc}")
+
+            sheets = spreadsheet.get("sheets", [])
+            if not sheets:
+                logger.error("[RESTORE_CELLS] No sheets available")
+                raise HTTPException(status_code=500, detail="No sheets available in spreadsheet")
+
+            # Find sheet by gid
+            sheet = None
+            if gid is None:
+                sheet = sheets[0]
+                logger.debug(f"[RESTORE_CELLS] Using first sheet (no gid provided)")
             else:
-                try:
-                    value = json.loads(value_json)
-                except json.JSONDecodeError:
-                    logger.warning(f"[RESTORE_CELLS] Failed to parse value for cell '{cell}', using raw string")
-                    value = value_json  # Fallback to string
-
-            cell_range = f"'{sheet_title}'!{cell}"
+                for candidate in sheets:
+                    if candidate["properties"].get("sheetId") == gid:
+                        sheet = candidate
+                        logger.debug(f"[RESTORE_CELLS] Found sheet with gid={gid}")
+                        break
+
+            if sheet is None:
+                logger.error(f"[RESTORE_CELLS] No sheet found with gid={gid}")
+                raise HTTPException(status_code=404, detail=f"No sheet found with gid={gid}")
+
+            sheet_props = sheet["properties"]
+            sheet_title = sheet_props["title"]
+
+            logger.info(f"[RESTORE_CELLS] Restoring cell values on sheet '{sheet_title}'")
+
+            matched = 0
+            skipped = 0
+            restored_cells = 0
+
+            def _build_value_data(page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                """Build batch update entries for one page - SKIP INVALID CELLS."""
+                nonlocal matched, skipped, restored_cells
+                batch_data: List[Dict[str, Any]] = []
+
+                for row in page:
+                    cell = row.get("cell")
+                    value_json = row.get("value")
+
+                    # Filter by cell_locations if provided
+                    if expected_cells is not None and cell not in expected_cells:
+                        continue
+                    matched += 1
+
+                    if not cell:
+                        logger.warning("[RESTORE_CELLS] Snapshot row missing 'cell', skipping")
+                        skipped += 1
+                        continue
+
+                    # Deserialize value
+                    if value_json is None:
+                        value = None
+                    else:
+                        try:
+                            value = json.loads(value_json)
+                        except json.JSONDecodeError:
+                            logger.warning(f"[RESTORE_CELLS] Failed to parse value for cell '{cell}', using raw string")
+                            value = value_json  # Fallback to string
+
+                    cell_range = f"'{sheet_title}'!{cell}"
+
+                    # Handle different value types
+                    if value is None:
+                        value_to_write = [[""]]
+                    elif isinstance(value, list):
+                        # It was a range - restore the full 2D array
+                        value_to_write = value
+                    else:
+                        # Single cell value
+                        value_to_write = [[value]]
+
+                    batch_data.append({
+                        "range": cell_range,
+                        "values": value_to_write,
+                    })
+                    restored_cells += row.get("cell_count", 1)
+
+                return batch_data
+
+            def _send_value_batch(batch: List[Dict[str, Any]]) -> None:
+                validator.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={
+                        "valueInputOption": "USER_ENTERED",
+                        "data": batch,
+                    },
+                ).execute()
 
-            # Handle different value types
-            if value is None:
-                value_to_write = [[""]]
-            elif isinstance(value, list):
-                # It was a range - restore the full 2D array
-                value_to_write = value
-            else:
-                # Single cell value
-                value_to_write = [[value]]
+            # Execute batch restore, pipelined with the remaining page fetches
+            writer = _PipelinedBatchWriter(_send_value_batch)
+            try:
+                await writer.add(_build_value_data(first_page))
+                async for page in pages:
+                    await writer.add(_build_value_data(page))
+                await writer.close()
+            except SnapshotStoreError as exc:
+                logger.error(f"[RESTORE_CELLS] Snapshot fetch failed: {exc}")
+                raise HTTPException(status_code=500, detail=f"Snapshot fetch failed: {exc}")
+            except Exception as exc:
+                logger.error(f"[RESTORE_CELLS] Failed to execute batchUpdate: {exc}", exc_info=True)
+                raise HTTPException(status_code=500, detail=f"Failed to update spreadsheet: {exc}")
+        finally:
+            await pages.aclose()
 
-            batch_data.append({
-                "range": cell_range,
-                "values": value_to_write,
-            })
+        if expected_cells is not None:
+            logger.debug(f"[RESTORE_CELLS] Filtered to {matched} cells matching request")
+            if not matched:
+                logger.warning("[RESTORE_CELLS] No matching cells found in snapshot")
+                return {
+                    "status": "success",
+                    "message": "No matching cells found in snapshot",
+                    "count": 0,
+                }
 
-        if not batch_data:
+        if not writer.written:
             logger.warning("[RESTORE_CELLS] No valid cells to restore")
             return {
                 "status": "success",
@@ -1965,26 +2309,12 @@ async def restore_cell_values(request: RestoreRequest) -> Dict[str, Any]:
                 "count": 0,
             }
 
-        logger.info(f"[RESTORE_CELLS] Restoring {len(batch_data)} cell(s), skipped {skipped}")
-
-        # Execute batch restore
-        try:
-            validator.service.spreadsheets().values().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={
-                    "valueInputOption": "USER_ENTERED",
-                    "data": batch_data,
-                },
-            ).execute()
-            logger.info(f"[RESTORE_CELLS] ✓ Successfully restored {len(batch_data)} cell value(s)")
-        except Exception as exc:
-            logger.error(f"[RESTORE_CELLS] Failed to execute batchUpdate: {exc}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to update spreadsheet: {exc}")
+        logger.info(f"[RESTORE_CELLS] ✓ Successfully restored {restored_cells} cell value(s) in {writer.batches} batch(es), skipped {skipped}")
 
         return {
             "status": "success",
-            "message": f"Restored {len(batch_data)} cell value(s) on '{sheet_title}' from snapshot.",
-            "count": len(batch_data),
+            "message": f"Restored {restored_cells} cell value(s) on '{sheet_title}' from snapshot.",
+            "count": restored_cells,
         }
 
     except HTTPException:
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from typing import Optional
 
-from .models import ChatRequest, ChatResponse
+from .logging_config import get_logger
+from .models import ChatRequest, ChatResponse, SheetContext
 from .orchestrator import AgentOrchestrator
-from .llm import create_llm_client
+from .llm import LLMClient, create_llm_client
 from .sheets_client import ServiceAccountSheetsClient
 from .context_builder import ContextBuilder
+from .utils import parse_spreadsheet_url
+
+logger = get_logger(__name__)
 
 
 class ChatBackend(ABC):
@@ -20,17 +25,33 @@ class ChatBackend(ABC):
   def send_chat(self, request: ChatRequest) -> ChatResponse:  # pragma: no cover - interface
     raise NotImplementedError
 
+  def prefetch(self, sheet_context: SheetContext) -> None:
+    """
+    Warm whatever the next send_chat for this sheet is likely to fetch.
+
+    Called off the request thread while session history loads; failures
+    must be swallowed. The default does nothing.
+    """
+
 
 class PythonChatBackend(ChatBackend):
   """
   Chat backend that runs the pure-Python AgentOrchestrator and Sheet/LLM stack
   directly (no Next.js dependency).
+
+  The LLM and Sheets clients default to the configured ones; passing them
+  in runs the same stack against other endpoints, e.g. in-process fakes.
   """
 
-  def __init__(self) -> None:
-    llm_client = create_llm_client()
-    sheets_client = ServiceAccountSheetsClient()
+  def __init__(
+    self,
+    llm_client: Optional[LLMClient] = None,
+    sheets_client: Optional[ServiceAccountSheetsClient] = None,
+  ) -> None:
+    llm_client = llm_client or create_llm_client()
+    sheets_client = sheets_client or ServiceAccountSheetsClient()
     context_builder = ContextBuilder(sheets_client)
+    self._sheets_client = sheets_client
     self._orchestrator = AgentOrchestrator(
       llm_client=llm_client,
       sheets_client=sheets_client,
@@ -41,6 +62,17 @@ class PythonChatBackend(ChatBackend):
     new_messages = self._orchestrator.process_chat(
       request.messages,
       request.sheetContext,
+      session_id=request.sessionId,
     )
     return ChatResponse(messages=new_messages, sessionId=request.sessionId)
 
+  def prefetch(self, sheet_context: SheetContext) -> None:
+    # Tools resolve sheet titles and build context from spreadsheet metadata,
+    # which the sheets client hands to the turn's first lookup
+    spreadsheet_id = parse_spreadsheet_url(sheet_context.spreadsheetId or "")["spreadsheet_id"]
+    if not spreadsheet_id:
+      return
+    try:
+      self._sheets_client.prefetch_metadata(spreadsheet_id)
+    except Exception as exc:
+      logger.debug(f"Metadata prefetch failed for {spreadsheet_id}: {exc}")
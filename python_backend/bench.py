@@ -0,0 +1,579 @@
+"""
+End-to-end benchmarks against the Sheets emulator and in-process fakes of
+OpenRouter and Supabase.
+
+  python -m python_backend.bench --sizes 1000,100000 --iterations 5 --output bench.json
+  python -m python_backend.bench --compare bench.json --output bench-new.json
+
+Each scenario runs the real backend code (ChatService, AgentOrchestrator,
+ContextBuilder, MistakeDetector, SheetModifier and the /tools endpoints)
+against fakes with the injected latency given on the command line, once per
+sheet size. Reported per scenario and size: p50/p95 latency, calls made to
+each fake, the time spent inside the fakes themselves, and the peak Python
+heap allocated during one run (measured in a separate, untimed run, since
+tracemalloc slows every allocation).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import api, snapshot_store, supabase_rest
+from .backend import PythonChatBackend
+from .fakes import FakeLLM, FakeSupabase, Latency
+from .llm import PROMPTS, LLMClient
+from .memory import ConversationStore
+from .models import ChatMessage, ChatMessageRole, ChatRequest, SheetContext
+from .service import ChatService
+from .sheets_client import MeteredHttpRequest, ServiceAccountSheetsClient
+from .sheets_emulator import SheetsEmulator
+from .snapshot_store import SupabaseSnapshotStore
+from .supabase_rest import SupabaseRestClient
+from .workbook_generator import generate_ledger, score_detection
+
+SCENARIOS = (
+  "context_builder",
+  "mistake_detector",
+  "sheet_modifier",
+  "orchestrator",
+  "chat_service",
+  "tools.update_cells",
+  "tools.color",
+  "tools.visualize_formulas",
+)
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+# Cells touched by the tool scenarios, independent of the sheet size
+TOOL_CELLS = 50
+
+RESULTS_VERSION = 1
+
+
+# --- benchmark sheets ---
+
+class BenchSheet:
+  def __init__(
+    self,
+    spreadsheet_id: str,
+    title: str,
+    sheet_id: int,
+    rows: int,
+    columns: int,
+    issues: Optional[List[Dict[str, Any]]] = None,
+  ) -> None:
+    self.spreadsheet_id = spreadsheet_id
+    self.title = title
+    self.sheet_id = sheet_id
+    self.rows = rows
+    self.columns = columns
+    # Manifest of planted issues, scored against mistake_detector's findings
+    self.issues = issues or []
+
+  @property
+  def url(self) -> str:
+    return f"https://docs.google.com/spreadsheets/d/{self.spreadsheet_id}/edit#gid={self.sheet_id}"
+
+  @property
+  def cells(self) -> int:
+    return self.rows * self.columns
+
+
+# --- fake backend stack ---
+
+class BenchEnvironment:
+  """
+  The backend wired to a fresh Sheets emulator and fakes. install() points
+  the module-level singletons (Supabase client, snapshot store, the tools'
+  Sheets service) at them; close() puts the previous ones back.
+  """
+
+  def __init__(self, sheets_latency: Latency, llm_latency: Latency, supabase_latency: Latency) -> None:
+    self.sheets = SheetsEmulator(sheets_latency)
+    self.llm = FakeLLM(self._respond, llm_latency)
+    self.supabase = FakeSupabase(supabase_latency)
+    self.agent_tool: Optional[Dict[str, Any]] = None
+    self._saved: Optional[tuple] = None
+
+    self.sheets_client = ServiceAccountSheetsClient(service=self.sheets.service(MeteredHttpRequest))
+    self.llm_client = LLMClient(api_key="bench", model="bench/fake-model", transport=self.llm.transport())
+    self.rest_client = SupabaseRestClient("http://supabase.bench", "bench", transport=self.supabase.transport())
+    self.chat_service: Optional[ChatService] = None
+
+  def install(self) -> None:
+    self._saved = (supabase_rest._rest_client, snapshot_store._store, api._sheets_service)
+    supabase_rest._rest_client = self.rest_client
+    snapshot_store._store = SupabaseSnapshotStore(self.rest_client)
+    api._sheets_service = api._SheetsServiceWrapper(self.sheets_client)
+    backend = PythonChatBackend(llm_client=self.llm_client, sheets_client=self.sheets_client)
+    self.orchestrator = backend._orchestrator
+    self.chat_service = ChatService(backend, ConversationStore())
+
+  def close(self) -> None:
+    if self.chat_service is not None:
+      self.chat_service.close()
+    if self._saved is not None:
+      supabase_rest._rest_client, snapshot_store._store, api._sheets_service = self._saved
+      self._saved = None
+    self.rest_client.close()
+    # The stack holds reference cycles; collect it so its caches stop showing
+    # up in memory_diagnostics.cache_stats()
+    self.chat_service = None
+    self.orchestrator = None
+    gc.collect()
+
+  def load_sheet(self, cells: int, columns: int, seed: int, issue_rate: float = 0.0) -> BenchSheet:
+    spreadsheet_id = f"bench-{cells}"
+    workbook = generate_ledger(rows=max(2, math.ceil(cells / columns)), columns=columns, issue_rate=issue_rate, seed=seed)
+    sheet_id = workbook.load_into(self.sheets, spreadsheet_id)["Ledger"]
+    return BenchSheet(spreadsheet_id, "Ledger", sheet_id, len(workbook.rows("Ledger")), columns, workbook.issues)
+
+  def settle(self) -> None:
+    """Let background writes (queued conversation rows) reach the fakes."""
+    if self.chat_service is not None and self.chat_service._logger.enabled:
+      self.chat_service._logger.flush()
+
+  def reset_stats(self) -> None:
+    for fake in (self.sheets, self.llm, self.supabase):
+      fake.reset_stats()
+
+  def _respond(self, messages: List[Dict[str, Any]]) -> Any:
+    system = str(messages[0].get("content") or "") if messages else ""
+    if system == PROMPTS.AGENT.system:
+      if self.agent_tool is None:
+        return {"step": "answer", "assistantMessage": "The ledger looks balanced."}
+      return {"step": "tool_call", "assistantMessage": "Let me check the sheet.", "tool": self.agent_tool}
+    if system == PROMPTS.MISTAKE_DETECTION.system:
+      return [
+        {
+          "category": "outlier",
+          "severity": "medium",
+          "title": f"Unusual amount in row {row}",
+          "description": "Amount is two orders of magnitude above its neighbours.",
+          "ranges": [{"a1Notation": f"D{row}", "description": f"Cell D{row}"}],
+          "suggestedFix": f"Change D{row} to a tenth of its value",
+          "confidence": 0.7,
+        }
+        for row in (5, 17, 42)
+      ]
+    if system == PROMPTS.MODIFICATION_PLAN.system:
+      return {
+        "intent": "Flag large totals",
+        "actions": [
+          {
+            "type": "batch_update",
+            "description": "Add a review flag column",
+            "params": {"updates": [{"cell": f"Z{row}", "value": f'=IF(T{row}>10000,"review","")', "is_formula": True} for row in range(2, 12)]},
+            "affectedRange": "Z2:Z11",
+            "estimatedImpact": {"rowsAffected": 10, "columnsAffected": 1, "destructive": False},
+          }
+        ],
+        "warnings": [],
+      }
+    if system == PROMPTS.HISTORY_SUMMARY.system:
+      return "The user is reviewing a ledger."
+    return {"step": "answer", "assistantMessage": "ok"}
+
+
+# --- scenarios ---
+
+Scenario = Callable[[BenchEnvironment, BenchSheet], Callable[[], Any]]
+
+
+def _user_message(content: str) -> ChatMessage:
+  return ChatMessage(id=str(uuid.uuid4()), role=ChatMessageRole.user, content=content)
+
+
+def _check_status(response: Any) -> Any:
+  if response.status_code >= 400:
+    raise RuntimeError(f"{response.request.url.path} returned {response.status_code}: {response.text[:200]}")
+  return response
+
+
+def _context_builder(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  builder = env.orchestrator.mistake_detector.context_builder
+  return lambda: builder.build_context(sheet.spreadsheet_id, sheet.title)
+
+
+def _mistake_detector(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  config = {
+    "enableRuleBased": True,
+    "enableLLMBased": True,
+    "minSeverity": "info",
+    "categoriesToCheck": ["formula_error", "inconsistent_formula", "type_mismatch", "missing_value", "duplicate_key"],
+  }
+  return lambda: env.orchestrator.mistake_detector.detect_issues(sheet.spreadsheet_id, sheet.title, config)
+
+
+def _sheet_modifier(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  request = {"spreadsheetId": sheet.spreadsheet_id, "sheetTitle": sheet.title, "prompt": "Flag totals over 10000 for review"}
+  return lambda: env.orchestrator.sheet_modifier.modify(dict(request))
+
+
+def _detect_issues_tool(sheet: BenchSheet) -> Dict[str, Any]:
+  return {
+    "name": "detect_issues",
+    "arguments": {"spreadsheetId": sheet.spreadsheet_id, "sheetTitle": sheet.title, "config": {"includeLLMBased": True}},
+  }
+
+
+def _orchestrator(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  env.agent_tool = _detect_issues_tool(sheet)
+  context = SheetContext(spreadsheetId=sheet.spreadsheet_id, sheetTitle=sheet.title)
+  return lambda: env.orchestrator.process_chat([_user_message("Find problems in this ledger")], context, session_id=str(uuid.uuid4()))
+
+
+def _chat_service(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  env.agent_tool = _detect_issues_tool(sheet)
+  context = SheetContext(spreadsheetId=sheet.spreadsheet_id, sheetTitle=sheet.title)
+
+  def run() -> Any:
+    # A new session each time: history is looked up in Supabase first
+    request = ChatRequest(messages=[_user_message("Find problems in this ledger")], sheetContext=context, sessionId=str(uuid.uuid4()))
+    return env.chat_service.chat(request)
+
+  return run
+
+
+def _tools_client() -> Any:
+  from fastapi.testclient import TestClient
+
+  return TestClient(api.app)
+
+
+def _tools_update_cells(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  client = _tools_client()
+  body = {
+    "spreadsheet_id": sheet.url,
+    "sheet_title": sheet.title,
+    "updates": [{"cell_location": f"D{row}", "value": row * 10} for row in range(2, 2 + min(TOOL_CELLS, sheet.rows - 1))],
+    "create_snapshot": True,
+  }
+  return lambda: _check_status(client.post("/tools/update_cells", json=body))
+
+
+def _tools_color(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  client = _tools_client()
+  body = [
+    {"cell_location": f"T{row}", "message": "Check this total", "color": "#FFE599", "url": sheet.url}
+    for row in range(2, 2 + min(TOOL_CELLS, sheet.rows - 1))
+  ]
+  return lambda: _check_status(client.post("/tools/color", json=body))
+
+
+def _tools_visualize_formulas(env: BenchEnvironment, sheet: BenchSheet) -> Callable[[], Any]:
+  client = _tools_client()
+  body = {"sheet_url": sheet.url, "mode": "conditional"}
+  return lambda: _check_status(client.post("/tools/visualize_formulas", json=body))
+
+
+_SCENARIO_FACTORIES: Dict[str, Scenario] = {
+  "context_builder": _context_builder,
+  "mistake_detector": _mistake_detector,
+  "sheet_modifier": _sheet_modifier,
+  "orchestrator": _orchestrator,
+  "chat_service": _chat_service,
+  "tools.update_cells": _tools_update_cells,
+  "tools.color": _tools_color,
+  "tools.visualize_formulas": _tools_visualize_formulas,
+}
+
+
+# --- measurement ---
+
+def percentile(values: Sequence[float], q: float) -> float:
+  """Nearest-rank percentile, q in [0, 1]."""
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _peak_allocated(run: Callable[[], Any]) -> int:
+  was_tracing = tracemalloc.is_tracing()
+  if not was_tracing:
+    tracemalloc.start()
+  try:
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    run()
+    return max(0, tracemalloc.get_traced_memory()[1] - baseline)
+  finally:
+    if not was_tracing:
+      tracemalloc.stop()
+
+
+def measure(env: BenchEnvironment, scenario: str, sheet: BenchSheet, iterations: int, warmup: int = 1) -> Dict[str, Any]:
+  run = _SCENARIO_FACTORIES[scenario](env, sheet)
+  for _ in range(warmup):
+    run()
+  env.settle()
+
+  latencies: List[float] = []
+  fake_seconds: List[float] = []
+  calls: Dict[str, Any] = {}
+  outcome: Any = None
+  for _ in range(iterations):
+    env.reset_stats()
+    started = time.perf_counter()
+    outcome = run()
+    latencies.append(time.perf_counter() - started)
+    fake_seconds.append(env.sheets.service_seconds + env.llm.service_seconds + env.supabase.service_seconds)
+    env.settle()
+    calls = {
+      "sheets": sum(env.sheets.calls.values()),
+      "sheets_by_method": dict(sorted(env.sheets.calls.items())),
+      "llm": sum(env.llm.calls.values()),
+      "supabase": sum(env.supabase.calls.values()),
+    }
+
+  peak = _peak_allocated(run)
+  env.settle()
+  result = {
+    "scenario": scenario,
+    "cells": sheet.cells,
+    "rows": sheet.rows,
+    "columns": sheet.columns,
+    "iterations": iterations,
+    "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+    "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+    "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+    "min_ms": round(min(latencies) * 1000, 3),
+    "max_ms": round(max(latencies) * 1000, 3),
+    "fake_ms": round(sum(fake_seconds) / len(fake_seconds) * 1000, 3),
+    "calls": calls,
+    "peak_alloc_bytes": peak,
+  }
+  if scenario == "mistake_detector" and sheet.issues:
+    # The fake LLM finds nothing real, so only rule findings are scored
+    found = [issue for issue in outcome.get("issues", []) if issue.get("detectedBy") == "rule"]
+    result["detection"] = score_detection(sheet.issues, found)
+  return result
+
+
+def run_benchmarks(
+  scenarios: Sequence[str] = SCENARIOS,
+  sizes: Sequence[int] = DEFAULT_SIZES,
+  iterations: int = 5,
+  columns: int = 20,
+  sheets_latency: Optional[Latency] = None,
+  llm_latency: Optional[Latency] = None,
+  supabase_latency: Optional[Latency] = None,
+  seed: int = 0,
+  issue_rate: float = 0.0,
+  progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+  """
+  Run every scenario at every size and return the results document. With
+  `issue_rate` set, the benchmark ledgers carry planted issues and the
+  mistake_detector results report how many were detected.
+  """
+  unknown = [name for name in scenarios if name not in _SCENARIO_FACTORIES]
+  if unknown:
+    raise ValueError(f"Unknown scenario(s): {', '.join(unknown)}. Expected some of {', '.join(SCENARIOS)}.")
+
+  latencies = {
+    "sheets": sheets_latency or Latency(),
+    "llm": llm_latency or Latency(),
+    "supabase": supabase_latency or Latency(),
+  }
+  env = BenchEnvironment(latencies["sheets"], latencies["llm"], latencies["supabase"])
+  env.install()
+  results: List[Dict[str, Any]] = []
+  try:
+    for size in sizes:
+      sheet = env.load_sheet(size, columns, seed, issue_rate)
+      for scenario in scenarios:
+        result = measure(env, scenario, sheet, iterations)
+        results.append(result)
+        if progress is not None:
+          progress(result)
+  finally:
+    env.close()
+
+  return {
+    "version": RESULTS_VERSION,
+    "meta": {
+      "created_at": _dt.datetime.utcnow().isoformat() + "Z",
+      "git_commit": _git_commit(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "iterations": iterations,
+      "seed": seed,
+      "issue_rate": issue_rate,
+      "latency_ms": {name: {"base": lat.base * 1000, "jitter": lat.jitter * 1000} for name, lat in latencies.items()},
+    },
+    "results": results,
+  }
+
+
+def _git_commit() -> Optional[str]:
+  try:
+    return subprocess.run(
+      ["git", "rev-parse", "--short", "HEAD"],
+      cwd=Path(__file__).resolve().parent,
+      capture_output=True,
+      text=True,
+      timeout=5,
+    ).stdout.strip() or None
+  except (OSError, subprocess.SubprocessError):
+    return None
+
+
+# --- reporting ---
+
+def format_result(result: Dict[str, Any]) -> str:
+  calls = result["calls"]
+  line = (
+    f"{result['scenario']:<26} {result['cells']:>9,} cells  "
+    f"p50 {result['p50_ms']:>10.1f}ms  p95 {result['p95_ms']:>10.1f}ms  "
+    f"sheets {calls['sheets']:>4}  llm {calls['llm']:>2}  supabase {calls['supabase']:>3}  "
+    f"peak {result['peak_alloc_bytes'] / 1e6:>8.1f}MB"
+  )
+  detection = result.get("detection")
+  if detection and detection["recall"] is not None:
+    line += f"  recall {detection['recall']:.0%} ({detection['detected']}/{detection['planted']})"
+  return line
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+  """Per scenario and size present in both documents, the change in latency, calls and memory."""
+  previous = {(r["scenario"], r["cells"]): r for r in baseline.get("results", [])}
+  deltas: List[Dict[str, Any]] = []
+  for result in current.get("results", []):
+    before = previous.get((result["scenario"], result["cells"]))
+    if before is None:
+      continue
+    deltas.append(
+      {
+        "scenario": result["scenario"],
+        "cells": result["cells"],
+        "p50_ms": (before["p50_ms"], result["p50_ms"]),
+        "p50_change": _relative_change(before["p50_ms"], result["p50_ms"]),
+        "p95_ms": (before["p95_ms"], result["p95_ms"]),
+        "p95_change": _relative_change(before["p95_ms"], result["p95_ms"]),
+        "calls": {
+          kind: (before["calls"][kind], result["calls"][kind]) for kind in ("sheets", "llm", "supabase")
+          if before["calls"][kind] != result["calls"][kind]
+        },
+        "peak_alloc_change": _relative_change(before["peak_alloc_bytes"], result["peak_alloc_bytes"]),
+      }
+    )
+  return deltas
+
+
+def _relative_change(before: float, after: float) -> Optional[float]:
+  return round((after - before) / before, 4) if before else None
+
+
+def _format_delta(delta: Dict[str, Any]) -> str:
+  def pct(value: Optional[float]) -> str:
+    return "   n/a" if value is None else f"{value * 100:+6.1f}%"
+
+  calls = ", ".join(f"{kind} {old}->{new}" for kind, (old, new) in delta["calls"].items())
+  return (
+    f"{delta['scenario']:<26} {delta['cells']:>9,} cells  "
+    f"p50 {delta['p50_ms'][0]:>9.1f} -> {delta['p50_ms'][1]:>9.1f}ms {pct(delta['p50_change'])}  "
+    f"p95 {pct(delta['p95_change'])}  peak {pct(delta['peak_alloc_change'])}"
+    + (f"  calls {calls}" if calls else "")
+  )
+
+
+# --- CLI ---
+
+def _parse_sizes(value: str) -> List[int]:
+  return [int(float(part)) for part in value.split(",") if part.strip()]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description="Benchmark the backend against in-process Sheets, LLM and Supabase fakes")
+  parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios (default: all)")
+  parser.add_argument(
+    "--sizes",
+    type=_parse_sizes,
+    default=list(DEFAULT_SIZES),
+    help="Comma-separated sheet sizes in cells (default: 1000,10000,100000,1000000)",
+  )
+  parser.add_argument("--iterations", type=int, default=5, help="Timed runs per scenario and size (default: 5)")
+  parser.add_argument("--columns", type=int, default=20, help="Columns of the benchmark sheets (default: 20)")
+  parser.add_argument("--sheets-latency-ms", type=float, default=0.0, help="Injected latency per Sheets call")
+  parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Injected latency per LLM call")
+  parser.add_argument("--supabase-latency-ms", type=float, default=0.0, help="Injected latency per Supabase call")
+  parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency per call, up to this much")
+  parser.add_argument("--seed", type=int, default=0, help="Seed for sheet contents and jitter (default: 0)")
+  parser.add_argument(
+    "--issue-rate",
+    type=float,
+    default=0.0,
+    help="Share of ledger rows given each kind of planted issue; mistake_detector then reports recall (default: 0)",
+  )
+  parser.add_argument("--output", help="Write the results as JSON to this file")
+  parser.add_argument("--compare", help="Results JSON from an earlier run to compare against")
+  parser.add_argument(
+    "--max-regression",
+    type=float,
+    help="Exit with status 1 if any p50 is this fraction slower than in --compare (e.g. 0.1)",
+  )
+  parser.add_argument("--log-level", default="WARNING", help="Log level for the backend while benchmarking (default: WARNING)")
+  return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  args = build_arg_parser().parse_args(argv)
+
+  # Loggers configure themselves from LOG_LEVEL, including ones created later
+  level = args.log_level.upper()
+  os.environ["LOG_LEVEL"] = level
+  for name in list(logging.root.manager.loggerDict):
+    if name.startswith("python_backend") or name == "httpx":
+      logging.getLogger(name).setLevel(level)
+
+  jitter = args.jitter_ms / 1000
+  document = run_benchmarks(
+    scenarios=[name.strip() for name in args.scenarios.split(",") if name.strip()],
+    sizes=args.sizes,
+    iterations=args.iterations,
+    columns=args.columns,
+    sheets_latency=Latency(args.sheets_latency_ms / 1000, jitter, seed=args.seed),
+    llm_latency=Latency(args.llm_latency_ms / 1000, jitter, seed=args.seed + 1),
+    supabase_latency=Latency(args.supabase_latency_ms / 1000, jitter, seed=args.seed + 2),
+    seed=args.seed,
+    issue_rate=args.issue_rate,
+    progress=lambda result: print(format_result(result), flush=True),
+  )
+
+  if args.output:
+    Path(args.output).write_text(json.dumps(document, indent=2) + "\n")
+    print(f"\nResults written to {args.output}")
+
+  if not args.compare:
+    return 0
+
+  baseline = json.loads(Path(args.compare).read_text())
+  deltas = compare(baseline, document)
+  print(f"\nCompared with {args.compare} ({baseline.get('meta', {}).get('git_commit') or 'unknown commit'}):")
+  for delta in deltas:
+    print(_format_delta(delta))
+  if args.max_regression is not None:
+    regressed = [d for d in deltas if d["p50_change"] is not None and d["p50_change"] > args.max_regression]
+    if regressed:
+      print(f"\n{len(regressed)} result(s) regressed by more than {args.max_regression:.0%}")
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .llm import _load_env_from_local_files
+from .logging_config import get_logger
+from .memory_diagnostics import register_stats
+from .models import ChatMessage, ChatMessageMetadata, PayloadRef
+from .supabase_rest import SupabaseRestClient, SupabaseRestError, eq, get_supabase_rest_client
+
+logger = get_logger(__name__)
+
+BLOB_TABLE = "chat_payload_blobs"
+
+DATA_DIR = Path(__file__).resolve().parents[1] / ".data"
+
+
+class BlobStoreError(RuntimeError):
+  """Raised when a blob cannot be stored or read."""
+
+
+def encode_payload(payload: Any) -> bytes:
+  """Canonical JSON bytes for a payload, so equal payloads hash the same."""
+  return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def payload_hash(data: bytes) -> str:
+  return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+  """
+  Content-addressed storage for large tool payloads.
+
+  Blobs are keyed by the SHA-256 of their bytes, so writing the same payload
+  twice stores it once.
+  """
+
+  @abstractmethod
+  def put(self, digest: str, data: bytes) -> None:
+    raise NotImplementedError
+
+  @abstractmethod
+  def get(self, digest: str) -> Optional[bytes]:
+    raise NotImplementedError
+
+  def put_many(self, blobs: Dict[str, bytes]) -> None:
+    for digest, data in blobs.items():
+      self.put(digest, data)
+
+  def close(self) -> None:
+    pass
+
+
+class LocalBlobStore(BlobStore):
+  """Blobs as zlib-compressed files under `root`, fanned out by hash prefix."""
+
+  def __init__(self, root: Path) -> None:
+    self.root = Path(root)
+    self.root.mkdir(parents=True, exist_ok=True)
+
+  def _path(self, digest: str) -> Path:
+    return self.root / digest[:2] / digest[2:]
+
+  def put(self, digest: str, data: bytes) -> None:
+    path = self._path(digest)
+    if path.exists():
+      return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+      # Write then rename so readers never see a partial blob
+      with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as handle:
+        handle.write(zlib.compress(data, 6))
+      os.replace(handle.name, path)
+    except OSError as exc:
+      raise BlobStoreError(f"Failed to write blob {digest}: {exc}") from exc
+
+  def get(self, digest: str) -> Optional[bytes]:
+    try:
+      return zlib.decompress(self._path(digest).read_bytes())
+    except FileNotFoundError:
+      return None
+    except (OSError, zlib.error) as exc:
+      raise BlobStoreError(f"Failed to read blob {digest}: {exc}") from exc
+
+
+class SupabaseBlobStore(BlobStore):
+  """Blobs in the chat_payload_blobs table (migration 006), base64 zlib-encoded."""
+
+  def __init__(self, client: SupabaseRestClient) -> None:
+    self._client = client
+
+  def put(self, digest: str, data: bytes) -> None:
+    self.put_many({digest: data})
+
+  def put_many(self, blobs: Dict[str, bytes]) -> None:
+    rows = [
+      {
+        "hash": digest,
+        "size": len(data),
+        "data": base64.b64encode(zlib.compress(data, 6)).decode("ascii"),
+      }
+      for digest, data in blobs.items()
+    ]
+    try:
+      self._client.insert_sync(BLOB_TABLE, rows, merge_duplicates=True, on_conflict="hash")
+    except SupabaseRestError as exc:
+      raise BlobStoreError(f"Failed to store {len(rows)} blob(s): {exc.status}") from exc
+
+  def get(self, digest: str) -> Optional[bytes]:
+    try:
+      rows = self._client.select_sync(BLOB_TABLE, "data", {"hash": eq(digest)}, limit=1)
+    except SupabaseRestError as exc:
+      raise BlobStoreError(f"Failed to fetch blob {digest}: {exc.status}") from exc
+    if not rows:
+      return None
+    return zlib.decompress(base64.b64decode(rows[0]["data"]))
+
+
+class PayloadStore:
+  """
+  Moves large tool payloads out of chat messages.
+
+  Payloads whose JSON is larger than `inline_max_bytes` are written to the
+  blob store and replaced in message metadata by a PayloadRef (hash, size and
+  a short summary). `load()` fetches them back on demand through an LRU
+  cache bounded to `cache_bytes` of decoded JSON.
+
+  With `defer_writes`, offload() does no I/O: encoded blobs wait in memory,
+  outside the LRU, until write_pending() stores them. ConversationLogger
+  calls it from its writer thread before inserting the message rows that
+  reference them. At most `unwritten_max_bytes` wait; past that (e.g. while
+  the blob store is down) payloads stay inline.
+  """
+
+  def __init__(
+    self,
+    blobs: BlobStore,
+    inline_max_bytes: int = 4096,
+    cache_bytes: int = 32 * 1024 * 1024,
+    defer_writes: bool = False,
+    unwritten_max_bytes: int = 16 * 1024 * 1024,
+  ) -> None:
+    self.blobs = blobs
+    self.inline_max_bytes = inline_max_bytes
+    self.cache_bytes = cache_bytes
+    self.defer_writes = defer_writes
+    self.unwritten_max_bytes = unwritten_max_bytes
+    self._cache: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+    self._cached_bytes = 0
+    # digest -> encoded bytes of blobs not written yet
+    self._unwritten: Dict[str, bytes] = {}
+    self._unwritten_bytes = 0
+    self._lock = threading.Lock()
+
+    register_stats("payload_cache", self)
+
+  def _remember(self, digest: str, size: int, payload: Any) -> None:
+    with self._lock:
+      if digest in self._cache:
+        self._cache.move_to_end(digest)
+        return
+      self._cache[digest] = (size, payload)
+      self._cached_bytes += size
+      while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+        _, (evicted_size, _) = self._cache.popitem(last=False)
+        self._cached_bytes -= evicted_size
+
+  def offload(self, message: ChatMessage) -> ChatMessage:
+    """Return `message` with a large payload replaced by a reference (or unchanged)."""
+    metadata = message.metadata
+    if metadata is None or metadata.payload is None:
+      return message
+
+    data = encode_payload(metadata.payload)
+    if len(data) <= self.inline_max_bytes:
+      return message
+
+    digest = payload_hash(data)
+    if self.defer_writes:
+      with self._lock:
+        if digest not in self._unwritten:
+          if self._unwritten_bytes + len(data) > self.unwritten_max_bytes:
+            logger.warning(f"{self._unwritten_bytes} bytes of payloads are waiting to be written; keeping this one inline")
+            return message
+          self._unwritten[digest] = data
+          self._unwritten_bytes += len(data)
+    else:
+      try:
+        self.blobs.put(digest, data)
+      except BlobStoreError as exc:
+        # Keeping the payload inline is always safe, just bigger
+        logger.warning(f"Payload offload failed, keeping it inline: {exc}")
+        return message
+      self._remember(digest, len(data), metadata.payload)
+
+    ref = PayloadRef(hash=digest, size=len(data), summary=summarize_payload(metadata.toolName, metadata.payload))
+    return message.model_copy(update={"metadata": metadata.model_copy(update={"payload": None, "payloadRef": ref})})
+
+  def offload_all(self, messages: Iterable[ChatMessage]) -> List[ChatMessage]:
+    return [self.offload(message) for message in messages]
+
+  def write_pending(self) -> Dict[str, bytes]:
+    """
+    Store every deferred blob in one write.
+
+    Returns the encoded payloads that could not be written, by digest; they
+    stay pending for the next call.
+    """
+    with self._lock:
+      pending = dict(self._unwritten)
+    if not pending:
+      return {}
+    try:
+      self.blobs.put_many(pending)
+    except BlobStoreError as exc:
+      logger.warning(f"Deferred payload write failed, will retry: {exc}")
+      return pending
+    with self._lock:
+      for digest, data in pending.items():
+        if self._unwritten.pop(digest, None) is not None:
+          self._unwritten_bytes -= len(data)
+    return {}
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+        "payloads": len(self._cache),
+        "cached_bytes": self._cached_bytes,
+        "cache_bytes": self.cache_bytes,
+        "unwritten": len(self._unwritten),
+        "unwritten_bytes": self._unwritten_bytes,
+      }
+
+  def load(self, metadata: Optional[ChatMessageMetadata]) -> Any:
+    """The payload of a message's metadata, fetching it from the blob store if needed."""
+    if metadata is None:
+      return None
+    if metadata.payload is not None or metadata.payloadRef is None:
+      return metadata.payload
+
+    digest = metadata.payloadRef.hash
+    with self._lock:
+      unwritten = self._unwritten.get(digest)
+      cached = self._cache.get(digest)
+      if cached is not None:
+        self._cache.move_to_end(digest)
+        return cached[1]
+    if unwritten is not None:
+      return json.loads(unwritten)
+
+    try:
+      data = self.blobs.get(digest)
+    except BlobStoreError as exc:
+      logger.warning(f"Payload {digest} unavailable: {exc}")
+      return None
+    if data is None:
+      logger.warning(f"Payload {digest} not found in blob store")
+      return None
+
+    payload = json.loads(data)
+    self._remember(digest, len(data), payload)
+    return payload
+
+
+def summarize_payload(tool_name: Optional[str], payload: Any) -> str:
+  """One-line description of a payload, kept inline next to its reference."""
+  if isinstance(payload, dict):
+    values = payload.get("values")
+    if isinstance(values, list):
+      n_cols = max((len(row) for row in values if isinstance(row, list)), default=0)
+      return f"{tool_name or 'tool'} result: {len(values)} row(s) x {n_cols} column(s)"
+    errors = payload.get("potential_errors")
+    if isinstance(errors, list):
+      return f"{tool_name or 'tool'} result: {len(errors)} potential error(s)"
+    keys = ", ".join(sorted(payload)[:8])
+    return f"{tool_name or 'tool'} result with keys: {keys}"
+  if isinstance(payload, list):
+    return f"{tool_name or 'tool'} result: {len(payload)} item(s)"
+  return f"{tool_name or 'tool'} result"
+
+
+_payload_store: Optional[PayloadStore] = None
+_payload_store_lock = threading.Lock()
+
+
+def get_payload_store() -> PayloadStore:
+  """
+  Get or create the shared payload store.
+
+  PAYLOAD_BLOB_STORE selects where blobs live: "supabase", "local", or unset
+  to use Supabase when it is configured and PAYLOAD_BLOB_DIR (default
+  .data/blobs) otherwise. PAYLOAD_INLINE_MAX_BYTES (default 4096) is the
+  largest payload kept inline and PAYLOAD_CACHE_BYTES bounds the read cache.
+  Supabase writes are deferred to the conversation logger's writer thread,
+  with at most PAYLOAD_UNWRITTEN_MAX_BYTES (default 16 MiB) waiting.
+  """
+  global _payload_store
+
+  if _payload_store is not None:
+    return _payload_store
+
+  with _payload_store_lock:
+    if _payload_store is not None:
+      return _payload_store
+
+    _load_env_from_local_files()
+    backend = (os.getenv("PAYLOAD_BLOB_STORE") or "").strip().lower()
+    if backend not in ("", "supabase", "local"):
+      raise ValueError(f"Unknown PAYLOAD_BLOB_STORE '{backend}'. Expected 'supabase' or 'local'.")
+
+    client = get_supabase_rest_client() if backend != "local" else None
+    if backend == "supabase" and client is None:
+      raise ValueError("PAYLOAD_BLOB_STORE=supabase requires SUPABASE_URL and a Supabase key.")
+
+    if client is not None:
+      blobs: BlobStore = SupabaseBlobStore(client)
+    else:
+      blobs = LocalBlobStore(Path(os.getenv("PAYLOAD_BLOB_DIR") or DATA_DIR / "blobs"))
+
+    _payload_store = PayloadStore(
+      blobs,
+      inline_max_bytes=int(os.getenv("PAYLOAD_INLINE_MAX_BYTES", "4096")),
+      cache_bytes=int(os.getenv("PAYLOAD_CACHE_BYTES", str(32 * 1024 * 1024))),
+      defer_writes=isinstance(blobs, SupabaseBlobStore),
+      unwritten_max_bytes=int(os.getenv("PAYLOAD_UNWRITTEN_MAX_BYTES", str(16 * 1024 * 1024))),
+    )
+    logger.info(f"Payload blob store: {type(blobs).__name__}")
+    return _payload_store
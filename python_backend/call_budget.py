@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# Response headers set from a budget, exposed to browser clients via CORS
+BUDGET_HEADERS = (
+  "X-Sheets-Calls",
+  "X-Sheets-Bytes",
+  "X-Sheets-Methods",
+  "X-LLM-Calls",
+  "X-LLM-Tokens",
+  "X-LLM-Prompt-Tokens",
+  "X-LLM-Completion-Tokens",
+  "X-Supabase-Calls",
+)
+
+
+class CallBudget:
+  """
+  Outbound API calls made while serving one request.
+
+  The clients record into the budget of the request they run under, found
+  through a context var, so calls made from helper threads (e.g. the sheet
+  prefetch) and the Supabase event loop count too. Recording takes a lock,
+  since those threads may record at the same time.
+  """
+
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self.sheets_calls: Dict[str, int] = {}
+    self.sheets_bytes = 0
+    self.llm_calls = 0
+    self.llm_prompt_tokens = 0
+    self.llm_completion_tokens = 0
+    self.supabase_calls = 0
+
+  def add_sheets_call(self, method: str, nbytes: int) -> None:
+    with self._lock:
+      self.sheets_calls[method] = self.sheets_calls.get(method, 0) + 1
+      self.sheets_bytes += nbytes
+
+  def add_llm_call(self, prompt_tokens: int, completion_tokens: int) -> None:
+    with self._lock:
+      self.llm_calls += 1
+      self.llm_prompt_tokens += prompt_tokens
+      self.llm_completion_tokens += completion_tokens
+
+  def add_supabase_call(self) -> None:
+    with self._lock:
+      self.supabase_calls += 1
+
+  def headers(self) -> Dict[str, str]:
+    """The budget as X-* response headers."""
+    with self._lock:
+      methods = sorted(self.sheets_calls.items())
+      headers = {
+        "X-Sheets-Calls": str(sum(count for _, count in methods)),
+        "X-Sheets-Bytes": str(self.sheets_bytes),
+        "X-LLM-Calls": str(self.llm_calls),
+        "X-LLM-Tokens": str(self.llm_prompt_tokens + self.llm_completion_tokens),
+        "X-LLM-Prompt-Tokens": str(self.llm_prompt_tokens),
+        "X-LLM-Completion-Tokens": str(self.llm_completion_tokens),
+        "X-Supabase-Calls": str(self.supabase_calls),
+      }
+    if methods:
+      headers["X-Sheets-Methods"] = ", ".join(f"{method}={count}" for method, count in methods)
+    return headers
+
+  def summary(self) -> Dict[str, Any]:
+    """The budget as structured log fields."""
+    with self._lock:
+      return {
+        "sheets_calls": sum(self.sheets_calls.values()),
+        "sheets_calls_by_method": dict(self.sheets_calls),
+        "sheets_bytes": self.sheets_bytes,
+        "llm_calls": self.llm_calls,
+        "llm_prompt_tokens": self.llm_prompt_tokens,
+        "llm_completion_tokens": self.llm_completion_tokens,
+        "supabase_calls": self.supabase_calls,
+      }
+
+
+_current: contextvars.ContextVar[Optional[CallBudget]] = contextvars.ContextVar("call_budget", default=None)
+
+
+def start_budget() -> Tuple[CallBudget, contextvars.Token]:
+  """Start counting the current request's calls; pass the token to end_budget()."""
+  budget = CallBudget()
+  return budget, _current.set(budget)
+
+
+def end_budget(token: contextvars.Token) -> None:
+  _current.reset(token)
+
+
+def current_budget() -> Optional[CallBudget]:
+  return _current.get()
+
+
+def record_sheets_call(method: str, nbytes: int) -> None:
+  budget = _current.get()
+  if budget is not None:
+    budget.add_sheets_call(method, nbytes)
+
+
+def record_llm_call(prompt_tokens: int, completion_tokens: int) -> None:
+  budget = _current.get()
+  if budget is not None:
+    budget.add_llm_call(prompt_tokens, completion_tokens)
+
+
+def record_supabase_call() -> None:
+  budget = _current.get()
+  if budget is not None:
+    budget.add_supabase_call()
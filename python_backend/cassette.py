@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httplib2
+import httpx
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+
+from .logging_config import get_logger
+from .sheets_emulator import _discovery_document
+
+logger = get_logger(__name__)
+
+REDACTED = "[REDACTED]"
+
+# Keys (JSON fields, query parameters, headers) whose values never reach a cassette
+SECRET_KEYS = (
+  "authorization",
+  "api_key",
+  "apikey",
+  "key",
+  "access_token",
+  "refresh_token",
+  "id_token",
+  "token",
+  "client_secret",
+  "secret",
+  "password",
+  "private_key",
+  "assertion",
+  "cookie",
+)
+
+# Only Sheets API traffic is recorded; OAuth token exchanges pass through
+SHEETS_HOST = "sheets.googleapis.com"
+
+
+class CassetteMiss(RuntimeError):
+  """A replayed request has no recorded interaction left to answer it."""
+
+
+def _is_secret(key: str, extra: Iterable[str]) -> bool:
+  normalized = key.lower().replace("-", "_")
+  return normalized in SECRET_KEYS or normalized in extra
+
+
+def redact(value: Any, extra: Iterable[str] = ()) -> Any:
+  """`value` with the values of secret-looking keys replaced, at any depth."""
+  if isinstance(value, dict):
+    return {k: REDACTED if _is_secret(str(k), extra) else redact(v, extra) for k, v in value.items()}
+  if isinstance(value, list):
+    return [redact(item, extra) for item in value]
+  return value
+
+
+def redact_url(url: str, extra: Iterable[str] = ()) -> str:
+  """The URL with secret query parameters redacted and the rest sorted."""
+  parts = urlsplit(url)
+  query = sorted((k, REDACTED if _is_secret(k, extra) else v) for k, v in parse_qsl(parts.query, keep_blank_values=True))
+  return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _decode(content: Any) -> Any:
+  if content is None or content == b"" or content == "":
+    return None
+  if isinstance(content, bytes):
+    content = content.decode("utf-8", errors="replace")
+  if not isinstance(content, str):
+    return content
+  try:
+    return json.loads(content)
+  except ValueError:
+    return content
+
+
+def _encode(body: Any) -> bytes:
+  if body is None:
+    return b""
+  return (body if isinstance(body, str) else json.dumps(body)).encode()
+
+
+def _fingerprint(body: Any) -> str:
+  return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class Cassette:
+  """
+  Recorded LLM and Sheets API traffic, one JSON interaction per line.
+
+  In "record" mode, llm_transport() and sheets_http() wrap the real
+  transports and append every exchange with its latency, secrets redacted.
+  In "replay" mode they answer from the recording instead: a request gets
+  the next unused interaction with the same method, URL and body, or failing
+  that, the next unused one for the same method and path (so prompts that
+  changed between code versions still replay in order). Each answer waits
+  for the recorded latency times `latency_scale` (0 answers immediately).
+  """
+
+  def __init__(
+    self,
+    path: Path,
+    mode: str,
+    latency_scale: float = 1.0,
+    redact_keys: Iterable[str] = (),
+  ) -> None:
+    if mode not in ("record", "replay"):
+      raise ValueError(f"Cassette mode must be 'record' or 'replay', got {mode!r}")
+    self.path = Path(path)
+    self.mode = mode
+    self.latency_scale = latency_scale
+    self.redact_keys = frozenset(key.strip().lower().replace("-", "_") for key in redact_keys if key.strip())
+    # Replayed interactions; recorded ones only go to the file
+    self.interactions: List[Dict[str, Any]] = []
+    self.recorded = 0
+    self.exact = 0
+    self.loose = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._by_request: Dict[Tuple[str, str, str, str], Deque[int]] = collections.defaultdict(collections.deque)
+    self._by_route: Dict[Tuple[str, str, str], Deque[int]] = collections.defaultdict(collections.deque)
+    self._used: set = set()
+
+    if mode == "replay":
+      with open(self.path, encoding="utf-8") as stream:
+        for line in stream:
+          if line.strip():
+            self._index(json.loads(line))
+      logger.info(f"Replaying {len(self.interactions)} recorded interaction(s) from {self.path}")
+
+  @property
+  def recording(self) -> bool:
+    return self.mode == "record"
+
+  @property
+  def replaying(self) -> bool:
+    return self.mode == "replay"
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+        "interactions": len(self.interactions) if self.replaying else self.recorded,
+        "exact": self.exact,
+        "loose": self.loose,
+        "misses": self.misses,
+        "unused": len(self.interactions) - len(self._used) if self.replaying else 0,
+      }
+
+  # --- recording ---
+
+  def record(
+    self,
+    kind: str,
+    method: str,
+    url: str,
+    request_body: Any,
+    status: int,
+    content_type: Optional[str],
+    response_body: Any,
+    duration: float,
+  ) -> Dict[str, Any]:
+    body = redact(_decode(request_body), self.redact_keys)
+    interaction = {
+      "kind": kind,
+      "method": method.upper(),
+      "url": redact_url(url, self.redact_keys),
+      "body": body,
+      "fingerprint": _fingerprint(body),
+      "status": status,
+      "content_type": content_type,
+      "response": redact(_decode(response_body), self.redact_keys),
+      "duration_ms": round(duration * 1000, 3),
+    }
+    line = json.dumps(interaction) + "\n"
+    with self._lock:
+      self.recorded += 1
+      with open(self.path, "a", encoding="utf-8") as stream:
+        stream.write(line)
+    return interaction
+
+  # --- replay ---
+
+  def _index(self, interaction: Dict[str, Any]) -> None:
+    index = len(self.interactions)
+    self.interactions.append(interaction)
+    method, url = interaction["method"], interaction["url"]
+    self._by_request[(interaction["kind"], method, url, interaction["fingerprint"])].append(index)
+    self._by_route[(interaction["kind"], method, urlsplit(url).path)].append(index)
+
+  def _next_unused(self, queue: Deque[int]) -> Optional[int]:
+    while queue:
+      index = queue.popleft()
+      if index not in self._used:
+        return index
+    return None
+
+  def match(self, kind: str, method: str, url: str, request_body: Any) -> Dict[str, Any]:
+    method = method.upper()
+    url = redact_url(url, self.redact_keys)
+    fingerprint = _fingerprint(redact(_decode(request_body), self.redact_keys))
+    with self._lock:
+      index = self._next_unused(self._by_request[(kind, method, url, fingerprint)])
+      if index is not None:
+        self.exact += 1
+      else:
+        index = self._next_unused(self._by_route[(kind, method, urlsplit(url).path)])
+        if index is None:
+          self.misses += 1
+          raise CassetteMiss(f"No recorded {kind} interaction left for {method} {url}")
+        self.loose += 1
+      self._used.add(index)
+      return self.interactions[index]
+
+  def _wait(self, interaction: Dict[str, Any]) -> None:
+    delay = interaction.get("duration_ms", 0) / 1000 * self.latency_scale
+    if delay > 0:
+      time.sleep(delay)
+
+  # --- transports ---
+
+  def llm_transport(self, inner: Optional[httpx.BaseTransport] = None) -> httpx.BaseTransport:
+    """An httpx transport for LLMClient that records through `inner` or replays."""
+    if self.replaying:
+      return _ReplayTransport(self)
+    return _RecordingTransport(self, inner or httpx.HTTPTransport())
+
+  def sheets_http(self, inner: Any) -> Any:
+    """Wrap an (authorized) httplib2-style http so Sheets calls are recorded."""
+    return _RecordingHttp(self, inner)
+
+  def sheets_service(self, request_builder: type = HttpRequest) -> Any:
+    """A Sheets API service answered from the recording, no credentials needed."""
+    return build_from_document(_discovery_document(), http=_ReplayHttp(self), requestBuilder=request_builder)
+
+
+class _RecordingTransport(httpx.BaseTransport):
+  def __init__(self, cassette: Cassette, inner: httpx.BaseTransport) -> None:
+    self._cassette = cassette
+    self._inner = inner
+
+  def handle_request(self, request: httpx.Request) -> httpx.Response:
+    started = time.perf_counter()
+    response = self._inner.handle_request(request)
+    content = response.read()
+    self._cassette.record(
+      "llm",
+      request.method,
+      str(request.url),
+      request.content,
+      response.status_code,
+      response.headers.get("content-type"),
+      content,
+      time.perf_counter() - started,
+    )
+    return response
+
+  def close(self) -> None:
+    self._inner.close()
+
+
+class _ReplayTransport(httpx.BaseTransport):
+  def __init__(self, cassette: Cassette) -> None:
+    self._cassette = cassette
+
+  def handle_request(self, request: httpx.Request) -> httpx.Response:
+    interaction = self._cassette.match("llm", request.method, str(request.url), request.read())
+    self._cassette._wait(interaction)
+    headers = {"content-type": interaction.get("content_type") or "application/json"}
+    return httpx.Response(interaction["status"], headers=headers, content=_encode(interaction["response"]))
+
+
+class _RecordingHttp:
+  def __init__(self, cassette: Cassette, inner: Any) -> None:
+    self._cassette = cassette
+    self._inner = inner
+
+  def __getattr__(self, name: str) -> Any:
+    return getattr(self._inner, name)
+
+  def request(
+    self,
+    uri: str,
+    method: str = "GET",
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs: Any,
+  ) -> Tuple[httplib2.Response, bytes]:
+    if urlsplit(uri).hostname != SHEETS_HOST:
+      return self._inner.request(uri, method, body=body, headers=headers, **kwargs)
+    started = time.perf_counter()
+    response, content = self._inner.request(uri, method, body=body, headers=headers, **kwargs)
+    self._cassette.record(
+      "sheets",
+      method,
+      uri,
+      body,
+      response.status,
+      response.get("content-type"),
+      content,
+      time.perf_counter() - started,
+    )
+    return response, content
+
+
+class _ReplayHttp:
+  def __init__(self, cassette: Cassette) -> None:
+    self._cassette = cassette
+
+  def request(
+    self,
+    uri: str,
+    method: str = "GET",
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs: Any,
+  ) -> Tuple[httplib2.Response, bytes]:
+    interaction = self._cassette.match("sheets", method, uri, body)
+    self._cassette._wait(interaction)
+    response = httplib2.Response({
+      "status": str(interaction["status"]),
+      "content-type": interaction.get("content_type") or "application/json; charset=UTF-8",
+    })
+    return response, _encode(interaction["response"])
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+  """
+  Get the process-wide cassette, or None when recording and replay are off.
+
+  CASSETTE_MODE is "record" or "replay" and CASSETTE_PATH the cassette file
+  (appended to when recording). LLMClient and the Sheets clients then record
+  their traffic there, or are answered from it. CASSETTE_LATENCY_SCALE
+  (default 1) scales replayed latencies; CASSETTE_REDACT_KEYS adds
+  comma-separated keys to redact.
+  """
+  global _cassette
+
+  if _cassette is not None:
+    return _cassette
+
+  mode = os.getenv("CASSETTE_MODE", "").strip().lower()
+  if not mode or mode in ("0", "false", "off"):
+    return None
+
+  path = os.getenv("CASSETTE_PATH", "").strip()
+  if not path:
+    raise ValueError("CASSETTE_PATH must be set when CASSETTE_MODE is")
+
+  with _cassette_lock:
+    if _cassette is None:
+      _cassette = Cassette(
+        Path(path),
+        mode,
+        latency_scale=float(os.getenv("CASSETTE_LATENCY_SCALE", "1")),
+        redact_keys=os.getenv("CASSETTE_REDACT_KEYS", "").split(","),
+      )
+      logger.warning(f"LLM and Sheets traffic is {'recorded to' if _cassette.recording else 'replayed from'} {path} (CASSETTE_MODE is set)")
+    return _cassette
@@ -80,6 +80,8 @@ def main(argv: list[str] | None = None) -> int:
 
   except KeyboardInterrupt:
     print("\nExiting...")
+  finally:
+    service.close()
 
   return 0
 
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import os
 from typing import Any, Dict, List, Optional
 
+from .shared_cache import NS_SHEET_CONTEXT, NS_SHEET_GENERATION, get_shared_cache
 from .sheets_client import ServiceAccountSheetsClient
+from .tracing import traced
 
 
 class ContextBuilder:
@@ -10,10 +13,17 @@ class ContextBuilder:
   Build contextual information about a sheet, ported from the TypeScript
   ContextBuilder. Works with the dictionary-shaped structures returned by
   ServiceAccountSheetsClient.
+
+  With the shared cache enabled and CONTEXT_CACHE_TTL > 0 (seconds, default
+  0), built contexts are shared by every worker on the host until they
+  expire or a write through ServiceAccountSheetsClient bumps the sheet's
+  generation. Edits made directly in Sheets are only seen after the TTL.
   """
 
   def __init__(self, client: ServiceAccountSheetsClient) -> None:
     self.client = client
+    self.context_ttl = float(os.getenv("CONTEXT_CACHE_TTL", "0"))
+    self._shared = get_shared_cache() if self.context_ttl > 0 else None
 
   def build_context(self, spreadsheet_id: str, sheet_title: str, gid: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -33,6 +43,19 @@ class ContextBuilder:
     if not sheet_title:
       raise ValueError("Either sheet_title or gid must be provided")
 
+    if self._shared is None:
+      return self._build_context(spreadsheet_id, sheet_title)
+
+    generation = self._shared.counter(NS_SHEET_GENERATION, spreadsheet_id)
+    key = f"{spreadsheet_id}/{generation}/{sheet_title}"
+    context = self._shared.get(NS_SHEET_CONTEXT, key)
+    if context is None:
+      context = self._build_context(spreadsheet_id, sheet_title)
+      self._shared.set(NS_SHEET_CONTEXT, key, context, ttl=self.context_ttl)
+    return context
+
+  @traced("context.build", "context")
+  def _build_context(self, spreadsheet_id: str, sheet_title: str) -> Dict[str, Any]:
     metadata = self.client.get_spreadsheet_metadata(spreadsheet_id)
     sheet_meta = next(
       (s for s in metadata.get("sheets", []) if s.get("title") == sheet_title),
@@ -1,66 +1,169 @@
 from __future__ import annotations
 
-import uuid
-from typing import Iterable, List, Optional
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from .blob_store import PayloadStore, get_payload_store
 from .logging_config import get_logger
+from .memory_diagnostics import register_stats
 from .models import ChatMessage, ChatMessageRole, ChatMessageMetadata, SheetContext
-from .supabase_client import get_supabase_client
+from .supabase_rest import SupabaseRestClient, eq, get_supabase_rest_client, lt
+from .tracing import traced
 
 logger = get_logger(__name__)
 
+# (spreadsheet_id, sheet_title, spreadsheet_url) identifying a sheet_tabs row
+SheetTabKey = Tuple[str, str, str]
+
+# History reloads project metadata to its small fields, leaving tool payloads out
+_HISTORY_COLUMNS = (
+  "message_id,role,content,created_at,"
+  "tool_name:metadata->>toolName,payload_ref:metadata->payloadRef,"
+  "plan:metadata->>plan,error:metadata->>error,timestamp:metadata->>timestamp"
+)
+_METADATA_COLUMNS = {
+  "tool_name": "toolName",
+  "payload_ref": "payloadRef",
+  "plan": "plan",
+  "error": "error",
+  "timestamp": "timestamp",
+}
+
 
 class ConversationLogger:
   """
   Lightweight logger that persists chat messages to Supabase when configured.
 
+  Writes are write-behind: `log_messages` only queues rows, and a background
+  thread inserts them in one request once `batch_size` rows are pending or
+  every `flush_interval` seconds. sheet_tabs ids are resolved at flush time
+  through an LRU of `sheet_tab_cache_size` entries, upserting unknown tabs in
+  one request. Pending rows are flushed by `close()` (also run at exit) and
+  before `load_messages` reads a session back. Each flush first writes the
+  payload store's deferred blobs, so no row references a blob that is not
+  stored; if that write fails, the batch's rows carry their payloads inline. Defaults come from
+  CONVERSATION_LOG_BATCH_SIZE (100), CONVERSATION_LOG_FLUSH_INTERVAL (1.0),
+  CONVERSATION_SHEET_TAB_CACHE (1024) and, for history pages,
+  CONVERSATION_HISTORY_PAGE (50).
+
   If Supabase configuration is missing or invalid, all methods become no-ops
   and the application continues to function with in-memory-only conversations.
   """
 
-  def __init__(self) -> None:
-    self._client = get_supabase_client()
+  def __init__(
+    self,
+    client: Optional[SupabaseRestClient] = None,
+    batch_size: Optional[int] = None,
+    flush_interval: Optional[float] = None,
+    sheet_tab_cache_size: Optional[int] = None,
+    history_page_size: Optional[int] = None,
+    payloads: Optional[PayloadStore] = None,
+  ) -> None:
+    self._client = client if client is not None else get_supabase_rest_client()
+    self._payloads = payloads
+    self.batch_size = max(1, batch_size or int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "100")))
+    self.flush_interval = (
+      flush_interval if flush_interval is not None else float(os.getenv("CONVERSATION_LOG_FLUSH_INTERVAL", "1.0"))
+    )
+    self.sheet_tab_cache_size = sheet_tab_cache_size or int(os.getenv("CONVERSATION_SHEET_TAB_CACHE", "1024"))
+    self.history_page_size = history_page_size or int(os.getenv("CONVERSATION_HISTORY_PAGE", "50"))
+    # Past this many pending rows, callers flush inline instead of growing the queue
+    self.max_pending = self.batch_size * 10
+
+    self._pending: List[Tuple[Optional[SheetTabKey], Dict[str, Any]]] = []
+    self._cond = threading.Condition()
+    self._flush_lock = threading.Lock()
+    self._sheet_tabs: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+    self._page_boundaries: "OrderedDict[str, str]" = OrderedDict()
+    self._last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+    self._writer: Optional[threading.Thread] = None
+    self._stopped = False
+
+    # Counters
+    self.flushed_rows = 0
+    self.failed_rows = 0
+    self.batches = 0
+
+    register_stats("conversation_logger", self)
+
     if self._client:
-      logger.info("ConversationLogger enabled with Supabase client")
+      logger.info("ConversationLogger enabled with Supabase REST client")
     else:
       logger.warning("ConversationLogger disabled: Supabase client not available")
 
+  def stats(self) -> Dict[str, int]:
+    with self._cond:
+      pending = len(self._pending)
+    return {
+      "pending_rows": pending,
+      "sheet_tabs": len(self._sheet_tabs),
+      "page_boundaries": len(self._page_boundaries),
+      "flushed_rows": self.flushed_rows,
+      "failed_rows": self.failed_rows,
+    }
+
   @property
   def enabled(self) -> bool:
     return self._client is not None
 
+  @traced("logger.load_messages", "logger")
   def load_messages(self, session_id: str) -> List[ChatMessage]:
     """
-    Load all messages for a given session from Supabase, ordered by creation time.
+    Load the most recent page of a session's messages, oldest first.
+
+    At most `history_page_size` messages are read, with metadata projected
+    to its small fields: tool payloads are not selected (offloaded ones keep
+    their payloadRef). Older messages are paged in with `load_messages_before`.
 
     Returns an empty list if Supabase is not configured or if the session has no messages.
     """
+    return self._load_page(session_id, None)
+
+  def load_messages_before(self, session_id: str, before_id: str) -> List[ChatMessage]:
+    """The page of messages preceding message `before_id`, oldest first."""
+    return self._load_page(session_id, before_id)
+
+  def _load_page(self, session_id: str, before_id: Optional[str]) -> List[ChatMessage]:
     if not self._client:
       logger.debug("Cannot load messages: Supabase client not available")
       return []
 
+    # Queued rows of this session must be visible to the select below
+    self.flush()
+
     try:
+      filters = {"session_id": eq(session_id)}
+      if before_id is not None:
+        boundary = self._page_boundaries.get(before_id) or self._created_at(before_id)
+        if boundary is None:
+          return []
+        filters["created_at"] = lt(boundary)
+
       logger.debug(f"Loading messages from Supabase for session {session_id}")
-      result = (
-        self._client.table("conversation_messages")
-        .select("*")
-        .eq("session_id", session_id)
-        .order("created_at", desc=False)
-        .execute()
+      data = self._client.select_sync(
+        "conversation_messages",
+        _HISTORY_COLUMNS,
+        filters,
+        order="created_at.desc",
+        limit=self.history_page_size,
       )
-
-      data = getattr(result, "data", None)
       if not isinstance(data, list):
         logger.warning(f"Unexpected response format when loading messages for session {session_id}")
         return []
 
       messages: List[ChatMessage] = []
-      for row in data:
+      for row in reversed(data):
         try:
-          # Parse metadata if present
+          # Rebuild metadata from the projected fields
+          fields = {key: row.get(column) for column, key in _METADATA_COLUMNS.items()}
           metadata = None
-          if row.get("metadata"):
-            metadata = ChatMessageMetadata(**row["metadata"])
+          if any(value is not None for value in fields.values()):
+            metadata = ChatMessageMetadata(**fields)
 
           # Create ChatMessage from database row
           message = ChatMessage(
@@ -77,6 +180,13 @@ class ConversationLogger:
           )
           continue
 
+      if data:
+        # Remember where this page starts so the next older page needs one request
+        oldest = data[-1]
+        self._page_boundaries[oldest["message_id"]] = oldest["created_at"]
+        while len(self._page_boundaries) > self.sheet_tab_cache_size:
+          self._page_boundaries.popitem(last=False)
+
       logger.info(f"Loaded {len(messages)} message(s) from Supabase for session {session_id}")
       return messages
 
@@ -87,6 +197,11 @@ class ConversationLogger:
       )
       return []
 
+  def _created_at(self, message_id: str) -> Optional[str]:
+    data = self._client.select_sync("conversation_messages", "created_at", {"message_id": eq(message_id)}, limit=1)
+    return data[0]["created_at"] if data else None
+
+  @traced("logger.log_messages", "logger")
   def log_messages(
     self,
     session_id: str,
@@ -94,56 +209,132 @@ class ConversationLogger:
     sheet_context: Optional[SheetContext] = None,
   ) -> None:
     """
-    Persist a batch of messages for a given session.
+    Queue a batch of messages for a given session.
 
     Each ChatMessage becomes a row in the conversation_messages table with a
-    simple, flat structure.
+    simple, flat structure. created_at is set here, so rows keep their order
+    even though a batch is inserted in one statement.
     """
-    if not self._client:
+    if not self._client or self._stopped:
       return
 
-    sheet_tab_id = self._get_or_create_sheet_tab(sheet_context) if sheet_context else None
-
-    rows: List[dict] = []
-    for msg in messages:
-      rows.append(
-        {
-          "session_id": session_id,
-          "message_id": msg.id,
-          "role": msg.role.value,
-          "content": msg.content,
-          "metadata": msg.metadata.model_dump(exclude_none=True)
-          if msg.metadata is not None
-          else None,
-          "sheet_tab_id": sheet_tab_id,
-        }
-      )
+    tab_key = self._sheet_tab_key(sheet_context) if sheet_context else None
 
-    if not rows:
-      logger.debug("No messages to log")
+    with self._cond:
+      for msg in messages:
+        self._pending.append(
+          (
+            tab_key,
+            {
+              "session_id": session_id,
+              "message_id": msg.id,
+              "role": msg.role.value,
+              "content": msg.content,
+              "metadata": msg.metadata.model_dump(exclude_none=True)
+              if msg.metadata is not None
+              else None,
+              "created_at": self._next_timestamp(),
+            },
+          )
+        )
+      pending = len(self._pending)
+      if pending >= self.batch_size:
+        self._cond.notify()
+
+    if pending >= self.max_pending:
+      # The writer is falling behind; apply backpressure
+      self.flush()
+    else:
+      self._ensure_writer()
+
+  def flush(self) -> None:
+    """Insert every queued row now."""
+    if not self._client:
       return
 
-    try:
-      logger.debug(f"Logging {len(rows)} message(s) to Supabase for session {session_id}")
-      self._client.table("conversation_messages").insert(rows).execute()
-      logger.debug(f"Successfully logged {len(rows)} message(s)")
-    except Exception as e:
-      # Persistence failures should not break the chat experience.
-      logger.warning(
+    # One flusher at a time, so batches reach Supabase in queue order
+    with self._flush_lock:
+      with self._cond:
+        batch, self._pending = self._pending, []
+      if not batch:
+        return
+
+      unwritten = self._write_payloads()
+      tab_ids = self._resolve_sheet_tabs({key for key, _ in batch if key is not None})
+      rows = []
+      for key, row in batch:
+        rows.append({**row, "sheet_tab_id": tab_ids.get(key[:2]) if key is not None else None})
+        ref = (row["metadata"] or {}).get("payloadRef")
+        if ref is not None and ref["hash"] in unwritten:
+          metadata = {k: v for k, v in row["metadata"].items() if k != "payloadRef"}
+          rows[-1]["metadata"] = {**metadata, "payload": json.loads(unwritten[ref["hash"]])}
+
+      try:
+        logger.debug(f"Logging {len(rows)} message(s) to Supabase")
+        # Upsert on message_id so a replayed batch does not fail on duplicates
+        self._client.insert_sync("conversation_messages", rows, merge_duplicates=True, on_conflict="message_id")
+        self.flushed_rows += len(rows)
+        self.batches += 1
+        logger.debug(f"Successfully logged {len(rows)} message(s)")
+      except Exception as e:
+        # Persistence failures should not break the chat experience.
+        self.failed_rows += len(rows)
+        logger.warning(
           f"Failed to persist {len(rows)} message(s) to Supabase: {str(e)}",
-          extra={"session_id": session_id, "message_count": len(rows)}
-      )
-      return
+          extra={"message_count": len(rows), "session_ids": sorted({row["session_id"] for row in rows})},
+        )
+
+  def _write_payloads(self) -> Dict[str, bytes]:
+    """Store deferred payload blobs; returns the encoded payloads that could not be, by hash."""
+    payloads = self._payloads if self._payloads is not None else get_payload_store()
+    if not payloads.defer_writes:
+      return {}
+    return payloads.write_pending()
+
+  def close(self, timeout: float = 10.0) -> None:
+    """Stop the writer thread and flush whatever is still queued."""
+    with self._cond:
+      self._stopped = True
+      self._cond.notify()
+      writer = self._writer
+    if writer is not None and writer is not threading.current_thread():
+      writer.join(timeout=timeout)
+    self.flush()
+
+  def _ensure_writer(self) -> None:
+    with self._cond:
+      if self._writer is not None or self._stopped:
+        return
+      self._writer = threading.Thread(target=self._run, name="conversation-logger", daemon=True)
+      self._writer.start()
+    atexit.register(self.close)
+
+  def _run(self) -> None:
+    while True:
+      with self._cond:
+        self._cond.wait_for(
+          lambda: self._stopped or len(self._pending) >= self.batch_size,
+          timeout=self.flush_interval,
+        )
+        stopped = self._stopped
+      self.flush()
+      if stopped:
+        return
+
+  def _next_timestamp(self) -> str:
+    # Strictly increasing, so rows queued in the same microsecond keep their order
+    now = datetime.now(timezone.utc)
+    if now <= self._last_timestamp:
+      now = self._last_timestamp + timedelta(microseconds=1)
+    self._last_timestamp = now
+    return now.isoformat()
 
-  def _get_or_create_sheet_tab(self, ctx: SheetContext) -> Optional[str]:
+  def _sheet_tab_key(self, ctx: SheetContext) -> Optional[SheetTabKey]:
     """
-    Ensure there is a sheet_tabs row for the given SheetContext and return its id.
+    The sheet_tabs row a SheetContext maps to.
 
     If spreadsheetId or sheetTitle is missing, no relation is stored.
     """
-    if not self._client:
-      return None
-
     spreadsheet_raw = ctx.spreadsheetId or ""
     sheet_title = ctx.sheetTitle or ""
     if not spreadsheet_raw or not sheet_title:
@@ -157,40 +348,54 @@ class ConversationLogger:
       spreadsheet_url = spreadsheet_raw
     else:
       spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
+    return spreadsheet_id, sheet_title, spreadsheet_url
 
-    try:
-      # Look up existing tab first
-      existing = (
-        self._client.table("sheet_tabs")
-        .select("id")
-        .eq("spreadsheet_id", spreadsheet_id)
-        .eq("sheet_title", sheet_title)
-        .limit(1)
-        .execute()
-      )
-      data = getattr(existing, "data", None)
-      if isinstance(data, list) and data:
-        return data[0].get("id")
-
-      # Insert new row
-      created = (
-        self._client.table("sheet_tabs")
-        .insert(
-          {
-            "spreadsheet_id": spreadsheet_id,
-            "spreadsheet_url": spreadsheet_url,
-            "sheet_title": sheet_title,
-          }
+  def _resolve_sheet_tabs(self, keys: Iterable[SheetTabKey]) -> Dict[Tuple[str, str], str]:
+    """
+    sheet_tabs ids for the given tabs, from the LRU or one upsert for the misses.
+
+    Tabs whose id cannot be resolved are left out (messages are then stored
+    without a sheet_tab_id).
+    """
+    ids: Dict[Tuple[str, str], str] = {}
+    missing: Dict[Tuple[str, str], str] = {}
+    for spreadsheet_id, sheet_title, spreadsheet_url in keys:
+      cached = self._sheet_tabs.get((spreadsheet_id, sheet_title))
+      if cached is not None:
+        self._sheet_tabs.move_to_end((spreadsheet_id, sheet_title))
+        ids[(spreadsheet_id, sheet_title)] = cached
+      else:
+        missing[(spreadsheet_id, sheet_title)] = spreadsheet_url
+
+    if missing and self._client:
+      try:
+        data = self._client.insert_sync(
+          "sheet_tabs",
+          [
+            {
+              "spreadsheet_id": spreadsheet_id,
+              "spreadsheet_url": spreadsheet_url,
+              "sheet_title": sheet_title,
+            }
+            for (spreadsheet_id, sheet_title), spreadsheet_url in missing.items()
+          ],
+          merge_duplicates=True,
+          on_conflict="spreadsheet_id,sheet_title",
+          returning=True,
         )
-        .execute()
-      )
-      cdata = getattr(created, "data", None)
-      if isinstance(cdata, list) and cdata:
-        return cdata[0].get("id")
-    except Exception:
-      return None
+      except Exception as e:
+        logger.warning(f"Failed to upsert {len(missing)} sheet tab(s): {str(e)}")
+        data = []
+
+      for row in data:
+        key = (row.get("spreadsheet_id"), row.get("sheet_title"))
+        if key in missing and row.get("id"):
+          ids[key] = row["id"]
+          self._sheet_tabs[key] = row["id"]
+      while len(self._sheet_tabs) > self.sheet_tab_cache_size:
+        self._sheet_tabs.popitem(last=False)
 
-    return None
+    return ids
 
   @staticmethod
   def _extract_spreadsheet_id(value: str) -> Optional[str]:
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .sheets_emulator import EmulatedService, Latency
+
+
+# --- OpenRouter ---
+
+Responder = Callable[[List[Dict[str, Any]]], Any]
+
+
+class FakeLLM(EmulatedService):
+  """
+  In-process OpenRouter chat completions endpoint. `responder` maps the
+  request's messages to the reply content; non-string replies are sent as
+  JSON. Usage is estimated at four characters per token. Pass transport()
+  to LLMClient.
+  """
+
+  def __init__(self, responder: Responder, latency: Optional[Latency] = None) -> None:
+    super().__init__(latency)
+    self.responder = responder
+
+  def transport(self) -> httpx.MockTransport:
+    return httpx.MockTransport(self._handle)
+
+  def _handle(self, request: httpx.Request) -> httpx.Response:
+    self.latency.sleep()
+    started = time.perf_counter()
+    body = json.loads(request.content)
+    messages = body.get("messages") or []
+    content = self.responder(messages)
+    if not isinstance(content, str):
+      content = json.dumps(content)
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+    data = {
+      "id": "fake-completion",
+      "model": body.get("model"),
+      "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+      "usage": {
+        "prompt_tokens": prompt_chars // 4,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": prompt_chars // 4 + len(content) // 4,
+      },
+    }
+    self._count("chat.completions", started)
+    return httpx.Response(200, json=data)
+
+
+# --- conversation logging ---
+
+
+class DisabledConversationLogger:
+  """
+  Stand-in for ConversationLogger that logs and loads nothing, whatever
+  Supabase settings are in the environment. Pass it to
+  ChatService(conversation_logger=...).
+  """
+
+  enabled = False
+  history_page_size = 50
+
+  def log_messages(self, *args: Any, **kwargs: Any) -> None:
+    pass
+
+  def load_messages(self, session_id: str) -> List[Any]:
+    return []
+
+  def load_messages_before(self, session_id: str, before_id: str) -> List[Any]:
+    return []
+
+  def flush(self) -> None:
+    pass
+
+  def close(self, timeout: float = 10.0) -> None:
+    pass
+
+
+# --- Supabase (PostgREST) ---
+
+
+def _pg_compare(stored: Any, literal: str) -> Tuple[Any, Any]:
+  if isinstance(stored, (int, float)) and not isinstance(stored, bool):
+    try:
+      return stored, float(literal)
+    except ValueError:
+      pass
+  return str(stored), literal
+
+
+def _pg_match(row: Dict[str, Any], column: str, condition: str) -> bool:
+  operator, _, literal = condition.partition(".")
+  value = row.get(column)
+  if operator == "is":
+    return value is None if literal == "null" else str(value).lower() == literal
+  if value is None:
+    return False
+  if operator == "in":
+    return str(value) in literal.strip("()").split(",")
+  stored, expected = _pg_compare(value, literal)
+  if operator == "eq":
+    return stored == expected
+  if operator == "neq":
+    return stored != expected
+  if operator == "gt":
+    return stored > expected
+  if operator == "gte":
+    return stored >= expected
+  if operator == "lt":
+    return stored < expected
+  if operator == "lte":
+    return stored <= expected
+  raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+class FakeSupabase(EmulatedService):
+  """
+  In-process PostgREST endpoint with in-memory tables, for
+  SupabaseRestClient(transport=...). Supports select with eq/neq/gt/lt/in/is
+  filters, order and limit, inserts (ids and created_at are assigned),
+  upserts on `on_conflict`, deletes, and RPCs registered in `functions`
+  (unknown ones return null).
+  """
+
+  def __init__(self, latency: Optional[Latency] = None) -> None:
+    super().__init__(latency)
+    self.tables: Dict[str, List[Dict[str, Any]]] = {}
+    self.functions: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+
+  def transport(self) -> httpx.MockTransport:
+    return httpx.MockTransport(self._handle)
+
+  async def _handle(self, request: httpx.Request) -> httpx.Response:
+    await self.latency.asleep()
+    started = time.perf_counter()
+    table = request.url.path.split("/rest/v1/", 1)[1]
+    params = dict(request.url.params)
+    with self._lock:
+      if table.startswith("rpc/"):
+        function = self.functions.get(table[len("rpc/"):])
+        result = function(json.loads(request.content or b"{}")) if function else None
+        response = httpx.Response(200, json=result)
+      elif request.method == "GET":
+        response = httpx.Response(200, json=self._select(table, params))
+      elif request.method == "POST":
+        rows = self._insert(table, json.loads(request.content), params.get("on_conflict"))
+        returning = "return=representation" in request.headers.get("Prefer", "")
+        response = httpx.Response(201, json=rows) if returning else httpx.Response(201)
+      elif request.method == "DELETE":
+        self._delete(table, params)
+        response = httpx.Response(204)
+      else:
+        response = httpx.Response(405)
+    self._count(f"{request.method} {table}", started)
+    return response
+
+  def _filtered(self, table: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    conditions = [(column, value) for column, value in params.items() if column not in ("select", "order", "limit", "on_conflict")]
+    return [row for row in self.tables.get(table, []) if all(_pg_match(row, column, value) for column, value in conditions)]
+
+  def _select(self, table: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    rows = self._filtered(table, params)
+    for term in reversed((params.get("order") or "").split(",")):
+      if term:
+        column, _, direction = term.partition(".")
+        rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith("desc"))
+    if "limit" in params:
+      rows = rows[: int(params["limit"])]
+    columns = params.get("select", "*")
+    if columns != "*":
+      names = columns.split(",")
+      rows = [{name: row.get(name) for name in names} for row in rows]
+    return rows
+
+  def _insert(self, table: str, rows: List[Dict[str, Any]], on_conflict: Optional[str]) -> List[Dict[str, Any]]:
+    stored = self.tables.setdefault(table, [])
+    keys = on_conflict.split(",") if on_conflict else None
+    index = {tuple(row.get(key) for key in keys): row for row in stored} if keys else {}
+    inserted = []
+    for row in rows:
+      existing = index.get(tuple(row.get(key) for key in keys)) if keys else None
+      if existing is not None:
+        existing.update(row)
+        inserted.append(existing)
+        continue
+      row = {"id": next(self._ids), "created_at": _timestamp(), **row}
+      stored.append(row)
+      if keys:
+        index[tuple(row.get(key) for key in keys)] = row
+      inserted.append(row)
+    return inserted
+
+  def _delete(self, table: str, params: Dict[str, str]) -> None:
+    doomed = {id(row) for row in self._filtered(table, params)}
+    self.tables[table] = [row for row in self.tables.get(table, []) if id(row) not in doomed]
+
+
+def _timestamp() -> str:
+  return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + f".{time.time_ns() % 1_000_000_000 // 1000:06d}+00:00"
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .history_render import FRAGMENT_SEPARATOR, RenderFn
+from .llm import PROMPTS, LLMClient
+from .logging_config import get_logger
+from .models import ChatMessage, ChatMessageRole
+
+logger = get_logger(__name__)
+
+# Rough characters per token, used to hold summaries to their budget
+_CHARS_PER_TOKEN = 4
+
+
+class _Summary:
+  __slots__ = ("covered", "last_id", "text")
+
+  def __init__(self, covered: int, last_id: str, text: str) -> None:
+    self.covered = covered
+    self.last_id = last_id
+    self.text = text
+
+
+def _turn_starts(messages: Sequence[ChatMessage], start: int) -> List[int]:
+  """Indices (from `start`) where a turn begins, i.e. where a user message is."""
+  return [i for i in range(start, len(messages)) if messages[i].role == ChatMessageRole.user]
+
+
+class HistoryCompactor:
+  """
+  Keep the AGENT prompt roughly constant in size for long sessions.
+
+  The last `keep_turns` turns (a turn starts at each user message) are sent
+  verbatim; everything older is replaced by a running summary. Summaries are
+  produced off the request path: after each response, once more than
+  `keep_turns + fold_turns` turns are unsummarized, a background job folds
+  the older ones into the summary with one LLM call capped at
+  `max_summary_tokens`. Until that job finishes the prompt simply carries a
+  few extra verbatim turns, so nothing is ever dropped.
+
+  Defaults come from CHAT_HISTORY_KEEP_TURNS (6), CHAT_HISTORY_FOLD_TURNS (4)
+  and CHAT_SUMMARY_MAX_TOKENS (800); CHAT_HISTORY_COMPACTION=0 disables it.
+  """
+
+  def __init__(
+    self,
+    llm_client: LLMClient,
+    render_fn: RenderFn,
+    keep_turns: Optional[int] = None,
+    fold_turns: Optional[int] = None,
+    max_summary_tokens: Optional[int] = None,
+    max_sessions: int = 256,
+    enabled: Optional[bool] = None,
+  ) -> None:
+    self._llm_client = llm_client
+    self._render_fn = render_fn
+    self.keep_turns = keep_turns if keep_turns is not None else int(os.getenv("CHAT_HISTORY_KEEP_TURNS", "6"))
+    self.fold_turns = max(1, fold_turns if fold_turns is not None else int(os.getenv("CHAT_HISTORY_FOLD_TURNS", "4")))
+    self.max_summary_tokens = (
+      max_summary_tokens if max_summary_tokens is not None else int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "800"))
+    )
+    self.enabled = enabled if enabled is not None else os.getenv("CHAT_HISTORY_COMPACTION", "1") != "0"
+    self.max_sessions = max_sessions
+
+    self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+    self._pending: Dict[str, Future] = {}
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+  # --- prompt side ---
+
+  def compact(
+    self,
+    session_id: Optional[str],
+    messages: Sequence[ChatMessage],
+  ) -> Tuple[Optional[str], Sequence[ChatMessage]]:
+    """Return (summary, messages to send verbatim) for this turn."""
+    if not self.enabled or session_id is None:
+      return None, messages
+
+    with self._lock:
+      summary = self._summaries.get(session_id)
+      if summary is not None:
+        self._summaries.move_to_end(session_id)
+
+    # The summary only applies while the history still starts with what it covered
+    if (
+      summary is None
+      or summary.covered > len(messages)
+      or messages[summary.covered - 1].id != summary.last_id
+    ):
+      return None, messages
+    return summary.text, messages[summary.covered:]
+
+  # --- background folding ---
+
+  def schedule(
+    self,
+    session_id: Optional[str],
+    messages: Sequence[ChatMessage],
+    new_messages: Sequence[ChatMessage] = (),
+  ) -> Optional[Future]:
+    """After a response, fold old turns into the summary if enough have piled up."""
+    if not self.enabled or session_id is None:
+      return None
+
+    history = list(messages) + list(new_messages)
+    with self._lock:
+      if session_id in self._pending:
+        return None
+      summary = self._summaries.get(session_id)
+
+    covered = 0
+    previous_text: Optional[str] = None
+    if summary is not None and summary.covered <= len(history) and history[summary.covered - 1].id == summary.last_id:
+      covered = summary.covered
+      previous_text = summary.text
+
+    starts = _turn_starts(history, covered)
+    if len(starts) <= self.keep_turns + self.fold_turns:
+      return None
+    fold_end = starts[len(starts) - self.keep_turns] if self.keep_turns else len(history)
+
+    with self._lock:
+      if session_id in self._pending:
+        return None
+      future = self._executor.submit(
+        self._fold, session_id, previous_text, history[covered:fold_end], fold_end, history[fold_end - 1].id
+      )
+      self._pending[session_id] = future
+    return future
+
+  def _fold(
+    self,
+    session_id: str,
+    previous_text: Optional[str],
+    folded: List[ChatMessage],
+    covered: int,
+    last_id: str,
+  ) -> None:
+    try:
+      transcript = FRAGMENT_SEPARATOR.join(self._render_fn(message) for message in folded)
+      text = self._llm_client.chat_text(
+        [
+          {"role": "system", "content": PROMPTS.HISTORY_SUMMARY.system},
+          {"role": "user", "content": PROMPTS.HISTORY_SUMMARY.user(previous_text, transcript, self.max_summary_tokens)},
+        ],
+        overrides={"maxTokens": self.max_summary_tokens, "temperature": 0.2},
+      ).strip()
+      if not text:
+        raise ValueError("empty summary")
+
+      # Hold the summary to its budget even if the model overshoots
+      text = text[: self.max_summary_tokens * _CHARS_PER_TOKEN]
+
+      with self._lock:
+        self._summaries[session_id] = _Summary(covered, last_id, text)
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > self.max_sessions:
+          self._summaries.popitem(last=False)
+      logger.info(
+        f"Folded {len(folded)} message(s) into the summary for session {session_id}",
+        extra={"session_id": session_id, "covered": covered, "summary_chars": len(text)},
+      )
+    except Exception as exc:
+      # Leave the previous summary in place; the next response retries
+      logger.warning(f"History summarization failed for session {session_id}: {exc}")
+    finally:
+      with self._lock:
+        self._pending.pop(session_id, None)
+
+  def flush(self, timeout: Optional[float] = None) -> None:
+    """Wait for in-flight summaries (used by tests and shutdown)."""
+    with self._lock:
+      pending = list(self._pending.values())
+    wait(pending, timeout=timeout)
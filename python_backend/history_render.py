@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .memory_diagnostics import register_stats
+from .models import ChatMessage
+
+FRAGMENT_SEPARATOR = "\n\n"
+
+RenderFn = Callable[[ChatMessage], str]
+
+
+class _RenderedHistory:
+  __slots__ = ("ids", "fragments", "text")
+
+  def __init__(self, ids: List[str], fragments: List[str], text: str) -> None:
+    self.ids = ids
+    self.fragments = fragments
+    self.text = text
+
+
+class HistoryRenderCache:
+  """
+  Per-session cache of rendered chat-history fragments.
+
+  Each message is rendered once by `render_fn` and remembered by id. When a
+  session's history only grew since the last turn, the previous text is
+  reused and just the new fragments are appended, so the rendered prefix is
+  byte-identical from turn to turn. If the history diverges (e.g. a rolled
+  back turn), fragments up to the divergence are reused and the rest are
+  rendered again. A window whose start moved forward (older messages folded
+  into a summary) reuses the fragments it still shares. At most
+  `max_sessions` sessions are kept, in LRU order.
+  """
+
+  def __init__(self, render_fn: RenderFn, max_sessions: int = 256) -> None:
+    self._render_fn = render_fn
+    self.max_sessions = max_sessions
+    self._sessions: "OrderedDict[str, _RenderedHistory]" = OrderedDict()
+    self._lock = threading.Lock()
+
+    # Counters
+    self.rendered = 0
+    self.reused = 0
+
+    register_stats("history_render_cache", self)
+
+  def render(self, session_id: Optional[str], messages: Sequence[ChatMessage]) -> str:
+    if session_id is None:
+      self.rendered += len(messages)
+      return FRAGMENT_SEPARATOR.join(self._render_fn(message) for message in messages)
+
+    with self._lock:
+      cached = self._sessions.get(session_id)
+      if cached is not None:
+        self._sessions.move_to_end(session_id)
+
+    ids = [message.id for message in messages]
+    if cached is not None and ids and cached.ids and cached.ids[0] != ids[0]:
+      # The window start moved: keep what the new window still shares
+      try:
+        start = cached.ids.index(ids[0])
+      except ValueError:
+        cached = None
+      else:
+        kept = cached.fragments[start:]
+        cached = _RenderedHistory(cached.ids[start:], kept, FRAGMENT_SEPARATOR.join(kept))
+
+    common = 0
+    if cached is not None:
+      limit = min(len(cached.ids), len(ids))
+      while common < limit and cached.ids[common] == ids[common]:
+        common += 1
+
+    new_fragments = [self._render_fn(message) for message in messages[common:]]
+    self.rendered += len(new_fragments)
+    self.reused += common
+
+    if cached is not None and common == len(cached.ids):
+      # History only grew: extend the previous text
+      fragments = cached.fragments + new_fragments
+      if not new_fragments:
+        text = cached.text
+      elif cached.text:
+        text = cached.text + FRAGMENT_SEPARATOR + FRAGMENT_SEPARATOR.join(new_fragments)
+      else:
+        text = FRAGMENT_SEPARATOR.join(new_fragments)
+    else:
+      fragments = (cached.fragments[:common] if cached is not None else []) + new_fragments
+      text = FRAGMENT_SEPARATOR.join(fragments)
+
+    with self._lock:
+      self._sessions[session_id] = _RenderedHistory(ids, fragments, text)
+      self._sessions.move_to_end(session_id)
+      while len(self._sessions) > self.max_sessions:
+        self._sessions.popitem(last=False)
+
+    return text
+
+  def forget(self, session_id: str) -> None:
+    with self._lock:
+      self._sessions.pop(session_id, None)
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+        "sessions": len(self._sessions),
+        "rendered_chars": sum(len(entry.text) for entry in self._sessions.values()),
+        "rendered": self.rendered,
+        "reused": self.reused,
+      }
@@ -8,7 +8,11 @@ from typing import Any, Dict, List, Optional
 
 import httpx
 
+from .call_budget import record_llm_call
+from .cassette import get_cassette
 from .logging_config import get_logger
+from .metrics import LLM_DURATION, LLM_REQUESTS, LLM_TOKENS, LLM_TOKENS_PER_CALL, LLM_TTFB
+from .tracing import span
 
 logger = get_logger(__name__)
 
@@ -27,6 +31,7 @@ class LLMClient:
     temperature: float = 0.7,
     max_tokens: int = 4000,
     headers: Optional[Dict[str, str]] = None,
+    transport: Optional[httpx.BaseTransport] = None,
   ) -> None:
     self.api_key = api_key
     self.model = model
@@ -34,6 +39,12 @@ class LLMClient:
     self.temperature = temperature
     self.max_tokens = max_tokens
     self.headers = headers or {}
+    # With CASSETTE_MODE set, calls are recorded to or replayed from a cassette
+    cassette = get_cassette() if transport is None else None
+    if cassette is not None:
+      transport = cassette.llm_transport()
+    # A custom transport (e.g. an in-process fake) gets its own client
+    self._http = httpx.Client(transport=transport) if transport is not None else None
 
   def _build_headers(self) -> Dict[str, str]:
     base = {
@@ -70,39 +81,62 @@ class LLMClient:
         extra={"model": model, "message_count": len(messages), "max_tokens": max_tokens}
     )
 
-    start_time = time.time()
-    try:
-      response = httpx.post(url, headers=self._build_headers(), json=payload, timeout=60.0)
-      response.raise_for_status()
-      duration_ms = int((time.time() - start_time) * 1000)
-
-      logger.info(
-          f"LLM API success: {duration_ms}ms",
-          extra={"model": model, "duration_ms": duration_ms, "status_code": response.status_code}
-      )
-    except httpx.RequestError as exc:
-      duration_ms = int((time.time() - start_time) * 1000)
-      logger.error(
-          f"LLM API request failed after {duration_ms}ms: {str(exc)}",
-          exc_info=True,
-          extra={"model": model, "duration_ms": duration_ms}
-      )
-      raise RuntimeError(f"LLM API request failed: {exc}") from exc
-    except httpx.HTTPStatusError as exc:
-      duration_ms = int((time.time() - start_time) * 1000)
-      logger.error(
-          f"LLM API error {exc.response.status_code} after {duration_ms}ms",
-          exc_info=True,
-          extra={
-              "model": model,
-              "status_code": exc.response.status_code,
-              "duration_ms": duration_ms,
-              "response_body": exc.response.text[:500]  # Truncate long responses
-          }
-      )
-      raise RuntimeError(f"LLM API returned error {exc.response.status_code}: {exc.response.text}") from exc
+    with span("llm.chat", "llm", model=model, messages=len(messages)) as llm_span:
+      start_time = time.time()
+      started = time.perf_counter()
+      try:
+        # Stream so the time to response headers can be told apart from generation time
+        stream = self._http.stream if self._http is not None else httpx.stream
+        with stream("POST", url, headers=self._build_headers(), json=payload, timeout=60.0) as response:
+          ttfb = time.perf_counter() - started
+          LLM_TTFB.observe(ttfb, model)
+          response.read()
+        LLM_DURATION.observe(time.perf_counter() - started, model)
+        response.raise_for_status()
+        duration_ms = int((time.time() - start_time) * 1000)
+        LLM_REQUESTS.inc(model, "ok")
 
-    return response.json()
+        logger.info(
+            f"LLM API success: {duration_ms}ms",
+            extra={"model": model, "duration_ms": duration_ms, "status_code": response.status_code}
+        )
+      except httpx.RequestError as exc:
+        duration_ms = int((time.time() - start_time) * 1000)
+        LLM_REQUESTS.inc(model, "transport_error")
+        record_llm_call(0, 0)
+        logger.error(
+            f"LLM API request failed after {duration_ms}ms: {str(exc)}",
+            exc_info=True,
+            extra={"model": model, "duration_ms": duration_ms}
+        )
+        raise RuntimeError(f"LLM API request failed: {exc}") from exc
+      except httpx.HTTPStatusError as exc:
+        duration_ms = int((time.time() - start_time) * 1000)
+        LLM_REQUESTS.inc(model, f"http_{exc.response.status_code}")
+        record_llm_call(0, 0)
+        logger.error(
+            f"LLM API error {exc.response.status_code} after {duration_ms}ms",
+            exc_info=True,
+            extra={
+                "model": model,
+                "status_code": exc.response.status_code,
+                "duration_ms": duration_ms,
+                "response_body": exc.response.text[:500]  # Truncate long responses
+            }
+        )
+        raise RuntimeError(f"LLM API returned error {exc.response.status_code}: {exc.response.text}") from exc
+
+      data = response.json()
+      usage = data.get("usage") or {}
+      if llm_span is not None:
+        llm_span.args.update(ttfb_ms=int(ttfb * 1000), usage=usage)
+      for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if isinstance(tokens, (int, float)):
+          LLM_TOKENS.inc(model, kind, amount=tokens)
+          LLM_TOKENS_PER_CALL.observe(tokens, model, kind)
+      record_llm_call(int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0))
+      return data
 
   def chat_text(
     self,
@@ -361,7 +395,11 @@ def create_llm_client() -> LLMClient:
 
   api_key = os.getenv("OPENROUTER_API_KEY")
   if not api_key:
-    raise RuntimeError("OPENROUTER_API_KEY environment variable not set")
+    # Replayed calls never reach OpenRouter
+    cassette = get_cassette()
+    if cassette is None or not cassette.replaying:
+      raise RuntimeError("OPENROUTER_API_KEY environment variable not set")
+    api_key = "replay"
 
   model = os.getenv("DEFAULT_LLM_MODEL", "anthropic/claude-haiku-4.5")
 
@@ -601,7 +639,8 @@ class PROMPTS:
       '      "sheetTitle"?: "string",\n'
       '      "range"?: "A1:C10"  // optional, defaults to entire sheet if omitted\n\n'
       '      // For visualize_formulas (color-code formulas vs values):\n'
-      '      "spreadsheetId"?: "string"  // The spreadsheet URL or ID to visualize\n'
+      '      "spreadsheetId"?: "string",  // The spreadsheet URL or ID to visualize\n'
+      '      "mode"?: "cells" | "conditional"  // "conditional" uses conditional formatting rules; prefer it for large sheets\n'
       "    }\n"
       "  }\n"
       "}\n\n"
@@ -651,13 +690,35 @@ class PROMPTS:
     )
 
     @staticmethod
-    def user(chat_history: str, sheet_context: Optional[str] = None) -> str:
-      prompt = "# Conversation History\n\n" + chat_history
+    def user(chat_history: str, sheet_context: Optional[str] = None, summary: Optional[str] = None) -> str:
+      prompt = ""
+      if summary:
+        prompt += "# Summary of Earlier Conversation\n\n" + summary + "\n\n"
+      prompt += "# Conversation History\n\n" + chat_history
       if sheet_context:
         prompt += "\n\n# Current Sheet Context\n\n" + sheet_context
       prompt += "\n\nRespond with JSON only following the format specified in your system prompt."
       return prompt
 
+  class HISTORY_SUMMARY:
+    system: str = (
+      "You maintain a running summary of a conversation between a user and Sheet Mangler, an assistant that "
+      "reads and edits Google Sheets. You receive the current summary (possibly empty) and the next part of the "
+      "conversation. Return an updated summary that replaces the current one.\n\n"
+      "Keep: the user's goals and preferences, spreadsheet and sheet names, ranges and cells that were read or "
+      "changed, formulas and values that matter for later turns, issues found and whether they were fixed, "
+      "snapshot ids for undo, and open questions.\n"
+      "Drop: greetings, repeated explanations, and raw sheet data beyond what later turns depend on.\n\n"
+      "Write plain text, most important facts first. No preamble."
+    )
+
+    @staticmethod
+    def user(previous_summary: Optional[str], transcript: str, max_tokens: int) -> str:
+      prompt = "# Current Summary\n\n" + (previous_summary or "(none yet)")
+      prompt += "\n\n# Next Part of the Conversation\n\n" + transcript
+      prompt += f"\n\nReturn the updated summary in at most {max_tokens} tokens."
+      return prompt
+
 
 def format_sheet_context(context: Any) -> str:
   """
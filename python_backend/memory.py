@@ -1,33 +1,360 @@
 from __future__ import annotations
 
+import os
 import threading
-from typing import Dict, List
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Optional, Sequence, overload
 
+from .logging_config import get_logger
+from .memory_diagnostics import register_stats
 from .models import ChatMessage
 
+logger = get_logger(__name__)
 
-class ConversationStore:
+HistoryLoader = Callable[[str], List[ChatMessage]]
+# (session_id, id of the oldest resident message) -> the page before it
+OlderHistoryLoader = Callable[[str, str], List[ChatMessage]]
+MessagePreparer = Callable[[ChatMessage], ChatMessage]
+
+# Rough per-message cost of the model object itself, on top of its JSON size
+_MESSAGE_OVERHEAD_BYTES = 400
+
+
+def _message_size(message: ChatMessage) -> int:
+  """Approximate resident size of a message, dominated by tool payloads."""
+  return len(message.model_dump_json()) + _MESSAGE_OVERHEAD_BYTES
+
+
+def _env_number(name: str, default: float) -> Optional[float]:
+  value = float(os.getenv(name, str(default)))
+  return value if value > 0 else None
+
+
+class HistoryView(Sequence[ChatMessage]):
   """
-  Simple in-memory conversation store keyed by sessionId.
+  Read-only view of the first `len(view)` messages of a SessionLog.
 
-  This is process-local and intended for development and CLI use.
+  A log's list only ever grows at the end (removing messages builds a new
+  log), so a view taken earlier keeps showing the same messages without
+  copying them.
   """
 
+  __slots__ = ("_messages", "_length")
+
+  def __init__(self, messages: List[ChatMessage], length: int) -> None:
+    self._messages = messages
+    self._length = length
+
+  def __len__(self) -> int:
+    return self._length
+
+  @overload
+  def __getitem__(self, index: int) -> ChatMessage: ...
+
+  @overload
+  def __getitem__(self, index: slice) -> List[ChatMessage]: ...
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self._messages[i] for i in range(*index.indices(self._length))]
+    if index < 0:
+      index += self._length
+    if not 0 <= index < self._length:
+      raise IndexError("history index out of range")
+    return self._messages[index]
+
+  def __iter__(self) -> Iterator[ChatMessage]:
+    return islice(self._messages, self._length)
+
+  def __repr__(self) -> str:
+    return f"HistoryView({self._length} messages)"
+
+
+class SessionLog:
+  """
+  Append-only message history for one session.
+
+  Message ids are indexed as they are appended, so dedupe costs O(1) per
+  message and an append costs O(new messages). Readers get HistoryView
+  snapshots instead of list copies.
+  """
+
+  __slots__ = ("_messages", "_sizes", "_index", "bytes")
+
+  def __init__(self, messages: Iterable[ChatMessage] = ()) -> None:
+    self._messages: List[ChatMessage] = []
+    self._sizes: List[int] = []
+    self._index: Dict[str, int] = {}
+    self.bytes = 0
+    self.append(messages)
+
+  def __len__(self) -> int:
+    return len(self._messages)
+
+  def __contains__(self, message_id: object) -> bool:
+    return message_id in self._index
+
+  def append(self, messages: Iterable[ChatMessage]) -> List[ChatMessage]:
+    """Append messages whose ids are not in the log yet. Returns the ones added."""
+    added: List[ChatMessage] = []
+    for message in messages:
+      if message.id in self._index:
+        continue
+      size = _message_size(message)
+      self._index[message.id] = len(self._messages)
+      self._messages.append(message)
+      self._sizes.append(size)
+      self.bytes += size
+      added.append(message)
+    return added
+
+  def without(self, message_ids: Collection[str]) -> "SessionLog":
+    """
+    A copy of the log minus the given messages (used to roll back a failed turn).
+
+    The list is copied rather than shrunk in place, since views of this log
+    may still be reading it.
+    """
+    log = SessionLog()
+    for message, size in zip(self._messages, self._sizes):
+      if message.id in message_ids:
+        continue
+      log._index[message.id] = len(log._messages)
+      log._messages.append(message)
+      log._sizes.append(size)
+      log.bytes += size
+    return log
+
+  def view(self) -> HistoryView:
+    return HistoryView(self._messages, len(self._messages))
+
+
+class _Session:
+  __slots__ = ("log", "last_access", "has_older")
+
   def __init__(self) -> None:
-    self._sessions: Dict[str, List[ChatMessage]] = {}
+    self.log = SessionLog()
+    self.last_access = time.monotonic()
+    # Whether the loader may have left older messages behind
+    self.has_older = False
+
+
+class ConversationStore:
+  """
+  In-memory conversation store keyed by sessionId, bounded for long-running workers.
+
+  Sessions are kept in LRU order and evicted when there are more than
+  `max_sessions`, when their approximate total size (JSON size of every
+  message, tool payloads included) exceeds `max_bytes`, or after `idle_ttl`
+  seconds without access. The session being written is never evicted to make
+  room for itself.
+
+  An evicted session is not lost if a `loader` is set: the next read calls
+  `loader(session_id)` (normally `ConversationLogger.load_messages`) and
+  caches the result again. Limits default to the CONVERSATION_MAX_SESSIONS,
+  CONVERSATION_MAX_BYTES and CONVERSATION_IDLE_TTL environment variables;
+  0 disables a limit.
+
+  The loader may return only the most recent page of a session. With an
+  `older_loader`, `load_older()` pages earlier messages in front of it.
+
+  If `prepare` is set, each message is passed through it once, the first
+  time it is appended, and the returned message is what the store keeps
+  (ChatService uses this to move large tool payloads to the blob store).
+  """
+
+  def __init__(
+    self,
+    max_sessions: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    idle_ttl: Optional[float] = None,
+    loader: Optional[HistoryLoader] = None,
+    prepare: Optional[MessagePreparer] = None,
+    older_loader: Optional[OlderHistoryLoader] = None,
+  ) -> None:
+    if max_sessions is None:
+      max_sessions = _env_number("CONVERSATION_MAX_SESSIONS", 1000)
+    if max_bytes is None:
+      max_bytes = _env_number("CONVERSATION_MAX_BYTES", 256 * 1024 * 1024)
+    if idle_ttl is None:
+      idle_ttl = _env_number("CONVERSATION_IDLE_TTL", 6 * 3600)
+
+    self.max_sessions = int(max_sessions) if max_sessions else None
+    self.max_bytes = int(max_bytes) if max_bytes else None
+    self.idle_ttl = idle_ttl or None
+    self.loader = loader
+    self.prepare = prepare
+    self.older_loader = older_loader
+
+    self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
     self._lock = threading.Lock()
 
-  def get_history(self, session_id: str) -> List[ChatMessage]:
+    # Counters
+    self.resident_bytes = 0
+    self.evictions = 0
+    self.expirations = 0
+    self.reloads = 0
+
+    register_stats("conversation_store", self)
+
+  # --- internal bookkeeping (lock held) ---
+
+  def _touch(self, session_id: str) -> Optional[_Session]:
+    session = self._sessions.get(session_id)
+    if session is not None:
+      session.last_access = time.monotonic()
+      self._sessions.move_to_end(session_id)
+    return session
+
+  def _remove(self, session_id: str) -> None:
+    session = self._sessions.pop(session_id)
+    self.resident_bytes -= session.log.bytes
+
+  def _expire_idle(self) -> None:
+    if self.idle_ttl is None:
+      return
+    cutoff = time.monotonic() - self.idle_ttl
+    # LRU order means idle sessions are at the front
+    while self._sessions:
+      session_id, session = next(iter(self._sessions.items()))
+      if session.last_access >= cutoff:
+        break
+      self._remove(session_id)
+      self.expirations += 1
+
+  def _enforce_limits(self, keep: str) -> None:
+    self._expire_idle()
+    while len(self._sessions) > 1:
+      over_count = self.max_sessions is not None and len(self._sessions) > self.max_sessions
+      over_bytes = self.max_bytes is not None and self.resident_bytes > self.max_bytes
+      if not (over_count or over_bytes):
+        break
+      victim = next(iter(self._sessions))
+      if victim == keep:
+        break
+      self._remove(victim)
+      self.evictions += 1
+      logger.debug(f"Evicted conversation {victim} from memory")
+
+  def _write(self, session_id: str, update: Callable[[SessionLog], Optional[SessionLog]]) -> SessionLog:
+    """Apply `update` to a session's log (or replace it with the log it returns)."""
+    session = self._touch(session_id)
+    if session is None:
+      session = self._sessions[session_id] = _Session()
+    before = session.log.bytes
+    replacement = update(session.log)
+    if replacement is not None:
+      session.log = replacement
+    self.resident_bytes += session.log.bytes - before
+    self._enforce_limits(keep=session_id)
+    return session.log
+
+  def _load(self, session_id: str) -> None:
+    """Make sure a session is resident, calling the loader if it is not."""
+    with self._lock:
+      self._expire_idle()
+      if self._touch(session_id) is not None:
+        return
+      loader = self.loader
+
+    if loader is None:
+      return
+
+    # Load outside the lock; a session with no stored messages is cached too,
+    # so unknown sessions do not hit the loader on every turn
+    messages = loader(session_id)
     with self._lock:
-      return list(self._sessions.get(session_id, []))
+      if self._touch(session_id) is None:
+        self.reloads += 1
+        self._write(session_id, lambda log: SessionLog(messages))
+        self._sessions[session_id].has_older = bool(messages)
+
+  # --- public API ---
 
-  def set_history(self, session_id: str, messages: List[ChatMessage]) -> None:
+  def get_history(self, session_id: str) -> HistoryView:
+    self._load(session_id)
     with self._lock:
-      self._sessions[session_id] = list(messages)
+      session = self._touch(session_id)
+      return session.log.view() if session is not None else HistoryView([], 0)
 
-  def append_messages(self, session_id: str, messages: List[ChatMessage]) -> None:
+  def cursor(self, session_id: str) -> Optional[str]:
+    """Id of the session's last message, or None if it has no messages."""
+    history = self.get_history(session_id)
+    return history[-1].id if history else None
+
+  def is_resident(self, session_id: str) -> bool:
     with self._lock:
-      existing = self._sessions.get(session_id, [])
-      self._sessions[session_id] = existing + list(messages)
+      return session_id in self._sessions
 
+  def load_older(self, session_id: str) -> int:
+    """
+    Page the messages preceding a resident session's history in front of it.
 
+    Returns how many were added; 0 once the start of the session is reached.
+    """
+    older_loader = self.older_loader
+    if older_loader is None:
+      return 0
+    with self._lock:
+      session = self._touch(session_id)
+      if session is None or not session.has_older or not len(session.log):
+        return 0
+      first_id = session.log.view()[0].id
+
+    # Load outside the lock, then prepend only if the log still starts there
+    page = older_loader(session_id, first_id)
+    with self._lock:
+      session = self._touch(session_id)
+      if session is None or not len(session.log) or session.log.view()[0].id != first_id:
+        return 0
+      page = [message for message in page if message.id not in session.log]
+      session.has_older = bool(page)
+      if page:
+        self._write(session_id, lambda log: SessionLog(page + list(log.view())))
+      return len(page)
+
+  def set_history(self, session_id: str, messages: Iterable[ChatMessage]) -> None:
+    with self._lock:
+      self._write(session_id, lambda log: SessionLog(messages))
+
+  def append_messages(self, session_id: str, messages: Iterable[ChatMessage]) -> List[ChatMessage]:
+    """Append messages not already in the session. Returns the ones added, as stored."""
+    self._load(session_id)
+    prepare = self.prepare
+    if prepare is not None:
+      # Prepare outside the lock (it may do I/O), and only messages not seen yet
+      with self._lock:
+        session = self._touch(session_id)
+        known = session.log if session is not None else ()
+        unseen = [message for message in messages if message.id not in known]
+      messages = [prepare(message) for message in unseen]
+    added: List[ChatMessage] = []
+    with self._lock:
+      self._write(session_id, lambda log: added.extend(log.append(messages)))
+    return added
+
+  def remove_messages(self, session_id: str, message_ids: Collection[str]) -> None:
+    """Drop the given messages from a resident session (rolls back a failed turn)."""
+    if not message_ids:
+      return
+    with self._lock:
+      if self._touch(session_id) is not None:
+        self._write(session_id, lambda log: log.without(message_ids))
+
+  def evict(self, session_id: str) -> None:
+    """Drop a session from memory; it is reloaded on next access if a loader is set."""
+    with self._lock:
+      if session_id in self._sessions:
+        self._remove(session_id)
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+        "sessions": len(self._sessions),
+        "resident_bytes": self.resident_bytes,
+        "evictions": self.evictions,
+        "expirations": self.expirations,
+        "reloads": self.reloads,
+      }
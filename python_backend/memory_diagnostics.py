@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import tracemalloc
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Allocation sites kept per endpoint between reports; the smallest are dropped
+MAX_SITES_PER_ENDPOINT = 500
+
+_TRACEMALLOC_FILTERS = [
+  tracemalloc.Filter(False, tracemalloc.__file__),
+  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+  tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+  tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+# --- in-process cache sizes ---
+
+_stats_sources: List[Tuple[str, "weakref.ref[Any]"]] = []
+_stats_lock = threading.Lock()
+
+
+def register_stats(name: str, owner: Any) -> None:
+  """
+  Report `owner.stats()` under `name` in cache_stats().
+
+  Only a weak reference is kept, so registering never keeps a cache alive;
+  sources that have been collected are dropped.
+  """
+  with _stats_lock:
+    _stats_sources.append((name, weakref.ref(owner)))
+
+
+def cache_stats() -> Dict[str, Any]:
+  """stats() of every live registered cache and store, keyed by name."""
+  with _stats_lock:
+    _stats_sources[:] = [(name, ref) for name, ref in _stats_sources if ref() is not None]
+    sources = list(_stats_sources)
+  report: Dict[str, Any] = {}
+  for name, ref in sources:
+    owner = ref()
+    if owner is None:
+      continue
+    key = name
+    index = 2
+    while key in report:
+      key = f"{name}#{index}"
+      index += 1
+    try:
+      report[key] = owner.stats()
+    except Exception as exc:
+      report[key] = {"error": str(exc)}
+  return report
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+  """Resident and peak resident set size of this process, in bytes."""
+  rss = peak = None
+  try:
+    with open("/proc/self/status") as status:
+      for line in status:
+        if line.startswith("VmRSS:"):
+          rss = int(line.split()[1]) * 1024
+        elif line.startswith("VmHWM:"):
+          peak = int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  if peak is None:
+    try:
+      import resource
+
+      peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+      pass
+  return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+# --- allocation diffs per endpoint ---
+
+
+class _EndpointAllocations:
+  def __init__(self) -> None:
+    self.samples = 0
+    self.size_diff = 0
+    # site -> [size diff, count diff]
+    self.sites: Dict[str, List[int]] = {}
+
+  def add(self, stats: List[tracemalloc.StatisticDiff]) -> None:
+    self.samples += 1
+    for stat in stats:
+      if not stat.size_diff and not stat.count_diff:
+        continue
+      frame = stat.traceback[0]
+      site = f"{frame.filename}:{frame.lineno}"
+      entry = self.sites.setdefault(site, [0, 0])
+      entry[0] += stat.size_diff
+      entry[1] += stat.count_diff
+      self.size_diff += stat.size_diff
+    if len(self.sites) > MAX_SITES_PER_ENDPOINT:
+      keep = sorted(self.sites.items(), key=lambda item: abs(item[1][0]), reverse=True)[:MAX_SITES_PER_ENDPOINT]
+      self.sites = dict(keep)
+
+  def report(self, top: int) -> Dict[str, Any]:
+    ranked = sorted(self.sites.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+      "samples": self.samples,
+      "size_diff": self.size_diff,
+      "size_diff_per_request": self.size_diff // self.samples if self.samples else 0,
+      "top_sites": [
+        {"site": site, "size_diff": size, "count_diff": count}
+        for site, (size, count) in ranked
+      ],
+    }
+
+
+class MemoryProfiler:
+  """
+  tracemalloc snapshots around sampled requests, aggregated per endpoint.
+
+  Off by default: tracemalloc slows every allocation while it traces, so
+  configure() only starts it when a sample rate is set, and stops it again
+  when the rate returns to 0. Snapshots cover the whole process, so at most
+  one request is sampled at a time and concurrent requests are skipped; the
+  sites that keep growing across many samples of an endpoint are the ones
+  that retain memory. Changing `frames` restarts tracing, which drops the
+  allocations traced so far; it is refused if tracemalloc was started by
+  someone else.
+  """
+
+  def __init__(self) -> None:
+    self.sample_rate = 0.0
+    self.frames = 1
+    self._endpoints: Dict[str, _EndpointAllocations] = {}
+    self._lock = threading.Lock()
+    self._sampling = threading.Lock()
+    self._started_tracing = False
+
+  def configure(self, sample_rate: Optional[float] = None, frames: Optional[int] = None, reset: bool = False) -> None:
+    # Waits for a request being sampled, so tracing never restarts between its snapshots
+    with self._sampling, self._lock:
+      if frames is not None:
+        frames = max(1, frames)
+        if tracemalloc.is_tracing() and not self._started_tracing and frames != tracemalloc.get_traceback_limit():
+          raise ValueError(
+            f"tracemalloc was started outside the memory profiler with {tracemalloc.get_traceback_limit()} frame(s)"
+          )
+        self.frames = frames
+      if sample_rate is not None:
+        self.sample_rate = sample_rate
+      if reset:
+        self._endpoints.clear()
+
+      if self.sample_rate > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(self.frames)
+        self._started_tracing = True
+        logger.info(f"tracemalloc started ({self.frames} frame(s)), sampling {self.sample_rate:.0%} of requests")
+      elif self.sample_rate <= 0 and self._started_tracing:
+        tracemalloc.stop()
+        self._started_tracing = False
+        logger.info("tracemalloc stopped")
+      elif self._started_tracing and tracemalloc.get_traceback_limit() != self.frames:
+        # The traceback depth is fixed when tracing starts
+        tracemalloc.stop()
+        tracemalloc.start(self.frames)
+        logger.info(f"tracemalloc restarted with {self.frames} frame(s)")
+
+  def should_sample(self) -> bool:
+    return self.sample_rate > 0 and random.random() < self.sample_rate
+
+  def begin(self) -> Optional[tracemalloc.Snapshot]:
+    """Snapshot before a sampled request, or None if another is being sampled."""
+    if not tracemalloc.is_tracing() or not self._sampling.acquire(blocking=False):
+      return None
+    try:
+      return tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+    except Exception:
+      self._sampling.release()
+      raise
+
+  def end(self, endpoint: str, before: tracemalloc.Snapshot) -> None:
+    """Snapshot after the request and fold the difference into `endpoint`."""
+    try:
+      if not tracemalloc.is_tracing():
+        return
+      after = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+      stats = after.compare_to(before, "lineno")
+      with self._lock:
+        self._endpoints.setdefault(endpoint, _EndpointAllocations()).add(stats)
+    finally:
+      self._sampling.release()
+
+  def report(self, top: int = 20) -> Dict[str, Any]:
+    with self._lock:
+      endpoints = {name: allocations.report(top) for name, allocations in self._endpoints.items()}
+    current = peak = None
+    if tracemalloc.is_tracing():
+      current, peak = tracemalloc.get_traced_memory()
+    return {
+      "process": process_memory(),
+      "tracemalloc": {
+        "tracing": tracemalloc.is_tracing(),
+        "frames": self.frames,
+        "sample_rate": self.sample_rate,
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+      },
+      "caches": cache_stats(),
+      "endpoints": endpoints,
+    }
+
+
+_memory_profiler: Optional[MemoryProfiler] = None
+_memory_profiler_lock = threading.Lock()
+
+
+def get_memory_profiler() -> MemoryProfiler:
+  """
+  Get or create the process-wide memory profiler. MEMORY_PROFILE_SAMPLE_RATE
+  (default 0) starts it sampling that fraction of requests.
+  """
+  global _memory_profiler
+
+  if _memory_profiler is not None:
+    return _memory_profiler
+
+  with _memory_profiler_lock:
+    if _memory_profiler is None:
+      profiler = MemoryProfiler()
+      rate = float(os.getenv("MEMORY_PROFILE_SAMPLE_RATE", "0"))
+      if rate > 0:
+        profiler.configure(sample_rate=rate)
+      _memory_profiler = profiler
+    return _memory_profiler
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .memory_diagnostics import register_stats
+
+# Latency buckets in seconds, from cache hits to slow LLM turns
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+  0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS: Tuple[float, ...] = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+  """
+  Collection of metrics rendered together in the Prometheus text format.
+
+  Recording is lock-free: every thread writes to its own shard of cells, so
+  the hot path is a dict lookup and an in-place add with no contention. A
+  lock is only taken the first time a thread records anything and when
+  rendering, which sums the shards of every thread that ever recorded.
+  Values are per process; with several workers, scrape each one.
+  """
+
+  def __init__(self) -> None:
+    self._metrics: Dict[str, _Metric] = {}
+    self._shards: List[Dict[Tuple[str, Tuple[str, ...]], List[float]]] = []
+    self._lock = threading.Lock()
+    self._local = threading.local()
+
+  def register(self, metric: "_Metric") -> None:
+    with self._lock:
+      if metric.name in self._metrics:
+        raise ValueError(f"Metric already registered: {metric.name}")
+      self._metrics[metric.name] = metric
+
+  def shard(self) -> Dict[Tuple[str, Tuple[str, ...]], List[float]]:
+    try:
+      return self._local.cells
+    except AttributeError:
+      cells = self._local.cells = {}
+      with self._lock:
+        self._shards.append(cells)
+      return cells
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {"metrics": len(self._metrics), "shards": len(self._shards), "cells": sum(len(s) for s in self._shards)}
+
+  def collect(self) -> Dict[str, Dict[Tuple[str, ...], List[float]]]:
+    """Sum every thread's cells into {metric name: {label values: cell}}."""
+    with self._lock:
+      shards = list(self._shards)
+    totals: Dict[str, Dict[Tuple[str, ...], List[float]]] = {}
+    for shard in shards:
+      # dict and list copies are atomic under the GIL; writers keep going
+      for (name, labels), cell in list(shard.items()):
+        cell = list(cell)
+        merged = totals.setdefault(name, {}).get(labels)
+        if merged is None:
+          totals[name][labels] = cell
+        else:
+          for i, value in enumerate(cell):
+            merged[i] += value
+    return totals
+
+  def render(self) -> str:
+    totals = self.collect()
+    with self._lock:
+      metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+    lines: List[str] = []
+    for metric in metrics:
+      lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+      lines.append(f"# TYPE {metric.name} {metric.kind}")
+      for labels, cell in sorted(totals.get(metric.name, {}).items()):
+        lines.extend(metric.render(labels, cell))
+    return "\n".join(lines) + "\n"
+
+
+class _Metric:
+  kind = ""
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    registry: Optional[Registry] = None,
+  ) -> None:
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._registry = registry or REGISTRY
+    self._registry.register(self)
+
+  def _cell(self, labels: Tuple[str, ...], size: int) -> List[float]:
+    shard = self._registry.shard()
+    key = (self.name, labels)
+    cell = shard.get(key)
+    if cell is None:
+      if len(labels) != len(self.labelnames):
+        raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+      cell = shard[key] = [0.0] * size
+    return cell
+
+  def _series(self, suffix: str, labels: Tuple[str, ...], value: float, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(v)}"' for name, v in zip(self.labelnames, labels)]
+    if extra:
+      pairs.append(extra)
+    label_str = "{" + ",".join(pairs) + "}" if pairs else ""
+    return f"{self.name}{suffix}{label_str} {_format_value(value)}"
+
+  def render(self, labels: Tuple[str, ...], cell: List[float]) -> List[str]:
+    raise NotImplementedError
+
+
+class Counter(_Metric):
+  """Monotonic total, e.g. requests by status."""
+
+  kind = "counter"
+
+  def inc(self, *labels: str, amount: float = 1.0) -> None:
+    self._cell(labels, 1)[0] += amount
+
+  def render(self, labels: Tuple[str, ...], cell: List[float]) -> List[str]:
+    return [self._series("", labels, cell[0])]
+
+
+class Histogram(_Metric):
+  """
+  Distribution of observations over fixed upper bounds.
+
+  A cell keeps one non-cumulative count per bucket (the last for +Inf) and
+  the sum; buckets are made cumulative and the count derived when rendering,
+  so a scrape never sees a count that disagrees with its buckets.
+  """
+
+  kind = "histogram"
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+    registry: Optional[Registry] = None,
+  ) -> None:
+    self.buckets = tuple(sorted(float(b) for b in buckets))
+    super().__init__(name, documentation, labelnames, registry)
+
+  def observe(self, value: float, *labels: str) -> None:
+    cell = self._cell(labels, len(self.buckets) + 2)
+    cell[bisect_left(self.buckets, value)] += 1
+    cell[-1] += value
+
+  def render(self, labels: Tuple[str, ...], cell: List[float]) -> List[str]:
+    lines = []
+    cumulative = 0.0
+    for bound, count in zip(self.buckets, cell):
+      cumulative += count
+      lines.append(self._series("_bucket", labels, cumulative, f'le="{_format_value(bound)}"'))
+    cumulative += cell[len(self.buckets)]
+    lines.append(self._series("_bucket", labels, cumulative, 'le="+Inf"'))
+    lines.append(self._series("_sum", labels, cell[-1]))
+    lines.append(self._series("_count", labels, cumulative))
+    return lines
+
+
+def _escape_label(value: str) -> str:
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escape_help(text: str) -> str:
+  return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+  if value == int(value) and abs(value) < 1e15:
+    return f"{int(value)}.0"
+  return repr(float(value))
+
+
+REGISTRY = Registry()
+register_stats("metrics_registry", REGISTRY)
+
+
+def render_metrics() -> str:
+  """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+  return REGISTRY.render()
+
+
+# --- metrics recorded by the backend ---
+
+HTTP_REQUESTS = Counter(
+  "http_requests_total",
+  "HTTP requests handled, by method, route template and status code.",
+  ("method", "route", "status"),
+)
+HTTP_DURATION = Histogram(
+  "http_request_duration_seconds",
+  "HTTP request latency in seconds, by method and route template.",
+  ("method", "route"),
+)
+
+LLM_REQUESTS = Counter(
+  "llm_requests_total",
+  "LLM chat completion calls, by model and outcome (ok, http_<status>, transport_error).",
+  ("model", "outcome"),
+)
+LLM_DURATION = Histogram(
+  "llm_request_duration_seconds",
+  "LLM chat completion latency in seconds, until the full body is read.",
+  ("model",),
+)
+LLM_TTFB = Histogram(
+  "llm_time_to_first_byte_seconds",
+  "Time until the LLM API returned response headers, in seconds.",
+  ("model",),
+)
+LLM_TOKENS = Counter(
+  "llm_tokens_total",
+  "Tokens reported by the LLM API, by model and kind (prompt, completion).",
+  ("model", "kind"),
+)
+LLM_TOKENS_PER_CALL = Histogram(
+  "llm_tokens_per_request",
+  "Tokens per LLM call, by model and kind (prompt, completion).",
+  ("model", "kind"),
+  buckets=TOKEN_BUCKETS,
+)
+
+SHEETS_REQUESTS = Counter(
+  "sheets_api_requests_total",
+  "Google Sheets API calls, by API method and outcome (ok, http_<status>, error).",
+  ("method", "outcome"),
+)
+SHEETS_DURATION = Histogram(
+  "sheets_api_request_duration_seconds",
+  "Google Sheets API latency in seconds, by API method.",
+  ("method",),
+)
+
+SUPABASE_REQUESTS = Counter(
+  "supabase_requests_total",
+  "Supabase REST calls (after retries), by HTTP method, table and outcome.",
+  ("method", "table", "outcome"),
+)
+SUPABASE_DURATION = Histogram(
+  "supabase_request_duration_seconds",
+  "Supabase REST latency in seconds including retries, by HTTP method and table.",
+  ("method", "table"),
+)
+
+TOOL_CALLS = Counter(
+  "orchestrator_tool_calls_total",
+  "Orchestrator tool executions, by tool and outcome (ok, error).",
+  ("tool", "outcome"),
+)
+TOOL_DURATION = Histogram(
+  "orchestrator_tool_duration_seconds",
+  "Orchestrator tool execution time in seconds, by tool.",
+  ("tool",),
+)
@@ -0,0 +1,16 @@
+-- Migration: create visualization_rule_snapshots table for conditional-mode formula visualization
+-- One row per visualization records the conditional format rules that were installed,
+-- so undo can remove them without any per-cell snapshot rows.
+
+create table if not exists public.visualization_rule_snapshots (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null,
+  spreadsheet_id text not null,
+  gid integer,
+  sheet_id integer not null,
+  formulas jsonb not null,
+  created_at timestamptz not null default now()
+);
+
+create unique index if not exists visualization_rule_snapshots_batch_idx
+  on public.visualization_rule_snapshots (snapshot_batch_id);
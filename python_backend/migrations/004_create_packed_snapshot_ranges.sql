@@ -0,0 +1,43 @@
+-- Migration: packed snapshot tables, one row per rectangular range instead of one row per cell
+-- Color ranges store a palette of distinct [red, green, blue] colors and, in `data`, the
+-- base64 zlib-compressed palette index of every cell in row-major order (uint8, or
+-- little-endian uint32 when the palette has more than 256 colors).
+-- Value ranges store, in `data`, a base64 zlib-compressed JSON 2D array of cell values.
+
+create table if not exists public.cell_color_snapshot_ranges (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null,
+  spreadsheet_id text not null,
+  gid integer,
+  origin_row integer not null,
+  origin_col integer not null,
+  n_rows integer not null,
+  n_cols integer not null,
+  palette jsonb not null,
+  data text not null,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists cell_color_snapshot_ranges_batch_idx
+  on public.cell_color_snapshot_ranges (snapshot_batch_id, id);
+
+-- kind = 'cells': a block merged from single-cell snapshots (range_ref is its A1 label)
+-- kind = 'range': one snapshot taken for a whole range; origin is null when the
+-- range has no fixed start cell (e.g. whole columns)
+create table if not exists public.cell_value_snapshot_ranges (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null,
+  spreadsheet_id text not null,
+  gid integer,
+  kind text not null check (kind in ('cells', 'range')),
+  range_ref text not null,
+  origin_row integer,
+  origin_col integer,
+  n_rows integer not null,
+  n_cols integer not null,
+  data text not null,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists cell_value_snapshot_ranges_batch_idx
+  on public.cell_value_snapshot_ranges (snapshot_batch_id, id);
@@ -0,0 +1,153 @@
+-- Migration: snapshot batch registry, indexes for the per-cell snapshot tables, and retention
+-- Every snapshot batch gets one row in snapshot_batches. Batches whose content matches an
+-- earlier batch of the same spreadsheet (same kind and content_hash) store no rows of their
+-- own: data_batch_id points at the batch that holds the data, and restores read from there.
+
+-- Per-cell tables predate the migrations folder; create them if missing
+create table if not exists public.cell_color_snapshots (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null,
+  spreadsheet_id text not null,
+  gid integer,
+  cell text not null,
+  red double precision not null,
+  green double precision not null,
+  blue double precision not null,
+  created_at timestamptz not null default now()
+);
+
+create table if not exists public.cell_value_snapshots (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null,
+  spreadsheet_id text not null,
+  gid integer,
+  cell text not null,
+  value text,
+  snapshot_type text,
+  created_at timestamptz not null default now()
+);
+
+-- Restores page through a batch ordered by id
+create index if not exists cell_color_snapshots_batch_idx
+  on public.cell_color_snapshots (snapshot_batch_id, id);
+
+create index if not exists cell_value_snapshots_batch_idx
+  on public.cell_value_snapshots (snapshot_batch_id, id);
+
+-- Retention scans by age
+create index if not exists cell_color_snapshots_created_at_idx
+  on public.cell_color_snapshots (created_at);
+
+create index if not exists cell_value_snapshots_created_at_idx
+  on public.cell_value_snapshots (created_at);
+
+create index if not exists cell_color_snapshot_ranges_created_at_idx
+  on public.cell_color_snapshot_ranges (created_at);
+
+create index if not exists cell_value_snapshot_ranges_created_at_idx
+  on public.cell_value_snapshot_ranges (created_at);
+
+create index if not exists visualization_rule_snapshots_created_at_idx
+  on public.visualization_rule_snapshots (created_at);
+
+create table if not exists public.snapshot_batches (
+  id uuid primary key default gen_random_uuid(),
+  snapshot_batch_id uuid not null unique,
+  spreadsheet_id text not null,
+  gid integer,
+  kind text not null check (kind in ('color', 'value', 'rule')),
+  content_hash text,
+  data_batch_id uuid not null,
+  row_count integer not null default 0,
+  created_at timestamptz not null default now()
+);
+
+-- Dedup lookup: newest batch of a spreadsheet with the same content
+create index if not exists snapshot_batches_content_idx
+  on public.snapshot_batches (spreadsheet_id, kind, content_hash, created_at desc);
+
+-- Retention: newest batches per spreadsheet, and "is this data still referenced?"
+create index if not exists snapshot_batches_spreadsheet_created_idx
+  on public.snapshot_batches (spreadsheet_id, created_at desc);
+
+create index if not exists snapshot_batches_data_batch_idx
+  on public.snapshot_batches (data_batch_id);
+
+-- Register batches written before this migration so retention does not treat them as orphans
+insert into public.snapshot_batches (snapshot_batch_id, spreadsheet_id, gid, kind, data_batch_id, row_count, created_at)
+select snapshot_batch_id, min(spreadsheet_id), min(gid), kind, snapshot_batch_id, count(*), min(created_at)
+from (
+  select snapshot_batch_id, spreadsheet_id, gid, 'color' as kind, created_at from public.cell_color_snapshots
+  union all
+  select snapshot_batch_id, spreadsheet_id, gid, 'color', created_at from public.cell_color_snapshot_ranges
+  union all
+  select snapshot_batch_id, spreadsheet_id, gid, 'value', created_at from public.cell_value_snapshots
+  union all
+  select snapshot_batch_id, spreadsheet_id, gid, 'value', created_at from public.cell_value_snapshot_ranges
+  union all
+  select snapshot_batch_id, spreadsheet_id, gid, 'rule', created_at from public.visualization_rule_snapshots
+) existing
+group by snapshot_batch_id, kind
+on conflict (snapshot_batch_id) do nothing;
+
+-- Expire batches older than max_age_seconds or beyond the newest max_batches per
+-- spreadsheet (either limit may be null), then delete snapshot rows that no remaining
+-- batch points at. Rows get an hour of grace because the batch row is written after them.
+-- Returns the number of snapshot rows deleted.
+create or replace function public.purge_snapshot_batches(max_age_seconds integer, max_batches integer)
+returns integer
+language plpgsql
+as $$
+declare
+  removed integer := 0;
+  deleted integer;
+  grace_cutoff timestamptz := now() - interval '1 hour';
+begin
+  with ranked as (
+    select
+      id,
+      created_at,
+      row_number() over (partition by spreadsheet_id order by created_at desc) as position
+    from public.snapshot_batches
+  )
+  delete from public.snapshot_batches b
+  using ranked r
+  where b.id = r.id
+    and (
+      (max_age_seconds is not null and r.created_at < now() - make_interval(secs => max_age_seconds))
+      or (max_batches is not null and r.position > max_batches)
+    );
+
+  delete from public.cell_color_snapshots s
+  where s.created_at < grace_cutoff
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_color_snapshot_ranges s
+  where s.created_at < grace_cutoff
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_value_snapshots s
+  where s.created_at < grace_cutoff
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_value_snapshot_ranges s
+  where s.created_at < grace_cutoff
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.visualization_rule_snapshots s
+  where s.created_at < grace_cutoff
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  return removed;
+end;
+$$;
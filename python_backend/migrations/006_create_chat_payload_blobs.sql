@@ -0,0 +1,11 @@
+-- Migration: content-addressed storage for large chat tool payloads
+-- Tool messages whose payload is larger than PAYLOAD_INLINE_MAX_BYTES keep only
+-- metadata.payloadRef ({hash, size, summary}) in conversation_messages; the payload itself
+-- is stored once per distinct content here, as base64 zlib-compressed canonical JSON.
+
+create table if not exists public.chat_payload_blobs (
+  hash text primary key,
+  size integer not null,
+  data text not null,
+  created_at timestamptz not null default now()
+);
@@ -0,0 +1,82 @@
+-- Migration: snapshot retention that cannot strand a deduplicated reference
+-- A backend dedups a new snapshot against a batch it registered recently and journals only
+-- the registry row pointing at that batch's data. Until the journal flushes, the server does
+-- not know about the reference, so purge_snapshot_batches now
+--   * keeps registry rows younger than an hour, whatever max_batches says, and
+--   * takes keep_batch_ids, the data batches the caller's unflushed or recent registry rows
+--     point at, and never deletes their rows.
+
+drop function if exists public.purge_snapshot_batches(integer, integer);
+
+-- Expire batches older than max_age_seconds or beyond the newest max_batches per
+-- spreadsheet (either limit may be null), then delete snapshot rows that no remaining
+-- batch points at and that are not in keep_batch_ids. Batches and rows get an hour of grace.
+-- Returns the number of snapshot rows deleted.
+create or replace function public.purge_snapshot_batches(
+  max_age_seconds integer,
+  max_batches integer,
+  keep_batch_ids uuid[] default '{}'
+)
+returns integer
+language plpgsql
+as $$
+declare
+  removed integer := 0;
+  deleted integer;
+  grace_cutoff timestamptz := now() - interval '1 hour';
+  keep uuid[] := coalesce(keep_batch_ids, '{}');
+begin
+  with ranked as (
+    select
+      id,
+      created_at,
+      row_number() over (partition by spreadsheet_id order by created_at desc) as position
+    from public.snapshot_batches
+  )
+  delete from public.snapshot_batches b
+  using ranked r
+  where b.id = r.id
+    and r.created_at < grace_cutoff
+    and (
+      (max_age_seconds is not null and r.created_at < now() - make_interval(secs => max_age_seconds))
+      or (max_batches is not null and r.position > max_batches)
+    );
+
+  delete from public.cell_color_snapshots s
+  where s.created_at < grace_cutoff
+    and s.snapshot_batch_id <> all(keep)
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_color_snapshot_ranges s
+  where s.created_at < grace_cutoff
+    and s.snapshot_batch_id <> all(keep)
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_value_snapshots s
+  where s.created_at < grace_cutoff
+    and s.snapshot_batch_id <> all(keep)
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.cell_value_snapshot_ranges s
+  where s.created_at < grace_cutoff
+    and s.snapshot_batch_id <> all(keep)
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  delete from public.visualization_rule_snapshots s
+  where s.created_at < grace_cutoff
+    and s.snapshot_batch_id <> all(keep)
+    and not exists (select 1 from public.snapshot_batches b where b.data_batch_id = s.snapshot_batch_id);
+  get diagnostics deleted = row_count;
+  removed := removed + deleted;
+
+  return removed;
+end;
+$$;
@@ -7,6 +7,7 @@ from typing import Any, Dict, List
 from .context_builder import ContextBuilder
 from .llm import LLMClient, PROMPTS, format_sample_data, format_sheet_context
 from .logging_config import get_logger
+from .tracing import traced
 
 logger = get_logger(__name__)
 
@@ -21,6 +22,7 @@ class MistakeDetector:
     self.context_builder = context_builder
     self.llm_client = llm_client
 
+  @traced("detector.detect_issues", "tool")
   def detect_issues(
     self,
     spreadsheet_id: str,
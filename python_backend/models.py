@@ -13,9 +13,17 @@ class ChatMessageRole(str, Enum):
   system = "system"
 
 
+class PayloadRef(BaseModel):
+  """A tool payload stored out of line in the blob store (see blob_store.py)."""
+  hash: str
+  size: int
+  summary: Optional[str] = None
+
+
 class ChatMessageMetadata(BaseModel):
   toolName: Optional[str] = None
   payload: Optional[Any] = None
+  payloadRef: Optional[PayloadRef] = None
   plan: Optional[str] = None
   error: Optional[str] = None
   timestamp: Optional[str] = None
@@ -34,14 +42,30 @@ class SheetContext(BaseModel):
 
 
 class ChatRequest(BaseModel):
+  """
+  A chat turn.
+
+  By default `messages` is the full history. With `delta` set, `messages`
+  holds only the new messages and `cursor` is the id of the last message the
+  client has seen (None for an empty session); the server keeps the history.
+  """
   messages: List[ChatMessage]
   sheetContext: SheetContext = Field(default_factory=SheetContext)
   sessionId: Optional[str] = None
+  delta: bool = False
+  cursor: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
+  """
+  Messages produced by a turn. `cursor` is the id of the session's last
+  message after the turn; `resync` means the request's cursor was stale, so
+  nothing was processed and the client should catch up from `cursor`.
+  """
   messages: List[ChatMessage]
   sessionId: Optional[str] = None
+  cursor: Optional[str] = None
+  resync: bool = False
 
 
 def chat_request_to_dict(request: ChatRequest) -> Dict[str, Any]:
@@ -1,20 +1,32 @@
 from __future__ import annotations
 
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
+from .blob_store import get_payload_store
 from .creator import SheetCreator
+from .history_compaction import HistoryCompactor
+from .history_render import HistoryRenderCache
 from .llm import LLMClient, PROMPTS
 from .logging_config import get_logger
+from .metrics import TOOL_CALLS, TOOL_DURATION
 from .mistake_detector import MistakeDetector
 from .modifier import SheetModifier
 from .context_builder import ContextBuilder
 from .sheets_client import ServiceAccountSheetsClient
+from .tracing import span, traced
 from .utils import normalize_spreadsheet_id, parse_spreadsheet_url
 from .models import ChatMessage, SheetContext
 
 logger = get_logger(__name__)
 
+# Tools the agent can call, used to bound metric labels
+_TOOLS = ("detect_issues", "modify_sheet", "create_sheet", "update_cells", "read_sheet", "visualize_formulas")
+
+# Tools whose payloads _render_message includes in the prompt
+_RENDERED_PAYLOAD_TOOLS = ("read_sheet", "detect_issues")
+
 
 class AgentOrchestrator:
   """
@@ -33,19 +45,26 @@ class AgentOrchestrator:
     self.mistake_detector = MistakeDetector(context_builder, llm_client)
     self.sheet_modifier = SheetModifier(sheets_client, context_builder, llm_client)
     self.sheet_creator = SheetCreator(sheets_client, llm_client)
+    self._history_cache = HistoryRenderCache(self._render_message)
+    self._compactor = HistoryCompactor(llm_client, self._render_message)
 
+  @traced("orchestrator.process_chat", "orchestrator")
   def process_chat(
     self,
-    messages: List[ChatMessage],
+    messages: Sequence[ChatMessage],
     sheet_context: SheetContext,
+    session_id: Optional[str] = None,
   ) -> List[ChatMessage]:
     try:
       logger.debug(f"Processing chat with {len(messages)} message(s)")
-      chat_history = self._format_chat_history(messages)
+      # Older turns are replaced by a running summary once the session grows long
+      summary, recent = self._compactor.compact(session_id, messages)
+      # Only messages added since the last turn of this session are rendered
+      chat_history = self._history_cache.render(session_id, recent)
       ctx_str = self._format_sheet_context(sheet_context)
 
       system_prompt = PROMPTS.AGENT.system
-      user_prompt = PROMPTS.AGENT.user(chat_history, ctx_str)
+      user_prompt = PROMPTS.AGENT.user(chat_history, ctx_str, summary=summary)
 
       logger.debug("Calling LLM for chat processing")
       response: Dict[str, Any] = self.llm_client.chat_json(
@@ -93,7 +112,13 @@ class AgentOrchestrator:
           )
         )
 
-        tool_messages = self._execute_tool_call(tool_name, tool_args, sheet_context)
+        started = time.perf_counter()
+        tool_label = tool_name if tool_name in _TOOLS else "unknown"
+        with span(f"tool.{tool_label}", "tool"):
+          tool_messages = self._execute_tool_call(tool_name, tool_args, sheet_context)
+        failed = any(m.metadata and m.metadata.error for m in tool_messages)
+        TOOL_CALLS.inc(tool_label, "error" if failed else "ok")
+        TOOL_DURATION.observe(time.perf_counter() - started, tool_label)
         new_messages.extend(tool_messages)
         logger.debug(f"Tool call completed: {len(tool_messages)} message(s) returned")
       else:
@@ -101,6 +126,7 @@ class AgentOrchestrator:
         raise ValueError(f"Unknown step type: {step}")
 
       logger.debug(f"Chat processing completed: {len(new_messages)} new message(s)")
+      self._compactor.schedule(session_id, messages, new_messages)
       return new_messages
     except Exception as exc:
       logger.error(f"Chat processing failed: {str(exc)}", exc_info=True)
@@ -434,18 +460,14 @@ class AgentOrchestrator:
 
           sheet_id = sheet["properties"]["sheetId"]
 
-          # Define Supabase insert function
-          def insert_snapshots(rows):
-            api._post_to_supabase(rows)
-
-          # Call visualization function
+          # Call visualization function (snapshots go to the configured snapshot store)
           result = viz_fn(
             validator=validator,
             spreadsheet_id=spreadsheet_id,
             sheet_title=sheet_title,
             sheet_id=sheet_id,
             gid=int(gid) if gid else None,
-            supabase_insert_fn=insert_snapshots,
+            mode=args.get("mode") or "cells",
           )
 
         except Exception as exc:
@@ -489,60 +511,63 @@ class AgentOrchestrator:
   # --- formatting helpers ---
 
   @staticmethod
-  def _format_chat_history(messages: List[ChatMessage]) -> str:
-    lines: List[str] = []
-    for msg in messages:
-      role = msg.role
-      if role == "user":
-        label = "User"
-        lines.append(f"{label}: {msg.content}")
-      elif role == "assistant":
-        label = "Assistant"
-        lines.append(f"{label}: {msg.content}")
-      elif role == "tool":
-        # For tool messages, include the tool result data
-        label = "System"
-        tool_content = f"{label}: {msg.content}"
-
-        # Include payload data for certain tools
-        if msg.metadata and msg.metadata.payload:
-          tool_name = msg.metadata.toolName if msg.metadata.toolName else "unknown"
-          payload = msg.metadata.payload
-
-          if tool_name == "read_sheet":
-            # Include a sample of the sheet data
-            values = payload.get("values", [])
-            if values:
-              sample_rows = min(10, len(values))
-              tool_content += f"\n  Sheet data (first {sample_rows} rows):\n"
-              for i, row in enumerate(values[:sample_rows]):
-                # Show each cell with its value and formula (if present)
-                row_data = []
-                for cell in row:
-                  if isinstance(cell, dict):
-                    val = cell.get("value")
-                    formula = cell.get("formula")
-                    if formula:
-                      row_data.append(f"{val} (formula: {formula})")
-                    elif val is not None:
-                      row_data.append(str(val))
-                    else:
-                      row_data.append("")
+  def _render_message(msg: ChatMessage) -> str:
+    """Render one history message for the AGENT prompt."""
+    role = msg.role
+    if role == "user":
+      label = "User"
+      return f"{label}: {msg.content}"
+    elif role == "assistant":
+      label = "Assistant"
+      return f"{label}: {msg.content}"
+    elif role == "tool":
+      # For tool messages, include the tool result data
+      label = "System"
+      tool_content = f"{label}: {msg.content}"
+
+      # Include payload data for certain tools
+      tool_name = msg.metadata.toolName if msg.metadata and msg.metadata.toolName else "unknown"
+      payload = msg.metadata.payload if msg.metadata else None
+      if payload is None and msg.metadata and msg.metadata.payloadRef and tool_name in _RENDERED_PAYLOAD_TOOLS:
+        # Large payloads live in the blob store; fetch only the ones the prompt uses
+        payload = get_payload_store().load(msg.metadata)
+        if payload is None and msg.metadata.payloadRef.summary:
+          tool_content += f"\n  {msg.metadata.payloadRef.summary}"
+
+      if payload:
+        if tool_name == "read_sheet":
+          # Include a sample of the sheet data
+          values = payload.get("values", [])
+          if values:
+            sample_rows = min(10, len(values))
+            tool_content += f"\n  Sheet data (first {sample_rows} rows):\n"
+            for i, row in enumerate(values[:sample_rows]):
+              # Show each cell with its value and formula (if present)
+              row_data = []
+              for cell in row:
+                if isinstance(cell, dict):
+                  val = cell.get("value")
+                  formula = cell.get("formula")
+                  if formula:
+                    row_data.append(f"{val} (formula: {formula})")
+                  elif val is not None:
+                    row_data.append(str(val))
                   else:
-                    row_data.append(str(cell) if cell is not None else "")
-                tool_content += f"  Row {i+1}: {' | '.join(row_data[:10])}\n"  # Show first 10 columns
-
-          elif tool_name == "detect_issues":
-            # Include summary of detected issues
-            potential_errors = payload.get("potential_errors", [])
-            if potential_errors:
-              tool_content += f"\n  Found {len(potential_errors)} issues"
-
-        lines.append(tool_content)
-      else:
-        # Other roles (system, etc.)
-        lines.append(f"System: {msg.content}")
-    return "\n\n".join(lines)
+                    row_data.append("")
+                else:
+                  row_data.append(str(cell) if cell is not None else "")
+              tool_content += f"  Row {i+1}: {' | '.join(row_data[:10])}\n"  # Show first 10 columns
+
+        elif tool_name == "detect_issues":
+          # Include summary of detected issues
+          potential_errors = payload.get("potential_errors", [])
+          if potential_errors:
+            tool_content += f"\n  Found {len(potential_errors)} issues"
+
+      return tool_content
+    else:
+      # Other roles (system, etc.)
+      return f"System: {msg.content}"
 
   @staticmethod
   def _format_sheet_context(context: SheetContext) -> Optional[str]:
@@ -684,6 +709,15 @@ class AgentOrchestrator:
     if status == "no_cells":
       return "No formulas or hard-coded numeric values were found on this sheet."
 
+    if result.get("mode") == "conditional":
+      summary = "I've added conditional formatting rules to your sheet:\n"
+      summary += "- Formulas are highlighted in green\n"
+      summary += "- Hard-coded numeric values are highlighted in orange\n\n"
+      summary += "The highlighting updates automatically as you edit the sheet."
+      if snapshot_id:
+        summary += f"\n\nYou can remove the highlighting if needed (snapshot ID: {snapshot_id[:8]}...)."
+      return summary
+
     summary = f"I've color-coded {count} cell{'s' if count != 1 else ''} on your sheet:\n"
     summary += "- Formulas are highlighted in green\n"
     summary += "- Hard-coded numeric values are highlighted in orange\n\n"
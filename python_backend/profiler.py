@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from .logging_config import get_logger
+from .memory_diagnostics import register_stats
+
+logger = get_logger(__name__)
+
+# Frames deeper than this are cut from the root end of the stack
+MAX_STACK_DEPTH = 128
+
+# Root frame of stacks sampled on an event-loop thread, which every
+# concurrent async request shares
+EVENT_LOOP_FRAME = "(event-loop)"
+
+T = TypeVar("T")
+
+
+class Profile:
+  """
+  Collapsed stacks sampled from the threads serving one request.
+
+  `peak_threads` is the most threads the request had working at once, so
+  samples can be read against it: two threads busy for 100 ms yield twice
+  the samples of one.
+
+  `loop_threads` are the threads in `threads` that run an event loop. Their
+  stacks are counted under an EVENT_LOOP_FRAME root and in `loop_samples`,
+  and include whatever other request the loop was running at the time.
+  """
+
+  def __init__(self, request_id: str, threads: List[int], loop_threads: Optional[List[int]] = None) -> None:
+    self.request_id = request_id
+    self.threads = set(threads)
+    self.loop_threads = set(loop_threads or [])
+    self.peak_threads = len(self.threads)
+    self.started_at = time.time()
+    self.duration: Optional[float] = None
+    self.samples = 0
+    self.loop_samples = 0
+    self.stacks: Counter = Counter()
+    self._lock = threading.Lock()
+    self._token: Optional[contextvars.Token] = None
+
+  def add_thread(self, thread_id: int) -> bool:
+    """Sample `thread_id` too; False when it already was."""
+    with self._lock:
+      if thread_id in self.threads:
+        return False
+      self.threads.add(thread_id)
+      self.peak_threads = max(self.peak_threads, len(self.threads))
+      return True
+
+  def remove_thread(self, thread_id: int) -> None:
+    with self._lock:
+      self.threads.discard(thread_id)
+
+  def thread_ids(self) -> List[int]:
+    with self._lock:
+      return list(self.threads)
+
+  def collapsed(self) -> str:
+    """
+    One "frame;frame;frame count" line per distinct stack, root first: the
+    input format of flamegraph.pl, speedscope and inferno.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# The profile of the request being served, so the worker threads it hands
+# work to (which run in a copy of its context) can join it
+_current: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("profile", default=None)
+
+
+@contextmanager
+def profiled_thread() -> Iterator[None]:
+  """Sample the calling thread with the current request's profile, if any, for the block."""
+  profile = _current.get()
+  if profile is None:
+    yield
+    return
+  thread_id = threading.get_ident()
+  added = profile.add_thread(thread_id)
+  try:
+    yield
+  finally:
+    if added:
+      profile.remove_thread(thread_id)
+
+
+def run_profiled(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+  """
+  Call fn inside profiled_thread(). Wrap work handed to asyncio.to_thread
+  or an executor (in a copy of the request's context) with it.
+  """
+  with profiled_thread():
+    return fn(*args, **kwargs)
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+  names: List[str] = []
+  while frame is not None and len(names) < MAX_STACK_DEPTH:
+    code = frame.f_code
+    names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+    frame = frame.f_back
+  names.reverse()
+  return ";".join(names)
+
+
+class SamplingProfiler:
+  """
+  Statistical profiler for individual requests.
+
+  While at least one request is being profiled, a daemon thread wakes every
+  `interval` seconds, reads the current frame of each profiled request's
+  threads via sys._current_frames() and counts the collapsed stack. With
+  nothing to profile the thread exits, so the only cost left on the request
+  path is the should_profile() check.
+
+  A request's threads are the one that started its profile plus any worker
+  thread running under run_profiled() for it (the sheet prefetch, snapshot
+  writes). Threads shared by all requests, like the Supabase client's event
+  loop, are not sampled, since their stacks cannot be attributed to one.
+
+  The exception is the server's event-loop thread: the middleware starts
+  profiles there, and async endpoints do their work on it, so it is
+  sampled. It serves every concurrent request, though, so its samples
+  include other requests' stacks. They are kept apart under an
+  EVENT_LOOP_FRAME root frame and counted in `Profile.loop_samples`; only
+  the worker-thread samples are the request's alone.
+
+  A request is profiled when it carries a valid signed X-Profile token (see
+  sign_token) or, with a sample rate set, at random. Finished profiles are
+  kept for the last `capacity` profiled requests.
+  """
+
+  def __init__(
+    self,
+    secret: Optional[str] = None,
+    sample_rate: float = 0.0,
+    interval: float = 0.005,
+    capacity: int = 50,
+  ) -> None:
+    self.secret = secret
+    self.sample_rate = sample_rate
+    self.interval = interval
+    self.capacity = capacity
+
+    self._active: Dict[str, Profile] = {}
+    self._finished: "OrderedDict[str, Profile]" = OrderedDict()
+    self._lock = threading.Lock()
+    self._sampler: Optional[threading.Thread] = None
+
+  # --- activation ---
+
+  def sign_token(self, ttl: float = 300.0) -> str:
+    """A token for the X-Profile header, valid for `ttl` seconds."""
+    if not self.secret:
+      raise ValueError("Profiling tokens need PROFILER_SECRET to be set")
+    expires = str(int(time.time() + ttl))
+    return f"{expires}.{self._signature(expires)}"
+
+  def _signature(self, expires: str) -> str:
+    return hmac.new(self.secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+
+  def verify_token(self, token: Optional[str]) -> bool:
+    if not token or not self.secret:
+      return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+      return False
+    return hmac.compare_digest(signature, self._signature(expires))
+
+  def should_profile(self, token: Optional[str]) -> bool:
+    if token is not None and self.verify_token(token):
+      return True
+    return self.sample_rate > 0 and random.random() < self.sample_rate
+
+  # --- sampling ---
+
+  def start(self, request_id: str, threads: Optional[List[int]] = None) -> Profile:
+    """
+    Start sampling `threads` (default: the calling thread) for a request.
+
+    A calling thread that is running an event loop is sampled as a loop
+    thread (see Profile).
+    """
+    loop_threads: List[int] = []
+    if not threads:
+      threads = [threading.get_ident()]
+      try:
+        asyncio.get_running_loop()
+        loop_threads = threads
+      except RuntimeError:
+        pass
+    profile = Profile(request_id, threads, loop_threads)
+    profile._token = _current.set(profile)
+    with self._lock:
+      self._active[request_id] = profile
+      if self._sampler is None:
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+    return profile
+
+  def stop(self, profile: Profile) -> Profile:
+    if profile._token is not None:
+      try:
+        _current.reset(profile._token)
+      except ValueError:
+        pass  # Stopped from another context; that one ends with its request
+      profile._token = None
+    with self._lock:
+      self._active.pop(profile.request_id, None)
+      profile.duration = time.time() - profile.started_at
+      self._finished[profile.request_id] = profile
+      self._finished.move_to_end(profile.request_id)
+      while len(self._finished) > self.capacity:
+        self._finished.popitem(last=False)
+    logger.info(
+      f"Profiled request {profile.request_id}: {profile.samples} samples, {len(profile.stacks)} stacks",
+      extra={"request_id": profile.request_id, "samples": profile.samples},
+    )
+    return profile
+
+  def get(self, request_id: str) -> Optional[Profile]:
+    with self._lock:
+      return self._finished.get(request_id) or self._active.get(request_id)
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+        "profiles": len(self._finished),
+        "active": len(self._active),
+        "stacks": sum(len(profile.stacks) for profile in self._finished.values()),
+      }
+
+  def recent(self) -> List[Profile]:
+    """Finished profiles, newest first."""
+    with self._lock:
+      return list(reversed(self._finished.values()))
+
+  def _run(self) -> None:
+    me = threading.get_ident()
+    while True:
+      with self._lock:
+        if not self._active:
+          self._sampler = None
+          return
+        profiles = list(self._active.values())
+      frames = sys._current_frames()
+      for profile in profiles:
+        for thread_id in profile.thread_ids():
+          frame = frames.get(thread_id)
+          if frame is not None and thread_id != me:
+            stack = _collapse(frame)
+            if thread_id in profile.loop_threads:
+              stack = f"{EVENT_LOOP_FRAME};{stack}"
+              profile.loop_samples += 1
+            profile.stacks[stack] += 1
+            profile.samples += 1
+      del frames
+      time.sleep(self.interval)
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> SamplingProfiler:
+  """
+  Get or create the process-wide request profiler.
+
+  PROFILER_SECRET signs X-Profile tokens and guards the profiling admin
+  endpoints; without it only PROFILER_SAMPLE_RATE (default 0, a fraction of
+  requests) can turn profiling on. PROFILER_INTERVAL_MS (default 5) is the
+  sampling interval and PROFILE_BUFFER_SIZE (default 50) how many profiles
+  are kept.
+  """
+  global _profiler
+
+  if _profiler is not None:
+    return _profiler
+
+  with _profiler_lock:
+    if _profiler is None:
+      _profiler = SamplingProfiler(
+        secret=os.getenv("PROFILER_SECRET") or None,
+        sample_rate=float(os.getenv("PROFILER_SAMPLE_RATE", "0")),
+        interval=float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000,
+        capacity=int(os.getenv("PROFILE_BUFFER_SIZE", "50")),
+      )
+      register_stats("request_profiles", _profiler)
+    return _profiler
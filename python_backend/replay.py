@@ -0,0 +1,303 @@
+"""
+Replay a chat session from a conversation_messages export against recorded
+LLM and Sheets traffic, and time each stage of every turn.
+
+  # Record the session's turns against the live APIs (needs credentials)
+  python -m python_backend.replay session.json --cassette session.jsonl --record
+  # Replay offline at the recorded latencies and keep the timings
+  python -m python_backend.replay session.json --cassette session.jsonl --output before.json
+  # After a change: replay again and compare with the earlier run
+  python -m python_backend.replay session.json --cassette session.jsonl --compare before.json
+
+The export holds the session's conversation_messages rows: a JSON array (as
+PostgREST returns them), {"messages": [...]}, or a CSV export. Each user
+message is sent through ChatService as one turn, in created_at order; the
+assistant and tool messages are produced anew by the backend. Conversation
+rows are written to an in-process Supabase fake, never to the real project.
+
+Stages are the trace spans recorded during each turn (llm.chat, Sheets API
+methods, context.build, tool.*, ...), timed inclusively: a stage's time
+includes the stages nested in it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime as _dt
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from . import api, cassette as cassette_module, snapshot_store, supabase_rest
+from .backend import PythonChatBackend
+from .bench import _git_commit, _relative_change
+from .cassette import Cassette
+from .fakes import FakeSupabase
+from .memory import ConversationStore
+from .models import ChatMessage, ChatMessageRole, ChatRequest, SheetContext
+from .service import ChatService
+from .snapshot_store import SupabaseSnapshotStore
+from .supabase_rest import SupabaseRestClient
+from .tracing import finish_trace, get_trace_buffer, start_trace
+
+RESULTS_VERSION = 1
+
+
+# --- session exports ---
+
+def load_session(path: Path, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+  """
+  The conversation_messages rows of one session, oldest first. Exports with
+  several sessions need `session_id`.
+  """
+  text = Path(path).read_text(encoding="utf-8")
+  if Path(path).suffix.lower() == ".csv":
+    rows: List[Dict[str, Any]] = list(csv.DictReader(text.splitlines()))
+  else:
+    data = json.loads(text)
+    rows = data.get("messages", []) if isinstance(data, dict) else data
+  for row in rows:
+    # CSV exports keep jsonb columns as JSON text
+    for column in ("metadata", "sheet_tabs"):
+      if isinstance(row.get(column), str):
+        row[column] = json.loads(row[column]) if row[column].strip() else None
+
+  sessions = sorted({row.get("session_id") for row in rows if row.get("session_id")})
+  if session_id is None and len(sessions) > 1:
+    raise ValueError(f"The export holds {len(sessions)} sessions; pick one of {', '.join(sessions)} with --session-id")
+  if session_id is not None:
+    rows = [row for row in rows if row.get("session_id") == session_id]
+  if not rows:
+    raise ValueError(f"No conversation_messages rows in {path}")
+  return sorted(rows, key=lambda row: row.get("created_at") or "")
+
+
+def _sheet_context(row: Dict[str, Any], default: SheetContext) -> SheetContext:
+  # Rows exported with select=*,sheet_tabs(spreadsheet_id,sheet_title) carry their tab
+  tab = row.get("sheet_tabs") or {}
+  spreadsheet_id = tab.get("spreadsheet_id") or row.get("spreadsheet_id")
+  if not spreadsheet_id:
+    return default
+  return SheetContext(spreadsheetId=spreadsheet_id, sheetTitle=tab.get("sheet_title") or row.get("sheet_title"))
+
+
+# --- replay ---
+
+def _stages(request_id: str) -> Dict[str, Dict[str, Any]]:
+  buffer = get_trace_buffer()
+  trace = buffer.get(request_id) if buffer is not None else None
+  stages: Dict[str, Dict[str, Any]] = {}
+  if trace is None:
+    return stages
+  for span in trace.spans[1:]:
+    if span.end is None:
+      continue
+    stage = stages.setdefault(span.name, {"calls": 0, "total_ms": 0.0})
+    stage["calls"] += 1
+    stage["total_ms"] += (span.end - span.start) * 1000
+  for stage in stages.values():
+    stage["total_ms"] = round(stage["total_ms"], 3)
+  return stages
+
+
+def replay_session(
+  rows: List[Dict[str, Any]],
+  cassette: Cassette,
+  sheet_context: Optional[SheetContext] = None,
+  progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+  """
+  Send the session's user messages through a fresh ChatService with LLM and
+  Sheets traffic recorded to or replayed from `cassette`; returns the
+  timings document.
+  """
+  if get_trace_buffer() is None:
+    raise RuntimeError("Replay times stages from traces; unset TRACE_BUFFER_SIZE=0")
+
+  default_context = sheet_context or SheetContext()
+  supabase = FakeSupabase()
+  rest_client = SupabaseRestClient("http://supabase.replay", "replay", transport=supabase.transport())
+  saved = (cassette_module._cassette, supabase_rest._rest_client, snapshot_store._store, api._sheets_service)
+  cassette_module._cassette = cassette
+  supabase_rest._rest_client = rest_client
+  snapshot_store._store = SupabaseSnapshotStore(rest_client)
+  service: Optional[ChatService] = None
+  turns: List[Dict[str, Any]] = []
+  try:
+    backend = PythonChatBackend()
+    api._sheets_service = api._SheetsServiceWrapper(backend._sheets_client)
+    service = ChatService(backend, ConversationStore())
+    session_id = f"replay-{uuid.uuid4()}"
+    cursor: Optional[str] = None
+    user_rows = [row for row in rows if row.get("role") == ChatMessageRole.user.value]
+    for index, row in enumerate(user_rows):
+      message = ChatMessage(id=row.get("message_id") or str(uuid.uuid4()), role=ChatMessageRole.user, content=row["content"])
+      request = ChatRequest(
+        messages=[message],
+        sheetContext=_sheet_context(row, default_context),
+        sessionId=session_id,
+        delta=True,
+        cursor=cursor,
+      )
+      request_id = f"{session_id}-{index}"
+      error: Optional[str] = None
+      token = start_trace(request_id, "replay.turn")
+      started = time.perf_counter()
+      try:
+        response = service.chat(request)
+        cursor = response.cursor
+      except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        # Later turns continue from whatever the session holds
+        cursor = service.store.cursor(session_id)
+      finally:
+        elapsed = time.perf_counter() - started
+        finish_trace(token)
+      turn = {
+        "index": index,
+        "message_id": message.id,
+        "total_ms": round(elapsed * 1000, 3),
+        "stages": _stages(request_id),
+      }
+      if error is not None:
+        turn["error"] = error
+      turns.append(turn)
+      if progress is not None:
+        progress(turn)
+  finally:
+    if service is not None:
+      service.close()
+    cassette_module._cassette, supabase_rest._rest_client, snapshot_store._store, api._sheets_service = saved
+    rest_client.close()
+
+  stages: Dict[str, Dict[str, Any]] = {}
+  for turn in turns:
+    for name, stage in turn["stages"].items():
+      total = stages.setdefault(name, {"calls": 0, "total_ms": 0.0})
+      total["calls"] += stage["calls"]
+      total["total_ms"] = round(total["total_ms"] + stage["total_ms"], 3)
+
+  return {
+    "version": RESULTS_VERSION,
+    "meta": {
+      "created_at": _dt.datetime.utcnow().isoformat() + "Z",
+      "git_commit": _git_commit(),
+      "session_id": rows[0].get("session_id"),
+      "cassette": str(cassette.path),
+      "mode": cassette.mode,
+      "latency_scale": cassette.latency_scale,
+    },
+    "total_ms": round(sum(turn["total_ms"] for turn in turns), 3),
+    "errors": sum(1 for turn in turns if "error" in turn),
+    "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["total_ms"])),
+    "turns": turns,
+    "cassette": cassette.stats(),
+  }
+
+
+# --- reporting ---
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+  """The session total, then every stage in either document, by the size of its change."""
+  before_stages = baseline.get("stages", {})
+  after_stages = current.get("stages", {})
+  deltas = [
+    {
+      "stage": "total",
+      "ms": (baseline.get("total_ms", 0.0), current.get("total_ms", 0.0)),
+      "calls": None,
+      "change": _relative_change(baseline.get("total_ms", 0.0), current.get("total_ms", 0.0)),
+    }
+  ]
+  names = list(after_stages) + [name for name in before_stages if name not in after_stages]
+  stage_deltas = []
+  for name in names:
+    before = before_stages.get(name, {"calls": 0, "total_ms": 0.0})
+    after = after_stages.get(name, {"calls": 0, "total_ms": 0.0})
+    stage_deltas.append(
+      {
+        "stage": name,
+        "ms": (before["total_ms"], after["total_ms"]),
+        "calls": (before["calls"], after["calls"]) if before["calls"] != after["calls"] else None,
+        "change": _relative_change(before["total_ms"], after["total_ms"]),
+      }
+    )
+  stage_deltas.sort(key=lambda delta: -abs(delta["ms"][1] - delta["ms"][0]))
+  return deltas + stage_deltas
+
+
+def format_turn(turn: Dict[str, Any]) -> str:
+  slowest = sorted(turn["stages"].items(), key=lambda item: -item[1]["total_ms"])[:3]
+  stages = ", ".join(f"{name} {stage['total_ms']:.0f}ms" for name, stage in slowest)
+  line = f"turn {turn['index'] + 1:>3}  {turn['total_ms']:>10.1f}ms  {stages}"
+  return line + (f"  ERROR {turn['error']}" if "error" in turn else "")
+
+
+def _format_delta(delta: Dict[str, Any]) -> str:
+  change = "   n/a" if delta["change"] is None else f"{delta['change'] * 100:+6.1f}%"
+  before, after = delta["ms"]
+  calls = f"  calls {delta['calls'][0]}->{delta['calls'][1]}" if delta["calls"] else ""
+  return f"{delta['stage']:<40} {before:>10.1f} -> {after:>10.1f}ms {change}  ({after - before:+.1f}ms){calls}"
+
+
+# --- CLI ---
+
+def build_arg_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description="Replay a conversation_messages session export and time each stage")
+  parser.add_argument("export", type=Path, help="Session export: JSON rows, {\"messages\": [...]} or CSV")
+  parser.add_argument("--cassette", type=Path, required=True, help="Cassette of recorded LLM and Sheets traffic (JSON lines)")
+  parser.add_argument("--record", action="store_true", help="Run against the live APIs and overwrite the cassette")
+  parser.add_argument(
+    "--latency-scale",
+    type=float,
+    default=1.0,
+    help="Multiplier for recorded latencies when replaying; 0 answers immediately (default: 1)",
+  )
+  parser.add_argument("--session-id", help="Session to replay when the export holds several")
+  parser.add_argument("--spreadsheet-id", help="Sheet context for rows without a sheet tab")
+  parser.add_argument("--sheet-title", help="Sheet title for rows without a sheet tab")
+  parser.add_argument("--redact-keys", default="", help="Comma-separated extra keys to redact when recording")
+  parser.add_argument("--output", help="Write the timings as JSON to this file")
+  parser.add_argument("--compare", help="Timings JSON from an earlier replay to compare against")
+  return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  args = build_arg_parser().parse_args(argv)
+  rows = load_session(args.export, args.session_id)
+  if args.record and args.cassette.exists():
+    args.cassette.unlink()
+  cassette = Cassette(
+    args.cassette,
+    "record" if args.record else "replay",
+    latency_scale=args.latency_scale,
+    redact_keys=args.redact_keys.split(","),
+  )
+  context = SheetContext(spreadsheetId=args.spreadsheet_id, sheetTitle=args.sheet_title)
+
+  document = replay_session(rows, cassette, context, progress=lambda turn: print(format_turn(turn), flush=True))
+  stats = document["cassette"]
+  print(
+    f"\n{len(document['turns'])} turn(s) in {document['total_ms']:.1f}ms; cassette: {stats['exact']} exact, "
+    f"{stats['loose']} loose, {stats['misses']} missed, {stats['unused']} unused interaction(s)"
+  )
+
+  if args.output:
+    Path(args.output).write_text(json.dumps(document, indent=2) + "\n")
+    print(f"Timings written to {args.output}")
+
+  if args.compare:
+    baseline = json.loads(Path(args.compare).read_text())
+    print(f"\nCompared with {args.compare} ({baseline.get('meta', {}).get('git_commit') or 'unknown commit'}):")
+    for delta in compare(baseline, document):
+      print(_format_delta(delta))
+
+  return 1 if document["errors"] else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,99 +1,224 @@
 from __future__ import annotations
 
+import contextvars
+import sqlite3
 import uuid
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
 
 from .backend import ChatBackend
+from .blob_store import get_payload_store
 from .conversation_logger import ConversationLogger
+from .logging_config import get_logger
 from .memory import ConversationStore
 from .models import ChatMessage, ChatMessageRole, ChatRequest, ChatResponse, SheetContext
+from .profiler import run_profiled
+from .shared_cache import SharedCache, get_shared_cache
+
+logger = get_logger(__name__)
+
+
+def _index_after(history: Sequence[ChatMessage], cursor: Optional[str]) -> int:
+  """Index just past message `cursor` in `history`, or 0 if it is not there."""
+  if cursor is not None:
+    for i in range(len(history) - 1, -1, -1):
+      if history[i].id == cursor:
+        return i + 1
+  return 0
 
 
 class ChatService:
   """
   High-level chat service that adds conversation memory on top of
   a lower-level chat backend.
+
+  With a shared cache (see shared_cache.py), every worker on the host appends
+  its turns to the same session logs: sessions are loaded from there before
+  Supabase, and a resident session picks up messages other workers added
+  before each turn.
   """
 
-  def __init__(self, backend: ChatBackend, store: Optional[ConversationStore] = None) -> None:
+  def __init__(
+    self,
+    backend: ChatBackend,
+    store: Optional[ConversationStore] = None,
+    shared: Optional[SharedCache] = None,
+    conversation_logger: Optional[ConversationLogger] = None,
+  ) -> None:
     self.backend = backend
     self.store = store or ConversationStore()
-    self._logger = ConversationLogger()
-    self._loaded_sessions: set = set()  # Track which sessions have been loaded from DB
-
-  def _ensure_history_loaded(self, session_id: str) -> None:
+    self._logger = conversation_logger if conversation_logger is not None else ConversationLogger()
+    self._shared = shared if shared is not None else get_shared_cache()
+    if self.store.loader is None and (self._shared is not None or self._logger.enabled):
+      # Sessions not in memory (new to this process, or evicted) are loaded
+      # on first access: the latest page, older pages on demand
+      self.store.loader = self._load_page
+      self.store.older_loader = self._load_older_page
+    if self.store.prepare is None:
+      # Stored and logged copies keep large tool payloads as blob references
+      self.store.prepare = get_payload_store().offload
+    self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-prefetch")
+
+  def close(self) -> None:
+    """Flush queued conversation rows (call on shutdown)."""
+    self._prefetcher.shutdown(wait=False)
+    self._logger.close()
+
+  def _load_page(self, session_id: str) -> List[ChatMessage]:
+    if self._shared is not None:
+      try:
+        messages = self._shared.load_messages(session_id, self._logger.history_page_size)
+        if messages:
+          return messages
+      except sqlite3.Error as exc:
+        logger.warning(f"Shared cache read failed for session {session_id}: {exc}")
+
+    if not self._logger.enabled:
+      return []
+    messages = self._logger.load_messages(session_id)
+    if messages:
+      # Seed the shared log so the other workers skip Supabase
+      self._append_shared(session_id, messages)
+    return messages
+
+  def _load_older_page(self, session_id: str, before_id: str) -> List[ChatMessage]:
+    if self._shared is not None:
+      try:
+        messages = self._shared.load_messages_before(session_id, before_id, self._logger.history_page_size)
+        if messages:
+          return messages
+      except sqlite3.Error as exc:
+        logger.warning(f"Shared cache read failed for session {session_id}: {exc}")
+    return self._logger.load_messages_before(session_id, before_id) if self._logger.enabled else []
+
+  def _append_shared(self, session_id: str, messages: List[ChatMessage]) -> None:
+    if self._shared is None or not messages:
+      return
+    try:
+      self._shared.append_messages(session_id, messages)
+    except sqlite3.Error as exc:
+      logger.warning(f"Shared cache write failed for session {session_id}: {exc}")
+
+  def _sync_shared(self, session_id: str) -> None:
+    # Another worker may have served turns of a session this one holds
+    if self._shared is None or not self.store.is_resident(session_id):
+      return
+    try:
+      newer = self._shared.messages_after(session_id, self.store.cursor(session_id))
+    except sqlite3.Error as exc:
+      logger.warning(f"Shared cache read failed for session {session_id}: {exc}")
+      return
+    if newer:
+      self.store.append_messages(session_id, newer)
+
+  def _start_prefetch(self, session_id: str, sheet_context: SheetContext) -> None:
+    # A session that has to be loaded first gets the backend's sheet prefetch
+    # running alongside the load
+    if sheet_context.spreadsheetId and not self.store.is_resident(session_id):
+      # Run in a copy of this context so the prefetch's spans land in the request's
+      # trace, and its stacks in the request's profile
+      self._prefetcher.submit(contextvars.copy_context().run, run_profiled, self.backend.prefetch, sheet_context)
+
+  def _send_turn(
+    self,
+    session_id: str,
+    messages: List[ChatMessage],
+    sheet_context: SheetContext,
+  ) -> ChatResponse:
     """
-    Ensure that the conversation history for a session is loaded from Supabase
-    into the in-memory store. Only loads once per session.
+    Append this turn's messages to the session log and send the history.
+
+    The backend gets a view of the log rather than a copy; if it fails, the
+    messages this turn appended are removed again so the turn can be retried.
+    Messages other turns appended meanwhile stay.
     """
-    if session_id in self._loaded_sessions:
-      return
+    new_messages = self.store.append_messages(session_id, messages)
 
-    # Check if we already have history in memory
-    existing_history = self.store.get_history(session_id)
-    if existing_history:
-      # Already have messages in memory, mark as loaded
-      self._loaded_sessions.add(session_id)
-      return
+    # The backend only iterates the history, so skip re-validating every message
+    full_request = ChatRequest.model_construct(
+      messages=self.store.get_history(session_id),
+      sheetContext=sheet_context,
+      sessionId=session_id,
+    )
+    try:
+      response = self.backend.send_chat(full_request)
+    except Exception:
+      self.store.remove_messages(session_id, {message.id for message in new_messages})
+      raise
+
+    # The client still gets full payloads; the store keeps the prepared copies
+    new_messages += self.store.append_messages(session_id, response.messages)
+    self._append_shared(session_id, new_messages)
 
-    # Try to load from Supabase if logger is enabled
     if self._logger.enabled:
-      messages = self._logger.load_messages(session_id)
-      if messages:
-        self.store.set_history(session_id, messages)
+      # Persist only newly seen request messages plus this turn's responses
+      self._logger.log_messages(
+        session_id,
+        new_messages,
+        sheet_context=sheet_context,
+      )
 
-    # Mark as loaded even if no messages were found (prevents repeated DB queries)
-    self._loaded_sessions.add(session_id)
+    response.cursor = self.store.cursor(session_id)
+    return response
 
   def chat(self, request: ChatRequest) -> ChatResponse:
     """
     Handle a ChatRequest that may contain partial or full message history.
 
-    This method loads any historical messages from Supabase on first access,
-    merges them with incoming messages, forwards the complete history to the backend,
-    and records the returned messages.
-    """
-    # Load historical context from Supabase if this is the first time we're seeing this session
-    if request.sessionId:
-      self._ensure_history_loaded(request.sessionId)
+    The store loads any historical messages from Supabase on first access.
+    Incoming messages the session has not seen are appended, the complete
+    history is forwarded to the backend, and the returned messages are recorded.
 
-    # Get the stored history (includes loaded Supabase messages)
-    history = self.store.get_history(request.sessionId) if request.sessionId else []
+    In delta mode the request's cursor must match the session's last message
+    id; otherwise nothing is processed and the response asks for a resync.
+    """
+    if not request.sessionId:
+      if request.delta:
+        raise ValueError("Delta chat requests require a sessionId")
+      return self.backend.send_chat(request)
+
+    self._start_prefetch(request.sessionId, request.sheetContext)
+    self._sync_shared(request.sessionId)
+    if request.delta:
+      cursor = self.store.cursor(request.sessionId)
+      if request.cursor != cursor:
+        logger.info(
+          f"Stale cursor for session {request.sessionId}, asking client to resync",
+          extra={"session_id": request.sessionId, "cursor": request.cursor, "server_cursor": cursor},
+        )
+        return ChatResponse(messages=[], sessionId=request.sessionId, cursor=cursor, resync=True)
 
-    # Merge stored history with incoming messages (avoiding duplicates)
-    seen_ids = {msg.id for msg in history}
-    new_request_messages = [m for m in request.messages if m.id not in seen_ids]
+    return self._send_turn(request.sessionId, request.messages, request.sheetContext)
 
-    # Create the complete message history: stored history + new messages
-    full_history = history + new_request_messages
+  def messages_after(self, session_id: str, cursor: Optional[str] = None) -> ChatResponse:
+    """
+    Messages a client at `cursor` has not seen, for catching up after a resync.
 
-    # Create a new request with the complete history
-    full_request = ChatRequest(
-      messages=full_history,
-      sheetContext=request.sheetContext,
-      sessionId=request.sessionId,
+    Older pages are loaded until the cursor is found; an unknown cursor
+    returns the whole history. Offloaded tool payloads are restored, since
+    clients read them from message metadata.
+    """
+    self._sync_shared(session_id)
+    history = self.store.get_history(session_id)
+    start = _index_after(history, cursor)
+    while cursor is not None and start == 0 and self.store.load_older(session_id):
+      history = self.store.get_history(session_id)
+      start = _index_after(history, cursor)
+
+    payloads = get_payload_store()
+    messages: List[ChatMessage] = []
+    for message in history[start:]:
+      if message.metadata is not None and message.metadata.payloadRef is not None:
+        payload = payloads.load(message.metadata)
+        message = message.model_copy(update={"metadata": message.metadata.model_copy(update={"payload": payload})})
+      messages.append(message)
+
+    return ChatResponse(
+      messages=messages,
+      sessionId=session_id,
+      cursor=history[-1].id if history else None,
     )
 
-    # Send the complete history to the backend
-    response = self.backend.send_chat(full_request)
-
-    if request.sessionId:
-      session_id = request.sessionId
-
-      # Store the complete conversation: full history + new responses
-      combined = full_history + response.messages
-      self.store.set_history(session_id, combined)
-
-      if self._logger.enabled:
-        # Persist only newly seen request messages plus this turn's responses
-        self._logger.log_messages(
-          session_id,
-          list(new_request_messages) + list(response.messages),
-          sheet_context=request.sheetContext,
-        )
-
-    return response
-
   def simple_chat(
     self,
     session_id: str,
@@ -105,37 +230,12 @@ class ChatService:
     the latest user message. The service maintains the full conversation
     history per session and sends that to the underlying backend.
     """
-    sheet_ctx = sheet_context or SheetContext()
-
-    # Load historical context from Supabase if this is the first time we're seeing this session
-    self._ensure_history_loaded(session_id)
-
-    history = self.store.get_history(session_id)
     user_message = ChatMessage(
       id=str(uuid.uuid4()),
       role=ChatMessageRole.user,
       content=user_content,
     )
-    full_history = history + [user_message]
-
-    request = ChatRequest(
-      messages=full_history,
-      sheetContext=sheet_ctx,
-      sessionId=session_id,
-    )
-
-    response = self.backend.send_chat(request)
-
-    # The current backend returns only the new messages; append them
-    combined = full_history + response.messages
-    self.store.set_history(session_id, combined)
-
-    if self._logger.enabled:
-      # For CLI-style usage we know exactly which messages are new.
-      self._logger.log_messages(
-        session_id,
-        [user_message] + list(response.messages),
-        sheet_context=sheet_ctx,
-      )
-
-    return response
+    sheet_context = sheet_context or SheetContext()
+    self._start_prefetch(session_id, sheet_context)
+    self._sync_shared(session_id)
+    return self._send_turn(session_id, [user_message], sheet_context)
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
+
+from .logging_config import get_logger
+from .models import ChatMessage
+
+logger = get_logger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parents[1] / ".data"
+
+# Namespaces used by the callers of the key/value tier
+NS_SHEETS_METADATA = "sheets_metadata"
+NS_SHEET_CONTEXT = "sheet_context"
+NS_SHEET_GENERATION = "sheet_generation"
+
+_SCHEMA = """
+create table if not exists kv (
+  namespace text not null,
+  key text not null,
+  value text not null,
+  expires_at real,
+  primary key (namespace, key)
+);
+create index if not exists kv_expires_at_idx on kv (expires_at);
+
+create table if not exists session_messages (
+  session_id text not null,
+  seq integer not null,
+  message_id text not null,
+  data text not null,
+  primary key (session_id, seq),
+  unique (session_id, message_id)
+);
+
+create table if not exists sessions (
+  session_id text primary key,
+  updated_at real not null
+);
+create index if not exists sessions_updated_at_idx on sessions (updated_at);
+"""
+
+
+class SharedCache:
+  """
+  Host-local cache tier shared by every worker process on a box.
+
+  One SQLite file in WAL mode holds a TTL'd key/value table (spreadsheet
+  metadata, sheet contexts, generation counters) and per-session message
+  logs. SQLite's file locks make it process-safe: readers never block, and
+  writers serialize through short `begin immediate` transactions, waiting
+  up to `busy_timeout` seconds for the lock. Sessions idle for longer than
+  `session_ttl` seconds are dropped by `purge_expired()`, which
+  `SharedCachePurgeJob` runs periodically.
+
+  Values are JSON; message logs store ChatMessage JSON in append order, so
+  a worker can pick up exactly the messages another worker added.
+  """
+
+  def __init__(self, path: Path, session_ttl: Optional[float] = 24 * 3600, busy_timeout: float = 5.0) -> None:
+    self.path = Path(path)
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    self.session_ttl = session_ttl
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(str(self.path), timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+    self._conn.execute("pragma journal_mode=wal")
+    self._conn.execute("pragma synchronous=normal")
+    self._conn.executescript(_SCHEMA)
+
+  def _write(self, statements: Iterable[tuple]) -> None:
+    with self._lock:
+      # Take the write lock up front so concurrent workers queue instead of failing to upgrade
+      self._conn.execute("begin immediate")
+      try:
+        for sql, params in statements:
+          self._conn.execute(sql, params)
+        self._conn.execute("commit")
+      except Exception:
+        self._conn.execute("rollback")
+        raise
+
+  # --- key/value ---
+
+  def get(self, namespace: str, key: str) -> Any:
+    """The value stored under (namespace, key), or None if missing or expired."""
+    with self._lock:
+      row = self._conn.execute(
+        "select value, expires_at from kv where namespace = ? and key = ?",
+        (namespace, key),
+      ).fetchone()
+    if row is None or (row[1] is not None and row[1] <= time.time()):
+      return None
+    return json.loads(row[0])
+
+  def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+    expires_at = time.time() + ttl if ttl else None
+    self._write([(
+      "insert or replace into kv (namespace, key, value, expires_at) values (?, ?, ?, ?)",
+      (namespace, key, json.dumps(value, default=str), expires_at),
+    )])
+
+  def delete(self, namespace: str, key: str) -> None:
+    self._write([("delete from kv where namespace = ? and key = ?", (namespace, key))])
+
+  def bump(self, namespace: str, key: str) -> None:
+    """Increment a counter, e.g. a generation that cache keys include."""
+    self._write([(
+      "insert into kv (namespace, key, value, expires_at) values (?, ?, '1', null) "
+      "on conflict (namespace, key) do update set value = cast(value as integer) + 1",
+      (namespace, key),
+    )])
+
+  def counter(self, namespace: str, key: str) -> int:
+    return int(self.get(namespace, key) or 0)
+
+  # --- session message logs ---
+
+  def append_messages(self, session_id: str, messages: Iterable[ChatMessage]) -> None:
+    """Append messages to a session's log; ids already in it are skipped."""
+    messages = list(messages)
+    if not messages:
+      return
+    now = time.time()
+    with self._lock:
+      self._conn.execute("begin immediate")
+      try:
+        row = self._conn.execute(
+          "select coalesce(max(seq), 0) from session_messages where session_id = ?",
+          (session_id,),
+        ).fetchone()
+        seq = row[0]
+        for message in messages:
+          cursor = self._conn.execute(
+            "insert or ignore into session_messages (session_id, seq, message_id, data) values (?, ?, ?, ?)",
+            (session_id, seq + 1, message.id, message.model_dump_json()),
+          )
+          seq += cursor.rowcount
+        self._conn.execute(
+          "insert or replace into sessions (session_id, updated_at) values (?, ?)",
+          (session_id, now),
+        )
+        self._conn.execute("commit")
+      except Exception:
+        self._conn.execute("rollback")
+        raise
+
+  def load_messages(self, session_id: str, limit: int) -> List[ChatMessage]:
+    """The last `limit` messages of a session, oldest first."""
+    with self._lock:
+      rows = self._conn.execute(
+        "select data from session_messages where session_id = ? order by seq desc limit ?",
+        (session_id, limit),
+      ).fetchall()
+    return [ChatMessage.model_validate_json(data) for (data,) in reversed(rows)]
+
+  def load_messages_before(self, session_id: str, before_id: str, limit: int) -> List[ChatMessage]:
+    """Up to `limit` messages preceding `before_id`, oldest first."""
+    with self._lock:
+      rows = self._conn.execute(
+        "select data from session_messages where session_id = ? and seq < "
+        "  (select seq from session_messages where session_id = ? and message_id = ?) "
+        "order by seq desc limit ?",
+        (session_id, session_id, before_id, limit),
+      ).fetchall()
+    return [ChatMessage.model_validate_json(data) for (data,) in reversed(rows)]
+
+  def messages_after(self, session_id: str, after_id: Optional[str]) -> Optional[List[ChatMessage]]:
+    """
+    Messages appended after `after_id` (all of them for None).
+
+    Returns None when `after_id` is not in the shared log, since nothing can
+    then be said about what follows it.
+    """
+    with self._lock:
+      if after_id is None:
+        after_seq = 0
+      else:
+        row = self._conn.execute(
+          "select seq from session_messages where session_id = ? and message_id = ?",
+          (session_id, after_id),
+        ).fetchone()
+        if row is None:
+          return None
+        after_seq = row[0]
+      rows = self._conn.execute(
+        "select data from session_messages where session_id = ? and seq > ? order by seq",
+        (session_id, after_seq),
+      ).fetchall()
+    return [ChatMessage.model_validate_json(data) for (data,) in rows]
+
+  # --- maintenance ---
+
+  def purge_expired(self) -> None:
+    now = time.time()
+    statements = [("delete from kv where expires_at is not null and expires_at <= ?", (now,))]
+    if self.session_ttl:
+      cutoff = now - self.session_ttl
+      statements += [
+        (
+          "delete from session_messages where session_id in (select session_id from sessions where updated_at < ?)",
+          (cutoff,),
+        ),
+        ("delete from sessions where updated_at < ?", (cutoff,)),
+      ]
+    self._write(statements)
+
+  def close(self) -> None:
+    with self._lock:
+      self._conn.close()
+
+
+class SharedCachePurgeJob:
+  """Background thread that runs `cache.purge_expired()` every `interval` seconds."""
+
+  def __init__(self, cache: SharedCache, interval: float) -> None:
+    self._cache = cache
+    self.interval = interval
+    self._stopped = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="shared-cache-purge", daemon=True)
+    self._thread.start()
+
+  def _run(self) -> None:
+    while not self._stopped.wait(self.interval):
+      try:
+        self._cache.purge_expired()
+      except sqlite3.Error as exc:
+        logger.warning(f"Shared cache purge failed: {exc}")
+
+  def stop(self, timeout: float = 5.0) -> None:
+    self._stopped.set()
+    self._thread.join(timeout=timeout)
+
+
+_shared_cache: Optional[SharedCache] = None
+_purge_job: Optional[SharedCachePurgeJob] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+  """
+  Get or create the host-wide shared cache, if enabled.
+
+  SHARED_CACHE=1 enables it at .data/shared_cache.sqlite3; SHARED_CACHE_PATH
+  enables it at another path (use the same path for every worker on a host).
+  SHARED_CACHE_SESSION_TTL (default 86400 seconds, 0 keeps sessions) bounds
+  how long idle session logs are kept; expired entries are purged on open
+  and every SHARED_CACHE_PURGE_INTERVAL seconds (default 3600, 0 disables
+  the periodic purge). Returns None when disabled.
+  """
+  global _shared_cache, _purge_job
+
+  if _shared_cache is not None:
+    return _shared_cache
+
+  path = os.getenv("SHARED_CACHE_PATH")
+  if not path and os.getenv("SHARED_CACHE", "0") != "1":
+    return None
+
+  with _shared_cache_lock:
+    if _shared_cache is not None:
+      return _shared_cache
+    session_ttl = float(os.getenv("SHARED_CACHE_SESSION_TTL", str(24 * 3600)))
+    _shared_cache = SharedCache(Path(path or DATA_DIR / "shared_cache.sqlite3"), session_ttl=session_ttl or None)
+    try:
+      _shared_cache.purge_expired()
+    except sqlite3.Error as exc:
+      logger.warning(f"Shared cache purge failed: {exc}")
+    purge_interval = float(os.getenv("SHARED_CACHE_PURGE_INTERVAL", "3600"))
+    if purge_interval > 0:
+      _purge_job = SharedCachePurgeJob(_shared_cache, purge_interval)
+    logger.info(f"Shared cache enabled at {_shared_cache.path}")
+    return _shared_cache
+
+
+def close_shared_cache() -> None:
+  global _shared_cache, _purge_job
+  with _shared_cache_lock:
+    if _purge_job is not None:
+      _purge_job.stop()
+      _purge_job = None
+    if _shared_cache is not None:
+      _shared_cache.close()
+      _shared_cache = None
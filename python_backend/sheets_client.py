@@ -2,20 +2,114 @@ from __future__ import annotations
 
 import json
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from .call_budget import record_sheets_call
+from .cassette import get_cassette
+from .logging_config import get_logger
+from .memory_diagnostics import register_stats
+from .metrics import SHEETS_DURATION, SHEETS_REQUESTS
+from .sheets_emulator import get_sheets_emulator
+from .tracing import span
+from .shared_cache import NS_SHEET_GENERATION, NS_SHEETS_METADATA, get_shared_cache
+
+logger = get_logger(__name__)
+
+# Spreadsheets whose metadata is held per client, least recently used dropped first
+_METADATA_CACHE_SIZE = 256
+# How long a prefetch waits for its hand-off when the metadata cache is off
+_PREFETCH_HANDOFF_SECONDS = 30.0
+
+
+class MeteredHttpRequest(HttpRequest):
+  """
+  API request that records its latency and outcome by API method, e.g.
+  sheets.spreadsheets.values.get, a trace span, and the call and bytes
+  received in the request's call budget. Services built with it as requestBuilder
+  are metered wherever their requests are executed.
+  """
+
+  def execute(self, http=None, num_retries=0):
+    method = self.methodId or "unknown"
+    started = time.perf_counter()
+    outcome = "error"
+    received = 0
+    postproc = self.postproc
+
+    def measure(resp, content):
+      nonlocal received
+      received = len(content or b"")
+      return postproc(resp, content)
+
+    self.postproc = measure
+    with span(method, "sheets"):
+      try:
+        result = super().execute(http=http, num_retries=num_retries)
+        outcome = "ok"
+        return result
+      except HttpError as exc:
+        outcome = f"http_{exc.resp.status}"
+        raise
+      finally:
+        self.postproc = postproc
+        SHEETS_REQUESTS.inc(method, outcome)
+        SHEETS_DURATION.observe(time.perf_counter() - started, method)
+        record_sheets_call(method, received)
 
 
 class ServiceAccountSheetsClient:
   """
   Google Sheets API client using service account credentials, mirroring the
   behavior of the TypeScript ServiceAccountSheetsClient.
+
+  Spreadsheet metadata is cached for SHEETS_METADATA_TTL seconds (default 0,
+  off) and concurrent lookups of the same spreadsheet share one request.
+  With the cache off, prefetch_metadata still hands its result to the next
+  lookup, once. Writes through this client drop the cached entry. With the
+  shared cache enabled and a TTL set, metadata is shared by every worker on
+  the host and writes expire it everywhere.
+
+  A prebuilt `service` (e.g. one backed by an in-process fake) is used as is,
+  without credentials, and so is the Sheets emulator when SHEETS_EMULATOR
+  is set (see sheets_emulator.get_sheets_emulator). With CASSETTE_MODE set,
+  API calls are recorded to or replayed from a cassette (see cassette.py).
   """
 
-  def __init__(self, credentials_path: Optional[str] = None) -> None:
+  def __init__(self, credentials_path: Optional[str] = None, service: Optional[Any] = None) -> None:
+    self.metadata_ttl = float(os.getenv("SHEETS_METADATA_TTL", "0"))
+    self._metadata: "OrderedDict[str, Tuple[float, Future, int]]" = OrderedDict()
+    self._shared = get_shared_cache()
+    self._metadata_lock = threading.Lock()
+    self._local = threading.local()
+    register_stats("sheets_metadata_cache", self)
+
+    emulator = get_sheets_emulator() if service is None else None
+    if emulator is not None:
+      service = emulator.service(MeteredHttpRequest)
+    cassette = get_cassette() if service is None else None
+    if cassette is not None and cassette.replaying:
+      service = cassette.sheets_service(MeteredHttpRequest)
+    self._recorder = cassette if cassette is not None and cassette.recording else None
+
+    if service is not None:
+      self._creds = None
+      self._service = service
+      self._sheets = service.spreadsheets()
+      return
+
     scopes = [
       "https://www.googleapis.com/auth/spreadsheets",
       "https://www.googleapis.com/auth/drive.readonly",
@@ -38,7 +132,8 @@ class ServiceAccountSheetsClient:
           info,
           scopes=scopes,
         )
-        service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+        service = self._build_service(creds)
+        self._creds = creds
         self._service = service
         self._sheets = service.spreadsheets()
         return
@@ -83,19 +178,145 @@ class ServiceAccountSheetsClient:
       scopes=scopes,
     )
 
-    service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+    service = self._build_service(creds)
+    self._creds = creds
     self._service = service
     self._sheets = service.spreadsheets()
 
+  def _build_service(self, creds: Any) -> Any:
+    if self._recorder is None:
+      return build("sheets", "v4", credentials=creds, cache_discovery=False, requestBuilder=MeteredHttpRequest)
+    return build("sheets", "v4", http=self._authorized_http(creds), cache_discovery=False, requestBuilder=MeteredHttpRequest)
+
+  def _authorized_http(self, creds: Any) -> Any:
+    http = AuthorizedHttp(creds, http=httplib2.Http())
+    # Recording wraps the authorized http, so tokens never reach the cassette
+    return self._recorder.sheets_http(http) if self._recorder is not None else http
+
   # --- Metadata ---
 
   def get_spreadsheet_metadata(self, spreadsheet_id: str) -> Dict[str, Any]:
+    # Writes from any worker bump the shared generation, expiring local copies
+    generation = self._generation(spreadsheet_id)
+    if generation is None:
+      return self._fetch_spreadsheet_metadata(spreadsheet_id)
+    now = time.monotonic()
+
+    if self.metadata_ttl <= 0:
+      # Only a prefetched entry is used, and only by one lookup
+      with self._metadata_lock:
+        entry = self._metadata.pop(spreadsheet_id, None)
+      if entry is not None and entry[0] > now and entry[2] == generation:
+        try:
+          return entry[1].result()
+        except Exception:
+          pass  # The prefetch failed; fetch it here
+      return self._fetch_spreadsheet_metadata(spreadsheet_id)
+
+    with self._metadata_lock:
+      entry = self._metadata.get(spreadsheet_id)
+      owner = entry is None or entry[0] <= now or entry[2] != generation
+      if owner:
+        future: Future = Future()
+        self._remember(spreadsheet_id, (now + self.metadata_ttl, future, generation))
+      else:
+        future = entry[1]
+        self._metadata.move_to_end(spreadsheet_id)
+
+    if owner:
+      self._resolve(spreadsheet_id, generation, future)
+    return future.result()
+
+  def prefetch_metadata(self, spreadsheet_id: str) -> None:
+    """Fetch metadata ahead of the next get_spreadsheet_metadata, e.g. from another thread."""
+    if self.metadata_ttl > 0:
+      self.get_spreadsheet_metadata(spreadsheet_id)
+      return
+
+    generation = self._generation(spreadsheet_id)
+    if generation is None:
+      return
+    future: Future = Future()
+    with self._metadata_lock:
+      self._remember(spreadsheet_id, (time.monotonic() + _PREFETCH_HANDOFF_SECONDS, future, generation))
+    self._resolve(spreadsheet_id, generation, future)
+    future.result()
+
+  def _remember(self, spreadsheet_id: str, entry: Tuple[float, Future, int]) -> None:
+    # Caller holds _metadata_lock
+    self._metadata[spreadsheet_id] = entry
+    self._metadata.move_to_end(spreadsheet_id)
+    while len(self._metadata) > _METADATA_CACHE_SIZE:
+      self._metadata.popitem(last=False)
+
+  def _generation(self, spreadsheet_id: str) -> Optional[int]:
+    # None when the shared cache cannot say, so nothing cached may be trusted
+    if not self._shared:
+      return 0
+    try:
+      return self._shared.counter(NS_SHEET_GENERATION, spreadsheet_id)
+    except sqlite3.Error as exc:
+      logger.warning(f"Shared cache read failed for spreadsheet {spreadsheet_id}: {exc}")
+      return None
+
+  def _resolve(self, spreadsheet_id: str, generation: int, future: Future) -> None:
+    shared = self._shared if self.metadata_ttl > 0 else None
+    # Keyed by generation, so a copy stored after another worker's write is never read
+    key = f"{spreadsheet_id}/{generation}"
+    try:
+      metadata = None
+      if shared:
+        try:
+          metadata = shared.get(NS_SHEETS_METADATA, key)
+        except sqlite3.Error as exc:
+          logger.warning(f"Shared cache read failed for spreadsheet {spreadsheet_id}: {exc}")
+          shared = None
+      if metadata is None:
+        metadata = self._fetch_spreadsheet_metadata(spreadsheet_id)
+        if shared:
+          try:
+            shared.set(NS_SHEETS_METADATA, key, metadata, ttl=self.metadata_ttl)
+          except sqlite3.Error as exc:
+            logger.warning(f"Shared cache write failed for spreadsheet {spreadsheet_id}: {exc}")
+      future.set_result(metadata)
+    except BaseException as exc:
+      # Failures are not cached; the next caller retries
+      with self._metadata_lock:
+        cached = self._metadata.get(spreadsheet_id)
+        if cached is not None and cached[1] is future:
+          del self._metadata[spreadsheet_id]
+      future.set_exception(exc)
+
+  def stats(self) -> Dict[str, int]:
+    with self._metadata_lock:
+      return {"spreadsheets": len(self._metadata)}
+
+  def invalidate_metadata(self, spreadsheet_id: str) -> None:
+    with self._metadata_lock:
+      self._metadata.pop(spreadsheet_id, None)
+    if self._shared:
+      # Entries are keyed by generation; bumping it expires them everywhere
+      try:
+        self._shared.bump(NS_SHEET_GENERATION, spreadsheet_id)
+      except sqlite3.Error as exc:
+        logger.warning(f"Shared cache write failed for spreadsheet {spreadsheet_id}: {exc}")
+
+  def _thread_http(self) -> Optional[Any]:
+    # httplib2 connections are not thread-safe; metadata may be fetched off-thread
+    if self._creds is None:
+      return None
+    http = getattr(self._local, "http", None)
+    if http is None:
+      http = self._local.http = self._authorized_http(self._creds)
+    return http
+
+  def _fetch_spreadsheet_metadata(self, spreadsheet_id: str) -> Dict[str, Any]:
     result = (
       self._sheets.get(
         spreadsheetId=spreadsheet_id,
         fields="spreadsheetId,properties,sheets",
       )
-      .execute()
+      .execute(http=self._thread_http())
     )
 
     sheets_meta: List[Dict[str, Any]] = []
@@ -285,6 +506,7 @@ class ServiceAccountSheetsClient:
       )
       .execute()
     )
+    self.invalidate_metadata(spreadsheet_id)
 
   def batch_update(
     self,
@@ -302,6 +524,7 @@ class ServiceAccountSheetsClient:
       )
       .execute()
     )
+    self.invalidate_metadata(spreadsheet_id)
 
   def add_sheet(self, spreadsheet_id: str, title: str) -> int:
     result = (
@@ -321,6 +544,7 @@ class ServiceAccountSheetsClient:
       )
       .execute()
     )
+    self.invalidate_metadata(spreadsheet_id)
     replies = result.get("replies") or []
     if not replies:
       return 0
@@ -342,6 +566,7 @@ class ServiceAccountSheetsClient:
       )
       .execute()
     )
+    self.invalidate_metadata(spreadsheet_id)
 
   def create_spreadsheet(self, title: str, sheet_titles: Optional[List[str]] = None) -> str:
     sheet_titles = sheet_titles or ["Sheet1"]
@@ -0,0 +1,787 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import functools
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import googleapiclient
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+SHEETS_DISCOVERY = Path(googleapiclient.__file__).parent / "discovery_cache" / "documents" / "sheets.v4.json"
+
+
+@functools.lru_cache(maxsize=1)
+def _discovery_document() -> str:
+  return SHEETS_DISCOVERY.read_text()
+
+
+class Latency:
+  """
+  Injected service latency: `base` seconds plus up to `jitter` seconds more,
+  drawn from a seeded generator so runs are repeatable.
+  """
+
+  def __init__(self, base: float = 0.0, jitter: float = 0.0, seed: int = 0) -> None:
+    self.base = base
+    self.jitter = jitter
+    self._rng = random.Random(seed)
+    self._lock = threading.Lock()
+
+  def sample(self) -> float:
+    if not self.jitter:
+      return self.base
+    with self._lock:
+      return self.base + self._rng.uniform(0, self.jitter)
+
+  def sleep(self) -> None:
+    delay = self.sample()
+    if delay > 0:
+      time.sleep(delay)
+
+  async def asleep(self) -> None:
+    delay = self.sample()
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+
+class EmulatedService:
+  """Call counts and time spent inside an emulated service, excluding injected latency."""
+
+  def __init__(self, latency: Optional[Latency]) -> None:
+    self.latency = latency or Latency()
+    self.calls: Dict[str, int] = {}
+    self.service_seconds = 0.0
+    self._stats_lock = threading.Lock()
+
+  def _count(self, route: str, started: float) -> None:
+    with self._stats_lock:
+      self.calls[route] = self.calls.get(route, 0) + 1
+      self.service_seconds += time.perf_counter() - started
+
+  def reset_stats(self) -> None:
+    with self._stats_lock:
+      self.calls.clear()
+      self.service_seconds = 0.0
+
+
+# --- field masks ---
+
+def _split_fields(mask: str) -> List[str]:
+  parts: List[str] = []
+  depth = start = 0
+  for index, char in enumerate(mask):
+    if char == "(":
+      depth += 1
+    elif char == ")":
+      depth -= 1
+    elif char == "," and depth == 0:
+      parts.append(mask[start:index])
+      start = index + 1
+  parts.append(mask[start:])
+  return [part.strip() for part in parts if part.strip()]
+
+
+def field_mask_paths(mask: str) -> List[Tuple[str, ...]]:
+  """The paths a `fields` parameter selects: "a.b,c(d,e)" is a.b, c.d and c.e."""
+  paths: List[Tuple[str, ...]] = []
+  for item in _split_fields(mask):
+    head, paren, inner = item.partition("(")
+    prefix = tuple(name.strip() for name in head.split("."))
+    if not paren:
+      paths.append(prefix)
+      continue
+    if not inner.endswith(")"):
+      raise ValueError(f"Unbalanced parentheses in field mask: {mask}")
+    paths.extend(prefix + sub for sub in field_mask_paths(inner[:-1]))
+  return paths
+
+
+def field_mask_tree(mask: str) -> Dict[str, Any]:
+  """Nested dict of selected names; None marks a fully selected value."""
+  tree: Dict[str, Any] = {}
+  # Shorter paths first, so a whole selection absorbs longer paths beneath it
+  for path in sorted(field_mask_paths(mask), key=len):
+    node: Optional[Dict[str, Any]] = tree
+    for name in path[:-1]:
+      node = node.setdefault(name, {})
+      if node is None:
+        break
+    if node is not None:
+      node[path[-1]] = None
+  return tree
+
+
+def apply_field_mask(value: Any, tree: Optional[Dict[str, Any]]) -> Any:
+  if tree is None:
+    return value
+  if isinstance(value, list):
+    return [apply_field_mask(item, tree) for item in value]
+  if not isinstance(value, dict):
+    return value
+  if "*" in tree:
+    return {key: apply_field_mask(item, tree.get(key, tree["*"])) for key, item in value.items()}
+  return {key: apply_field_mask(value[key], sub) for key, sub in tree.items() if key in value}
+
+
+def _merge_masked(existing: Any, update: Any, tree: Optional[Dict[str, Any]]) -> Any:
+  # What an update with `fields` does: selected fields are replaced, and
+  # cleared when the update leaves them out; everything else is kept
+  if tree is None:
+    return update
+  merged = dict(existing) if isinstance(existing, dict) else {}
+  update = update if isinstance(update, dict) else {}
+  keys = set(merged) | set(update) if "*" in tree else set(tree)
+  for key in keys:
+    value = _merge_masked(merged.get(key), update.get(key), tree.get(key, tree.get("*")))
+    if value is None:
+      merged.pop(key, None)
+    else:
+      merged[key] = value
+  return merged
+
+
+# --- cells ---
+
+_CELL_RE = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _column_index(letters: str) -> int:
+  index = 0
+  for char in letters:
+    index = index * 26 + (ord(char) - 64)
+  return index - 1
+
+
+def _column_letters(index: int) -> str:
+  letters = ""
+  index += 1
+  while index:
+    index, remainder = divmod(index - 1, 26)
+    letters = chr(65 + remainder) + letters
+  return letters
+
+
+def _typed_value(value: Any) -> Dict[str, Any]:
+  if isinstance(value, bool):
+    return {"boolValue": value}
+  if isinstance(value, (int, float)):
+    return {"numberValue": value}
+  if isinstance(value, str) and value.startswith("#") and value.rstrip("!?/0").lstrip("#").isupper():
+    return {"errorValue": {"type": value.strip("#!?/0") or "ERROR", "message": value}}
+  return {"stringValue": str(value)}
+
+
+def _formatted(value: Any) -> str:
+  if isinstance(value, bool):
+    return "TRUE" if value else "FALSE"
+  return str(value)
+
+
+def sheet_cell(value: Any) -> Dict[str, Any]:
+  """
+  CellData for a seeded value: None is empty, "=..." a formula evaluating to
+  0, a (formula, result) pair or {"formula": ..., "value": ...} a formula
+  with that result ("#REF!" etc. for errors), anything else a constant.
+  """
+  if value is None or value == "":
+    return {}
+  if isinstance(value, dict) and "formula" in value:
+    value = (value["formula"], value.get("value", 0))
+  if isinstance(value, (tuple, list)):
+    formula, result = value
+    return {
+      "userEnteredValue": {"formulaValue": formula},
+      "effectiveValue": _typed_value(result),
+      "formattedValue": _formatted(result),
+    }
+  if isinstance(value, str) and value.startswith("="):
+    return {
+      "userEnteredValue": {"formulaValue": value},
+      "effectiveValue": {"numberValue": 0},
+      "formattedValue": "0",
+    }
+  typed = _typed_value(value)
+  if "errorValue" in typed:
+    typed = {"stringValue": value}
+  return {"userEnteredValue": typed, "effectiveValue": typed, "formattedValue": _formatted(value)}
+
+
+def _settle(cell: Dict[str, Any]) -> Dict[str, Any]:
+  # Recompute what an edited cell evaluates to; formulas are not evaluated
+  entered = cell.get("userEnteredValue")
+  if not entered:
+    return {key: value for key, value in cell.items() if key not in ("effectiveValue", "formattedValue")}
+  if "formulaValue" in entered:
+    settled = sheet_cell(entered["formulaValue"])
+  else:
+    value = next(iter(entered.values()))
+    settled = {"userEnteredValue": entered, "effectiveValue": entered, "formattedValue": _formatted(value)}
+  return {**cell, **settled}
+
+
+def _user_entered(value: Any) -> Any:
+  # What USER_ENTERED input makes of a written string
+  if not isinstance(value, str) or value.startswith("="):
+    return value
+  if value.upper() in ("TRUE", "FALSE"):
+    return value.upper() == "TRUE"
+  try:
+    number = float(value)
+  except ValueError:
+    return value
+  return int(number) if number.is_integer() and "." not in value else number
+
+
+def _render(cell: Dict[str, Any], render: str) -> Any:
+  if not cell:
+    return ""
+  if render == "FORMULA":
+    formula = (cell.get("userEnteredValue") or {}).get("formulaValue")
+    if formula is not None:
+      return formula
+  if render == "FORMATTED_VALUE":
+    return cell.get("formattedValue", "")
+  effective = cell.get("effectiveValue") or {}
+  for key in ("numberValue", "stringValue", "boolValue"):
+    if key in effective:
+      return effective[key]
+  if "errorValue" in effective:
+    return cell.get("formattedValue", "#ERROR!")
+  return ""
+
+
+class _SheetsError(Exception):
+  def __init__(self, status: int, reason: str, message: str, **extra: Any) -> None:
+    super().__init__(message)
+    self.status = status
+    self.reason = reason
+    self.extra = extra
+
+  def body(self) -> Dict[str, Any]:
+    return {"error": {"code": self.status, "message": str(self), "status": self.reason, **self.extra}}
+
+
+def _quota_error(kind: str) -> _SheetsError:
+  metric = "Read requests" if kind == "read" else "Write requests"
+  limit = f"{metric} per minute per user"
+  message = (
+    f"Quota exceeded for quota metric '{metric}' and limit '{limit}' of service "
+    "'sheets.googleapis.com' for consumer 'project_number:0'."
+  )
+  return _SheetsError(
+    429,
+    "RESOURCE_EXHAUSTED",
+    message,
+    errors=[{"message": message, "domain": "global", "reason": "rateLimitExceeded"}],
+    details=[
+      {
+        "@type": "type.googleapis.com/google.rpc.ErrorInfo",
+        "reason": "RATE_LIMIT_EXCEEDED",
+        "domain": "googleapis.com",
+        "metadata": {
+          "service": "sheets.googleapis.com",
+          "quota_metric": f"sheets.googleapis.com/{kind}_requests",
+          "quota_limit": f"{kind.capitalize()}RequestsPerMinutePerUser",
+          "consumer": "projects/0",
+        },
+      }
+    ],
+  )
+
+
+# --- the emulator ---
+
+class SheetsEmulator(EmulatedService):
+  """
+  In-memory Google Sheets API v4: an httplib2-compatible `http` that serves
+  spreadsheets held in this process, so the real googleapiclient code paths
+  run offline. service() builds a Sheets service on top of it.
+
+  It covers the calls the backend makes: spreadsheets.get (ranges,
+  includeGridData), spreadsheets.create, values.get/batchGet/update/
+  batchUpdate, and batchUpdate with repeatCell, updateCells, add/deleteSheet
+  and conditional format rules. `fields` masks are applied to every
+  response and to repeatCell/updateCells; grid data is only returned when
+  includeGridData is set or the mask names sheets.data. Formulas are not
+  evaluated: they keep the result they were seeded with.
+
+  Every request waits for `latency`. With `read_quota` or `write_quota` set,
+  requests beyond that many reads (GETs) or writes per `quota_window`
+  seconds fail with the API's 429 RESOURCE_EXHAUSTED error.
+  """
+
+  def __init__(
+    self,
+    latency: Optional[Latency] = None,
+    read_quota: int = 0,
+    write_quota: int = 0,
+    quota_window: float = 60.0,
+    clock: Callable[[], float] = time.monotonic,
+  ) -> None:
+    super().__init__(latency)
+    self.quotas = {"read": read_quota, "write": write_quota}
+    self.quota_window = quota_window
+    self._clock = clock
+    self._admitted: Dict[str, Deque[float]] = {"read": collections.deque(), "write": collections.deque()}
+    self._spreadsheets: Dict[str, Dict[str, Any]] = {}
+    self._lock = threading.Lock()
+    self._sheet_ids = itertools.count(1000)
+
+  def service(self, request_builder: type = HttpRequest) -> Any:
+    return build_from_document(_discovery_document(), http=self, requestBuilder=request_builder)
+
+  # --- seeding ---
+
+  def add_spreadsheet(self, spreadsheet_id: str, title: str = "Untitled spreadsheet") -> None:
+    with self._lock:
+      self._spreadsheets[spreadsheet_id] = {"title": title, "sheets": []}
+
+  def add_sheet(self, spreadsheet_id: str, title: str, rows: List[List[Any]], sheet_id: Optional[int] = None) -> int:
+    """Seed a sheet from rows of plain values (see sheet_cell)."""
+    with self._lock:
+      spreadsheet = self._spreadsheets[spreadsheet_id]
+      sheet_id = next(self._sheet_ids) if sheet_id is None else sheet_id
+      spreadsheet["sheets"].append(
+        {
+          "sheetId": sheet_id,
+          "title": title,
+          "rows": [[sheet_cell(value) for value in row] for row in rows],
+          "conditionalFormats": [],
+        }
+      )
+      return sheet_id
+
+  def load_fixture(self, fixture: Dict[str, Any]) -> List[str]:
+    """
+    Seed spreadsheets from a fixture:
+    {"spreadsheets": [{"spreadsheetId", "title", "sheets": [{"title",
+    "sheetId"?, "rows": [[value, ...], ...]}]}]}, with values as in
+    sheet_cell. Returns the spreadsheet ids.
+    """
+    ids = []
+    for spreadsheet in fixture.get("spreadsheets") or []:
+      spreadsheet_id = spreadsheet["spreadsheetId"]
+      self.add_spreadsheet(spreadsheet_id, spreadsheet.get("title") or "Untitled spreadsheet")
+      for sheet in spreadsheet.get("sheets") or []:
+        self.add_sheet(spreadsheet_id, sheet["title"], sheet.get("rows") or [], sheet.get("sheetId"))
+      ids.append(spreadsheet_id)
+    return ids
+
+  def cell(self, spreadsheet_id: str, sheet_title: str, row: int, col: int) -> Dict[str, Any]:
+    with self._lock:
+      rows = self._sheet(self._spreadsheets[spreadsheet_id], sheet_title)["rows"]
+      return rows[row][col] if row < len(rows) and col < len(rows[row]) else {}
+
+  # --- httplib2 interface ---
+
+  def request(
+    self,
+    uri: str,
+    method: str = "GET",
+    body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs: Any,
+  ) -> Tuple[httplib2.Response, bytes]:
+    self.latency.sleep()
+    started = time.perf_counter()
+    parts = urlsplit(uri)
+    path = unquote(parts.path).split("/v4/spreadsheets", 1)[1].lstrip("/")
+    query = parse_qs(parts.query)
+    payload = json.loads(body) if body else {}
+    try:
+      self._admit("read" if method == "GET" else "write")
+      with self._lock:
+        route, result = self._dispatch(method, path, query, payload)
+        if "fields" in query:
+          result = apply_field_mask(result, field_mask_tree(query["fields"][0]))
+        # Serialized under the lock, since results share the stored cells
+        status, content = 200, json.dumps(result)
+    except _SheetsError as exc:
+      route = "quota" if exc.status == 429 else "error"
+      status, content = exc.status, json.dumps(exc.body())
+    except (KeyError, TypeError, ValueError) as exc:
+      route = "error"
+      status, content = 400, json.dumps(_SheetsError(400, "INVALID_ARGUMENT", f"Invalid request: {exc}").body())
+    self._count(route, started)
+    response = httplib2.Response({"status": str(status), "content-type": "application/json; charset=UTF-8"})
+    return response, content.encode()
+
+  def _admit(self, kind: str) -> None:
+    limit = self.quotas[kind]
+    if not limit:
+      return
+    now = self._clock()
+    with self._lock:
+      admitted = self._admitted[kind]
+      while admitted and admitted[0] <= now - self.quota_window:
+        admitted.popleft()
+      if len(admitted) >= limit:
+        raise _quota_error(kind)
+      admitted.append(now)
+
+  def _dispatch(self, method: str, path: str, query: Dict[str, List[str]], payload: Dict[str, Any]) -> Tuple[str, Any]:
+    if not path and method == "POST":
+      return "spreadsheets.create", self._create(payload)
+    spreadsheet_id, _, rest = path.partition("/")
+    spreadsheet_id, _, verb = spreadsheet_id.partition(":")
+    spreadsheet = self._spreadsheets.get(spreadsheet_id)
+    if spreadsheet is None:
+      raise _SheetsError(404, "NOT_FOUND", "Requested entity was not found.")
+
+    if not rest and method == "GET":
+      return "spreadsheets.get", self._get(spreadsheet_id, spreadsheet, query)
+    if not rest and verb == "batchUpdate":
+      return "spreadsheets.batchUpdate", self._batch_update(spreadsheet_id, spreadsheet, payload)
+    if rest == "values:batchGet":
+      return "values.batchGet", {
+        "spreadsheetId": spreadsheet_id,
+        "valueRanges": [self._value_range(spreadsheet, range_a1, query) for range_a1 in query.get("ranges") or []],
+      }
+    if rest == "values:batchUpdate":
+      option = payload.get("valueInputOption", "RAW")
+      responses = [
+        self._write_values(spreadsheet_id, spreadsheet, data["range"], data.get("values") or [], option)
+        for data in payload.get("data") or []
+      ]
+      return "values.batchUpdate", {
+        "spreadsheetId": spreadsheet_id,
+        "totalUpdatedRows": sum(response.get("updatedRows", 0) for response in responses),
+        "totalUpdatedColumns": sum(response.get("updatedColumns", 0) for response in responses),
+        "totalUpdatedCells": sum(response.get("updatedCells", 0) for response in responses),
+        "totalUpdatedSheets": len({response["updatedRange"].rpartition("!")[0] for response in responses}),
+        "responses": responses,
+      }
+    if rest.startswith("values/") and method == "GET":
+      return "values.get", self._value_range(spreadsheet, rest[len("values/"):], query)
+    if rest.startswith("values/") and method == "PUT":
+      option = (query.get("valueInputOption") or ["RAW"])[0]
+      return "values.update", self._write_values(spreadsheet_id, spreadsheet, rest[len("values/"):], payload.get("values") or [], option)
+    raise _SheetsError(400, "INVALID_ARGUMENT", f"Unsupported call: {method} {path}")
+
+  # --- ranges ---
+
+  def _sheet(self, spreadsheet: Dict[str, Any], title: Optional[str]) -> Dict[str, Any]:
+    if title is None:
+      return spreadsheet["sheets"][0]
+    for sheet in spreadsheet["sheets"]:
+      if sheet["title"] == title:
+        return sheet
+    raise _SheetsError(400, "INVALID_ARGUMENT", f"Unable to parse range: {title}")
+
+  def _resolve(self, spreadsheet: Dict[str, Any], range_a1: str) -> Tuple[Dict[str, Any], int, int, Optional[int], Optional[int]]:
+    """Sheet and [start, end) bounds of an A1 range; None ends are open."""
+    title: Optional[str] = None
+    cells = range_a1
+    if "!" in range_a1:
+      title, _, cells = range_a1.rpartition("!")
+    elif any(sheet["title"] == range_a1.strip("'").replace("''", "'") for sheet in spreadsheet["sheets"]):
+      title, cells = range_a1, ""
+    if title is not None and title.startswith("'") and title.endswith("'"):
+      title = title[1:-1].replace("''", "'")
+    sheet = self._sheet(spreadsheet, title)
+    if not cells:
+      return sheet, 0, 0, None, None
+
+    start, _, end = cells.upper().partition(":")
+    end = end or start
+    start_match, end_match = _CELL_RE.match(start), _CELL_RE.match(end)
+    if not start_match or not end_match:
+      raise _SheetsError(400, "INVALID_ARGUMENT", f"Unable to parse range: {range_a1}")
+    start_col = _column_index(start_match.group(1)) if start_match.group(1) else 0
+    start_row = int(start_match.group(2)) - 1 if start_match.group(2) else 0
+    end_col = _column_index(end_match.group(1)) + 1 if end_match.group(1) else None
+    end_row = int(end_match.group(2)) if end_match.group(2) else None
+    return sheet, start_row, start_col, end_row, end_col
+
+  def _label(self, sheet: Dict[str, Any], start_row: int, start_col: int, end_row: Optional[int], end_col: Optional[int]) -> str:
+    # The A1 range the API echoes back: quoted title, open ends closed at the grid size
+    grid = self._grid_size(sheet)
+    end_row = end_row if end_row is not None else grid["rowCount"]
+    end_col = end_col if end_col is not None else grid["columnCount"]
+    title = sheet["title"]
+    if not re.fullmatch(r"[A-Za-z0-9_]+", title):
+      title = "'" + title.replace("'", "''") + "'"
+    return f"{title}!{_column_letters(start_col)}{start_row + 1}:{_column_letters(end_col - 1)}{end_row}"
+
+  def _window(self, sheet: Dict[str, Any], start_row: int, start_col: int, end_row: Optional[int], end_col: Optional[int]) -> List[List[Dict[str, Any]]]:
+    rows = sheet["rows"][start_row:end_row]
+    window = [row[start_col:end_col] for row in rows]
+    while window and not any(window[-1]):
+      window.pop()
+    return window
+
+  def _value_range(self, spreadsheet: Dict[str, Any], range_a1: str, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    sheet, start_row, start_col, end_row, end_col = self._resolve(spreadsheet, range_a1)
+    render = (query.get("valueRenderOption") or ["FORMATTED_VALUE"])[0]
+    dimension = (query.get("majorDimension") or ["ROWS"])[0]
+    values: List[List[Any]] = []
+    for row in self._window(sheet, start_row, start_col, end_row, end_col):
+      rendered = [_render(cell, render) for cell in row]
+      while rendered and rendered[-1] == "":
+        rendered.pop()
+      values.append(rendered)
+    if dimension == "COLUMNS":
+      values = [list(column) for column in itertools.zip_longest(*values, fillvalue="")]
+      for column in values:
+        while column and column[-1] == "":
+          column.pop()
+    result = {"range": self._label(sheet, start_row, start_col, end_row, end_col), "majorDimension": dimension}
+    # Like the API, empty ranges come back without a values key
+    if values:
+      result["values"] = values
+    return result
+
+  def _write_values(self, spreadsheet_id: str, spreadsheet: Dict[str, Any], range_a1: str, values: List[List[Any]], option: str) -> Dict[str, Any]:
+    sheet, start_row, start_col, _, _ = self._resolve(spreadsheet, range_a1)
+    for r, row in enumerate(values):
+      for c, value in enumerate(row):
+        if option == "USER_ENTERED":
+          value = _user_entered(value)
+        elif isinstance(value, str) and value.startswith("="):
+          value = {"userEnteredValue": {"stringValue": value}, "effectiveValue": {"stringValue": value}, "formattedValue": value}
+        self._put(sheet, start_row + r, start_col + c, value if isinstance(value, dict) else sheet_cell(value))
+    width = max((len(row) for row in values), default=0)
+    updated = {
+      "spreadsheetId": spreadsheet_id,
+      "updatedRange": self._label(sheet, start_row, start_col, start_row + max(len(values), 1), start_col + max(width, 1)),
+    }
+    if values:
+      updated.update(
+        updatedRows=len(values),
+        updatedColumns=width,
+        updatedCells=sum(len(row) for row in values),
+      )
+    return updated
+
+  @staticmethod
+  def _put(sheet: Dict[str, Any], row: int, col: int, cell: Dict[str, Any]) -> None:
+    rows = sheet["rows"]
+    while len(rows) <= row:
+      rows.append([])
+    cells = rows[row]
+    while len(cells) <= col:
+      cells.append({})
+    cells[col] = cell
+
+  @staticmethod
+  def _existing(sheet: Dict[str, Any], row: int, col: int) -> Dict[str, Any]:
+    rows = sheet["rows"]
+    return rows[row][col] if row < len(rows) and col < len(rows[row]) else {}
+
+  # --- spreadsheets.get / create / batchUpdate ---
+
+  @staticmethod
+  def _grid_size(sheet: Dict[str, Any]) -> Dict[str, int]:
+    rows = sheet["rows"]
+    width = max((len(row) for row in rows), default=0)
+    return {"rowCount": max(len(rows), 1000), "columnCount": max(width, 26)}
+
+  def _properties(self, sheet: Dict[str, Any], index: int) -> Dict[str, Any]:
+    return {
+      "sheetId": sheet["sheetId"],
+      "title": sheet["title"],
+      "index": index,
+      "sheetType": "GRID",
+      "gridProperties": self._grid_size(sheet),
+    }
+
+  def _spreadsheet(self, spreadsheet_id: str, spreadsheet: Dict[str, Any], sheets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+      "spreadsheetId": spreadsheet_id,
+      "properties": {"title": spreadsheet["title"], "locale": "en_US", "timeZone": "Etc/GMT"},
+      "sheets": sheets,
+      "spreadsheetUrl": f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit",
+    }
+
+  def _get(self, spreadsheet_id: str, spreadsheet: Dict[str, Any], query: Dict[str, List[str]]) -> Dict[str, Any]:
+    ranges = query.get("ranges") or []
+    if "fields" in query:
+      # The API ignores includeGridData once a field mask is set
+      sheets_mask = field_mask_tree(query["fields"][0]).get("sheets")
+      with_data = isinstance(sheets_mask, dict) and "data" in sheets_mask
+    else:
+      with_data = (query.get("includeGridData") or ["false"])[0] == "true"
+    requested: Dict[int, List[Dict[str, Any]]] = {}
+    for range_a1 in ranges:
+      sheet, start_row, start_col, end_row, end_col = self._resolve(spreadsheet, range_a1)
+      block: Dict[str, Any] = {"startRow": start_row, "startColumn": start_col}
+      if with_data:
+        block["rowData"] = [{"values": row} for row in self._window(sheet, start_row, start_col, end_row, end_col)]
+      requested.setdefault(sheet["sheetId"], []).append(block)
+
+    sheets = []
+    for index, sheet in enumerate(spreadsheet["sheets"]):
+      if ranges and sheet["sheetId"] not in requested:
+        continue
+      entry: Dict[str, Any] = {"properties": self._properties(sheet, index)}
+      if sheet["conditionalFormats"]:
+        entry["conditionalFormats"] = sheet["conditionalFormats"]
+      if with_data:
+        entry["data"] = requested.get(sheet["sheetId"]) or [
+          {"startRow": 0, "startColumn": 0, "rowData": [{"values": row} for row in self._window(sheet, 0, 0, None, None)]}
+        ]
+      sheets.append(entry)
+    return self._spreadsheet(spreadsheet_id, spreadsheet, sheets)
+
+  def _create(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    spreadsheet_id = uuid.uuid4().hex
+    title = (payload.get("properties") or {}).get("title") or "Untitled spreadsheet"
+    spreadsheet: Dict[str, Any] = {"title": title, "sheets": []}
+    for index, requested in enumerate(payload.get("sheets") or [{}]):
+      properties = requested.get("properties") or {}
+      sheet = {
+        "sheetId": properties.get("sheetId", 0 if index == 0 else next(self._sheet_ids)),
+        "title": properties.get("title") or f"Sheet{index + 1}",
+        "rows": [],
+        "conditionalFormats": list(requested.get("conditionalFormats") or []),
+      }
+      for block in requested.get("data") or []:
+        for r, row in enumerate(block.get("rowData") or []):
+          for c, cell in enumerate(row.get("values") or []):
+            self._put(sheet, block.get("startRow", 0) + r, block.get("startColumn", 0) + c, _settle(cell))
+      spreadsheet["sheets"].append(sheet)
+    self._spreadsheets[spreadsheet_id] = spreadsheet
+    return self._spreadsheet(
+      spreadsheet_id,
+      spreadsheet,
+      [{"properties": self._properties(sheet, index)} for index, sheet in enumerate(spreadsheet["sheets"])],
+    )
+
+  def _sheet_by_id(self, spreadsheet: Dict[str, Any], sheet_id: int) -> Dict[str, Any]:
+    for sheet in spreadsheet["sheets"]:
+      if sheet["sheetId"] == sheet_id:
+        return sheet
+    raise _SheetsError(400, "INVALID_ARGUMENT", f"No grid with id: {sheet_id}")
+
+  def _update_cell(self, sheet: Dict[str, Any], row: int, col: int, cell: Dict[str, Any], mask: Dict[str, Any]) -> None:
+    updated = _merge_masked(self._existing(sheet, row, col), cell, mask)
+    if "userEnteredValue" in mask or "*" in mask:
+      updated = _settle(updated)
+    self._put(sheet, row, col, updated)
+
+  def _batch_update(self, spreadsheet_id: str, spreadsheet: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    replies: List[Dict[str, Any]] = []
+    for index, request in enumerate(payload.get("requests") or []):
+      kind, params = next(iter(request.items()))
+      if kind in ("repeatCell", "updateCells"):
+        if not params.get("fields"):
+          raise _SheetsError(
+            400,
+            "INVALID_ARGUMENT",
+            f"Invalid requests[{index}].{kind}: At least one field must be updated. Specify at least one field in fields.",
+          )
+        mask = field_mask_tree(params["fields"])
+      if kind == "repeatCell":
+        grid = params["range"]
+        sheet = self._sheet_by_id(spreadsheet, grid.get("sheetId", 0))
+        size = self._grid_size(sheet)
+        cell = params.get("cell") or {}
+        for row in range(grid.get("startRowIndex", 0), grid.get("endRowIndex", size["rowCount"])):
+          for col in range(grid.get("startColumnIndex", 0), grid.get("endColumnIndex", size["columnCount"])):
+            self._update_cell(sheet, row, col, cell, mask)
+        replies.append({})
+      elif kind == "updateCells":
+        grid = params.get("start") or params.get("range") or {}
+        sheet = self._sheet_by_id(spreadsheet, grid.get("sheetId", 0))
+        for r, row in enumerate(params.get("rows") or []):
+          for c, cell in enumerate(row.get("values") or []):
+            row_index = grid.get("rowIndex", grid.get("startRowIndex", 0)) + r
+            col_index = grid.get("columnIndex", grid.get("startColumnIndex", 0)) + c
+            self._update_cell(sheet, row_index, col_index, cell, mask)
+        replies.append({})
+      elif kind == "addSheet":
+        properties = params.get("properties") or {}
+        title = properties.get("title") or f"Sheet{len(spreadsheet['sheets']) + 1}"
+        if any(sheet["title"] == title for sheet in spreadsheet["sheets"]):
+          raise _SheetsError(
+            400,
+            "INVALID_ARGUMENT",
+            f'Invalid requests[{index}].addSheet: A sheet with the name "{title}" already exists. Please enter another name.',
+          )
+        sheet_id = properties.get("sheetId", next(self._sheet_ids))
+        spreadsheet["sheets"].append({"sheetId": sheet_id, "title": title, "rows": [], "conditionalFormats": []})
+        replies.append({"addSheet": {"properties": self._properties(spreadsheet["sheets"][-1], len(spreadsheet["sheets"]) - 1)}})
+      elif kind == "deleteSheet":
+        sheet = self._sheet_by_id(spreadsheet, params["sheetId"])
+        if len(spreadsheet["sheets"]) == 1:
+          raise _SheetsError(
+            400,
+            "INVALID_ARGUMENT",
+            f"Invalid requests[{index}].deleteSheet: You can't remove all the sheets in a document.",
+          )
+        spreadsheet["sheets"].remove(sheet)
+        replies.append({})
+      elif kind == "addConditionalFormatRule":
+        rule = params["rule"]
+        sheet = self._sheet_by_id(spreadsheet, rule["ranges"][0].get("sheetId", 0))
+        sheet["conditionalFormats"].insert(params.get("index", 0), rule)
+        replies.append({})
+      elif kind == "deleteConditionalFormatRule":
+        sheet = self._sheet_by_id(spreadsheet, params.get("sheetId", 0))
+        position = params.get("index", 0)
+        if position >= len(sheet["conditionalFormats"]):
+          raise _SheetsError(400, "INVALID_ARGUMENT", f"Invalid requests[{index}].deleteConditionalFormatRule: No conditional format at index {position}")
+        sheet["conditionalFormats"].pop(position)
+        replies.append({})
+      else:
+        raise _SheetsError(400, "INVALID_ARGUMENT", f"Invalid requests[{index}]: unsupported request {kind}")
+    return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+
+_emulator: Optional[SheetsEmulator] = None
+_emulator_lock = threading.Lock()
+
+
+def get_sheets_emulator() -> Optional[SheetsEmulator]:
+  """
+  The process-wide emulator that replaces the Google Sheets API, or None
+  when SHEETS_EMULATOR is unset.
+
+  SHEETS_EMULATOR is "1" for an empty emulator or the path of a JSON fixture
+  to seed it with (see SheetsEmulator.load_fixture).
+  SHEETS_EMULATOR_LATENCY_MS and SHEETS_EMULATOR_JITTER_MS (default 0) add
+  latency to every call; SHEETS_EMULATOR_READ_QUOTA and
+  SHEETS_EMULATOR_WRITE_QUOTA (default 0, unlimited) cap requests per minute.
+  """
+  global _emulator
+
+  if _emulator is not None:
+    return _emulator
+
+  setting = os.getenv("SHEETS_EMULATOR", "").strip()
+  if not setting or setting.lower() in ("0", "false"):
+    return None
+
+  with _emulator_lock:
+    if _emulator is None:
+      emulator = SheetsEmulator(
+        latency=Latency(
+          float(os.getenv("SHEETS_EMULATOR_LATENCY_MS", "0")) / 1000,
+          float(os.getenv("SHEETS_EMULATOR_JITTER_MS", "0")) / 1000,
+        ),
+        read_quota=int(os.getenv("SHEETS_EMULATOR_READ_QUOTA", "0")),
+        write_quota=int(os.getenv("SHEETS_EMULATOR_WRITE_QUOTA", "0")),
+      )
+      if setting.lower() not in ("1", "true"):
+        ids = emulator.load_fixture(json.loads(Path(setting).read_text()))
+        logger.info(f"Sheets emulator seeded with {len(ids)} spreadsheet(s) from {setting}")
+      logger.warning("Google Sheets calls are served by the in-process emulator (SHEETS_EMULATOR is set)")
+      _emulator = emulator
+    return _emulator
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .logging_config import get_logger
+
+logger = get_logger(__name__)
+
+FlushFn = Callable[[str, List[Dict[str, Any]]], None]
+RetryableFn = Callable[[Exception], bool]
+
+_SCHEMA = """
+create table if not exists snapshot_journal (
+  seq integer primary key autoincrement,
+  table_name text not null,
+  snapshot_batch_id text,
+  payload text not null,
+  created_at real not null,
+  attempts integer not null default 0,
+  next_attempt_at real not null default 0
+);
+create index if not exists snapshot_journal_batch_idx
+  on snapshot_journal (snapshot_batch_id, table_name);
+create table if not exists snapshot_journal_dead (
+  seq integer primary key,
+  table_name text not null,
+  snapshot_batch_id text,
+  payload text not null,
+  created_at real not null,
+  attempts integer not null,
+  failed_at real not null,
+  error text not null
+);
+"""
+
+
+class SnapshotJournal:
+  """
+  Durable write-behind journal for snapshot rows.
+
+  Rows are committed to a local SQLite database (WAL mode) and the caller
+  returns immediately. A background thread flushes them to the remote store
+  in batches via `flush_fn(table, rows)`, deleting entries only after a
+  successful flush and backing off with jitter on failure. Entries survive
+  restarts and are retried on the next start.
+
+  Failures for which `retryable(exc)` is false (a rejected row, a missing
+  table) are not retried as they are: the batch is split in halves until the
+  good rows land, and each row that still fails on its own is moved to the
+  snapshot_journal_dead table. Rows that fail `max_attempts` times in a row
+  are moved there too.
+
+  Until an entry is flushed, `pending()` returns it so restores can read the
+  local copy.
+  """
+
+  def __init__(
+    self,
+    path: Path,
+    flush_fn: FlushFn,
+    batch_size: int = 500,
+    flush_interval: float = 1.0,
+    backoff_base: float = 1.0,
+    max_backoff: float = 300.0,
+    max_attempts: int = 20,
+    retryable: Optional[RetryableFn] = None,
+  ) -> None:
+    self.path = Path(path)
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    self._flush_fn = flush_fn
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.backoff_base = backoff_base
+    self.max_backoff = max_backoff
+    self.max_attempts = max_attempts
+    self._retryable = retryable or (lambda exc: True)
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+    self._conn.execute("pragma journal_mode=wal")
+    self._conn.execute("pragma synchronous=normal")
+    self._conn.executescript(_SCHEMA)
+    # Entries left over from a previous process are retried right away
+    self._conn.execute("update snapshot_journal set next_attempt_at = 0")
+
+    self._wake = threading.Event()
+    self._stopped = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="snapshot-journal", daemon=True)
+    self._thread.start()
+
+  # --- writes ---
+
+  def append(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    """Durably record rows for `table` and schedule them for flushing."""
+    if not rows:
+      return
+    now = time.time()
+    entries = [
+      (table, row.get("snapshot_batch_id"), json.dumps(row), now)
+      for row in rows
+    ]
+    with self._lock:
+      self._conn.execute("begin")
+      try:
+        self._conn.executemany(
+          "insert into snapshot_journal (table_name, snapshot_batch_id, payload, created_at) values (?, ?, ?, ?)",
+          entries,
+        )
+        self._conn.execute("commit")
+      except Exception:
+        self._conn.execute("rollback")
+        raise
+    self._wake.set()
+    logger.debug(f"Journaled {len(rows)} row(s) for {table}")
+
+  # --- reads ---
+
+  def pending(self, table: str, snapshot_batch_id: str) -> List[Dict[str, Any]]:
+    """Return rows for a batch that have not been flushed yet."""
+    with self._lock:
+      cursor = self._conn.execute(
+        "select payload from snapshot_journal where snapshot_batch_id = ? and table_name = ? order by seq",
+        (snapshot_batch_id, table),
+      )
+      return [json.loads(payload) for (payload,) in cursor.fetchall()]
+
+  def pending_rows(self, table: str) -> List[Dict[str, Any]]:
+    """Return every unflushed row for `table`."""
+    with self._lock:
+      cursor = self._conn.execute(
+        "select payload from snapshot_journal where table_name = ? order by seq",
+        (table,),
+      )
+      return [json.loads(payload) for (payload,) in cursor.fetchall()]
+
+  def pending_count(self) -> int:
+    with self._lock:
+      (count,) = self._conn.execute("select count(*) from snapshot_journal").fetchone()
+    return count
+
+  def dead_count(self) -> int:
+    with self._lock:
+      (count,) = self._conn.execute("select count(*) from snapshot_journal_dead").fetchone()
+    return count
+
+  # --- background flushing ---
+
+  def _next_batch(self) -> List[tuple]:
+    with self._lock:
+      head = self._conn.execute(
+        "select table_name from snapshot_journal where next_attempt_at <= ? order by seq limit 1",
+        (time.time(),),
+      ).fetchone()
+      if head is None:
+        return []
+      return self._conn.execute(
+        "select seq, table_name, payload, attempts, snapshot_batch_id, created_at from snapshot_journal "
+        "where table_name = ? and next_attempt_at <= ? order by seq limit ?",
+        (head[0], time.time(), self.batch_size),
+      ).fetchall()
+
+  def _flush_once(self) -> bool:
+    """Flush one batch. Returns True if there may be more ready work."""
+    batch = self._next_batch()
+    if not batch:
+      return False
+
+    table = batch[0][1]
+    try:
+      self._flush_fn(table, [json.loads(entry[2]) for entry in batch])
+    except Exception as exc:
+      if self._retryable(exc):
+        self._retry_later(table, batch, exc)
+        return False
+      # Something in the batch is rejected: land what can land
+      flushed, dead, failed = self._split(table, batch, exc)
+      self._delete(flushed)
+      self._bury(dead)
+      if failed:
+        self._retry_later(table, failed[0], failed[1])
+      return bool(flushed or dead)
+
+    self._delete(batch)
+    logger.debug(f"Flushed {len(batch)} journaled row(s) to {table}")
+    return True
+
+  def _split(
+    self,
+    table: str,
+    batch: List[tuple],
+    exc: Exception,
+  ) -> Tuple[List[tuple], List[tuple], Optional[tuple]]:
+    """
+    Flush the halves of a rejected batch separately, recursing into halves
+    that are rejected again. Returns the flushed entries, the (entry, error)
+    pairs that fail on their own, and any entries whose half hit a
+    retryable error, with that error.
+    """
+    if len(batch) == 1:
+      return [], [(batch[0], exc)], None
+    flushed: List[tuple] = []
+    dead: List[tuple] = []
+    failed: Optional[tuple] = None
+    middle = len(batch) // 2
+    for half in (batch[:middle], batch[middle:]):
+      try:
+        self._flush_fn(table, [json.loads(entry[2]) for entry in half])
+      except Exception as half_exc:
+        if self._retryable(half_exc):
+          failed = (failed[0] + half if failed else half, half_exc)
+          continue
+        half_flushed, half_dead, half_failed = self._split(table, half, half_exc)
+        flushed.extend(half_flushed)
+        dead.extend(half_dead)
+        if half_failed:
+          failed = (failed[0] + half_failed[0] if failed else half_failed[0], half_failed[1])
+      else:
+        flushed.extend(half)
+    return flushed, dead, failed
+
+  def _retry_later(self, table: str, batch: List[tuple], exc: Exception) -> None:
+    attempts = max(entry[3] for entry in batch) + 1
+    if attempts >= self.max_attempts:
+      logger.error(
+        f"Snapshot journal flush to {table} failed {attempts} times; moving {len(batch)} row(s) aside: {exc}",
+        extra={"table": table, "rows": len(batch), "attempts": attempts},
+      )
+      self._bury([(entry, exc) for entry in batch])
+      return
+    delay = min(self.max_backoff, self.backoff_base * (2 ** (attempts - 1)))
+    delay = random.uniform(delay / 2, delay)
+    logger.warning(
+      f"Snapshot journal flush to {table} failed (attempt {attempts}), retrying in {delay:.1f}s: {exc}",
+      extra={"table": table, "rows": len(batch), "attempts": attempts},
+    )
+    with self._lock:
+      self._conn.executemany(
+        "update snapshot_journal set attempts = ?, next_attempt_at = ? where seq = ?",
+        [(attempts, time.time() + delay, entry[0]) for entry in batch],
+      )
+
+  def _delete(self, entries: List[tuple]) -> None:
+    if not entries:
+      return
+    with self._lock:
+      self._conn.executemany("delete from snapshot_journal where seq = ?", [(entry[0],) for entry in entries])
+
+  def _bury(self, dead: List[tuple]) -> None:
+    """Move (entry, error) pairs to the dead-letter table."""
+    if not dead:
+      return
+    now = time.time()
+    for entry, exc in dead:
+      logger.error(
+        f"Snapshot journal row {entry[0]} for {entry[1]} moved to the dead-letter table: {exc}",
+        extra={"table": entry[1], "snapshot_batch_id": entry[4]},
+      )
+    with self._lock:
+      self._conn.execute("begin")
+      try:
+        self._conn.executemany(
+          "insert or replace into snapshot_journal_dead "
+          "(seq, table_name, snapshot_batch_id, payload, created_at, attempts, failed_at, error) "
+          "values (?, ?, ?, ?, ?, ?, ?, ?)",
+          [(entry[0], entry[1], entry[4], entry[2], entry[5], entry[3] + 1, now, str(exc)) for entry, exc in dead],
+        )
+        self._conn.executemany("delete from snapshot_journal where seq = ?", [(entry[0],) for entry, _ in dead])
+        self._conn.execute("commit")
+      except Exception:
+        self._conn.execute("rollback")
+        raise
+
+  def _run(self) -> None:
+    while not self._stopped.is_set():
+      self._wake.clear()
+      try:
+        more = self._flush_once()
+      except Exception as exc:
+        logger.error(f"Snapshot journal flusher error: {exc}", exc_info=True)
+        more = False
+
+      if not more:
+        self._wake.wait(self.flush_interval)
+
+  def flush(self, timeout: Optional[float] = None) -> bool:
+    """Wake the flusher and wait until the journal is empty. Returns True if drained."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while self.pending_count():
+      self._wake.set()
+      if deadline is not None and time.monotonic() >= deadline:
+        return False
+      time.sleep(0.05)
+    return True
+
+  def close(self, timeout: float = 5.0) -> None:
+    """Try to drain within `timeout`, then stop; unflushed rows stay on disk."""
+    if not self.flush(timeout):
+      logger.warning(f"Snapshot journal closed with {self.pending_count()} unflushed row(s)")
+    self._stopped.set()
+    self._wake.set()
+    self._thread.join(timeout=timeout)
+    with self._lock:
+      self._conn.close()
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import base64
+import json
+import re
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Packed tables: one row per rectangular block of a snapshot batch
+COLOR_RANGES_TABLE = "cell_color_snapshot_ranges"
+VALUE_RANGES_TABLE = "cell_value_snapshot_ranges"
+
+# Value range kinds: a block merged from single-cell snapshots, or one
+# snapshot entry that was taken for a whole range (e.g. "A1:C3")
+KIND_CELLS = "cells"
+KIND_RANGE = "range"
+
+_CELL_RE = re.compile(r"([A-Z]+)(\d+)")
+
+Color = Tuple[float, float, float]
+
+
+# --- cell addressing ---
+
+def parse_cell(cell: str) -> Tuple[int, int]:
+  """Parse an A1 cell label into zero-based (row, col)."""
+  match = _CELL_RE.fullmatch(cell)
+  if not match:
+    raise ValueError(f"Invalid cell reference '{cell}'.")
+  col = 0
+  for char in match.group(1):
+    col = col * 26 + (ord(char) - 64)
+  row = int(match.group(2)) - 1
+  if row < 0:
+    raise ValueError(f"Row index must be positive in '{cell}'.")
+  return row, col - 1
+
+
+def cell_address(row: int, col: int) -> str:
+  label = ""
+  index = col
+  while index >= 0:
+    index, remainder = divmod(index, 26)
+    label = chr(65 + remainder) + label
+    index -= 1
+  return f"{label}{row + 1}"
+
+
+def range_address(row: int, col: int, n_rows: int, n_cols: int) -> str:
+  start = cell_address(row, col)
+  if n_rows == 1 and n_cols == 1:
+    return start
+  return f"{start}:{cell_address(row + n_rows - 1, col + n_cols - 1)}"
+
+
+# --- encoding ---
+
+def _encode(raw: bytes) -> str:
+  return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def _decode(data: str) -> bytes:
+  return zlib.decompress(base64.b64decode(data))
+
+
+def _index_typecode(palette_size: int) -> str:
+  return "B" if palette_size <= 256 else "I"
+
+
+def _rectangles(cells: Iterable[Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+  """
+  Cover a set of (row, col) cells with disjoint rectangles.
+
+  Cells are first merged into horizontal runs per row, then runs spanning the
+  same columns on consecutive rows are stacked. A dense range becomes one
+  rectangle; scattered cells degrade gracefully to short runs.
+  Returns (row, col, n_rows, n_cols) tuples.
+  """
+  by_row: Dict[int, List[int]] = {}
+  for row, col in cells:
+    by_row.setdefault(row, []).append(col)
+
+  open_rects: Dict[Tuple[int, int], List[int]] = {}  # (col, n_cols) -> [row, n_rows]
+  done: List[Tuple[int, int, int, int]] = []
+
+  for row in sorted(by_row):
+    cols = sorted(set(by_row[row]))
+    runs: List[Tuple[int, int]] = []
+    start = prev = cols[0]
+    for col in cols[1:]:
+      if col != prev + 1:
+        runs.append((start, prev - start + 1))
+        start = col
+      prev = col
+    runs.append((start, prev - start + 1))
+
+    next_open: Dict[Tuple[int, int], List[int]] = {}
+    for run in runs:
+      rect = open_rects.pop(run, None)
+      if rect is not None and rect[0] + rect[1] == row:
+        rect[1] += 1
+      else:
+        if rect is not None:
+          done.append((rect[0], run[0], rect[1], run[1]))
+        rect = [row, 1]
+      next_open[run] = rect
+    for (col, n_cols), rect in open_rects.items():
+      done.append((rect[0], col, rect[1], n_cols))
+    open_rects = next_open
+
+  for (col, n_cols), rect in open_rects.items():
+    done.append((rect[0], col, rect[1], n_cols))
+  return done
+
+
+def _group_key(row: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+  return row["snapshot_batch_id"], row["spreadsheet_id"], row.get("gid")
+
+
+# --- colors ---
+
+def pack_color_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+  """
+  Pack per-cell color snapshot rows into one row per rectangular block.
+
+  Each packed row stores its origin and shape, a palette of distinct colors
+  and the zlib-compressed, base64-encoded palette index of every cell in
+  row-major order.
+  """
+  groups: Dict[Tuple[Any, Any, Any], Dict[Tuple[int, int], Color]] = {}
+  for row in rows:
+    color = (float(row["red"]), float(row["green"]), float(row["blue"]))
+    groups.setdefault(_group_key(row), {})[parse_cell(row["cell"])] = color
+
+  packed: List[Dict[str, Any]] = []
+  for (batch_id, spreadsheet_id, gid), colors in groups.items():
+    for origin_row, origin_col, n_rows, n_cols in _rectangles(colors):
+      palette: List[Color] = []
+      palette_index: Dict[Color, int] = {}
+      indices: List[int] = []
+      for r in range(origin_row, origin_row + n_rows):
+        for c in range(origin_col, origin_col + n_cols):
+          color = colors[(r, c)]
+          index = palette_index.get(color)
+          if index is None:
+            index = palette_index[color] = len(palette)
+            palette.append(color)
+          indices.append(index)
+
+      data = array(_index_typecode(len(palette)), indices)
+      if sys.byteorder != "little":
+        data.byteswap()
+
+      packed.append(
+        {
+          "snapshot_batch_id": batch_id,
+          "spreadsheet_id": spreadsheet_id,
+          "gid": gid,
+          "origin_row": origin_row,
+          "origin_col": origin_col,
+          "n_rows": n_rows,
+          "n_cols": n_cols,
+          "palette": [list(color) for color in palette],
+          "data": _encode(data.tobytes()),
+        }
+      )
+  return packed
+
+
+def _color_indices(packed: Dict[str, Any]) -> array:
+  data = array(_index_typecode(len(packed["palette"])))
+  data.frombytes(_decode(packed["data"]))
+  if sys.byteorder != "little":
+    data.byteswap()
+  return data
+
+
+def iter_color_runs(
+  packed: Dict[str, Any],
+  cells: Optional[Set[str]] = None,
+) -> Iterator[Tuple[int, int, int, Dict[str, float]]]:
+  """
+  Yield (row, col, n_cols, color) for each horizontal run of one color.
+
+  When `cells` is given, only those cells are yielded and runs break around
+  excluded cells, so a subset restore never touches other cells.
+  """
+  palette = packed["palette"]
+  indices = _color_indices(packed)
+  origin_row = packed["origin_row"]
+  origin_col = packed["origin_col"]
+  n_cols = packed["n_cols"]
+
+  for r in range(packed["n_rows"]):
+    row = origin_row + r
+    run_start: Optional[int] = None
+    run_index = -1
+    for c in range(n_cols + 1):
+      if c < n_cols:
+        included = cells is None or cell_address(row, origin_col + c) in cells
+        index = indices[r * n_cols + c] if included else -1
+      else:
+        index = -1
+      if run_start is not None and index != run_index:
+        red, green, blue = palette[run_index]
+        yield row, origin_col + run_start, c - run_start, {"red": red, "green": green, "blue": blue}
+        run_start = None
+      if index >= 0 and run_start is None:
+        run_start = c
+        run_index = index
+
+
+def unpack_color_row(packed: Dict[str, Any]) -> List[Dict[str, Any]]:
+  """Expand a packed color row back into per-cell rows."""
+  rows: List[Dict[str, Any]] = []
+  for row, col, length, color in iter_color_runs(packed):
+    for c in range(col, col + length):
+      rows.append({"cell": cell_address(row, c), **color})
+  return rows
+
+
+# --- values ---
+
+def pack_value_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+  """
+  Pack per-cell value snapshot rows into one row per rectangular block.
+
+  Single-cell rows are merged into rectangles holding a compressed 2D array
+  of their decoded values. Rows that already snapshot a whole range keep
+  their range label and 2D value as a single packed row.
+  """
+  groups: Dict[Tuple[Any, Any, Any], Dict[Tuple[int, int], Any]] = {}
+  packed: List[Dict[str, Any]] = []
+
+  for row in rows:
+    value_json = row.get("value")
+    value = json.loads(value_json) if value_json is not None else None
+    cell = row["cell"]
+    batch_id, spreadsheet_id, gid = _group_key(row)
+
+    try:
+      position = parse_cell(cell)
+    except ValueError:
+      position = None
+
+    if position is None:
+      # A range (or a reference we cannot place): keep it whole
+      grid = value if isinstance(value, list) else [[value]]
+      try:
+        origin_row, origin_col = parse_cell(cell.split(":", 1)[0])
+      except ValueError:
+        origin_row = origin_col = None
+      packed.append(
+        {
+          "snapshot_batch_id": batch_id,
+          "spreadsheet_id": spreadsheet_id,
+          "gid": gid,
+          "kind": KIND_RANGE,
+          "range_ref": cell,
+          "origin_row": origin_row,
+          "origin_col": origin_col,
+          "n_rows": len(grid),
+          "n_cols": max((len(r) for r in grid), default=0),
+          "data": _encode(json.dumps(grid).encode("utf-8")),
+        }
+      )
+      continue
+
+    groups.setdefault((batch_id, spreadsheet_id, gid), {})[position] = value
+
+  for (batch_id, spreadsheet_id, gid), values in groups.items():
+    for origin_row, origin_col, n_rows, n_cols in _rectangles(values):
+      grid = [
+        [values[(r, c)] for c in range(origin_col, origin_col + n_cols)]
+        for r in range(origin_row, origin_row + n_rows)
+      ]
+      packed.append(
+        {
+          "snapshot_batch_id": batch_id,
+          "spreadsheet_id": spreadsheet_id,
+          "gid": gid,
+          "kind": KIND_CELLS,
+          "range_ref": range_address(origin_row, origin_col, n_rows, n_cols),
+          "origin_row": origin_row,
+          "origin_col": origin_col,
+          "n_rows": n_rows,
+          "n_cols": n_cols,
+          "data": _encode(json.dumps(grid).encode("utf-8")),
+        }
+      )
+  return packed
+
+
+def unpack_value_row(
+  packed: Dict[str, Any],
+  cells: Optional[Set[str]] = None,
+) -> List[Dict[str, Any]]:
+  """
+  Expand a packed value row into restore entries shaped like legacy rows.
+
+  Each entry has `cell`, a JSON-encoded `value` and `cell_count`. Without a
+  `cells` filter a merged block comes back as one range entry with blanks
+  written as "", so it restores in a single write; with a filter, only the
+  matching cells (or a matching range label) are returned.
+  """
+  grid = json.loads(_decode(packed["data"]))
+
+  if packed.get("kind") == KIND_RANGE:
+    if cells is not None and packed["range_ref"] not in cells:
+      return []
+    return [{"cell": packed["range_ref"], "value": json.dumps(grid), "cell_count": 1}]
+
+  origin_row = packed["origin_row"]
+  origin_col = packed["origin_col"]
+
+  if cells is None:
+    if packed["n_rows"] == 1 and packed["n_cols"] == 1:
+      value = grid[0][0]
+      return [{"cell": packed["range_ref"], "value": json.dumps(value) if value is not None else None, "cell_count": 1}]
+    blanked = [["" if value is None else value for value in row] for row in grid]
+    return [{"cell": packed["range_ref"], "value": json.dumps(blanked), "cell_count": packed["n_rows"] * packed["n_cols"]}]
+
+  entries: List[Dict[str, Any]] = []
+  for r, row_values in enumerate(grid):
+    for c, value in enumerate(row_values):
+      cell = cell_address(origin_row + r, origin_col + c)
+      if cell in cells:
+        entries.append({"cell": cell, "value": json.dumps(value) if value is not None else None, "cell_count": 1})
+  return entries
@@ -0,0 +1,828 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .llm import _load_env_from_local_files
+from .logging_config import get_logger
+from .profiler import run_profiled
+from .snapshot_journal import SnapshotJournal
+from .snapshot_pack import (
+  COLOR_RANGES_TABLE,
+  VALUE_RANGES_TABLE,
+  pack_color_rows,
+  pack_value_rows,
+  range_address,
+  unpack_color_row,
+)
+from .supabase_rest import (
+  RETRYABLE_STATUS,
+  SupabaseRestClient,
+  SupabaseRestError,
+  eq,
+  eq_or_null,
+  get_supabase_rest_client,
+)
+
+logger = get_logger(__name__)
+
+COLOR_TABLE = "cell_color_snapshots"
+VALUE_TABLE = "cell_value_snapshots"
+RULE_TABLE = "visualization_rule_snapshots"
+BATCH_TABLE = "snapshot_batches"
+
+# Batch kinds in the snapshot_batches registry
+KIND_COLOR = "color"
+KIND_VALUE = "value"
+KIND_RULE = "rule"
+
+DATA_DIR = Path(__file__).resolve().parents[1] / ".data"
+
+# Supabase writes are upserts on a key fixed before the first attempt (rows get
+# an id when they are journaled), so a write replayed after an ambiguous 5xx
+# overwrites what may have landed instead of duplicating it
+_SUPABASE_CONFLICT_KEYS: Dict[str, str] = {
+  BATCH_TABLE: "snapshot_batch_id",
+}
+
+# Columns that differ between otherwise identical snapshots
+_HASH_IGNORED_COLUMNS = {"id", "snapshot_batch_id", "created_at"}
+
+# Snapshot rows are written before their batch row, so unregistered rows are
+# only treated as orphans once they are this old
+_UNREGISTERED_GRACE_SECONDS = 3600.0
+
+# Supabase dedups against batches this process registered in the last half
+# hour. purge_snapshot_batches (migration 007) keeps registry rows for an
+# hour, so the data a new reference points at outlives the journal flush.
+_DEDUP_WINDOW_SECONDS = 1800.0
+_DEDUP_CACHE_SIZE = 1024
+
+
+class SnapshotStoreError(RuntimeError):
+  """Raised when a snapshot store cannot read or write rows."""
+
+
+class SnapshotStore(ABC):
+  """
+  Storage for undo snapshots.
+
+  Rows are plain dicts grouped by a table name (e.g. cell_color_snapshots)
+  and a snapshot_batch_id. Implementations decide how and where they live.
+  """
+
+  @abstractmethod
+  def insert(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    """Persist snapshot rows for `table`."""
+    raise NotImplementedError
+
+  async def insert_async(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    await asyncio.to_thread(run_profiled, self.insert, table, rows)
+
+  @abstractmethod
+  def select_pages(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, Any]] = None,
+    key: str = "id",
+  ) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield every row of a batch in pages.
+
+    `filters` maps column names to required values (None matches NULL).
+    `key` is a column that is unique within the batch, used for paging.
+    """
+    raise NotImplementedError
+
+  async def first(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    columns: str = "*",
+  ) -> Optional[Dict[str, Any]]:
+    """Return any one row of a batch, or None."""
+    pages = self.select_pages(table, snapshot_batch_id, columns)
+    try:
+      async for page in pages:
+        if page:
+          return page[0]
+    finally:
+      await pages.aclose()
+    return None
+
+  def fetch_all_sync(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    filters: Optional[Dict[str, Any]] = None,
+    key: str = "id",
+  ) -> List[Dict[str, Any]]:
+    """Blocking helper for scripts: every row of a batch as one list."""
+
+    async def _collect() -> List[Dict[str, Any]]:
+      rows: List[Dict[str, Any]] = []
+      async for page in self.select_pages(table, snapshot_batch_id, filters=filters, key=key):
+        rows.extend(page)
+      return rows
+
+    return asyncio.run(_collect())
+
+  # --- batch registry ---
+
+  def register_batch(self, batch: Dict[str, Any]) -> None:
+    """Record a batch in the registry (see record_snapshot)."""
+    self.insert(BATCH_TABLE, [batch])
+
+  @abstractmethod
+  def find_batch(
+    self,
+    kind: str,
+    spreadsheet_id: str,
+    gid: Optional[int],
+    content_hash: str,
+  ) -> Optional[Dict[str, Any]]:
+    """Return the newest registered batch with this content, or None."""
+    raise NotImplementedError
+
+  async def resolve_batch(self, snapshot_batch_id: str) -> str:
+    """
+    Map a batch id to the batch holding its rows.
+
+    Deduplicated batches point at an earlier batch with the same content;
+    everything else, including batches written before the registry existed,
+    resolves to itself.
+    """
+    batch = await self.first(BATCH_TABLE, snapshot_batch_id, "data_batch_id")
+    if batch and batch.get("data_batch_id"):
+      return str(batch["data_batch_id"])
+    return snapshot_batch_id
+
+  def purge_expired(self) -> int:
+    """Delete snapshots past their retention. Returns the number of rows removed."""
+    return 0
+
+  def close(self) -> None:
+    pass
+
+
+def _matches(row: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+  return all(row.get(column) == value for column, value in (filters or {}).items())
+
+
+def _conflict_key(table: str) -> str:
+  return _SUPABASE_CONFLICT_KEYS.get(table, "id")
+
+
+def _keyed(table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+  """Rows with the ids their upserts conflict on; rows that have one keep it."""
+  if _conflict_key(table) != "id":
+    return rows
+  return [row if row.get("id") else {**row, "id": str(uuid.uuid4())} for row in rows]
+
+
+def _retryable_flush_error(exc: Exception) -> bool:
+  # Transport failures, 408, 429 and 5xx may clear up, and every write is an
+  # upsert, so resending is safe; any other status means PostgREST rejected
+  # the rows and resending them cannot help
+  if isinstance(exc, SupabaseRestError) and exc.status is not None:
+    return exc.status in RETRYABLE_STATUS
+  return True
+
+
+def _missing_relation(exc: SupabaseRestError) -> bool:
+  # PostgREST answers 404 with 42P01 (undefined table) or, since v12, PGRST205
+  return exc.status == 404 and ("42P01" in exc.body or "PGRST205" in exc.body)
+
+
+class SupabaseSnapshotStore(SnapshotStore):
+  """
+  Snapshots in Supabase tables via the pooled REST client.
+
+  With a journal, inserts are written locally and flushed in the background;
+  reads return unflushed journal rows ahead of the Supabase pages. Every
+  write is an upsert (rows get their id before they are journaled), so
+  flushes can be retried after a 5xx. Retention
+  runs server-side through the purge_snapshot_batches function (migration
+  007), which is told which batches unflushed registry rows point at.
+
+  Dedup lookups never leave the process: find_batch answers from an LRU of
+  recently registered batches, so recording a snapshot does not wait on
+  Supabase.
+  """
+
+  def __init__(
+    self,
+    client: SupabaseRestClient,
+    journal_path: Optional[Path] = None,
+    ttl_seconds: Optional[float] = None,
+    max_batches: Optional[int] = None,
+  ) -> None:
+    self._client = client
+    self._journal = (
+      SnapshotJournal(journal_path, self._write, retryable=_retryable_flush_error) if journal_path else None
+    )
+    self.ttl_seconds = ttl_seconds
+    self.max_batches = max_batches
+    # (kind, spreadsheet_id, gid, content_hash) -> (data_batch_id, registered_at)
+    self._recent: "OrderedDict[Tuple[str, str, Optional[int], str], Tuple[str, float]]" = OrderedDict()
+    self._recent_lock = threading.Lock()
+
+  def _write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    # Rows journaled before they were keyed get their ids here
+    self._client.insert_sync(table, _keyed(table, rows), merge_duplicates=True, on_conflict=_conflict_key(table))
+
+  def insert(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    rows = _keyed(table, rows)
+    if self._journal is not None:
+      self._journal.append(table, rows)
+      return
+    try:
+      self._write(table, rows)
+    except SupabaseRestError as exc:
+      raise SnapshotStoreError(f"Snapshot insert into {table} failed: {exc}") from exc
+
+  async def insert_async(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    if self._journal is not None:
+      self._journal.append(table, rows)
+      return
+    try:
+      await self._client.insert(table, rows, **_SUPABASE_INSERT_OPTIONS.get(table, {}))
+    except SupabaseRestError as exc:
+      raise SnapshotStoreError(f"Snapshot insert into {table} failed: {exc}") from exc
+
+  async def select_pages(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, Any]] = None,
+    key: str = "id",
+  ) -> AsyncIterator[List[Dict[str, Any]]]:
+    if self._journal is not None:
+      journaled = [row for row in self._journal.pending(table, snapshot_batch_id) if _matches(row, filters)]
+      if journaled:
+        yield journaled
+
+    remote_filters = {"snapshot_batch_id": eq(snapshot_batch_id)}
+    for column, value in (filters or {}).items():
+      remote_filters[column] = eq_or_null(value)
+
+    try:
+      async for page in self._client.select_pages(table, columns, remote_filters, key=key):
+        yield page
+    except SupabaseRestError as exc:
+      # Databases without migration 004 have no packed tables; their snapshots
+      # are all in the per-cell tables, so there is nothing to read here
+      if table in (COLOR_RANGES_TABLE, VALUE_RANGES_TABLE) and _missing_relation(exc):
+        logger.debug(f"Snapshot table {table} does not exist; skipping packed rows")
+        return
+      raise SnapshotStoreError(f"Snapshot fetch from {table} failed: {exc.status}") from exc
+
+  def register_batch(self, batch: Dict[str, Any]) -> None:
+    super().register_batch(batch)
+    key = (batch["kind"], batch["spreadsheet_id"], batch.get("gid"), batch["content_hash"])
+    with self._recent_lock:
+      self._recent[key] = (str(batch["data_batch_id"]), time.time())
+      self._recent.move_to_end(key)
+      while len(self._recent) > _DEDUP_CACHE_SIZE:
+        self._recent.popitem(last=False)
+
+  def find_batch(
+    self,
+    kind: str,
+    spreadsheet_id: str,
+    gid: Optional[int],
+    content_hash: str,
+  ) -> Optional[Dict[str, Any]]:
+    # Only recent local registrations: retention cannot have removed their
+    # data yet, and no request waits on a Supabase round trip
+    key = (kind, spreadsheet_id, gid, content_hash)
+    with self._recent_lock:
+      entry = self._recent.get(key)
+      if entry is None:
+        return None
+      data_batch_id, registered_at = entry
+      if time.time() - registered_at > _DEDUP_WINDOW_SECONDS:
+        del self._recent[key]
+        return None
+    return {"data_batch_id": data_batch_id}
+
+  def _referenced_batches(self) -> List[str]:
+    """Data batches that unflushed or recent registry rows point at."""
+    cutoff = time.time() - _DEDUP_WINDOW_SECONDS
+    with self._recent_lock:
+      referenced = {data_batch_id for data_batch_id, registered_at in self._recent.values() if registered_at >= cutoff}
+    if self._journal is not None:
+      referenced.update(str(row["data_batch_id"]) for row in self._journal.pending_rows(BATCH_TABLE))
+    return sorted(referenced)
+
+  def purge_expired(self) -> int:
+    if not self.ttl_seconds and not self.max_batches:
+      return 0
+    try:
+      removed = self._client.rpc_sync(
+        "purge_snapshot_batches",
+        {
+          "max_age_seconds": int(self.ttl_seconds) if self.ttl_seconds else None,
+          "max_batches": self.max_batches or None,
+          "keep_batch_ids": self._referenced_batches(),
+        },
+      )
+    except SupabaseRestError as exc:
+      raise SnapshotStoreError(f"Snapshot retention failed: {exc.status}") from exc
+    removed = int(removed or 0)
+    if removed:
+      logger.info(f"Purged {removed} expired snapshot row(s) from Supabase")
+    return removed
+
+  def close(self) -> None:
+    if self._journal is not None:
+      self._journal.close()
+      self._journal = None
+
+
+_SQLITE_SCHEMA = """
+create table if not exists snapshot_rows (
+  id integer primary key autoincrement,
+  table_name text not null,
+  snapshot_batch_id text not null,
+  cell text,
+  spreadsheet_id text,
+  gid integer,
+  payload text not null,
+  created_at real not null
+);
+create index if not exists snapshot_rows_batch_cell_idx
+  on snapshot_rows (snapshot_batch_id, cell);
+create index if not exists snapshot_rows_created_idx
+  on snapshot_rows (created_at);
+create table if not exists snapshot_batches (
+  snapshot_batch_id text primary key,
+  spreadsheet_id text,
+  gid integer,
+  kind text not null,
+  content_hash text,
+  data_batch_id text not null,
+  row_count integer not null default 0,
+  created_at real not null
+);
+create index if not exists snapshot_batches_content_idx
+  on snapshot_batches (spreadsheet_id, kind, content_hash, created_at);
+create index if not exists snapshot_batches_spreadsheet_created_idx
+  on snapshot_batches (spreadsheet_id, created_at);
+create index if not exists snapshot_batches_data_batch_idx
+  on snapshot_batches (data_batch_id);
+"""
+
+_BATCH_COLUMNS = ("snapshot_batch_id", "spreadsheet_id", "gid", "kind", "content_hash", "data_batch_id", "row_count")
+
+# Columns stored next to the JSON payload so they can be filtered in SQL
+_SQLITE_FILTER_COLUMNS = ("cell", "spreadsheet_id", "gid")
+
+
+def _row_cell(row: Dict[str, Any]) -> Optional[str]:
+  """The cell (or range label) a snapshot row covers, for the (batch, cell) index."""
+  if row.get("cell"):
+    return row["cell"]
+  if row.get("range_ref"):
+    return row["range_ref"]
+  if row.get("origin_row") is not None and row.get("n_rows"):
+    return range_address(row["origin_row"], row["origin_col"], row["n_rows"], row["n_cols"])
+  return None
+
+
+class SQLiteSnapshotStore(SnapshotStore):
+  """
+  Embedded snapshot store for deployments without Supabase.
+
+  All snapshot tables share one SQLite file (WAL mode), indexed on
+  (snapshot_batch_id, cell); the batch registry has its own table. Inserts
+  are a single executemany transaction. Batches older than `ttl_seconds` or
+  beyond the newest `max_batches` per spreadsheet are purged on open and
+  whenever the retention job runs.
+  """
+
+  def __init__(
+    self,
+    path: Path,
+    ttl_seconds: Optional[float] = 30 * 24 * 3600,
+    max_batches: Optional[int] = None,
+    page_size: int = 5000,
+  ) -> None:
+    self.path = Path(path)
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    self.ttl_seconds = ttl_seconds
+    self.max_batches = max_batches
+    self.page_size = page_size
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+    self._conn.execute("pragma journal_mode=wal")
+    self._conn.execute("pragma synchronous=normal")
+    self._conn.executescript(_SQLITE_SCHEMA)
+    # Register batches written before the registry existed so retention keeps them
+    self._conn.execute(
+      "insert or ignore into snapshot_batches "
+      "(snapshot_batch_id, spreadsheet_id, gid, kind, data_batch_id, row_count, created_at) "
+      "select snapshot_batch_id, min(spreadsheet_id), min(gid), "
+      "  case when table_name = ? then ? when table_name in (?, ?) then ? else ? end, "
+      "  snapshot_batch_id, count(*), min(created_at) "
+      "from snapshot_rows where snapshot_batch_id not in (select data_batch_id from snapshot_batches) "
+      "group by snapshot_batch_id",
+      (RULE_TABLE, KIND_RULE, VALUE_TABLE, VALUE_RANGES_TABLE, KIND_VALUE, KIND_COLOR),
+    )
+    self.purge_expired()
+
+  def insert(self, table: str, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+      return
+    now = time.time()
+    entries = [
+      (
+        table,
+        str(row["snapshot_batch_id"]),
+        _row_cell(row),
+        row.get("spreadsheet_id"),
+        row.get("gid"),
+        json.dumps(row),
+        now,
+      )
+      for row in rows
+    ]
+    try:
+      with self._lock:
+        self._conn.execute("begin")
+        try:
+          self._conn.executemany(
+            "insert into snapshot_rows (table_name, snapshot_batch_id, cell, spreadsheet_id, gid, payload, created_at) "
+            "values (?, ?, ?, ?, ?, ?, ?)",
+            entries,
+          )
+          self._conn.execute("commit")
+        except Exception:
+          self._conn.execute("rollback")
+          raise
+    except sqlite3.Error as exc:
+      raise SnapshotStoreError(f"Snapshot insert into {table} failed: {exc}") from exc
+
+  def _page(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    filters: Optional[Dict[str, Any]],
+    after_id: int,
+    limit: int,
+  ) -> List[Dict[str, Any]]:
+    clauses = ["snapshot_batch_id = ?", "table_name = ?", "id > ?"]
+    params: List[Any] = [snapshot_batch_id, table, after_id]
+    for column, value in (filters or {}).items():
+      if column not in _SQLITE_FILTER_COLUMNS:
+        raise SnapshotStoreError(f"Unsupported snapshot filter column '{column}'.")
+      clauses.append(f"{column} is ?")
+      params.append(value)
+    params.append(limit)
+
+    try:
+      with self._lock:
+        cursor = self._conn.execute(
+          f"select id, payload from snapshot_rows where {' and '.join(clauses)} order by id limit ?",
+          params,
+        )
+        fetched = cursor.fetchall()
+    except sqlite3.Error as exc:
+      raise SnapshotStoreError(f"Snapshot fetch from {table} failed: {exc}") from exc
+
+    rows = []
+    for row_id, payload in fetched:
+      row = json.loads(payload)
+      row["id"] = row_id
+      rows.append(row)
+    return rows
+
+  async def select_pages(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, Any]] = None,
+    key: str = "id",
+  ) -> AsyncIterator[List[Dict[str, Any]]]:
+    # Local rowids are always unique, so `key` is not needed for paging here
+    after_id = 0
+    while True:
+      rows = self._page(table, snapshot_batch_id, filters, after_id, self.page_size)
+      if not rows:
+        return
+      after_id = rows[-1]["id"]
+      yield rows
+
+  def fetch_all_sync(
+    self,
+    table: str,
+    snapshot_batch_id: str,
+    filters: Optional[Dict[str, Any]] = None,
+    key: str = "id",
+  ) -> List[Dict[str, Any]]:
+    return self._page(table, snapshot_batch_id, filters, 0, -1)
+
+  def register_batch(self, batch: Dict[str, Any]) -> None:
+    values = [batch.get(column) for column in _BATCH_COLUMNS]
+    try:
+      with self._lock:
+        self._conn.execute(
+          f"insert or replace into snapshot_batches ({', '.join(_BATCH_COLUMNS)}, created_at) "
+          f"values ({', '.join('?' for _ in _BATCH_COLUMNS)}, ?)",
+          [*values, time.time()],
+        )
+    except sqlite3.Error as exc:
+      raise SnapshotStoreError(f"Snapshot batch registration failed: {exc}") from exc
+
+  def find_batch(
+    self,
+    kind: str,
+    spreadsheet_id: str,
+    gid: Optional[int],
+    content_hash: str,
+  ) -> Optional[Dict[str, Any]]:
+    with self._lock:
+      found = self._conn.execute(
+        "select snapshot_batch_id, data_batch_id from snapshot_batches "
+        "where spreadsheet_id = ? and kind = ? and content_hash = ? and gid is ? "
+        "order by created_at desc limit 1",
+        (spreadsheet_id, kind, content_hash, gid),
+      ).fetchone()
+    if found is None:
+      return None
+    return {"snapshot_batch_id": found[0], "data_batch_id": found[1]}
+
+  async def resolve_batch(self, snapshot_batch_id: str) -> str:
+    with self._lock:
+      found = self._conn.execute(
+        "select data_batch_id from snapshot_batches where snapshot_batch_id = ?",
+        (snapshot_batch_id,),
+      ).fetchone()
+    return found[0] if found else snapshot_batch_id
+
+  def purge_expired(self) -> int:
+    now = time.time()
+    age_cutoff = now - self.ttl_seconds if self.ttl_seconds else None
+    with self._lock:
+      self._conn.execute("begin")
+      try:
+        self._conn.execute(
+          "delete from snapshot_batches where snapshot_batch_id in ("
+          "  select snapshot_batch_id from ("
+          "    select snapshot_batch_id, created_at,"
+          "      row_number() over (partition by spreadsheet_id order by created_at desc) as position"
+          "    from snapshot_batches"
+          "  ) where (? is not null and created_at < ?) or (? is not null and position > ?)"
+          ")",
+          (age_cutoff, age_cutoff, self.max_batches, self.max_batches),
+        )
+        cursor = self._conn.execute(
+          "delete from snapshot_rows where created_at < ? "
+          "and snapshot_batch_id not in (select data_batch_id from snapshot_batches)",
+          (now - _UNREGISTERED_GRACE_SECONDS,),
+        )
+        self._conn.execute("commit")
+      except Exception:
+        self._conn.execute("rollback")
+        raise
+    if cursor.rowcount:
+      logger.info(f"Purged {cursor.rowcount} expired snapshot row(s) from {self.path}")
+    return cursor.rowcount
+
+  def close(self) -> None:
+    with self._lock:
+      self._conn.close()
+
+
+class SnapshotRetentionJob:
+  """Background thread that runs `store.purge_expired()` every `interval` seconds."""
+
+  def __init__(self, store: SnapshotStore, interval: float) -> None:
+    self._store = store
+    self.interval = interval
+    self._stopped = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="snapshot-retention", daemon=True)
+    self._thread.start()
+
+  def _run(self) -> None:
+    while not self._stopped.wait(self.interval):
+      try:
+        self._store.purge_expired()
+      except Exception as exc:
+        logger.warning(f"Snapshot retention run failed: {exc}")
+
+  def stop(self, timeout: float = 5.0) -> None:
+    self._stopped.set()
+    self._thread.join(timeout=timeout)
+
+
+_store: Optional[SnapshotStore] = None
+_retention_job: Optional[SnapshotRetentionJob] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+  """
+  Get or create the configured snapshot store.
+
+  SNAPSHOT_STORE selects the backend: "supabase", "sqlite", or unset to use
+  Supabase when it is configured and the local SQLite store otherwise.
+  Snapshot tables are written with a service key (SUPABASE_SERVICE_ROLE_KEY
+  or SUPABASE_SERVICE_KEY), never the anon key. SNAPSHOT_JOURNAL=0 disables the write-behind journal in front of Supabase;
+  SNAPSHOT_JOURNAL_PATH and SNAPSHOT_SQLITE_PATH move the local files.
+
+  Retention applies to either backend: SNAPSHOT_TTL_DAYS (default 30) and
+  SNAPSHOT_MAX_BATCHES per spreadsheet (default 200) bound what is kept, and a
+  background job enforces them every SNAPSHOT_GC_INTERVAL seconds (default
+  3600, 0 disables it). A limit of 0 turns that limit off.
+  """
+  global _store, _retention_job
+
+  if _store is not None:
+    return _store
+
+  with _store_lock:
+    if _store is not None:
+      return _store
+
+    _load_env_from_local_files()
+    backend = (os.getenv("SNAPSHOT_STORE") or "").strip().lower()
+    if backend not in ("", "supabase", "sqlite"):
+      raise ValueError(f"Unknown SNAPSHOT_STORE '{backend}'. Expected 'supabase' or 'sqlite'.")
+
+    client = get_supabase_rest_client() if backend != "sqlite" else None
+    if backend == "supabase" and client is None:
+      raise ValueError("SNAPSHOT_STORE=supabase requires SUPABASE_URL and a Supabase key.")
+    if client is not None and not client.service_role:
+      if backend == "supabase":
+        raise ValueError("SNAPSHOT_STORE=supabase requires SUPABASE_SERVICE_ROLE_KEY; the anon key cannot write snapshots.")
+      logger.warning("Supabase is configured with the anon key only; keeping snapshots in the local SQLite store")
+      client = None
+
+    ttl_days = float(os.getenv("SNAPSHOT_TTL_DAYS", "30"))
+    ttl_seconds = ttl_days * 24 * 3600 if ttl_days > 0 else None
+    max_batches = int(os.getenv("SNAPSHOT_MAX_BATCHES", "200")) or None
+
+    if client is not None:
+      journal_path = None
+      if os.getenv("SNAPSHOT_JOURNAL", "1") != "0":
+        journal_path = Path(os.getenv("SNAPSHOT_JOURNAL_PATH") or DATA_DIR / "snapshot_journal.sqlite3")
+      _store = SupabaseSnapshotStore(client, journal_path, ttl_seconds=ttl_seconds, max_batches=max_batches)
+      logger.info(f"Snapshot store: supabase (journal={journal_path or 'off'})")
+    else:
+      path = Path(os.getenv("SNAPSHOT_SQLITE_PATH") or DATA_DIR / "snapshots.sqlite3")
+      _store = SQLiteSnapshotStore(path, ttl_seconds=ttl_seconds, max_batches=max_batches)
+      logger.info(f"Snapshot store: sqlite at {path}")
+
+    gc_interval = float(os.getenv("SNAPSHOT_GC_INTERVAL", "3600"))
+    if gc_interval > 0:
+      _retention_job = SnapshotRetentionJob(_store, gc_interval)
+
+    return _store
+
+
+def close_snapshot_store() -> None:
+  """Flush and close the shared store, if one was created."""
+  global _store, _retention_job
+  with _store_lock:
+    if _retention_job is not None:
+      _retention_job.stop()
+      _retention_job = None
+    if _store is not None:
+      _store.close()
+      _store = None
+
+
+# --- snapshot formats ---
+
+def _packed_snapshots() -> bool:
+  # PACKED_SNAPSHOTS=1 writes one packed row per range, which needs migration
+  # 004 applied first. Off by default, writing legacy per-cell rows; restores
+  # read both formats either way.
+  return os.getenv("PACKED_SNAPSHOTS", "0") == "1"
+
+
+def color_snapshot_payload(rows: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+  """Pick the color snapshot table and rows to write for per-cell snapshot rows."""
+  if _packed_snapshots():
+    return COLOR_RANGES_TABLE, pack_color_rows(rows)
+  return COLOR_TABLE, rows
+
+
+def value_snapshot_payload(rows: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+  """Pick the value snapshot table and rows to write for per-cell snapshot rows."""
+  if _packed_snapshots():
+    return VALUE_RANGES_TABLE, pack_value_rows(rows)
+  return VALUE_TABLE, rows
+
+
+def snapshot_content_hash(kind: str, rows: List[Dict[str, Any]]) -> str:
+  """Hash a snapshot's content, ignoring batch ids and row order."""
+  entries = sorted(
+    json.dumps({k: v for k, v in row.items() if k not in _HASH_IGNORED_COLUMNS}, sort_keys=True)
+    for row in rows
+  )
+  digest = hashlib.sha256(kind.encode("utf-8"))
+  for entry in entries:
+    digest.update(b"\n")
+    digest.update(entry.encode("utf-8"))
+  return digest.hexdigest()
+
+
+def record_snapshot(
+  kind: str,
+  rows: List[Dict[str, Any]],
+  payload_fn: Callable[[List[Dict[str, Any]]], Tuple[str, List[Dict[str, Any]]]],
+) -> str:
+  """
+  Store one snapshot batch and register it. Returns the batch holding its rows.
+
+  All rows share one snapshot_batch_id. If the spreadsheet already has a
+  batch of this kind with identical content, only the registry row is
+  written and it points at the existing data.
+  """
+  if not rows:
+    raise ValueError("No rows to snapshot.")
+  first = rows[0]
+  snapshot_batch_id = str(first["snapshot_batch_id"])
+  spreadsheet_id = first["spreadsheet_id"]
+  gid = first.get("gid")
+  content_hash = snapshot_content_hash(kind, rows)
+  store = get_snapshot_store()
+
+  try:
+    existing = store.find_batch(kind, spreadsheet_id, gid, content_hash)
+  except SnapshotStoreError as exc:
+    logger.warning(f"Snapshot dedup lookup failed, storing a full copy: {exc}")
+    existing = None
+
+  if existing is not None:
+    data_batch_id = str(existing["data_batch_id"])
+    logger.info(f"Snapshot {snapshot_batch_id} matches {data_batch_id}; storing a reference only")
+  else:
+    data_batch_id = snapshot_batch_id
+    table, payload = payload_fn(rows)
+    store.insert(table, payload)
+
+  store.register_batch(
+    {
+      "snapshot_batch_id": snapshot_batch_id,
+      "spreadsheet_id": spreadsheet_id,
+      "gid": gid,
+      "kind": kind,
+      "content_hash": content_hash,
+      "data_batch_id": data_batch_id,
+      "row_count": len(rows),
+    }
+  )
+  return data_batch_id
+
+
+def record_color_snapshot(rows: List[Dict[str, Any]]) -> None:
+  """Store per-cell color snapshot rows in the configured store."""
+  record_snapshot(KIND_COLOR, rows, color_snapshot_payload)
+
+
+async def record_color_snapshot_async(rows: List[Dict[str, Any]]) -> None:
+  await asyncio.to_thread(run_profiled, record_color_snapshot, rows)
+
+
+def record_value_snapshot(rows: List[Dict[str, Any]]) -> None:
+  """Store per-cell value snapshot rows in the configured store."""
+  record_snapshot(KIND_VALUE, rows, value_snapshot_payload)
+
+
+def record_rule_snapshot(row: Dict[str, Any]) -> None:
+  """Store the conditional format rules installed by a visualization."""
+  record_snapshot(KIND_RULE, [row], lambda rows: (RULE_TABLE, rows))
+
+
+def load_color_snapshot(
+  snapshot_batch_id: str,
+  spreadsheet_id: str,
+  gid: Optional[int],
+) -> List[Dict[str, Any]]:
+  """Blocking helper for scripts: every per-cell color row of a batch, packed or legacy."""
+  store = get_snapshot_store()
+  snapshot_batch_id = asyncio.run(store.resolve_batch(snapshot_batch_id))
+  filters = {"spreadsheet_id": spreadsheet_id, "gid": gid}
+  rows: List[Dict[str, Any]] = []
+  for packed in store.fetch_all_sync(COLOR_RANGES_TABLE, snapshot_batch_id, filters):
+    rows.extend(unpack_color_row(packed))
+  rows.extend(store.fetch_all_sync(COLOR_TABLE, snapshot_batch_id, filters))
+  return rows
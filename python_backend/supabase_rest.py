@@ -0,0 +1,503 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Coroutine, Dict, Iterable, List, Optional, TypeVar
+
+import httpx
+
+from .call_budget import record_supabase_call
+from .llm import _load_env_from_local_files
+from .logging_config import get_logger
+from .metrics import SUPABASE_DURATION, SUPABASE_REQUESTS
+from .tracing import span
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying: rate limiting and transient gateway/server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Of those, the ones that mean the request was turned away before it ran, so
+# retrying is safe even for requests that are not idempotent
+REJECTED_STATUS = {408, 429}
+
+# Transport errors raised before the request reached the server
+REJECTED_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class SupabaseRestError(RuntimeError):
+  """Raised when a PostgREST call fails after all retries."""
+
+  def __init__(self, message: str, status: Optional[int] = None, body: str = "") -> None:
+    super().__init__(message)
+    self.status = status
+    self.body = body
+
+
+# --- filter helpers (PostgREST operator syntax) ---
+
+def eq(value: Any) -> str:
+  return f"eq.{value}"
+
+
+def gt(value: Any) -> str:
+  return f"gt.{value}"
+
+
+def lt(value: Any) -> str:
+  return f"lt.{value}"
+
+
+def is_null() -> str:
+  return "is.null"
+
+
+def in_(values: Iterable[Any]) -> str:
+  return "in.(" + ",".join(str(v) for v in values) + ")"
+
+
+def eq_or_null(value: Optional[Any]) -> str:
+  """Match a nullable column, e.g. gid, with `is.null` when value is None."""
+  return is_null() if value is None else eq(value)
+
+
+class SupabaseRestClient:
+  """
+  Pooled PostgREST client for Supabase tables.
+
+  All requests run on a dedicated event loop thread that owns a single
+  httpx.AsyncClient, so TLS connections are reused across calls and callers
+  never block their own event loop. Async callers await the coroutine
+  methods; synchronous code (tools, the orchestrator) uses the *_sync
+  variants, which wait on the same loop.
+  """
+
+  def __init__(
+    self,
+    url: str,
+    key: str,
+    timeout: float = 15.0,
+    max_connections: int = 20,
+    max_retries: int = 3,
+    backoff_base: float = 0.25,
+    chunk_size: int = 500,
+    max_concurrent_chunks: int = 4,
+    page_size: int = 1000,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    service_role: bool = False,
+  ) -> None:
+    self.base_url = f"{url.rstrip('/')}/rest/v1"
+    self._key = key
+    self._timeout = timeout
+    self._limits = httpx.Limits(
+      max_connections=max_connections,
+      max_keepalive_connections=max_connections,
+    )
+    self.max_retries = max_retries
+    self.backoff_base = backoff_base
+    self.chunk_size = chunk_size
+    self.max_concurrent_chunks = max_concurrent_chunks
+    self.page_size = page_size
+    self._transport = transport
+    # Whether `key` is a service key (bypasses row-level security)
+    self.service_role = service_role
+
+    self._http: Optional[httpx.AsyncClient] = None
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(
+      target=self._loop.run_forever,
+      name="supabase-rest",
+      daemon=True,
+    )
+    self._thread.start()
+
+  # --- loop plumbing ---
+
+  def _headers(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    headers = {
+      "apikey": self._key,
+      "Authorization": f"Bearer {self._key}",
+      "Accept": "application/json",
+    }
+    if extra:
+      headers.update(extra)
+    return headers
+
+  def _client(self) -> httpx.AsyncClient:
+    # Created lazily on the client loop so the pool is bound to it
+    if self._http is None:
+      self._http = httpx.AsyncClient(timeout=self._timeout, limits=self._limits, transport=self._transport)
+    return self._http
+
+  async def _dispatch(self, coro: Coroutine[Any, Any, T]) -> T:
+    future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+    return await asyncio.wrap_future(future)
+
+  def run_sync(self, coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on the client loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+  def close(self) -> None:
+    """Close the connection pool and stop the loop thread."""
+    if not self._loop.is_running():
+      return
+
+    async def _close() -> None:
+      if self._http is not None:
+        await self._http.aclose()
+        self._http = None
+
+    try:
+      self.run_sync(_close())
+    finally:
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._thread.join(timeout=5)
+
+  # --- core request with retries ---
+
+  async def _request(
+    self,
+    method: str,
+    table: str,
+    params: Optional[Dict[str, str]] = None,
+    json_body: Any = None,
+    headers: Optional[Dict[str, str]] = None,
+    idempotent: Optional[bool] = None,
+  ) -> httpx.Response:
+    """
+    Send one PostgREST request, retrying transient failures.
+
+    Requests that are not idempotent (POST, unless `idempotent` says
+    otherwise) are only retried when the server cannot have run them:
+    connection failures, 408 and 429. A 5xx or a dropped response may mean
+    the rows were written, so those are raised instead of inserted twice.
+    """
+    if idempotent is None:
+      idempotent = method != "POST"
+    started = time.perf_counter()
+    outcome = "transport_error"
+    with span(f"supabase {method} {table}", "supabase"):
+      try:
+        response = await self._request_with_retries(method, table, params, json_body, headers, idempotent)
+        outcome = "ok"
+        return response
+      except SupabaseRestError as exc:
+        if exc.status is not None:
+          outcome = f"http_{exc.status}"
+        raise
+      finally:
+        record_supabase_call()
+        SUPABASE_REQUESTS.inc(method, table, outcome)
+        SUPABASE_DURATION.observe(time.perf_counter() - started, method, table)
+
+  async def _request_with_retries(
+    self,
+    method: str,
+    table: str,
+    params: Optional[Dict[str, str]],
+    json_body: Any,
+    headers: Optional[Dict[str, str]],
+    idempotent: bool,
+  ) -> httpx.Response:
+    url = f"{self.base_url}/{table}"
+    last_error: Optional[BaseException] = None
+
+    for attempt in range(self.max_retries + 1):
+      try:
+        response = await self._client().request(
+          method,
+          url,
+          params=params,
+          json=json_body,
+          headers=self._headers(headers),
+        )
+      except httpx.TransportError as exc:
+        last_error = exc
+        logger.warning(
+          f"Supabase {method} {table} transport error (attempt {attempt + 1}): {exc}",
+          extra={"table": table, "attempt": attempt + 1},
+        )
+        if not idempotent and not isinstance(exc, REJECTED_ERRORS):
+          break
+      else:
+        if response.status_code < 400:
+          return response
+        retryable = RETRYABLE_STATUS if idempotent else REJECTED_STATUS
+        if response.status_code not in retryable:
+          raise SupabaseRestError(
+            f"Supabase {method} {table} failed: {response.status_code} {response.text}",
+            status=response.status_code,
+            body=response.text,
+          )
+        last_error = SupabaseRestError(
+          f"Supabase {method} {table} failed: {response.status_code} {response.text}",
+          status=response.status_code,
+          body=response.text,
+        )
+        logger.warning(
+          f"Supabase {method} {table} returned {response.status_code} (attempt {attempt + 1})",
+          extra={"table": table, "status_code": response.status_code, "attempt": attempt + 1},
+        )
+
+      if attempt < self.max_retries:
+        # Exponential backoff with full jitter
+        await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+    if isinstance(last_error, SupabaseRestError):
+      raise last_error
+    raise SupabaseRestError(f"Supabase {method} {table} failed: {last_error}") from last_error
+
+  # --- query helpers ---
+
+  async def _select(
+    self,
+    table: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, str]] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+  ) -> List[Dict[str, Any]]:
+    params: Dict[str, str] = {"select": columns}
+    params.update(filters or {})
+    if order:
+      params["order"] = order
+    if limit is not None:
+      params["limit"] = str(limit)
+
+    response = await self._request("GET", table, params=params)
+    rows = response.json()
+    if not isinstance(rows, list):
+      raise SupabaseRestError(f"Supabase response for {table} malformed; expected a list.")
+    return rows
+
+  async def _insert_chunk(
+    self,
+    table: str,
+    rows: List[Dict[str, Any]],
+    prefer: str,
+    params: Dict[str, str],
+  ) -> List[Dict[str, Any]]:
+    # An upsert on a conflict target can be replayed; a plain insert cannot
+    response = await self._request(
+      "POST",
+      table,
+      params=params or None,
+      json_body=rows,
+      headers={"Content-Type": "application/json", "Prefer": prefer},
+      idempotent="on_conflict" in params,
+    )
+    if "return=representation" in prefer and response.content:
+      data = response.json()
+      return data if isinstance(data, list) else []
+    return []
+
+  async def _insert(
+    self,
+    table: str,
+    rows: List[Dict[str, Any]],
+    merge_duplicates: bool = False,
+    on_conflict: Optional[str] = None,
+    returning: bool = False,
+  ) -> List[Dict[str, Any]]:
+    if not rows:
+      return []
+
+    prefer_parts = ["return=representation" if returning else "return=minimal"]
+    if merge_duplicates:
+      prefer_parts.append("resolution=merge-duplicates")
+    prefer = ",".join(prefer_parts)
+    params = {"on_conflict": on_conflict} if on_conflict else {}
+
+    chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+    if len(chunks) == 1:
+      return await self._insert_chunk(table, chunks[0], prefer, params)
+
+    semaphore = asyncio.Semaphore(self.max_concurrent_chunks)
+
+    async def _bounded(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+      async with semaphore:
+        return await self._insert_chunk(table, chunk, prefer, params)
+
+    results = await asyncio.gather(*(_bounded(chunk) for chunk in chunks))
+    logger.debug(f"Inserted {len(rows)} row(s) into {table} in {len(chunks)} chunk(s)")
+    return [row for result in results for row in result]
+
+  async def _delete(self, table: str, filters: Dict[str, str]) -> None:
+    if not filters:
+      raise ValueError("Refusing to delete without filters.")
+    await self._request("DELETE", table, params=dict(filters), headers={"Prefer": "return=minimal"})
+
+  async def _rpc(self, function: str, params: Optional[Dict[str, Any]] = None, idempotent: bool = True) -> Any:
+    response = await self._request(
+      "POST",
+      f"rpc/{function}",
+      json_body=params or {},
+      headers={"Content-Type": "application/json"},
+      idempotent=idempotent,
+    )
+    return response.json() if response.content else None
+
+  # --- public async API ---
+
+  async def select(
+    self,
+    table: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, str]] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+  ) -> List[Dict[str, Any]]:
+    return await self._dispatch(self._select(table, columns, filters, order, limit))
+
+  async def insert(
+    self,
+    table: str,
+    rows: List[Dict[str, Any]],
+    merge_duplicates: bool = False,
+    on_conflict: Optional[str] = None,
+    returning: bool = False,
+  ) -> List[Dict[str, Any]]:
+    return await self._dispatch(self._insert(table, rows, merge_duplicates, on_conflict, returning))
+
+  async def delete(self, table: str, filters: Dict[str, str]) -> None:
+    await self._dispatch(self._delete(table, filters))
+
+  async def rpc(self, function: str, params: Optional[Dict[str, Any]] = None, idempotent: bool = True) -> Any:
+    """
+    Call a Postgres function exposed by PostgREST and return its decoded result.
+
+    Pass idempotent=False for functions that must not run twice, so 5xx
+    responses are not retried.
+    """
+    return await self._dispatch(self._rpc(function, params, idempotent))
+
+  async def select_pages(
+    self,
+    table: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, str]] = None,
+    key: str = "id",
+    page_size: Optional[int] = None,
+  ) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield every matching row, one page at a time, using keyset pagination.
+
+    PostgREST silently truncates a response at its max-rows setting, so a
+    single GET can miss rows. Pages are ordered by `key` (which must be unique
+    within the filtered rows) and each request resumes after the last key seen.
+    The next page is fetched while the caller processes the current one, and
+    iteration only stops on an empty page, so a server cap smaller than
+    page_size cannot end it early.
+    """
+    page_size = page_size or self.page_size
+    if columns != "*" and key not in columns.split(","):
+      columns = f"{columns},{key}"
+
+    def _fetch(after: Optional[Any]) -> "asyncio.Future[List[Dict[str, Any]]]":
+      page_filters = dict(filters or {})
+      if after is not None:
+        page_filters[key] = gt(after)
+      return asyncio.ensure_future(
+        self.select(table, columns, page_filters, order=f"{key}.asc", limit=page_size)
+      )
+
+    pending = _fetch(None)
+    try:
+      while True:
+        rows = await pending
+        if not rows:
+          return
+        pending = _fetch(rows[-1][key])
+        yield rows
+    finally:
+      if not pending.done():
+        pending.cancel()
+
+  # --- public sync API ---
+
+  def select_sync(
+    self,
+    table: str,
+    columns: str = "*",
+    filters: Optional[Dict[str, str]] = None,
+    order: Optional[str] = None,
+    limit: Optional[int] = None,
+  ) -> List[Dict[str, Any]]:
+    return self.run_sync(self._select(table, columns, filters, order, limit))
+
+  def insert_sync(
+    self,
+    table: str,
+    rows: List[Dict[str, Any]],
+    merge_duplicates: bool = False,
+    on_conflict: Optional[str] = None,
+    returning: bool = False,
+  ) -> List[Dict[str, Any]]:
+    return self.run_sync(self._insert(table, rows, merge_duplicates, on_conflict, returning))
+
+  def delete_sync(self, table: str, filters: Dict[str, str]) -> None:
+    self.run_sync(self._delete(table, filters))
+
+  def rpc_sync(self, function: str, params: Optional[Dict[str, Any]] = None, idempotent: bool = True) -> Any:
+    return self.run_sync(self._rpc(function, params, idempotent))
+
+
+_rest_client: Optional[SupabaseRestClient] = None
+_rest_client_lock = threading.Lock()
+
+
+def get_supabase_rest_client() -> Optional[SupabaseRestClient]:
+  """
+  Lazily create and cache the shared SupabaseRestClient, if configured.
+
+  Uses the same environment variables as get_supabase_client. Returns None
+  when SUPABASE_URL or a key is missing, so callers can degrade gracefully.
+  The client's `service_role` says whether it fell back to the anon key;
+  stores that need row-level-security bypass check it.
+  """
+  global _rest_client
+
+  if _rest_client is not None:
+    return _rest_client
+
+  with _rest_client_lock:
+    if _rest_client is not None:
+      return _rest_client
+
+    _load_env_from_local_files()
+
+    url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_SERVICE_KEY")
+    key = service_key or os.getenv("SUPABASE_ANON_KEY")
+    if not url or not key:
+      logger.warning(
+        "Supabase REST client not configured - missing URL or key",
+        extra={"has_url": bool(url), "has_key": bool(key)},
+      )
+      return None
+
+    _rest_client = SupabaseRestClient(
+      url,
+      key,
+      max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20")),
+      max_retries=int(os.getenv("SUPABASE_MAX_RETRIES", "3")),
+      chunk_size=int(os.getenv("SUPABASE_INSERT_CHUNK_SIZE", "500")),
+      page_size=int(os.getenv("SUPABASE_PAGE_SIZE", "1000")),
+      service_role=bool(service_key),
+    )
+    logger.info(f"Supabase REST client created for URL: {url[:30]}...")
+    return _rest_client
+
+
+def close_supabase_rest_client() -> None:
+  """Close the shared client, if one was created."""
+  global _rest_client
+  with _rest_client_lock:
+    if _rest_client is not None:
+      _rest_client.close()
+      _rest_client = None
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from .memory_diagnostics import register_stats
+
+T = TypeVar("T")
+
+# Spans beyond this are dropped so one runaway request can't grow without bound
+MAX_SPANS_PER_TRACE = 5000
+
+
+class Span:
+  __slots__ = ("name", "category", "start", "end", "thread_id", "thread_name", "args")
+
+  def __init__(self, name: str, category: str, args: Dict[str, Any]) -> None:
+    self.name = name
+    self.category = category
+    self.args = args
+    thread = threading.current_thread()
+    self.thread_id = thread.ident or 0
+    self.thread_name = thread.name
+    self.start = time.perf_counter()
+    self.end: Optional[float] = None
+
+
+class Trace:
+  """
+  Spans recorded while handling one request, keyed by its request id.
+
+  Spans are appended from whichever thread or event loop ends up doing the
+  work (list.append is atomic), so the trace can be read while late spans,
+  e.g. from a streaming response, are still being added.
+  """
+
+  def __init__(self, request_id: str, name: str) -> None:
+    self.request_id = request_id
+    self.started_at = time.time()
+    self.root = Span(name, "request", {"request_id": request_id})
+    self.spans: List[Span] = [self.root]
+    self.dropped = 0
+
+  @property
+  def duration(self) -> Optional[float]:
+    if self.root.end is None:
+      return None
+    return self.root.end - self.root.start
+
+  def add(self, span: Span) -> None:
+    if len(self.spans) >= MAX_SPANS_PER_TRACE:
+      self.dropped += 1
+      return
+    self.spans.append(span)
+
+  def to_chrome(self) -> Dict[str, Any]:
+    """
+    The trace as Chrome trace-event JSON (complete "X" events), loadable in
+    chrome://tracing or Perfetto. Timestamps are microseconds from the start
+    of the request.
+    """
+    pid = os.getpid()
+    origin = self.root.start
+    now = time.perf_counter()
+    events: List[Dict[str, Any]] = [
+      {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"request {self.request_id}"}},
+    ]
+    threads: Dict[int, str] = {}
+    for span in list(self.spans):
+      threads.setdefault(span.thread_id, span.thread_name)
+      end = span.end if span.end is not None else now
+      args = dict(span.args)
+      if span.end is None:
+        args["unfinished"] = True
+      events.append({
+        "name": span.name,
+        "cat": span.category,
+        "ph": "X",
+        "ts": round((span.start - origin) * 1e6, 3),
+        "dur": round((end - span.start) * 1e6, 3),
+        "pid": pid,
+        "tid": span.thread_id,
+        "args": args,
+      })
+    for thread_id, thread_name in threads.items():
+      events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+    return {
+      "traceEvents": events,
+      "displayTimeUnit": "ms",
+      "otherData": {
+        "request_id": self.request_id,
+        "started_at": self.started_at,
+        "dropped_spans": self.dropped,
+      },
+    }
+
+
+class TraceBuffer:
+  """Ring buffer of the most recent `capacity` traces."""
+
+  def __init__(self, capacity: int) -> None:
+    self.capacity = capacity
+    self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+    self._lock = threading.Lock()
+
+  def add(self, trace: Trace) -> None:
+    with self._lock:
+      self._traces[trace.request_id] = trace
+      self._traces.move_to_end(trace.request_id)
+      while len(self._traces) > self.capacity:
+        self._traces.popitem(last=False)
+
+  def get(self, request_id: str) -> Optional[Trace]:
+    with self._lock:
+      return self._traces.get(request_id)
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {"traces": len(self._traces), "spans": sum(len(trace.spans) for trace in self._traces.values())}
+
+  def recent(self) -> List[Trace]:
+    """Buffered traces, newest first."""
+    with self._lock:
+      return list(reversed(self._traces.values()))
+
+
+# The trace of the request being handled and the innermost open span
+_active: contextvars.ContextVar[Optional[Tuple[Trace, Span]]] = contextvars.ContextVar("trace", default=None)
+
+_buffer: Optional[TraceBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_trace_buffer() -> Optional[TraceBuffer]:
+  """
+  Get or create the process-wide trace buffer.
+
+  TRACE_BUFFER_SIZE (default 200) is how many recent requests are kept;
+  0 disables tracing and returns None.
+  """
+  global _buffer
+
+  if _buffer is not None:
+    return _buffer
+
+  capacity = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+  if capacity <= 0:
+    return None
+
+  with _buffer_lock:
+    if _buffer is None:
+      _buffer = TraceBuffer(capacity)
+      register_stats("trace_buffer", _buffer)
+    return _buffer
+
+
+def start_trace(request_id: str, name: str) -> Optional[contextvars.Token]:
+  """Begin tracing the current request; returns a token for finish_trace()."""
+  buffer = get_trace_buffer()
+  if buffer is None:
+    return None
+  trace = Trace(request_id, name)
+  buffer.add(trace)
+  return _active.set((trace, trace.root))
+
+
+def finish_trace(token: Optional[contextvars.Token], name: Optional[str] = None, **args: Any) -> None:
+  if token is None:
+    return
+  active = _active.get()
+  if active is not None:
+    trace = active[0]
+    if name is not None:
+      trace.root.name = name
+    trace.root.args.update(args)
+    trace.root.end = time.perf_counter()
+  _active.reset(token)
+
+
+@contextmanager
+def span(name: str, category: str = "app", **args: Any) -> Iterator[Optional[Span]]:
+  """
+  Record a span of the current request's trace around the block.
+
+  Outside a traced request this does nothing beyond one context-var read.
+  Exceptions are recorded in the span's args and re-raised.
+  """
+  active = _active.get()
+  if active is None:
+    yield None
+    return
+
+  trace = active[0]
+  current = Span(name, category, args)
+  token = _active.set((trace, current))
+  try:
+    yield current
+  except BaseException as exc:
+    current.args["error"] = f"{type(exc).__name__}: {exc}"
+    raise
+  finally:
+    current.end = time.perf_counter()
+    _active.reset(token)
+    trace.add(current)
+
+
+def traced(name: str, category: str = "app") -> Callable[[Callable[..., T]], Callable[..., T]]:
+  """Decorator form of span() for a whole function."""
+
+  def decorate(func: Callable[..., T]) -> Callable[..., T]:
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+      with span(name, category):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+  return decorate
@@ -9,6 +9,7 @@ import uuid
 from typing import Any, Dict, List, Optional, Tuple
 
 from .logging_config import get_logger
+from .snapshot_store import record_color_snapshot, record_rule_snapshot
 
 logger = get_logger(__name__)
 
@@ -18,6 +19,24 @@ Color = Dict[str, float]
 FORMULA_COLOR: Color = {"red": 0.75, "green": 0.92, "blue": 0.75}  # light green
 VALUE_COLOR: Color = {"red": 0.98, "green": 0.8, "blue": 0.5}      # light orange
 
+# Visualization modes
+MODE_CELLS = "cells"              # color each cell individually, snapshot per cell
+MODE_CONDITIONAL = "conditional"  # install conditional format rules over the used range
+VISUALIZE_MODES = (MODE_CELLS, MODE_CONDITIONAL)
+
+# Custom formulas for the conditional mode, relative to the top-left cell (A1) of the rule range
+FORMULA_RULE = "=ISFORMULA(A1)"
+VALUE_RULE = "=AND(ISNUMBER(A1),NOT(ISFORMULA(A1)))"
+
+# Installed rules carry their snapshot batch id as a no-op term (N() of text is 0),
+# so undo removes exactly that batch's rules and leaves the user's and other batches'
+RULE_TAG = "sheet-mangler:"
+
+
+def _tagged_rule(formula: str, snapshot_batch_id: str) -> str:
+    """The custom formula with the batch's tag, e.g. =AND(ISFORMULA(A1),N("sheet-mangler:<id>")=0)."""
+    return f'=AND({formula[1:]},N("{RULE_TAG}{snapshot_batch_id}")=0)'
+
 
 def _cell_to_indices(cell: str) -> Tuple[int, int]:
     """Convert cell reference like 'A1' to (row_index, col_index)."""
@@ -73,6 +92,40 @@ def _build_color_request(sheet_id: int, row: int, col: int, color: Color) -> Dic
     }
 
 
+def _build_conditional_rule_request(
+    sheet_id: int,
+    row_count: int,
+    col_count: int,
+    formula: str,
+    color: Color,
+    index: int,
+) -> Dict[str, Any]:
+    """Build an addConditionalFormatRule request covering the sheet's used grid."""
+    return {
+        "addConditionalFormatRule": {
+            "rule": {
+                "ranges": [
+                    {
+                        "sheetId": sheet_id,
+                        "startRowIndex": 0,
+                        "endRowIndex": row_count,
+                        "startColumnIndex": 0,
+                        "endColumnIndex": col_count,
+                    }
+                ],
+                "booleanRule": {
+                    "condition": {
+                        "type": "CUSTOM_FORMULA",
+                        "values": [{"userEnteredValue": formula}],
+                    },
+                    "format": {"backgroundColor": color},
+                },
+            },
+            "index": index,
+        }
+    }
+
+
 def _normalize_color(cell_data: Dict[str, Any]) -> Color:
     """Extract background color from cell data."""
     fmt = cell_data.get("userEnteredFormat") or cell_data.get("effectiveFormat") or {}
@@ -90,7 +143,9 @@ def visualize_formulas(
     sheet_title: str,
     sheet_id: int,
     gid: Optional[int],
-    supabase_insert_fn: callable,
+    snapshot_fn: Optional[callable] = None,
+    mode: str = MODE_CELLS,
+    rule_snapshot_fn: Optional[callable] = None,
 ) -> Dict[str, Any]:
     """
     Color-code cells to distinguish formulas (green) from hard-coded values (orange).
@@ -101,11 +156,24 @@ def visualize_formulas(
         sheet_title: The sheet name
         sheet_id: The sheet ID for API requests
         gid: The gid for snapshots (optional)
-        supabase_insert_fn: Function to insert snapshot rows
+        snapshot_fn: Function to store per-cell snapshot rows
+            (defaults to the configured snapshot store)
+        mode: "cells" colors every matching cell and snapshots each one;
+              "conditional" installs two conditional format rules instead
+        rule_snapshot_fn: Function to store the rule snapshot row (conditional mode,
+            defaults to the configured snapshot store)
 
     Returns:
         Dict with status, message, count, and snapshot_batch_id
     """
+    if mode not in VISUALIZE_MODES:
+        raise ValueError(f"Unknown visualization mode '{mode}'. Expected one of {VISUALIZE_MODES}.")
+
+    if mode == MODE_CONDITIONAL:
+        return _visualize_with_conditional_rules(
+            validator, spreadsheet_id, sheet_title, sheet_id, gid, rule_snapshot_fn or record_rule_snapshot
+        )
+
     logger.info(f"Visualizing formulas on sheet '{sheet_title}' (id={spreadsheet_id})")
 
     # Fetch cell data with formulas
@@ -186,7 +254,7 @@ def visualize_formulas(
     ]
 
     try:
-        supabase_insert_fn(snapshot_rows)
+        (snapshot_fn or record_color_snapshot)(snapshot_rows)
         logger.info(f"Created snapshot {snapshot_batch_id} with {len(snapshot_rows)} cells")
     except Exception as exc:
         logger.error(f"Failed to create snapshot: {exc}", exc_info=True)
@@ -222,3 +290,149 @@ def visualize_formulas(
         "count": len(targets),
         "snapshot_batch_id": snapshot_batch_id,
     }
+
+
+def _visualize_with_conditional_rules(
+    validator: Any,
+    spreadsheet_id: str,
+    sheet_title: str,
+    sheet_id: int,
+    gid: Optional[int],
+    rule_snapshot_fn: callable,
+) -> Dict[str, Any]:
+    """
+    Install ISFORMULA / numeric-constant conditional format rules over the used grid.
+
+    Independent of sheet size this costs one metadata read, one snapshot row and
+    one batchUpdate; nothing is read or written per cell.
+    """
+    logger.info(f"Visualizing formulas with conditional rules on sheet '{sheet_title}' (id={spreadsheet_id})")
+
+    quoted_title = sheet_title.replace("'", "''")
+    try:
+        response = validator.service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            ranges=[f"'{quoted_title}'"],
+            fields="sheets(properties(sheetId,title,gridProperties(rowCount,columnCount)))",
+        ).execute()
+    except Exception as exc:
+        logger.error(f"Failed to fetch sheet properties: {exc}", exc_info=True)
+        raise
+
+    sheets_data = response.get("sheets", [])
+    grid = ((sheets_data[0].get("properties") or {}).get("gridProperties") or {}) if sheets_data else {}
+    row_count = int(grid.get("rowCount") or 0)
+    col_count = int(grid.get("columnCount") or 0)
+    if row_count <= 0 or col_count <= 0:
+        return {
+            "status": "no_cells",
+            "message": f"No data found on sheet '{sheet_title}'.",
+            "count": 0,
+            "snapshot_batch_id": None,
+        }
+
+    snapshot_batch_id = str(uuid.uuid4())
+    formula_rule = _tagged_rule(FORMULA_RULE, snapshot_batch_id)
+    value_rule = _tagged_rule(VALUE_RULE, snapshot_batch_id)
+    try:
+        rule_snapshot_fn({
+            "snapshot_batch_id": snapshot_batch_id,
+            "spreadsheet_id": spreadsheet_id,
+            "gid": gid,
+            "sheet_id": sheet_id,
+            "formulas": [formula_rule, value_rule],
+        })
+        logger.info(f"Created rule snapshot {snapshot_batch_id}")
+    except Exception as exc:
+        logger.error(f"Failed to create rule snapshot: {exc}", exc_info=True)
+        raise
+
+    # Insert at the front so the visualization wins over any existing rules
+    batch_requests = [
+        _build_conditional_rule_request(sheet_id, row_count, col_count, formula_rule, FORMULA_COLOR, 0),
+        _build_conditional_rule_request(sheet_id, row_count, col_count, value_rule, VALUE_COLOR, 1),
+    ]
+
+    try:
+        validator.service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={"requests": batch_requests},
+        ).execute()
+        logger.info(f"Installed {len(batch_requests)} conditional format rule(s) over {row_count}x{col_count} cells")
+    except Exception as exc:
+        logger.error(f"Failed to install conditional format rules: {exc}", exc_info=True)
+        raise
+
+    return {
+        "status": "success",
+        "message": (
+            f"Installed {len(batch_requests)} conditional format rule(s) on '{sheet_title}' "
+            "(formulas → green, values → orange)."
+        ),
+        "count": len(batch_requests),
+        "mode": MODE_CONDITIONAL,
+        "snapshot_batch_id": snapshot_batch_id,
+    }
+
+
+def remove_conditional_visualization(
+    validator: Any,
+    spreadsheet_id: str,
+    sheet_id: int,
+    formulas: List[str],
+) -> int:
+    """
+    Delete the conditional format rules installed by one conditional-mode visualization.
+
+    Rules are located by their custom formula rather than by index, because the
+    user may have added or reordered rules since the visualization was applied.
+    The formulas carry the batch's tag, so rules the user wrote and rules of
+    other visualizations are left alone. Untagged formulas (snapshots from
+    before tagging) only match rules whose format is a visualization color.
+
+    Returns:
+        Number of rules removed
+    """
+    response = validator.service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields="sheets(properties(sheetId),conditionalFormats(booleanRule(condition(type,values),format(backgroundColor))))",
+    ).execute()
+
+    sheet = next(
+        (s for s in response.get("sheets", []) if (s.get("properties") or {}).get("sheetId") == sheet_id),
+        None,
+    )
+    if sheet is None:
+        raise ValueError(f"No sheet found with id={sheet_id}.")
+
+    targets = set(formulas)
+    indices: List[int] = []
+    for index, rule in enumerate(sheet.get("conditionalFormats", [])):
+        boolean_rule = rule.get("booleanRule") or {}
+        condition = boolean_rule.get("condition") or {}
+        values = condition.get("values") or []
+        if condition.get("type") != "CUSTOM_FORMULA" or len(values) != 1:
+            continue
+        formula = values[0].get("userEnteredValue")
+        if formula not in targets:
+            continue
+        if RULE_TAG not in formula:
+            color = (boolean_rule.get("format") or {}).get("backgroundColor")
+            if color not in (FORMULA_COLOR, VALUE_COLOR):
+                continue
+        indices.append(index)
+
+    if not indices:
+        return 0
+
+    # Delete from the back so earlier indices stay valid
+    batch_requests = [
+        {"deleteConditionalFormatRule": {"sheetId": sheet_id, "index": index}}
+        for index in sorted(indices, reverse=True)
+    ]
+    validator.service.spreadsheets().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={"requests": batch_requests},
+    ).execute()
+    logger.info(f"Removed {len(batch_requests)} conditional format rule(s) from sheet id={sheet_id}")
+    return len(batch_requests)
@@ -0,0 +1,532 @@
+"""
+Synthetic workbooks for load and scale testing, generated deterministically
+from a seed.
+
+  python -m python_backend.workbook_generator ledger --rows 500000 --issue-rate 0.001 --output ledger.json
+  python -m python_backend.workbook_generator model --rows 2000 --columns 61 --seed 7 --output model.json
+
+Two kinds of workbook are generated: transaction ledgers (ids, dates,
+categories, amounts, derived and total columns) and financial models (an
+Assumptions sheet and blocks of formula-driven P&L lines per segment).
+Issues are planted at a configurable rate and listed in a manifest with
+their cells, so detection quality can be scored against it:
+
+  error_cells            formulas that evaluate to #DIV/0!, #REF! or #N/A
+  duplicate_keys         a row key repeated from an earlier row
+  mixed_types            numbers entered as text in numeric columns
+  missing_values         empty key or input cells
+  inconsistent_formulas  hard-coded values or shifted ranges in formula runs
+
+Cell results are computed like Sheets would, errors and text included, so
+planted issues propagate to dependent formulas. The JSON output is a
+SheetsEmulator fixture (SHEETS_EMULATOR=ledger.json) with the manifest
+under "issues".
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import math
+import random
+import re
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sheets_emulator import SheetsEmulator
+
+ISSUE_KINDS = ("error_cells", "duplicate_keys", "mixed_types", "missing_values", "inconsistent_formulas")
+
+# The detector category each planted issue kind should be reported under
+ISSUE_CATEGORIES = {
+  "error_cells": "formula_error",
+  "duplicate_keys": "duplicate_key",
+  "mixed_types": "type_mismatch",
+  "missing_values": "missing_value",
+  "inconsistent_formulas": "inconsistent_formula",
+}
+
+CATEGORIES = ("Travel", "Payroll", "Software", "Rent", "Hardware", "Marketing", "Utilities", "Consulting")
+
+
+def _column_letter(index: int) -> str:
+  letters = ""
+  index += 1
+  while index:
+    index, remainder = divmod(index - 1, 26)
+    letters = chr(65 + remainder) + letters
+  return letters
+
+
+def _column_index(letters: str) -> int:
+  index = 0
+  for char in letters:
+    index = index * 26 + (ord(char) - 64)
+  return index - 1
+
+
+# --- Sheets arithmetic ---
+
+def _operand(cell: Any) -> Any:
+  """A cell's value as a formula operand: a number, or the error it raises."""
+  if cell is None:
+    return 0.0
+  if isinstance(cell, tuple):
+    cell = cell[1]
+  if isinstance(cell, bool):
+    return float(cell)
+  if isinstance(cell, (int, float)):
+    return cell
+  if isinstance(cell, str) and cell.startswith("#"):
+    return cell
+  return "#VALUE!"
+
+
+def _calc(fn: Callable[..., float], *cells: Any) -> Any:
+  operands = [_operand(cell) for cell in cells]
+  for operand in operands:
+    if isinstance(operand, str):
+      return operand
+  return round(fn(*operands), 2)
+
+
+def _sum(cells: Iterable[Any]) -> Any:
+  # SUM skips text but not errors
+  total = 0.0
+  for cell in cells:
+    value = cell[1] if isinstance(cell, tuple) else cell
+    if isinstance(value, str) and value.startswith("#"):
+      return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+      total += value
+  return round(total, 2)
+
+
+# --- workbooks ---
+
+class Workbook:
+  """
+  Generated sheets as rows of plain values (see sheets_emulator.sheet_cell)
+  and the manifest of planted issues.
+  """
+
+  def __init__(self, title: str, sheets: List[Tuple[str, List[List[Any]]]], issues: List[Dict[str, Any]], options: Dict[str, Any]) -> None:
+    self.title = title
+    self.sheets = sheets
+    self.issues = issues
+    self.options = options
+
+  @property
+  def cells(self) -> int:
+    return sum(len(row) for _, rows in self.sheets for row in rows)
+
+  def rows(self, title: str) -> List[List[Any]]:
+    for sheet_title, rows in self.sheets:
+      if sheet_title == title:
+        return rows
+    raise KeyError(title)
+
+  def load_into(self, emulator: SheetsEmulator, spreadsheet_id: str) -> Dict[str, int]:
+    """Seed the workbook into an emulator; returns sheet ids by title."""
+    emulator.add_spreadsheet(spreadsheet_id, self.title)
+    return {title: emulator.add_sheet(spreadsheet_id, title, rows) for title, rows in self.sheets}
+
+  def write_fixture(self, path: Path, spreadsheet_id: str) -> None:
+    """
+    Write an emulator fixture with the manifest under "issues". Rows are
+    streamed one per line, so 500k-row ledgers never exist as one string.
+    """
+    header = {"spreadsheetId": spreadsheet_id, "title": self.title, "options": self.options, "issues": self.issues}
+    with open(path, "w", encoding="utf-8") as out:
+      out.write('{"spreadsheets": [')
+      out.write(json.dumps(header)[:-1])
+      out.write(', "sheets": [')
+      for index, (title, rows) in enumerate(self.sheets):
+        out.write(", " if index else "")
+        out.write(json.dumps({"title": title})[:-1] + ', "rows": [\n')
+        for row_index, row in enumerate(rows):
+          out.write(",\n" if row_index else "")
+          out.write(json.dumps([_fixture_value(value) for value in row]))
+        out.write("\n]}")
+      out.write("]}]}\n")
+
+
+def _fixture_value(value: Any) -> Any:
+  if isinstance(value, tuple):
+    return {"formula": value[0], "value": value[1]}
+  return value
+
+
+class _Planter:
+  """Picks where issues go, without two issues on one spot."""
+
+  def __init__(self, rng: random.Random, rate: float, kinds: Sequence[str]) -> None:
+    unknown = [kind for kind in kinds if kind not in ISSUE_KINDS]
+    if unknown:
+      raise ValueError(f"Unknown issue kind(s): {', '.join(unknown)}. Expected some of {', '.join(ISSUE_KINDS)}.")
+    self.rng = rng
+    self.rate = rate
+    self.kinds = [kind for kind in ISSUE_KINDS if kind in kinds]
+    self.issues: List[Dict[str, Any]] = []
+
+  def count(self, population: int) -> int:
+    if self.rate <= 0 or population <= 0:
+      return 0
+    return min(population, max(1, round(self.rate * population)))
+
+  def plan(self, population: Sequence[Any], kinds: Optional[Sequence[str]] = None) -> Dict[Any, str]:
+    """Spots in `population` mapped to the issue kind planted there."""
+    kinds = [kind for kind in self.kinds if kinds is None or kind in kinds]
+    wanted = {kind: self.count(len(population)) for kind in kinds}
+    total = min(len(population), sum(wanted.values()))
+    spots = self.rng.sample(population, total)
+    plan: Dict[Any, str] = {}
+    for kind in kinds:
+      for _ in range(wanted[kind]):
+        if not spots:
+          return plan
+        plan[spots.pop()] = kind
+    return plan
+
+  def record(self, kind: str, sheet: str, row: int, col: int, detail: str) -> None:
+    self.issues.append({"kind": kind, "sheet": sheet, "cell": f"{_column_letter(col)}{row + 1}", "detail": detail})
+
+
+def generate_ledger(
+  rows: int = 10_000,
+  columns: int = 20,
+  formula_density: float = 0.05,
+  issue_rate: float = 0.0,
+  issues: Sequence[str] = ISSUE_KINDS,
+  seed: int = 0,
+  title: str = "Ledger",
+) -> Workbook:
+  """
+  A transaction ledger of `rows` rows (header included): ID, Date, Category,
+  amounts and a Total. `formula_density` is the share of columns holding
+  formulas: the Total always does, and further amount columns from the right
+  become derived amounts (=ROUND(prev*rate,2)). 2% of input amounts are left
+  blank. With `issue_rate` set, that share of data rows gets each kind of
+  planted issue.
+  """
+  if columns < 5:
+    raise ValueError("A ledger needs at least 5 columns")
+  rng = random.Random(seed)
+  planter = _Planter(rng, issue_rate, issues)
+  amount_count = columns - 4
+  formula_columns = min(amount_count, max(1, round(formula_density * columns)))
+  derived = formula_columns - 1
+  first_amount, total_col = 3, columns - 1
+  first_derived = first_amount + amount_count - derived
+  last_amount = _column_letter(total_col - 1)
+
+  header = ["ID", "Date", "Category"] + [f"Amount {i}" for i in range(1, amount_count + 1)] + ["Total"]
+  data_rows = max(1, rows - 1)
+  plan = planter.plan(range(1, data_rows + 1))
+  start = _dt.date(2024, 1, 1)
+  sheet: List[List[Any]] = [header]
+  keys: List[Tuple[int, str]] = []
+
+  for r in range(1, data_rows + 1):
+    n = r + 1
+    kind = plan.get(r)
+    key: Optional[str] = f"TX-{r:07d}"
+    if kind == "duplicate_keys" and keys:
+      original_row, key = keys[rng.randrange(len(keys))]
+      planter.record(kind, title, r, 0, f"same ID as A{original_row + 1}")
+    elif kind == "missing_values":
+      key = None
+      planter.record(kind, title, r, 0, "empty ID")
+    else:
+      keys.append((r, key))
+
+    row: List[Any] = [key, (start + _dt.timedelta(days=r % 365)).isoformat(), rng.choice(CATEGORIES)]
+    for col in range(first_amount, first_derived):
+      row.append(round(rng.uniform(-1000, 5000), 2) if rng.random() > 0.02 else None)
+    if kind == "mixed_types" and first_derived > first_amount:
+      col = rng.randrange(first_amount, first_derived)
+      amount = row[col] if row[col] is not None else round(rng.uniform(0, 5000), 2)
+      row[col] = rng.choice((f"{amount:,.2f}", f"${amount:.2f}", "n/a"))
+      planter.record(kind, title, r, col, f"amount entered as text {row[col]!r}")
+    for col in range(first_derived, total_col):
+      rate = 1 + (col - first_derived + 1) / 10
+      previous = _column_letter(col - 1)
+      row.append((f"=ROUND({previous}{n}*{rate},2)", _calc(lambda value: value * rate, row[col - 1])))
+
+    total = (f"=SUM(D{n}:{last_amount}{n})", _sum(row[first_amount:total_col]))
+    if kind == "error_cells":
+      total = rng.choice(
+        (
+          (f"=SUM(D{n}:{last_amount}{n})/0", "#DIV/0!"),
+          ("=SUM(#REF!)", "#REF!"),
+          (f'=VLOOKUP(A{n},Rates!A:B,2,FALSE)', "#N/A"),
+        )
+      )
+      planter.record(kind, title, r, total_col, f"{total[0]} evaluates to {total[1]}")
+    elif kind == "inconsistent_formulas":
+      if rng.random() < 0.5 or total_col - first_amount < 2:
+        total = total[1]
+        planter.record(kind, title, r, total_col, "hard-coded value in the Total column")
+      else:
+        shifted = _column_letter(total_col - 2)
+        total = (f"=SUM(D{n}:{shifted}{n})", _sum(row[first_amount:total_col - 1]))
+        planter.record(kind, title, r, total_col, f"SUM stops at {shifted} instead of {last_amount}")
+    row.append(total)
+    sheet.append(row)
+
+  options = {"kind": "ledger", "rows": rows, "columns": columns, "formula_density": formula_density, "issue_rate": issue_rate, "seed": seed}
+  return Workbook(f"Synthetic ledger ({rows:,} rows)", [(title, sheet)], planter.issues, options)
+
+
+# Lines of one segment block in the financial model
+_MODEL_LINES = ("Revenue", "COGS", "Gross profit", "Opex", "EBITDA", "Tax", "Net income")
+_BLOCK_ROWS = len(_MODEL_LINES) + 1
+
+_ASSUMPTIONS = [
+  ["Assumption", "Value"],
+  ["Revenue growth", 0.03],
+  ["COGS %", 0.4],
+  ["Opex growth", 0.01],
+  ["Tax rate", 0.25],
+]
+
+
+def generate_financial_model(
+  rows: int = 400,
+  columns: int = 37,
+  formula_density: float = 0.8,
+  issue_rate: float = 0.0,
+  issues: Sequence[str] = ISSUE_KINDS,
+  seed: int = 0,
+) -> Workbook:
+  """
+  A P&L model: an Assumptions sheet and a Model sheet with one block of
+  Revenue..Net income lines per segment, `columns - 1` monthly periods,
+  and SUMIF totals at the bottom; `rows` sets the number of blocks.
+  Each line is a run of formulas with probability `formula_density`,
+  otherwise a line of hard-coded inputs. With `issue_rate` set, that share
+  of the eligible cells gets each kind of planted issue: formula cells take
+  errors and inconsistencies, inputs text and blanks, labels duplicates.
+  """
+  if columns < 3:
+    raise ValueError("A financial model needs at least 3 columns")
+  rng = random.Random(seed)
+  planter = _Planter(rng, issue_rate, issues)
+  growth, cogs_pct, opex_growth, tax_rate = (row[1] for row in _ASSUMPTIONS[1:])
+  periods = columns - 1
+  blocks = max(1, (rows - 3) // _BLOCK_ROWS)
+  title = "Model"
+
+  start = _dt.date(2024, 1, 1)
+  header = ["Line item"] + [
+    f"{start.year + (start.month - 1 + p) // 12}-{(start.month - 1 + p) % 12 + 1:02d}" for p in range(periods)
+  ]
+  sheet: List[List[Any]] = [header]
+  is_formula = [[rng.random() < formula_density for _ in _MODEL_LINES] for _ in range(blocks)]
+
+  # Errors and inconsistencies go into formula cells, text and blanks into
+  # inputs, duplicates into labels after the first
+  cells = [(b, line, p) for b in range(blocks) for line in range(len(_MODEL_LINES)) for p in range(periods)]
+  formula_cells = [cell for cell in cells if _model_formula(is_formula, *cell)]
+  input_cells = [cell for cell in cells if not _model_formula(is_formula, *cell)]
+  plan = planter.plan(formula_cells, ("error_cells", "inconsistent_formulas"))
+  plan.update(planter.plan(input_cells, ("mixed_types", "missing_values")))
+  label_plan = planter.plan([(b, line) for b in range(blocks) for line in range(len(_MODEL_LINES))][1:], ("duplicate_keys",))
+  labels: List[Tuple[int, str]] = []
+
+  for b in range(blocks):
+    first_row = len(sheet)
+    rev, cogs, gp, opex, ebitda, tax, net = (first_row + line for line in range(len(_MODEL_LINES)))
+    for line, name in enumerate(_MODEL_LINES):
+      label = f"{name} S{b + 1}"
+      if (b, line) in label_plan:
+        original_row, label = labels[rng.randrange(len(labels))]
+        planter.record("duplicate_keys", title, first_row + line, 0, f"same line item as A{original_row + 1}")
+      labels.append((first_row + line, label))
+      sheet.append([label])
+    sheet.append([])
+
+    base_revenue = round(rng.uniform(50_000, 500_000), 2)
+    base_opex = round(base_revenue * rng.uniform(0.2, 0.4), 2)
+    for p in range(periods):
+      col = p + 1
+      c, prev = _column_letter(col), _column_letter(col - 1)
+
+      def at(row: int) -> Any:
+        return sheet[row][col]
+
+      def prior(row: int) -> Any:
+        return sheet[row][col - 1]
+
+      lines = [
+        (f"={prev}{rev + 1}*(1+Assumptions!$B$2)", lambda: _calc(lambda v: v * (1 + growth), prior(rev))) if p else None,
+        (f"={c}{rev + 1}*Assumptions!$B$3", lambda: _calc(lambda v: v * cogs_pct, at(rev))),
+        (f"={c}{rev + 1}-{c}{cogs + 1}", lambda: _calc(lambda a, b: a - b, at(rev), at(cogs))),
+        (f"={prev}{opex + 1}*(1+Assumptions!$B$4)", lambda: _calc(lambda v: v * (1 + opex_growth), prior(opex))) if p else None,
+        (f"={c}{gp + 1}-{c}{opex + 1}", lambda: _calc(lambda a, b: a - b, at(gp), at(opex))),
+        (f"=MAX(0,{c}{ebitda + 1}*Assumptions!$B$5)", lambda: _calc(lambda v: max(0.0, v * tax_rate), at(ebitda))),
+        (f"={c}{ebitda + 1}-{c}{tax + 1}", lambda: _calc(lambda a, b: a - b, at(ebitda), at(tax))),
+      ]
+      for line, definition in enumerate(lines):
+        row = first_row + line
+        if definition is None:
+          value: Any = base_revenue if line == 0 else base_opex
+        else:
+          formula, compute = definition
+          result = compute()
+          if _model_formula(is_formula, b, line, p):
+            value = (formula, result)
+          else:
+            # Hard-coded lines are typed in, so they never carry upstream errors
+            if not isinstance(result, float):
+              result = next((v for v in reversed(sheet[row][1:]) if isinstance(v, float)), base_opex)
+            value = round(result * rng.uniform(0.97, 1.03), 2)
+        kind = plan.get((b, line, p))
+        if kind == "error_cells":
+          value = rng.choice(((f"={c}{row + 1}/0", "#DIV/0!"), ("=#REF!*(1+Assumptions!$B$2)", "#REF!")))
+          planter.record(kind, title, row, col, f"{value[0]} evaluates to {value[1]}")
+        elif kind == "inconsistent_formulas":
+          value = round(value[1], 2) if isinstance(value[1], float) else round(base_revenue, 2)
+          planter.record(kind, title, row, col, "hard-coded value in a row of formulas")
+        elif kind == "mixed_types":
+          value = f"{value:,.0f}"
+          planter.record(kind, title, row, col, f"input entered as text {value!r}")
+        elif kind == "missing_values":
+          value = None
+          planter.record(kind, title, row, col, "empty input")
+        sheet[row].append(value)
+
+  # Totals over every segment's lines, by label
+  last_row = len(sheet)
+  for name in ("Revenue", "Net income"):
+    total: List[Any] = [f"Total {name.lower()}"]
+    for col in range(1, periods + 1):
+      c = _column_letter(col)
+      matching = [sheet[r][col] for r in range(1, last_row) if len(sheet[r]) > col and str(sheet[r][0]).startswith(name + " ")]
+      total.append((f'=SUMIF($A$2:$A${last_row},"{name} *",{c}$2:{c}${last_row})', _sum(matching)))
+    sheet.append(total)
+
+  options = {"kind": "model", "rows": rows, "columns": columns, "formula_density": formula_density, "issue_rate": issue_rate, "seed": seed}
+  return Workbook(f"Synthetic model ({blocks:,} segments)", [("Assumptions", [list(row) for row in _ASSUMPTIONS]), (title, sheet)], planter.issues, options)
+
+
+def _model_formula(is_formula: List[List[bool]], block: int, line: int, period: int) -> bool:
+  # The first period of revenue and opex is always an input
+  if period == 0 and _MODEL_LINES[line] in ("Revenue", "Opex"):
+    return False
+  return is_formula[block][line]
+
+
+GENERATORS: Dict[str, Callable[..., Workbook]] = {
+  "ledger": generate_ledger,
+  "model": generate_financial_model,
+}
+
+
+def generate_workbook(kind: str, **options: Any) -> Workbook:
+  if kind not in GENERATORS:
+    raise ValueError(f"Unknown workbook kind: {kind}. Expected one of {', '.join(GENERATORS)}.")
+  return GENERATORS[kind](**options)
+
+
+# --- detection quality ---
+
+_A1_PART = re.compile(r"^\$?([A-Z]*)\$?(\d*)$")
+
+
+def _bounds(a1: str) -> Optional[Tuple[Optional[str], int, int, int, int]]:
+  """Sheet title and inclusive row/column bounds of an A1 range; open sides are unbounded."""
+  title: Optional[str] = None
+  if "!" in a1:
+    title, _, a1 = a1.rpartition("!")
+    title = title.strip("'").replace("''", "'")
+  start, _, end = a1.upper().partition(":")
+  first, last = _A1_PART.match(start.strip()), _A1_PART.match((end or start).strip())
+  if not first or not last or not (start.strip() and (end or start).strip()):
+    return None
+  col_lo = _column_index(first.group(1)) if first.group(1) else 0
+  col_hi = _column_index(last.group(1)) if last.group(1) else math.inf
+  row_lo = int(first.group(2)) - 1 if first.group(2) else 0
+  row_hi = int(last.group(2)) - 1 if last.group(2) else math.inf
+  return title, row_lo, row_hi, col_lo, col_hi
+
+
+def _covers(a1: str, sheet: str, cell: str) -> bool:
+  target, bounds = _bounds(cell), _bounds(a1)
+  if target is None or bounds is None:
+    return False
+  title, row_lo, row_hi, col_lo, col_hi = bounds
+  if title is not None and title != sheet:
+    return False
+  _, row, _, col, _ = target
+  return row_lo <= row <= row_hi and col_lo <= col <= col_hi
+
+
+def score_detection(planted: Sequence[Dict[str, Any]], found: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+  """
+  How well detector issues (MistakeDetector's "issues") cover a manifest of
+  planted issues. A planted issue counts as detected when an issue of its
+  category has a range covering its cell; found issues that cover no planted
+  cell are counted as unmatched.
+  """
+  by_kind: Dict[str, Dict[str, int]] = {}
+  matched = set()
+  for issue in planted:
+    counts = by_kind.setdefault(issue["kind"], {"planted": 0, "detected": 0})
+    counts["planted"] += 1
+    category = ISSUE_CATEGORIES[issue["kind"]]
+    for index, candidate in enumerate(found):
+      if candidate.get("category") != category:
+        continue
+      if any(_covers(r.get("a1Notation") or "", issue["sheet"], issue["cell"]) for r in candidate.get("ranges") or []):
+        counts["detected"] += 1
+        matched.add(index)
+        break
+  planted_total = sum(counts["planted"] for counts in by_kind.values())
+  detected_total = sum(counts["detected"] for counts in by_kind.values())
+  return {
+    "planted": planted_total,
+    "detected": detected_total,
+    "recall": round(detected_total / planted_total, 4) if planted_total else None,
+    "unmatched_findings": len(found) - len(matched),
+    "by_kind": by_kind,
+  }
+
+
+# --- CLI ---
+
+def build_arg_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description="Generate synthetic workbooks as Sheets emulator fixtures")
+  parser.add_argument("kind", choices=sorted(GENERATORS), help="ledger or model (financial model)")
+  parser.add_argument("--rows", type=int, default=None, help="Rows (ledger) or approximate rows (model)")
+  parser.add_argument("--columns", type=int, default=None, help="Columns; for models, periods + 1")
+  parser.add_argument("--formula-density", type=float, default=None, help="Share of formula columns (ledger) or formula lines (model)")
+  parser.add_argument("--issue-rate", type=float, default=0.0, help="Share of rows/cells given each kind of planted issue (default: 0)")
+  parser.add_argument("--issues", default=",".join(ISSUE_KINDS), help="Comma-separated issue kinds to plant (default: all)")
+  parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+  parser.add_argument("--spreadsheet-id", default=None, help="Spreadsheet id in the fixture (default: synthetic-<kind>-<seed>)")
+  parser.add_argument("--output", type=Path, required=True, help="Fixture file to write")
+  return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+  args = build_arg_parser().parse_args(argv)
+  options: Dict[str, Any] = {
+    "issue_rate": args.issue_rate,
+    "issues": [kind for kind in args.issues.split(",") if kind],
+    "seed": args.seed,
+  }
+  for name in ("rows", "columns", "formula_density"):
+    if getattr(args, name) is not None:
+      options[name] = getattr(args, name)
+  workbook = generate_workbook(args.kind, **options)
+  spreadsheet_id = args.spreadsheet_id or f"synthetic-{args.kind}-{args.seed}"
+  workbook.write_fixture(args.output, spreadsheet_id)
+  print(f"{workbook.title}: {workbook.cells:,} cells, {len(workbook.issues)} planted issue(s) -> {args.output} ({spreadsheet_id})")
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test the benchmark suite: scenarios run against the in-process fakes, report
+latency percentiles, call counts and peak memory, honour injected latency,
+compare against an earlier results document, and score detection of
+planted issues.
+"""
+
+import sys
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend import api, supabase_rest
+from python_backend.bench import compare, percentile, run_benchmarks
+from python_backend.fakes import Latency
+
+
+def test_bench():
+    """Run a few scenarios on a small sheet."""
+
+    print("=" * 80)
+    print("Testing the benchmark suite")
+    print("=" * 80)
+
+    all_passed = True
+
+    print("\nTest 1: nearest-rank percentiles")
+    samples = [float(i) for i in range(1, 101)]
+    if percentile(samples, 0.5) == 50.0 and percentile(samples, 0.95) == 95.0 and percentile([3.0], 0.95) == 3.0:
+        print("  ✓ PASS - p50 and p95 of 1..100 are 50 and 95")
+    else:
+        print("  ✗ FAIL - unexpected percentiles")
+        all_passed = False
+
+    document = run_benchmarks(
+        scenarios=["context_builder", "chat_service", "tools.update_cells"],
+        sizes=[1000],
+        iterations=2,
+    )
+    results = {r["scenario"]: r for r in document["results"]}
+    update = results.get("tools.update_cells", {}).get("calls", {})
+    chat = results.get("chat_service", {}).get("calls", {})
+    print(f"\nTest 2: results per scenario (update_cells sheets calls {update.get('sheets')}, chat {chat})")
+    if (
+        len(results) == 3
+        and all(r["cells"] == 1000 and r["p95_ms"] >= r["p50_ms"] > 0 and r["peak_alloc_bytes"] > 0 for r in results.values())
+        # 50 rows leave 49 data rows to update: one metadata fetch, one
+        # values.get per snapshotted cell and one batch write
+        and update.get("sheets") == 51
+        and update.get("sheets_by_method", {}).get("values.get") == 49
+        and update.get("supabase", 0) >= 1
+        and chat.get("llm") == 2
+        and chat.get("supabase", 0) >= 1
+        and api._sheets_service is None
+        and supabase_rest._rest_client is None
+    ):
+        print("  ✓ PASS - latency, calls and memory reported; singletons restored")
+    else:
+        print(f"  ✗ FAIL - unexpected results: {results}")
+        all_passed = False
+
+    slow = run_benchmarks(scenarios=["context_builder"], sizes=[1000], iterations=2, sheets_latency=Latency(0.05))
+    slow_p50 = slow["results"][0]["p50_ms"]
+    deltas = compare(document, slow)
+    print(f"\nTest 3: injected latency and comparison (p50 {slow_p50}ms, change {deltas[0]['p50_change'] if deltas else None})")
+    if (
+        slow_p50 >= 50
+        and slow["meta"]["latency_ms"]["sheets"]["base"] == 50
+        and len(deltas) == 1
+        and deltas[0]["scenario"] == "context_builder"
+        and deltas[0]["p50_change"] > 0
+    ):
+        print("  ✓ PASS - Sheets latency shows up in p50 and in the comparison")
+    else:
+        print("  ✗ FAIL - expected a slower context_builder")
+        all_passed = False
+
+    planted = run_benchmarks(scenarios=["mistake_detector"], sizes=[2000], iterations=1, issue_rate=0.01)
+    detection = planted["results"][0].get("detection") or {}
+    print(f"\nTest 4: planted issues and detection recall ({detection.get('detected')}/{detection.get('planted')})")
+    if detection.get("planted") == 5 and detection.get("recall") is not None and planted["meta"]["issue_rate"] == 0.01:
+        print("  ✓ PASS - mistake_detector results score rule findings against the planted issues")
+    else:
+        print(f"  ✗ FAIL - unexpected detection report: {detection}")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_bench())
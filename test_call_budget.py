@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test per-request API call budgets: Sheets calls made while serving a request
+are counted by method and bytes and returned in X-* response headers, and
+LLM/Supabase calls from any thread count toward the same budget.
+"""
+
+import contextvars
+import json
+import sys
+import threading
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+import googleapiclient
+from fastapi.testclient import TestClient
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpMockSequence
+
+from python_backend import api
+from python_backend.call_budget import end_budget, record_llm_call, record_supabase_call, start_budget
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatResponse
+from python_backend.service import ChatService
+from python_backend.sheets_client import MeteredHttpRequest
+
+DISCOVERY = Path(googleapiclient.__file__).parent / "discovery_cache" / "documents" / "sheets.v4.json"
+
+
+class _Validator:
+    """Stands in for the sheet tools' validator, backed by canned responses."""
+
+    def __init__(self, responses):
+        http = HttpMockSequence([({"status": "200"}, json.dumps(body)) for body in responses])
+        self.service = build_from_document(DISCOVERY.read_text(), http=http, requestBuilder=MeteredHttpRequest)
+
+
+class _CellReadingBackend:
+    """Snapshots three cells one API call at a time, like _fetch_cell_values."""
+
+    def send_chat(self, request):
+        validator = _Validator([{"values": [[i]]} for i in range(3)])
+        api._fetch_cell_values(validator, "abc", "Sheet1", ["A1", "B1", "C1"])
+        reply = ChatMessage(id="reply", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_call_budget():
+    """Serve a request that reads cells one by one, then count from threads."""
+
+    print("=" * 80)
+    print("Testing per-request call budgets")
+    print("=" * 80)
+
+    all_passed = True
+
+    service = ChatService(
+        _CellReadingBackend(),
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    api.service = service
+    client = TestClient(api.app)
+    response = client.post("/chat", json={"messages": [{"id": "m1", "role": "user", "content": "hi"}], "sessionId": "b1"})
+    headers = response.headers
+    print(f"\nTest 1: per-cell reads show up in headers (X-Sheets-Methods: {headers.get('X-Sheets-Methods')})")
+    if (
+        headers.get("X-Sheets-Calls") == "3"
+        and headers.get("X-Sheets-Methods") == "sheets.spreadsheets.values.get=3"
+        and int(headers.get("X-Sheets-Bytes", "0")) > 0
+        and headers.get("X-LLM-Tokens") == "0"
+        and headers.get("X-Supabase-Calls") == "0"
+    ):
+        print("  ✓ PASS - three values.get calls counted for this request")
+    else:
+        print(f"  ✗ FAIL - unexpected headers: {dict(headers)}")
+        all_passed = False
+
+    other = client.post("/chat", json={"messages": [{"id": "m2", "role": "user", "content": "hi"}], "sessionId": "b2"})
+    health = client.get("/")
+    print(f"\nTest 2: budgets are per request (second chat {other.headers.get('X-Sheets-Calls')}, root {health.headers.get('X-Sheets-Calls')})")
+    if other.headers.get("X-Sheets-Calls") == "3" and health.headers.get("X-Sheets-Calls") == "0":
+        print("  ✓ PASS - counts do not leak between requests")
+    else:
+        print("  ✗ FAIL - expected 3 and 0")
+        all_passed = False
+
+    budget, token = start_budget()
+
+    def work():
+        for _ in range(1000):
+            record_llm_call(10, 5)
+            record_supabase_call()
+
+    # Helper threads record into the budget when run in a copy of the request context
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(work,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end_budget(token)
+    record_llm_call(1, 1)
+    summary = budget.summary()
+    print(f"\nTest 3: concurrent recording ({summary['llm_calls']} LLM calls, {summary['supabase_calls']} Supabase calls)")
+    if (
+        summary["llm_calls"] == 8000
+        and summary["llm_prompt_tokens"] == 80000
+        and summary["llm_completion_tokens"] == 40000
+        and summary["supabase_calls"] == 8000
+    ):
+        print("  ✓ PASS - no lost updates, nothing counted after the budget ended")
+    else:
+        print("  ✗ FAIL - expected 8000 of each")
+        all_passed = False
+
+    api.service = None
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_call_budget())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Test LLM and Sheets record/replay: cassettes are redacted, replay answers
+exact and changed requests in order with scaled latency, CASSETTE_MODE wires
+the backend clients, and a session export replays through ChatService with
+per-stage timings.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from googleapiclient.discovery import build_from_document
+
+from python_backend import cassette as cassette_module
+from python_backend.cassette import REDACTED, Cassette, CassetteMiss
+from python_backend.fakes import FakeLLM
+from python_backend.llm import LLMClient, create_llm_client
+from python_backend.replay import compare, load_session, replay_session
+from python_backend.sheets_client import MeteredHttpRequest, ServiceAccountSheetsClient
+from python_backend.sheets_emulator import Latency, SheetsEmulator, _discovery_document
+
+CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+
+def _completion(content):
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(content)}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+    }
+
+
+def test_cassette():
+    """Record against the fakes, then replay without them."""
+
+    print("=" * 80)
+    print("Testing LLM and Sheets record/replay")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    path = Path(tmp.name) / "traffic.jsonl"
+
+    print("\nTest 1: recording redacts secrets")
+    recorder = Cassette(path, "record")
+    fake = FakeLLM(lambda messages: {"step": "answer", "assistantMessage": "Looks fine."})
+    llm = LLMClient(api_key="sk-live-secret", model="test/model", transport=recorder.llm_transport(fake.transport()))
+    llm.chat([{"role": "user", "content": "Check my sheet"}])
+    emulator = SheetsEmulator(Latency(0.03))
+    emulator.add_spreadsheet("book")
+    emulator.add_sheet("book", "Data", [["Item", "Amount"], ["Rent", 1200]])
+    service = build_from_document(_discovery_document(), http=recorder.sheets_http(emulator), requestBuilder=MeteredHttpRequest)
+    recorded_read = ServiceAccountSheetsClient(service=service).read_range("book", "Data!A1:B2")
+    recorder.record("llm", "POST", CHAT_URL + "?key=abc", {"api_key": "sk-2", "messages": []}, 200, None, {}, 0.0)
+    text = path.read_text()
+    lines = [json.loads(line) for line in text.splitlines()]
+    if (
+        [line["kind"] for line in lines] == ["llm", "sheets", "llm"]
+        and "sk-live-secret" not in text
+        and "sk-2" not in text
+        and lines[2]["body"]["api_key"] == REDACTED
+        and lines[2]["url"].endswith("key=" + REDACTED.replace("[", "%5B").replace("]", "%5D"))
+        and lines[1]["duration_ms"] >= 30
+        and recorder.stats()["interactions"] == 3
+    ):
+        print("  ✓ PASS - keys, tokens and auth headers stay out of the cassette; latency is kept")
+    else:
+        print(f"  ✗ FAIL - unexpected cassette: {text[:500]}")
+        all_passed = False
+
+    print("\nTest 2: replay with exact and changed requests")
+    replay = Cassette(path, "replay", latency_scale=0)
+    llm = LLMClient(api_key="unused", model="test/model", transport=replay.llm_transport())
+    changed = llm.chat_text([{"role": "user", "content": "A prompt that changed since recording"}])
+    sheets = ServiceAccountSheetsClient(service=replay.sheets_service(MeteredHttpRequest))
+    started = time.perf_counter()
+    replayed_read = sheets.read_range("book", "Data!A1:B2")
+    fast = time.perf_counter() - started
+    try:
+        sheets.read_range("book", "Data!A1:B2")
+        missed = False
+    except CassetteMiss:
+        missed = True
+    slow = Cassette(path, "replay", latency_scale=1)
+    started = time.perf_counter()
+    ServiceAccountSheetsClient(service=slow.sheets_service(MeteredHttpRequest)).read_range("book", "Data!A1:B2")
+    scaled = time.perf_counter() - started
+    stats = replay.stats()
+    if (
+        "Looks fine." in changed
+        and replayed_read == recorded_read
+        and missed
+        and stats["exact"] == 1
+        and stats["loose"] == 1
+        and stats["misses"] == 1
+        and fast < 0.03 <= scaled
+    ):
+        print("  ✓ PASS - recorded answers come back in order, at the scaled latency")
+    else:
+        print(f"  ✗ FAIL - unexpected replay: {stats}, {fast:.3f}s vs {scaled:.3f}s")
+        all_passed = False
+
+    print("\nTest 3: CASSETTE_MODE wires the backend clients")
+    saved = {name: os.environ.get(name) for name in ("CASSETTE_MODE", "CASSETTE_PATH", "CASSETTE_LATENCY_SCALE", "OPENROUTER_API_KEY")}
+    os.environ.update({"CASSETTE_MODE": "replay", "CASSETTE_PATH": str(path), "CASSETTE_LATENCY_SCALE": "0"})
+    os.environ.pop("OPENROUTER_API_KEY", None)
+    cassette_module._cassette = None
+    try:
+        client = create_llm_client()
+        answer = client.chat_text([{"role": "user", "content": "Check my sheet"}])
+        env_read = ServiceAccountSheetsClient().read_range("book", "Data!A1:B2")
+        env_stats = cassette_module.get_cassette().stats()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        cassette_module._cassette = None
+    if "Looks fine." in answer and env_read == recorded_read and env_stats["exact"] + env_stats["loose"] == 2:
+        print("  ✓ PASS - LLMClient and the Sheets client replay without credentials")
+    else:
+        print(f"  ✗ FAIL - unexpected env replay: {env_stats}")
+        all_passed = False
+
+    print("\nTest 4: a session export replays through ChatService")
+    session_path = Path(tmp.name) / "session.jsonl"
+    recorder = Cassette(session_path, "record")
+    for text in ("Hello!", "Column B sums to 1200."):
+        recorder.record("llm", "POST", CHAT_URL, {"messages": []}, 200, "application/json", _completion({"step": "answer", "assistantMessage": text}), 0.02)
+    export = Path(tmp.name) / "export.json"
+    export.write_text(json.dumps([
+        {"session_id": "s1", "message_id": "m3", "role": "user", "content": "Sum column B", "created_at": "2025-01-01T00:00:02Z"},
+        {"session_id": "s1", "message_id": "m1", "role": "user", "content": "Hi", "created_at": "2025-01-01T00:00:00Z"},
+        {"session_id": "s1", "message_id": "m2", "role": "assistant", "content": "Hello!", "created_at": "2025-01-01T00:00:01Z"},
+    ]))
+    rows = load_session(export)
+    instant = replay_session(rows, Cassette(session_path, "replay", latency_scale=0))
+    recorded = replay_session(rows, Cassette(session_path, "replay", latency_scale=1))
+    deltas = compare(instant, recorded)
+    llm_delta = next((d for d in deltas if d["stage"] == "llm.chat"), None)
+    if (
+        [turn["message_id"] for turn in recorded["turns"]] == ["m1", "m3"]
+        and recorded["errors"] == 0
+        and recorded["stages"]["llm.chat"]["calls"] == 2
+        and recorded["cassette"]["unused"] == 0
+        and deltas[0]["stage"] == "total"
+        and llm_delta is not None
+        and llm_delta["ms"][1] - llm_delta["ms"][0] >= 30
+        and cassette_module._cassette is None
+    ):
+        print("  ✓ PASS - user turns replay in order and the LLM stage shows the recorded latency")
+    else:
+        print(f"  ✗ FAIL - unexpected replay timings: {recorded['stages']} / {deltas}")
+        all_passed = False
+
+    tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_cassette())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test the delta chat protocol: clients send only new messages plus a cursor,
+the server owns the history, and a stale cursor gets a resync response.
+"""
+
+import sys
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatRequest, ChatResponse
+from python_backend.service import ChatService
+
+
+class _EchoBackend:
+    """Replies with one assistant message per turn."""
+
+    def __init__(self):
+        self.histories = []
+
+    def send_chat(self, request):
+        self.histories.append(len(request.messages))
+        reply = ChatMessage(id=f"reply-{len(self.histories)}", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def _delta(i, cursor):
+    message = ChatMessage(id=f"user-{i}", role=ChatMessageRole.user, content=f"question {i}")
+    return ChatRequest(messages=[message], sessionId="s", delta=True, cursor=cursor)
+
+
+def test_chat_delta():
+    """Run delta turns, then a stale cursor and a catch-up."""
+
+    print("=" * 80)
+    print("Testing delta chat protocol")
+    print("=" * 80)
+
+    all_passed = True
+    backend = _EchoBackend()
+    service = ChatService(
+        backend,
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        conversation_logger=DisabledConversationLogger(),
+    )
+
+    cursor = None
+    for i in range(5):
+        response = service.chat(_delta(i, cursor))
+        cursor = response.cursor
+    print(f"\nTest 1: delta turns (backend saw {backend.histories}, cursor={cursor})")
+    if backend.histories == [1, 3, 5, 7, 9] and cursor == "reply-5" and not response.resync:
+        print("  ✓ PASS - one new message per request, server-side history grows")
+    else:
+        print("  ✗ FAIL - expected histories of 1, 3, 5, 7, 9 and cursor reply-5")
+        all_passed = False
+
+    # A second client still at reply-3 is behind
+    stale = service.chat(_delta(99, "reply-3"))
+    print(f"\nTest 2: stale cursor (resync={stale.resync}, cursor={stale.cursor})")
+    if stale.resync and stale.cursor == "reply-5" and not stale.messages and len(backend.histories) == 5:
+        print("  ✓ PASS - nothing processed, server cursor returned")
+    else:
+        print("  ✗ FAIL - expected a resync response")
+        all_passed = False
+
+    catch_up = service.messages_after("s", "reply-3")
+    ids = [message.id for message in catch_up.messages]
+    print(f"\nTest 3: catch-up after reply-3 ({ids})")
+    if ids == ["user-3", "reply-4", "user-4", "reply-5"] and catch_up.cursor == "reply-5":
+        print("  ✓ PASS - only missed messages returned")
+    else:
+        print("  ✗ FAIL - expected the four messages after reply-3")
+        all_passed = False
+
+    fresh = service.chat(_delta(0, "reply-1").model_copy(update={"sessionId": "new"}))
+    print(f"\nTest 4: cursor for an empty session (resync={fresh.resync})")
+    if fresh.resync and fresh.cursor is None:
+        print("  ✓ PASS - client told the session is empty")
+    else:
+        print("  ✗ FAIL - expected a resync with no cursor")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_chat_delta())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind ConversationLogger: turns only queue rows, a writer
+thread inserts them in batches, sheet tab ids are upserted once and cached,
+and pending rows are flushed on close and before a session is reloaded.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.conversation_logger import ConversationLogger
+from python_backend.models import ChatMessage, ChatMessageRole, SheetContext
+
+
+class _FakeRestClient:
+    """Records inserts; sheet_tabs upserts return an id per tab."""
+
+    def __init__(self, insert_delay=0.0):
+        self.calls = []
+        self.rows = []
+        self.insert_delay = insert_delay
+        self.lock = threading.Lock()
+
+    def insert_sync(self, table, rows, merge_duplicates=False, on_conflict=None, returning=False):
+        time.sleep(self.insert_delay)
+        with self.lock:
+            self.calls.append((table, len(rows), on_conflict))
+            if table == "sheet_tabs":
+                return [dict(row, id=f"tab-{row['sheet_title']}") for row in rows]
+            self.rows.extend(rows)
+            return []
+
+    def select_sync(self, table, columns="*", filters=None, order=None, limit=None):
+        with self.lock:
+            self.calls.append((table, "select", columns))
+            rows = [r for r in self.rows if all(r[k] == v[len("eq."):] for k, v in filters.items() if v.startswith("eq."))]
+            if "created_at" in filters:
+                rows = [r for r in rows if r["created_at"] < filters["created_at"][len("lt."):]]
+            rows.sort(key=lambda r: r["created_at"], reverse=order == "created_at.desc")
+            if columns == "created_at":
+                return [{"created_at": row["created_at"]} for row in rows[:limit]]
+            # Mirror the metadata projection: no payloads come back
+            return [
+                {
+                    "message_id": row["message_id"],
+                    "role": row["role"],
+                    "content": row["content"],
+                    "created_at": row["created_at"],
+                    "tool_name": (row["metadata"] or {}).get("toolName"),
+                    "payload_ref": (row["metadata"] or {}).get("payloadRef"),
+                }
+                for row in rows[:limit]
+            ]
+
+
+def _messages(turn):
+    return [
+        ChatMessage(id=f"user-{turn}", role=ChatMessageRole.user, content=f"question {turn}"),
+        ChatMessage(id=f"assistant-{turn}", role=ChatMessageRole.assistant, content=f"answer {turn}"),
+    ]
+
+
+def test_conversation_logger():
+    """Queue turns, then check batching, the sheet tab cache and flushing."""
+
+    print("=" * 80)
+    print("Testing write-behind conversation logging")
+    print("=" * 80)
+
+    all_passed = True
+    context = SheetContext(spreadsheetId="https://docs.google.com/spreadsheets/d/abc/edit", sheetTitle="Sheet1")
+
+    client = _FakeRestClient(insert_delay=0.05)
+    conv_logger = ConversationLogger(client, batch_size=1000, flush_interval=0.2)
+    started = time.perf_counter()
+    for turn in range(10):
+        conv_logger.log_messages("s1", _messages(turn), sheet_context=context)
+    queued_in = time.perf_counter() - started
+    calls_before_flush = len(client.calls)
+    time.sleep(0.6)
+    inserts = [call for call in client.calls if call[0] == "conversation_messages"]
+    print(f"\nTest 1: turns only queue rows ({queued_in * 1000:.1f} ms for 10 turns, inserts={inserts})")
+    if calls_before_flush == 0 and queued_in < 0.05 and inserts == [("conversation_messages", 20, "message_id")]:
+        print("  ✓ PASS - no round trips on the request path, one batched insert")
+    else:
+        print("  ✗ FAIL - expected 20 rows in one background insert")
+        all_passed = False
+
+    for turn in range(10, 15):
+        conv_logger.log_messages("s1", _messages(turn), sheet_context=context)
+    conv_logger.flush()
+    tab_upserts = [call for call in client.calls if call[0] == "sheet_tabs"]
+    tab_ids = {row["sheet_tab_id"] for row in client.rows}
+    print(f"\nTest 2: sheet tab resolved once ({len(tab_upserts)} upsert(s), ids={tab_ids})")
+    if tab_upserts == [("sheet_tabs", 1, "spreadsheet_id,sheet_title")] and tab_ids == {"tab-Sheet1"}:
+        print("  ✓ PASS - upserted on first use, cached afterwards")
+    else:
+        print("  ✗ FAIL - expected a single sheet_tabs upsert")
+        all_passed = False
+
+    for turn in range(15, 20):
+        conv_logger.log_messages("s1", _messages(turn))
+    loaded = conv_logger.load_messages("s1")
+    ids = [message.id for message in loaded]
+    expected = [message.id for turn in range(20) for message in _messages(turn)]
+    print(f"\nTest 3: load flushes queued rows first ({len(ids)} message(s) loaded)")
+    if ids == expected:
+        print("  ✓ PASS - reload sees every queued message, in order")
+    else:
+        print("  ✗ FAIL - expected all 40 messages in turn order")
+        all_passed = False
+
+    # Size-triggered flush and flush on close
+    client = _FakeRestClient()
+    conv_logger = ConversationLogger(client, batch_size=4, flush_interval=60)
+    conv_logger.log_messages("s2", _messages(0) + _messages(1))
+    time.sleep(0.2)
+    flushed_by_size = len(client.rows)
+    conv_logger.log_messages("s2", _messages(2))
+    conv_logger.close()
+    print(f"\nTest 4: batch size and close ({flushed_by_size} rows by size, {len(client.rows)} after close)")
+    if flushed_by_size == 4 and len(client.rows) == 6:
+        print("  ✓ PASS - full batches flush early, close drains the queue")
+    else:
+        print("  ✗ FAIL - expected 4 rows flushed by size and 6 after close")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_conversation_logger())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test the bounded ConversationStore: session cap with LRU eviction, byte budget,
+idle expiry, and lazy reload of evicted sessions through the loader; plus the
+append-only session log behind ChatService turns.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore, SessionLog
+from python_backend.models import ChatMessage, ChatMessageMetadata, ChatMessageRole, ChatRequest, ChatResponse
+from python_backend.service import ChatService
+
+
+def _message(session_id, i, payload=None):
+    metadata = ChatMessageMetadata(toolName="read_sheet", payload=payload) if payload is not None else None
+    return ChatMessage(id=f"{session_id}-{i}", role=ChatMessageRole.user, content=f"message {i}", metadata=metadata)
+
+
+class _EchoBackend:
+    """Replies with one assistant message per turn; fails when asked to."""
+
+    def __init__(self):
+        self.histories = []
+        self.fail = False
+        self.during = None
+
+    def send_chat(self, request):
+        self.histories.append(request.messages)
+        if self.during is not None:
+            self.during()
+        if self.fail:
+            raise RuntimeError("backend down")
+        reply = ChatMessage(id=f"reply-{len(self.histories)}", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_conversation_store():
+    """Exercise eviction, expiry, reload and append-only chat turns."""
+
+    print("=" * 80)
+    print("Testing bounded ConversationStore")
+    print("=" * 80)
+
+    all_passed = True
+
+    # Persisted copy of every session, standing in for Supabase
+    persisted = {}
+    loads = []
+
+    def loader(session_id):
+        loads.append(session_id)
+        return list(persisted.get(session_id, []))
+
+    store = ConversationStore(max_sessions=2, max_bytes=0, idle_ttl=0, loader=loader)
+    for session_id in ("s1", "s2", "s3"):
+        messages = [_message(session_id, i) for i in range(3)]
+        persisted[session_id] = messages
+        store.set_history(session_id, messages)
+
+    stats = store.stats()
+    print(f"\nTest 1: session cap ({stats})")
+    if stats["sessions"] == 2 and stats["evictions"] == 1:
+        print("  ✓ PASS - least recently used session evicted")
+    else:
+        print("  ✗ FAIL - expected 2 resident sessions and 1 eviction")
+        all_passed = False
+
+    history = store.get_history("s1")
+    print(f"\nTest 2: evicted session reloads ({len(history)} messages, loads={loads})")
+    if [m.id for m in history] == ["s1-0", "s1-1", "s1-2"] and loads == ["s1"] and store.reloads == 1:
+        print("  ✓ PASS - history reloaded through the loader")
+    else:
+        print("  ✗ FAIL - expected s1 reloaded once")
+        all_passed = False
+
+    # Byte budget: one large tool payload pushes older sessions out
+    grid = [[f"cell {r},{c}" for c in range(20)] for r in range(200)]
+    store = ConversationStore(max_sessions=0, max_bytes=50_000, idle_ttl=0)
+    store.set_history("small", [_message("small", 0)])
+    store.append_messages("big", [_message("big", 0, payload=grid)])
+    stats = store.stats()
+    print(f"\nTest 3: byte budget ({stats})")
+    if stats["sessions"] == 1 and stats["evictions"] == 1 and store.get_history("big"):
+        print("  ✓ PASS - oversized session kept, older session evicted")
+    else:
+        print("  ✗ FAIL - expected only the active session to remain")
+        all_passed = False
+
+    store.append_messages("big", [_message("big", 1)])
+    resident = store.stats()["resident_bytes"]
+    store.evict("big")
+    print(f"\nTest 4: resident byte accounting ({resident} -> {store.stats()['resident_bytes']})")
+    if resident > 50_000 and store.stats()["resident_bytes"] == 0:
+        print("  ✓ PASS - resident bytes track appends and evictions")
+    else:
+        print("  ✗ FAIL - expected resident bytes to return to 0")
+        all_passed = False
+
+    store = ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0.05)
+    store.set_history("idle", [_message("idle", 0)])
+    time.sleep(0.1)
+    store.set_history("active", [_message("active", 0)])
+    stats = store.stats()
+    print(f"\nTest 5: idle expiry ({stats})")
+    if stats["sessions"] == 1 and stats["expirations"] == 1 and not store.get_history("idle"):
+        print("  ✓ PASS - idle session expired")
+    else:
+        print("  ✗ FAIL - expected the idle session to expire")
+        all_passed = False
+
+    log = SessionLog([_message("log", i) for i in range(3)])
+    before = log.view()
+    added = log.append([_message("log", 1), _message("log", 3), _message("log", 3)])
+    print(f"\nTest 6: append-only log (added={[m.id for m in added]}, old view={len(before)}, log={len(log)})")
+    if [m.id for m in added] == ["log-3"] and len(before) == 3 and list(before)[-1].id == "log-2" and len(log) == 4:
+        print("  ✓ PASS - duplicates skipped and earlier views unchanged")
+    else:
+        print("  ✗ FAIL - expected one new message and a stable 3-message view")
+        all_passed = False
+
+    # ChatService: clients resend their full history every turn
+    backend = _EchoBackend()
+    service = ChatService(
+        backend,
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    sent = []
+    for turn in range(3):
+        sent.append(_message("chat", turn))
+        service.chat(ChatRequest(messages=list(sent), sessionId="chat"))
+    lengths = [len(history) for history in backend.histories]
+    print(f"\nTest 7: chat turns with resent history (backend saw {lengths})")
+    if lengths == [1, 3, 5] and len(service.store.get_history("chat")) == 6:
+        print("  ✓ PASS - resent messages deduped, replies appended")
+    else:
+        print("  ✗ FAIL - expected histories of 1, 3 and 5 messages")
+        all_passed = False
+
+    # Another worker's message lands while the failing turn is in flight
+    other = ChatMessage(id="other-worker", role=ChatMessageRole.assistant, content="meanwhile")
+    backend.during = lambda: service.store.append_messages("chat", [other])
+    backend.fail = True
+    before = service.store.get_history("chat")
+    before_ids = [message.id for message in before]
+    sent.append(_message("chat", 3))
+    try:
+        service.chat(ChatRequest(messages=list(sent), sessionId="chat"))
+    except RuntimeError:
+        pass
+    failed_view = backend.histories[-1]
+    backend.during = None
+    backend.fail = False
+    after_failure = [message.id for message in service.store.get_history("chat")]
+    service.chat(ChatRequest(messages=list(sent), sessionId="chat"))
+    print(f"\nTest 8: failed turn rolled back (history={len(after_failure)}, retry saw {len(backend.histories[-1])})")
+    if (
+        after_failure == before_ids + ["other-worker"]
+        and [message.id for message in before] == before_ids
+        and [message.id for message in failed_view][-1] == "chat-3"
+        and len(list(failed_view)) == 7
+        and len(backend.histories[-1]) == 8
+    ):
+        print("  ✓ PASS - only the failed turn's messages removed; earlier views never shrank")
+    else:
+        print(f"  ✗ FAIL - after rollback {after_failure}")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_conversation_store())
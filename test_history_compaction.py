@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test rolling history compaction: old turns are folded into a summary in the
+background, the prompt keeps only recent turns verbatim, and a failed
+summary never drops history.
+"""
+
+import sys
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.history_compaction import HistoryCompactor
+from python_backend.history_render import FRAGMENT_SEPARATOR, HistoryRenderCache
+from python_backend.models import ChatMessage, ChatMessageRole
+from python_backend.orchestrator import AgentOrchestrator
+
+
+class _FakeLLM:
+    """Returns a numbered summary and records what it was asked to fold."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def chat_text(self, messages, overrides=None):
+        self.calls.append((messages[1]["content"], overrides))
+        if self.fail:
+            raise RuntimeError("llm down")
+        return f"summary {len(self.calls)}"
+
+
+def _turn(i):
+    return [
+        ChatMessage(id=f"user-{i}", role=ChatMessageRole.user, content=f"question {i} " + "x" * 200),
+        ChatMessage(id=f"assistant-{i}", role=ChatMessageRole.assistant, content=f"answer {i} " + "y" * 200),
+    ]
+
+
+def _run_session(compactor, cache, turns):
+    """Simulate turns; return the verbatim message count and prompt size seen each turn."""
+    history = []
+    seen = []
+    for i in range(turns):
+        user, reply = _turn(i)
+        history.append(user)
+        summary, recent = compactor.compact("session-1", history)
+        text = cache.render("session-1", recent)
+        assert text == FRAGMENT_SEPARATOR.join(AgentOrchestrator._render_message(m) for m in recent)
+        seen.append((len(recent), len(text) + len(summary or "")))
+        compactor.schedule("session-1", history, [reply])
+        history.append(reply)
+        compactor.flush(timeout=5)
+    return history, seen
+
+
+def test_history_compaction():
+    """Fold a 30-turn session and check the prompt stays bounded."""
+
+    print("=" * 80)
+    print("Testing rolling history compaction")
+    print("=" * 80)
+
+    all_passed = True
+    llm = _FakeLLM()
+    compactor = HistoryCompactor(llm, AgentOrchestrator._render_message, keep_turns=3, fold_turns=2, max_summary_tokens=100)
+    cache = HistoryRenderCache(AgentOrchestrator._render_message)
+
+    history, seen = _run_session(compactor, cache, 30)
+    max_verbatim = max(count for count, _ in seen)
+    sizes = [size for _, size in seen]
+    print(f"\nTest 1: verbatim window bounded (max {max_verbatim} messages, prompt sizes {sizes[5]}..{sizes[-1]})")
+    # keep + fold complete turns plus the incoming user message
+    if max_verbatim <= 2 * (3 + 2) + 1 and max(sizes[-10:]) <= 1.1 * max(sizes[10:20]):
+        print("  ✓ PASS - prompt size stops growing with the session")
+    else:
+        print("  ✗ FAIL - expected a bounded verbatim window")
+        all_passed = False
+
+    summary, recent = compactor.compact("session-1", history)
+    previous_in_prompt = "summary 1" in llm.calls[1][0]
+    print(f"\nTest 2: rolling summary ({len(llm.calls)} folds, summary={summary!r}, recent starts at {recent[0].id})")
+    if summary == f"summary {len(llm.calls)}" and previous_in_prompt and llm.calls[0][1]["maxTokens"] == 100:
+        print("  ✓ PASS - each fold extends the previous summary within the token budget")
+    else:
+        print("  ✗ FAIL - expected the latest summary and the previous one in each fold prompt")
+        all_passed = False
+
+    # Summaries failing must never drop history
+    llm_down = _FakeLLM()
+    llm_down.fail = True
+    compactor = HistoryCompactor(llm_down, AgentOrchestrator._render_message, keep_turns=3, fold_turns=2)
+    history, seen = _run_session(compactor, HistoryRenderCache(AgentOrchestrator._render_message), 12)
+    print(f"\nTest 3: failed summaries (last turn sent {seen[-1][0]} of {len(history) - 1} messages)")
+    if llm_down.calls and seen[-1][0] == len(history) - 1:
+        print("  ✓ PASS - full history sent while summarization fails")
+    else:
+        print("  ✗ FAIL - expected the full history to be sent")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_history_compaction())
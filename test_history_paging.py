@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test paged history loading: a resumed session loads only its latest page
+without tool payloads, older pages come in on demand, and the sheet prefetch
+runs while the history loads.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.conversation_logger import ConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatRequest, ChatResponse, SheetContext
+from python_backend.service import ChatService
+
+
+class _StoredRows:
+    """Serves conversation_messages like PostgREST would, projection included."""
+
+    def __init__(self, session_id, n_messages):
+        self.selects = []
+        self.rows = []
+        for i in range(n_messages):
+            tool = i % 3 == 2
+            self.rows.append({
+                "session_id": session_id,
+                "message_id": f"m-{i:03d}",
+                "role": "tool" if tool else "user",
+                "content": f"message {i}",
+                "metadata": {"toolName": "read_sheet", "payload": {"values": [[i] * 50] * 50}} if tool else None,
+                "created_at": f"2026-01-01T00:00:{i // 1000:02d}.{i % 1000:03d}000+00:00",
+            })
+
+    def select_sync(self, table, columns="*", filters=None, order=None, limit=None):
+        self.selects.append(columns)
+        rows = [r for r in self.rows if r["session_id"] == filters["session_id"][len("eq."):]]
+        if "message_id" in filters:
+            rows = [r for r in self.rows if r["message_id"] == filters["message_id"][len("eq."):]]
+        if "created_at" in filters:
+            rows = [r for r in rows if r["created_at"] < filters["created_at"][len("lt."):]]
+        rows = sorted(rows, key=lambda r: r["created_at"], reverse=order == "created_at.desc")[:limit]
+        if columns == "created_at":
+            return [{"created_at": r["created_at"]} for r in rows]
+        return [
+            {
+                "message_id": r["message_id"],
+                "role": r["role"],
+                "content": r["content"],
+                "created_at": r["created_at"],
+                "tool_name": (r["metadata"] or {}).get("toolName"),
+            }
+            for r in rows
+        ]
+
+
+class _SlowBackend:
+    """Backend whose sheet prefetch takes as long as the history load."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.prefetched = []
+
+    def prefetch(self, sheet_context):
+        time.sleep(self.delay)
+        self.prefetched.append(sheet_context.spreadsheetId)
+
+    def send_chat(self, request):
+        reply = ChatMessage(id=f"reply-{len(request.messages)}", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_history_paging():
+    """Resume a 500-message session page by page."""
+
+    print("=" * 80)
+    print("Testing paged history loading")
+    print("=" * 80)
+
+    all_passed = True
+    rows = _StoredRows("old", 500)
+    conv_logger = ConversationLogger(rows, history_page_size=50)
+
+    page = conv_logger.load_messages("old")
+    tool_messages = [m for m in page if m.role == ChatMessageRole.tool]
+    print(f"\nTest 1: latest page only ({len(page)} messages, {page[0].id}..{page[-1].id})")
+    if (
+        len(page) == 50
+        and page[-1].id == "m-499"
+        and all(column != "metadata" and not column.endswith("->payload") for column in rows.selects[-1].split(","))
+        and all(m.metadata.toolName == "read_sheet" and m.metadata.payload is None for m in tool_messages)
+    ):
+        print("  ✓ PASS - newest 50 messages, metadata without payloads")
+    else:
+        print("  ✗ FAIL - expected the newest 50 messages without payloads")
+        all_passed = False
+
+    store = ConversationStore(
+        max_sessions=0,
+        max_bytes=0,
+        idle_ttl=0,
+        loader=conv_logger.load_messages,
+        older_loader=conv_logger.load_messages_before,
+    )
+    resident = len(store.get_history("old"))
+    pages = 0
+    while store.load_older("old"):
+        pages += 1
+    history = store.get_history("old")
+    ids = [message.id for message in history]
+    print(f"\nTest 2: older pages on demand ({resident} resident at first, {pages} more page(s))")
+    if resident == 50 and pages == 9 and ids == [f"m-{i:03d}" for i in range(500)]:
+        print("  ✓ PASS - paged back to the start of the session, in order")
+    else:
+        print("  ✗ FAIL - expected 9 older pages and the full ordered history")
+        all_passed = False
+
+    # A resumed session's first turn: prefetch overlaps the slow history load
+    delay = 0.3
+
+    def slow_loader(session_id):
+        time.sleep(delay)
+        return conv_logger.load_messages(session_id)
+
+    backend = _SlowBackend(delay)
+    service = ChatService(backend, ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0, loader=slow_loader))
+    service.store.older_loader = conv_logger.load_messages_before
+    context = SheetContext(spreadsheetId="https://docs.google.com/spreadsheets/d/abc/edit", sheetTitle="Sheet1")
+    started = time.perf_counter()
+    response = service.chat(ChatRequest(
+        messages=[ChatMessage(id="new-1", role=ChatMessageRole.user, content="hi")],
+        sessionId="old",
+        sheetContext=context,
+        delta=True,
+        cursor="m-499",
+    ))
+    service._prefetcher.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    catch_up = service.messages_after("old", "m-120")
+    print(f"\nTest 3: first turn of a resumed session ({elapsed * 1000:.0f} ms, prefetched={backend.prefetched})")
+    if (
+        not response.resync
+        and backend.prefetched == [context.spreadsheetId]
+        and elapsed < 2 * delay
+        and catch_up.messages[0].id == "m-121"
+    ):
+        print("  ✓ PASS - prefetch ran alongside the load, catch-up paged to an old cursor")
+    else:
+        print("  ✗ FAIL - expected overlapping prefetch and a catch-up from m-121")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_history_paging())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test incremental chat-history rendering: each turn renders only new messages
+and produces exactly the text a full re-render would.
+"""
+
+import sys
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.history_render import FRAGMENT_SEPARATOR, HistoryRenderCache
+from python_backend.models import ChatMessage, ChatMessageMetadata, ChatMessageRole
+from python_backend.orchestrator import AgentOrchestrator
+
+
+def _turn(i):
+    grid = [[{"value": r * c, "formula": f"=A{r}*{c}" if c % 2 else None} for c in range(12)] for r in range(40)]
+    return [
+        ChatMessage(id=f"user-{i}", role=ChatMessageRole.user, content=f"read the sheet ({i})"),
+        ChatMessage(id=f"assistant-{i}", role=ChatMessageRole.assistant, content="Reading it now."),
+        ChatMessage(
+            id=f"tool-{i}",
+            role=ChatMessageRole.tool,
+            content="Read 40 rows.",
+            metadata=ChatMessageMetadata(toolName="read_sheet", payload={"values": grid}),
+        ),
+    ]
+
+
+def _full_render(messages):
+    return FRAGMENT_SEPARATOR.join(AgentOrchestrator._render_message(m) for m in messages)
+
+
+def test_history_render():
+    """Render a growing session turn by turn and compare with full renders."""
+
+    print("=" * 80)
+    print("Testing incremental history rendering")
+    print("=" * 80)
+
+    all_passed = True
+    calls = []
+
+    def counting_render(message):
+        calls.append(message.id)
+        return AgentOrchestrator._render_message(message)
+
+    cache = HistoryRenderCache(counting_render)
+    history = []
+    previous = ""
+    identical = True
+    prefix_stable = True
+    for i in range(20):
+        history.extend(_turn(i))
+        text = cache.render("session-1", history)
+        identical = identical and text == _full_render(history)
+        prefix_stable = prefix_stable and text.startswith(previous)
+        previous = text
+
+    print(f"\nTest 1: incremental text matches a full render ({len(previous)} chars)")
+    if identical and prefix_stable:
+        print("  ✓ PASS - byte-identical output with a stable prefix")
+    else:
+        print("  ✗ FAIL - incremental render differs from a full render")
+        all_passed = False
+
+    print(f"\nTest 2: each message rendered once ({len(calls)} renders for {len(history)} messages)")
+    if len(calls) == len(history):
+        print("  ✓ PASS - old messages reused")
+    else:
+        print("  ✗ FAIL - expected one render per message")
+        all_passed = False
+
+    # A rolled-back turn: history diverges after message 30
+    calls.clear()
+    diverged = history[:30] + [ChatMessage(id="user-retry", role=ChatMessageRole.user, content="try again")]
+    text = cache.render("session-1", diverged)
+    print(f"\nTest 3: diverged history (renders={calls})")
+    if text == _full_render(diverged) and calls == ["user-retry"]:
+        print("  ✓ PASS - shared prefix reused, only the new message rendered")
+    else:
+        print("  ✗ FAIL - expected only user-retry rendered")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_history_render())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test memory diagnostics: sampled requests are diffed with tracemalloc and
+attributed to their endpoint, the in-process caches report their sizes, and
+tracemalloc is stopped again when sampling is turned off and restarted when
+the traceback depth changes.
+"""
+
+import sys
+import tracemalloc
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+
+from python_backend import api, memory_diagnostics, profiler as profiler_module
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.memory_diagnostics import cache_stats
+from python_backend.models import ChatMessage, ChatMessageRole, ChatResponse
+from python_backend.profiler import SamplingProfiler
+from python_backend.service import ChatService
+
+_retained = []
+
+
+class _LeakyBackend:
+    """Keeps ~200 KB per turn alive, like a cache that never evicts."""
+
+    def send_chat(self, request):
+        _retained.append(bytearray(200_000))
+        reply = ChatMessage(id="reply", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_memory_diagnostics():
+    """Sample leaking chat turns through the API and read the report."""
+
+    print("=" * 80)
+    print("Testing memory diagnostics")
+    print("=" * 80)
+
+    all_passed = True
+    was_tracing = tracemalloc.is_tracing()
+
+    store = ConversationStore(max_sessions=10, max_bytes=0, idle_ttl=0)
+    print("\nTest 1: cache sizes are reported")
+    caches = cache_stats()
+    if "conversation_store" in caches and "metrics_registry" in caches:
+        print(f"  ✓ PASS - {len(caches)} caches registered")
+    else:
+        print(f"  ✗ FAIL - missing caches: {sorted(caches)}")
+        all_passed = False
+
+    profiler_module._profiler = SamplingProfiler(secret="s3cret")
+    memory_diagnostics._memory_profiler = None
+    service = ChatService(_LeakyBackend(), store, conversation_logger=DisabledConversationLogger())
+    api.service = service
+    client = TestClient(api.app)
+    auth = {"Authorization": "Bearer s3cret"}
+
+    denied = client.post("/admin/memory", json={"sample_rate": 1.0})
+    configured = client.post("/admin/memory", json={"sample_rate": 1.0, "frames": 1}, headers=auth)
+    body = {"messages": [{"id": "m1", "role": "user", "content": "hi"}], "sessionId": "mem1"}
+    for _ in range(3):
+        client.post("/chat", json=body)
+    report = client.get("/admin/memory", params={"top": 5}, headers=auth).json()
+    chat = report["endpoints"].get("POST /chat", {})
+    top = chat.get("top_sites", [{}])[0]
+    print(f"\nTest 2: leaking endpoint ({chat.get('samples')} samples, top site {top.get('site')})")
+    if (
+        denied.status_code == 403
+        and configured.status_code == 200
+        and chat.get("samples") == 3
+        and __file__ in top.get("site", "")
+        and top.get("size_diff", 0) >= 3 * 200_000
+        and report["process"]["rss_bytes"]
+        and report["caches"]["conversation_store"]["sessions"] == 1
+    ):
+        print("  ✓ PASS - retained bytearrays attributed to POST /chat")
+    else:
+        print(f"  ✗ FAIL - unexpected report: {chat}")
+        all_passed = False
+
+    stopped = client.post("/admin/memory", json={"sample_rate": 0, "reset": True}, headers=auth)
+    client.post("/chat", json=body)
+    report = client.get("/admin/memory", headers=auth).json()
+    invalid = client.post("/admin/memory", json={"sample_rate": 2}, headers=auth)
+    print(f"\nTest 3: sampling off (tracing={report['tracemalloc']['tracing']})")
+    if (
+        stopped.status_code == 200
+        and tracemalloc.is_tracing() == was_tracing
+        and report["endpoints"] == {}
+        and invalid.status_code == 400
+    ):
+        print("  ✓ PASS - tracemalloc stopped, diffs cleared, bad rates rejected")
+    else:
+        print("  ✗ FAIL - expected tracing off and no endpoints")
+        all_passed = False
+
+    client.post("/admin/memory", json={"sample_rate": 1.0, "frames": 1}, headers=auth)
+    deeper = client.post("/admin/memory", json={"frames": 4}, headers=auth)
+    limit = tracemalloc.get_traceback_limit()
+    client.post("/admin/memory", json={"sample_rate": 0}, headers=auth)
+    print(f"\nTest 4: changing frames while tracing (status {deeper.status_code}, limit {limit})")
+    if (deeper.status_code == 409) if was_tracing else (deeper.status_code == 200 and limit == 4 and deeper.json()["frames"] == 4):
+        print("  ✓ PASS - tracemalloc restarted with the new traceback depth")
+    else:
+        print("  ✗ FAIL - expected the new frame count to take effect")
+        all_passed = False
+
+    api.service = None
+    profiler_module._profiler = None
+    memory_diagnostics._memory_profiler = None
+    _retained.clear()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_memory_diagnostics())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test the metrics subsystem: per-thread recording sums up correctly, the
+output follows the Prometheus text format, /metrics reports requests by route
+template, and Sheets API calls are counted by API method.
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+from python_backend.api import app
+from python_backend.metrics import Counter, Histogram, Registry, render_metrics
+from python_backend.sheets_client import MeteredHttpRequest
+
+
+def _sheets_discovery():
+    import googleapiclient
+
+    static = Path(googleapiclient.__file__).parent / "discovery_cache" / "documents" / "sheets.v4.json"
+    return static.read_text()
+
+
+def _sample(text, series):
+    """The value of one series in a scrape, 0 if absent."""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_metrics():
+    """Record from many threads, render, and scrape the API."""
+
+    print("=" * 80)
+    print("Testing metrics")
+    print("=" * 80)
+
+    all_passed = True
+
+    registry = Registry()
+    calls = Counter("calls_total", "Calls.", ("kind",), registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", ("kind",), buckets=(0.1, 1.0), registry=registry)
+
+    def record():
+        for i in range(10000):
+            calls.inc("a")
+            latency.observe(0.05 if i % 2 else 0.5, "a")
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    text = registry.render()
+    print("\nTest 1: 8 threads x 10000 observations")
+    if (
+        'calls_total{kind="a"} 80000.0' in text
+        and 'latency_seconds_bucket{kind="a",le="0.1"} 40000.0' in text
+        and 'latency_seconds_bucket{kind="a",le="1.0"} 80000.0' in text
+        and 'latency_seconds_bucket{kind="a",le="+Inf"} 80000.0' in text
+        and 'latency_seconds_count{kind="a"} 80000.0' in text
+        and "# TYPE latency_seconds histogram" in text
+    ):
+        print("  ✓ PASS - shards merged, buckets cumulative")
+    else:
+        print(f"  ✗ FAIL - unexpected output:\n{text}")
+        all_passed = False
+
+    calls.inc('quote"back\\slash')
+    print("\nTest 2: label escaping")
+    if 'calls_total{kind="quote\\"back\\\\slash"} 1.0' in registry.render():
+        print("  ✓ PASS - quotes and backslashes escaped")
+    else:
+        print("  ✗ FAIL - label value not escaped")
+        all_passed = False
+
+    client = TestClient(app)
+    series = 'http_requests_total{method="GET",route="/health",status="200"}'
+    before = _sample(client.get("/metrics").text, series)
+    client.get("/health")
+    client.get("/health")
+    response = client.get("/metrics")
+    print(f"\nTest 3: /metrics endpoint ({response.headers.get('content-type')})")
+    if (
+        response.status_code == 200
+        and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        and _sample(response.text, series) - before == 2
+        and "# TYPE llm_request_duration_seconds histogram" in response.text
+    ):
+        print("  ✓ PASS - requests counted by route template")
+    else:
+        print("  ✗ FAIL - expected two /health requests in the scrape")
+        all_passed = False
+
+    method = "sheets.spreadsheets.values.get"
+    ok_series = f'sheets_api_requests_total{{method="{method}",outcome="ok"}}'
+    error_series = f'sheets_api_requests_total{{method="{method}",outcome="http_404"}}'
+    count_series = f'sheets_api_request_duration_seconds_count{{method="{method}"}}'
+    before = {name: _sample(render_metrics(), name) for name in (ok_series, error_series, count_series)}
+    http = HttpMockSequence([
+        ({"status": "200"}, json.dumps({"values": [[1]]})),
+        ({"status": "404"}, json.dumps({"error": {"message": "not found"}})),
+    ])
+    service = build_from_document(_sheets_discovery(), http=http, requestBuilder=MeteredHttpRequest)
+    service.spreadsheets().values().get(spreadsheetId="abc", range="A1").execute()
+    try:
+        service.spreadsheets().values().get(spreadsheetId="abc", range="A1").execute()
+    except HttpError:
+        pass
+    text = render_metrics()
+    delta = {name: _sample(text, name) - before[name] for name in before}
+    print("\nTest 4: Sheets API calls by method")
+    if delta == {ok_series: 1, error_series: 1, count_series: 2}:
+        print("  ✓ PASS - success and HTTP error counted separately")
+    else:
+        print("  ✗ FAIL - expected one ok and one http_404 call")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_metrics())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Test out-of-line tool payloads: large payloads are stored once in a
+content-addressed blob store, messages keep only a reference, and the
+orchestrator fetches them lazily when rendering history. Supabase blob
+writes wait for the conversation logger's flush and land before the rows
+that reference them.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend import blob_store
+from python_backend.blob_store import BLOB_TABLE, BlobStoreError, LocalBlobStore, PayloadStore, SupabaseBlobStore
+from python_backend.conversation_logger import ConversationLogger
+from python_backend.fakes import DisabledConversationLogger, FakeSupabase
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageMetadata, ChatMessageRole, ChatRequest, ChatResponse
+from python_backend.orchestrator import AgentOrchestrator
+from python_backend.service import ChatService
+from python_backend.supabase_rest import SupabaseRestClient
+
+
+def _grid(n_rows):
+    return {"values": [[{"value": r * c, "formula": None} for c in range(8)] for r in range(n_rows)]}
+
+
+def _tool_message(message_id, payload):
+    return ChatMessage(
+        id=message_id,
+        role=ChatMessageRole.tool,
+        content="Read the sheet.",
+        metadata=ChatMessageMetadata(toolName="read_sheet", payload=payload),
+    )
+
+
+class _CountingBlobs(LocalBlobStore):
+    def __init__(self, root):
+        super().__init__(root)
+        self.gets = 0
+
+    def get(self, digest):
+        self.gets += 1
+        return super().get(digest)
+
+
+class _UnavailableBlobs(LocalBlobStore):
+    def put_many(self, blobs):
+        raise BlobStoreError("blob table unavailable")
+
+
+class _ReadSheetBackend:
+    """Replies to every turn with a read_sheet tool message carrying a large grid."""
+
+    def __init__(self):
+        self.histories = []
+
+    def send_chat(self, request):
+        self.histories.append(list(request.messages))
+        reply = _tool_message(f"tool-{len(self.histories)}", _grid(200))
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_payload_blobs():
+    """Offload, dedupe and lazily reload tool payloads."""
+
+    print("=" * 80)
+    print("Testing out-of-line tool payloads")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    blobs = _CountingBlobs(Path(tmp.name))
+    payloads = PayloadStore(blobs, inline_max_bytes=1024)
+
+    small = _tool_message("small", {"values": [[1, 2]]})
+    large = _tool_message("large", _grid(200))
+    offloaded = payloads.offload(large)
+    ref = offloaded.metadata.payloadRef
+    inline_size = len(offloaded.model_dump_json())
+    print(f"\nTest 1: offload above the threshold ({len(large.model_dump_json())} -> {inline_size} bytes)")
+    if (
+        payloads.offload(small) is small
+        and offloaded.metadata.payload is None
+        and ref.size > 1024
+        and ref.summary == "read_sheet result: 200 row(s) x 8 column(s)"
+        and inline_size < 1024
+    ):
+        print("  ✓ PASS - only hash, size and summary kept inline")
+    else:
+        print("  ✗ FAIL - expected the large payload replaced by a reference")
+        all_passed = False
+
+    # A fresh store (e.g. another worker) reads through the blob store
+    reader = PayloadStore(blobs, inline_max_bytes=1024)
+    rendered = AgentOrchestrator._render_message(large)
+    blob_store._payload_store = reader
+    try:
+        lazy = AgentOrchestrator._render_message(offloaded)
+        again = AgentOrchestrator._render_message(offloaded)
+        chat_only = AgentOrchestrator._render_message(
+            offloaded.model_copy(update={"metadata": offloaded.metadata.model_copy(update={"toolName": "modify_sheet"})})
+        )
+    finally:
+        blob_store._payload_store = None
+    print(f"\nTest 2: lazy load when rendering ({blobs.gets} blob read(s))")
+    if lazy == rendered and again == rendered and blobs.gets == 1 and "Row 1" not in chat_only:
+        print("  ✓ PASS - rendered identically, fetched once, only for tools the prompt uses")
+    else:
+        print("  ✗ FAIL - expected an identical render from a single blob read")
+        all_passed = False
+
+    payloads.offload(_tool_message("large-again", _grid(200)))
+    stored = [path for path in Path(tmp.name).rglob("*") if path.is_file()]
+    print(f"\nTest 3: identical payloads stored once ({len(stored)} blob file(s))")
+    if len(stored) == 1 and stored[0].stat().st_size < ref.size:
+        print("  ✓ PASS - content-addressed and compressed")
+    else:
+        print("  ✗ FAIL - expected one compressed blob")
+        all_passed = False
+
+    # ChatService keeps references while the client still gets full payloads
+    backend = _ReadSheetBackend()
+    service = ChatService(
+        backend,
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0, prepare=payloads.offload),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    question = ChatMessage(id="q-1", role=ChatMessageRole.user, content="read it")
+    response = service.chat(ChatRequest(messages=[question], sessionId="s"))
+    follow_up = ChatMessage(id="q-2", role=ChatMessageRole.user, content="and again")
+    service.chat(ChatRequest(messages=[question, response.messages[0], follow_up], sessionId="s"))
+    history = service.store.get_history("s")
+    resent = backend.histories[-1][1]
+    print(f"\nTest 4: chat service ({service.store.stats()['resident_bytes']} resident bytes)")
+    if (
+        response.messages[0].metadata.payload is not None
+        and history[1].metadata.payload is None
+        and history[1].metadata.payloadRef is not None
+        and resent.metadata.payloadRef is not None
+    ):
+        print("  ✓ PASS - stored history holds references, response holds the payload")
+    else:
+        print("  ✗ FAIL - expected references in the store and payloads in the response")
+        all_passed = False
+
+    # Supabase blobs are written by the logger's flush, ahead of the message rows
+    fake = FakeSupabase()
+    order = []
+    inner = fake.transport()
+
+    def _recording(request):
+        if request.method == "POST":
+            order.append(request.url.path.rsplit("/", 1)[-1])
+        return inner.handle_async_request(request)
+
+    client = SupabaseRestClient("https://fake.supabase.co", "key", transport=httpx.MockTransport(_recording))
+    deferred = PayloadStore(SupabaseBlobStore(client), inline_max_bytes=1024, defer_writes=True)
+    conv_logger = ConversationLogger(client, flush_interval=60, payloads=deferred)
+    stored_message = deferred.offload(_tool_message("tool-a", _grid(200)))
+    before_flush = (list(order), deferred.load(stored_message.metadata) == _grid(200))
+    conv_logger.log_messages("s", [stored_message])
+    conv_logger.flush()
+    logged = fake.tables["conversation_messages"][0]["metadata"]
+    print(f"\nTest 5: deferred Supabase blob writes (writes before flush {before_flush[0]}, after {order})")
+    if (
+        before_flush == ([], True)
+        and order == [BLOB_TABLE, "conversation_messages"]
+        and len(fake.tables[BLOB_TABLE]) == 1
+        and logged["payloadRef"]["hash"] == stored_message.metadata.payloadRef.hash
+        and deferred.stats()["unwritten"] == 0
+    ):
+        print("  ✓ PASS - offload does no I/O; the blob lands before the row referencing it")
+    else:
+        print("  ✗ FAIL - expected the blob insert to precede the message insert")
+        all_passed = False
+
+    failing = PayloadStore(_UnavailableBlobs(Path(tmp.name) / "down"), inline_max_bytes=1024, defer_writes=True)
+    conv_logger = ConversationLogger(client, flush_interval=60, payloads=failing)
+    stranded = failing.offload(_tool_message("tool-b", _grid(150)))
+    conv_logger.log_messages("s", [stranded])
+    conv_logger.flush()
+    logged = next(row for row in fake.tables["conversation_messages"] if row["message_id"] == "tool-b")["metadata"]
+    print("\nTest 6: rows carry the payload inline when the blob write fails")
+    if (
+        "payloadRef" not in logged
+        and logged["payload"] == _grid(150)
+        and failing.stats()["unwritten"] == 1
+        and failing.load(stranded.metadata) == _grid(150)
+    ):
+        print("  ✓ PASS - nothing references a missing blob; the payload stays pending in memory")
+    else:
+        print("  ✗ FAIL - expected an inline payload and a pending blob")
+        all_passed = False
+    client.close()
+
+    print("\nTest 7: pending blobs are bounded by unwritten_max_bytes during an outage")
+    outage = PayloadStore(_UnavailableBlobs(Path(tmp.name) / "outage"), inline_max_bytes=1024, defer_writes=True)
+    first = outage.offload(_tool_message("tool-c", _grid(150)))
+    outage.unwritten_max_bytes = outage.stats()["unwritten_bytes"]
+    second = outage.offload(_tool_message("tool-d", _grid(160)))
+    failed = outage.write_pending()
+    if (
+        first.metadata.payloadRef is not None
+        and second.metadata.payloadRef is None
+        and second.metadata.payload == _grid(160)
+        and outage.stats()["unwritten"] == 1
+        and outage.stats()["unwritten_bytes"] == outage.unwritten_max_bytes > 0
+        and list(failed) == [first.metadata.payloadRef.hash]
+    ):
+        print("  ✓ PASS - past the budget the payload stays inline; only encoded bytes are held")
+    else:
+        print(f"  ✗ FAIL - unexpected pending state: {outage.stats()}")
+        all_passed = False
+
+    tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_payload_blobs())
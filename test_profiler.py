@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test the request profiler: signed X-Profile tokens turn sampling on for one
+request, the sampled stacks download in collapsed format, worker threads
+the request hands work to are sampled with it, event-loop samples are
+kept apart, and the sampler thread goes away when nothing is being profiled.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+
+from python_backend import api, profiler as profiler_module
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatResponse
+from python_backend.profiler import EVENT_LOOP_FRAME, SamplingProfiler
+from python_backend.service import ChatService
+
+
+def _parse_grid(seconds):
+    """CPU-bound stand-in for parsing a giant grid."""
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(i * i for i in range(1000))
+    return total
+
+
+class _BusyBackend:
+    def prefetch(self, sheet_context):
+        _parse_grid(0.1)
+
+    def send_chat(self, request):
+        _parse_grid(0.2)
+        reply = ChatMessage(id="reply", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_profiler():
+    """Profile a CPU-bound chat turn through the API."""
+
+    print("=" * 80)
+    print("Testing the request profiler")
+    print("=" * 80)
+
+    all_passed = True
+
+    profiler = SamplingProfiler(secret="s3cret", interval=0.002)
+    token = profiler.sign_token(60)
+    expired = profiler.sign_token(-1)
+    forged = token[:-1] + ("0" if token[-1] != "0" else "1")
+    print("\nTest 1: token verification")
+    if (
+        profiler.verify_token(token)
+        and not profiler.verify_token(expired)
+        and not profiler.verify_token(forged)
+        and not SamplingProfiler().verify_token(token)
+        and not profiler.should_profile(None)
+    ):
+        print("  ✓ PASS - valid token accepted; expired, forged and unsigned rejected")
+    else:
+        print("  ✗ FAIL - token checks wrong")
+        all_passed = False
+
+    profiler_module._profiler = profiler
+    service = ChatService(
+        _BusyBackend(),
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    api.service = service
+    client = TestClient(api.app)
+    body = {"messages": [{"id": "m1", "role": "user", "content": "hi"}], "sessionId": "p1"}
+    plain = client.post("/chat", json=body)
+    profiled = client.post("/chat", json=body, headers={"X-Profile": token})
+    request_id = profiled.headers["X-Request-ID"]
+    auth = {"Authorization": "Bearer s3cret"}
+    folded = client.get(f"/profiles/{request_id}", headers=auth)
+    denied = client.get(f"/profiles/{request_id}")
+    lines = folded.text.splitlines() if folded.status_code == 200 else []
+    busy = sum(int(line.rsplit(" ", 1)[1]) for line in lines if "_parse_grid" in line)
+    print(f"\nTest 2: profiled chat turn ({len(lines)} stacks, {busy} samples in _parse_grid)")
+    if (
+        "X-Profiled" not in plain.headers
+        and profiled.headers.get("X-Profiled") == "1"
+        and profiler.get(plain.headers["X-Request-ID"]) is None
+        and busy >= 5
+        and all(line.split(" ")[0].count(";") >= 1 for line in lines)
+        and denied.status_code == 403
+    ):
+        print("  ✓ PASS - only the signed request was sampled, stacks collapsed root first")
+    else:
+        print(f"  ✗ FAIL - expected samples in _parse_grid (status {folded.status_code}, denied {denied.status_code})")
+        all_passed = False
+
+    configured = client.post("/admin/profiler", json={"sample_rate": 1.0}, headers=auth)
+    sampled = client.post("/chat", json=body)
+    client.post("/admin/profiler", json={"sample_rate": 0}, headers=auth)
+    time.sleep(0.05)
+    print(f"\nTest 3: admin sample rate (status {configured.status_code}, sampler idle={profiler._sampler is None})")
+    if (
+        configured.status_code == 200
+        and profiler.verify_token(configured.json()["token"])
+        and sampled.headers.get("X-Profiled") == "1"
+        and profiler.sample_rate == 0
+        and profiler._sampler is None
+    ):
+        print("  ✓ PASS - sampling by rate, sampler thread exits when idle")
+    else:
+        print("  ✗ FAIL - expected a sampled request and an idle sampler afterwards")
+        all_passed = False
+
+    print("\nTest 4: the sheet prefetch thread is sampled with its request")
+    fresh = {**body, "sessionId": "p2", "sheetContext": {"spreadsheetId": "abc", "sheetTitle": "Sheet1"}}
+    prefetched = client.post("/chat", json=fresh, headers={"X-Profile": token})
+    service._prefetcher.shutdown(wait=True)
+    prefetched_id = prefetched.headers["X-Request-ID"]
+    lines = client.get(f"/profiles/{prefetched_id}", headers=auth).text.splitlines()
+    listed = {p["request_id"]: p for p in client.get("/profiles", headers=auth).json()["profiles"]}
+    worker = sum(int(line.rsplit(" ", 1)[1]) for line in lines if "run_profiled" in line and "_parse_grid" in line)
+    if worker >= 5 and listed[prefetched_id]["peak_threads"] == 2 and listed[request_id]["peak_threads"] == 1:
+        print(f"  ✓ PASS - {worker} samples from the prefetch thread, peak of 2 threads recorded")
+    else:
+        print(f"  ✗ FAIL - {worker} prefetch samples, listing {listed.get(prefetched_id)}")
+        all_passed = False
+
+    print("\nTest 5: event-loop samples are marked as shared")
+    loop_lines = [line for line in lines if line.startswith(f"{EVENT_LOOP_FRAME};")]
+    worker_lines = [line for line in lines if "run_profiled" in line]
+    loop_count = sum(int(line.rsplit(" ", 1)[1]) for line in loop_lines)
+    if (
+        loop_count == listed[prefetched_id]["loop_samples"] > 0
+        and listed[request_id]["loop_samples"] == listed[request_id]["samples"]
+        and not any(line.startswith(f"{EVENT_LOOP_FRAME};") for line in worker_lines)
+        and "note" in client.get("/profiles", headers=auth).json()
+    ):
+        print(f"  ✓ PASS - {loop_count} loop-thread samples under {EVENT_LOOP_FRAME}, worker samples unmarked")
+    else:
+        print(f"  ✗ FAIL - {loop_count} loop-thread samples, listing {listed.get(prefetched_id)}")
+        all_passed = False
+
+    api.service = None
+    profiler_module._profiler = None
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_profiler())
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Test that snapshot restores page through more rows than PostgREST returns at once,
+for both legacy per-cell rows and packed one-row-per-range snapshots.
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend import api, snapshot_store, supabase_rest
+from python_backend.snapshot_pack import pack_color_rows, pack_value_rows
+from python_backend.snapshot_store import SQLiteSnapshotStore, SupabaseSnapshotStore
+from python_backend.supabase_rest import SupabaseRestClient
+
+MAX_ROWS = 1000  # PostgREST default max-rows
+ROW_COUNT = 2500
+
+
+def _cell_name(i):
+    return f"A{i + 1}"
+
+
+def _make_tables():
+    value_rows = [
+        {
+            "cell": _cell_name(i),
+            "value": json.dumps(i),
+            "spreadsheet_id": "sheet-123",
+            "gid": 0,
+            "snapshot_batch_id": "batch-1",
+        }
+        for i in range(ROW_COUNT)
+    ]
+    color_rows = [
+        {
+            "id": f"{i:08d}",
+            "cell": _cell_name(i),
+            "red": 1.0,
+            "green": 1.0,
+            "blue": 1.0,
+            "spreadsheet_id": "sheet-123",
+            "gid": 0,
+            "snapshot_batch_id": "batch-1",
+        }
+        for i in range(ROW_COUNT)
+    ]
+    return {
+        "cell_value_snapshots": value_rows,
+        "cell_color_snapshots": color_rows,
+        "cell_value_snapshot_ranges": [],
+        "cell_color_snapshot_ranges": [],
+        "snapshot_batches": [],
+    }
+
+
+def _make_packed_tables():
+    """Same snapshot as _make_tables, stored one row per range (scattered cells force many ranges)."""
+    legacy = _make_tables()
+    values = [row for i, row in enumerate(legacy["cell_value_snapshots"]) if i % 3]
+    colors = [dict(row, red=0.5) if i % 2 else row for i, row in enumerate(legacy["cell_color_snapshots"])]
+
+    def with_ids(rows):
+        return [dict(row, id=f"{i:08d}") for i, row in enumerate(rows)]
+
+    return {
+        "cell_value_snapshots": [],
+        "cell_color_snapshots": [],
+        "cell_value_snapshot_ranges": with_ids(pack_value_rows(values)),
+        "cell_color_snapshot_ranges": with_ids(pack_color_rows(colors)),
+        "snapshot_batches": [],
+    }, len(values)
+
+
+def _fake_postgrest(tables, requests_seen):
+    """Minimal PostgREST: eq/gt filters, order, limit, and a max-rows cap."""
+
+    def handler(request):
+        table = request.url.path.rsplit("/", 1)[-1]
+        params = {k: v[0] for k, v in parse_qs(request.url.query.decode()).items()}
+        requests_seen.append((table, params))
+        if table not in tables:
+            return httpx.Response(404, json={"code": "PGRST205", "message": f"Could not find the table 'public.{table}'"})
+
+        rows = tables[table]
+        for column, expr in params.items():
+            if column in ("select", "order", "limit"):
+                continue
+            op, _, operand = expr.partition(".")
+            if op == "eq":
+                rows = [r for r in rows if str(r.get(column)) == operand]
+            elif op == "gt":
+                rows = [r for r in rows if str(r.get(column)) > operand]
+
+        if "order" in params:
+            key = params["order"].split(".")[0]
+            rows = sorted(rows, key=lambda r: str(r[key]))
+        limit = min(int(params.get("limit", MAX_ROWS)), MAX_ROWS)
+        return httpx.Response(200, json=rows[:limit])
+
+    return handler
+
+
+class _FakeRequest:
+    def __init__(self, calls, kind, body):
+        self._calls = calls
+        self._kind = kind
+        self._body = body
+
+    def execute(self):
+        self._calls.append((self._kind, self._body))
+        return {}
+
+
+class _FakeValues:
+    def __init__(self, calls):
+        self._calls = calls
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _FakeRequest(self._calls, "values", body)
+
+
+class _FakeSpreadsheets:
+    def __init__(self, calls):
+        self._calls = calls
+
+    def batchUpdate(self, spreadsheetId, body):
+        return _FakeRequest(self._calls, "format", body)
+
+    def values(self):
+        return _FakeValues(self._calls)
+
+
+class _FakeService:
+    def __init__(self, calls):
+        self._calls = calls
+
+    def spreadsheets(self):
+        return _FakeSpreadsheets(self._calls)
+
+
+class _FakeValidator:
+    def __init__(self):
+        self.calls = []
+        self.service = _FakeService(self.calls)
+
+    def fetch_spreadsheet(self, spreadsheet_id):
+        return {"sheets": [{"properties": {"sheetId": 0, "title": "Sheet1"}}]}
+
+
+async def _install_transport(client, transport):
+    client._http = httpx.AsyncClient(transport=transport)
+
+
+def test_restore_pagination():
+    """Restore a 2500-row snapshot through a server capped at 1000 rows."""
+
+    print("=" * 80)
+    print("Testing paginated snapshot restore")
+    print("=" * 80)
+
+    tables = _make_tables()
+    requests_seen = []
+    transport = httpx.MockTransport(_fake_postgrest(tables, requests_seen))
+
+    client = SupabaseRestClient("http://supabase.test", "key", backoff_base=0.0)
+    # Created on the client loop, like the real pool
+    client.run_sync(_install_transport(client, transport))
+    supabase_rest._rest_client = client
+
+    validator = _FakeValidator()
+    original_get_sheets_service = api._get_sheets_service
+    api._get_sheets_service = lambda: validator
+    data_dir = tempfile.TemporaryDirectory()
+    snapshot_store._store = SupabaseSnapshotStore(client, journal_path=Path(data_dir.name) / "journal.sqlite3")
+
+    all_passed = True
+
+    try:
+        result = asyncio.run(api.restore_cell_values(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        written = sum(len(body["data"]) for kind, body in validator.calls if kind == "values")
+        print(f"\nValues: count={result['count']}, written={written}")
+        if result["count"] == ROW_COUNT and written == ROW_COUNT:
+            print("  ✓ PASS - all cell values restored")
+        else:
+            print("  ✗ FAIL - expected every cell value to be restored")
+            all_passed = False
+
+        validator.calls.clear()
+        result = asyncio.run(api.restore_colors(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        written = sum(len(body["requests"]) for kind, body in validator.calls if kind == "format")
+        print(f"\nColors: count={result['count']}, written={written}")
+        if result["count"] == ROW_COUNT and written == ROW_COUNT:
+            print("  ✓ PASS - all cell colors restored")
+        else:
+            print("  ✗ FAIL - expected every cell color to be restored")
+            all_passed = False
+
+        validator.calls.clear()
+        request = api.RestoreRequest(snapshot_batch_id="batch-1", cell_locations=["A5", "A2000"])
+        result = asyncio.run(api.restore_cell_values(request))
+        print(f"\nSubset: count={result['count']}")
+        if result["count"] == 2:
+            print("  ✓ PASS - cell_locations filter applied across pages")
+        else:
+            print("  ✗ FAIL - expected 2 cells restored")
+            all_passed = False
+
+        # Packed one-row-per-range snapshots
+        packed_tables, value_count = _make_packed_tables()
+        tables.clear()
+        tables.update(packed_tables)
+
+        validator.calls.clear()
+        result = asyncio.run(api.restore_cell_values(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        print(f"\nPacked values: count={result['count']}")
+        if result["count"] == value_count:
+            print("  ✓ PASS - all packed cell values restored")
+        else:
+            print(f"  ✗ FAIL - expected {value_count} cell values restored")
+            all_passed = False
+
+        validator.calls.clear()
+        result = asyncio.run(api.restore_colors(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        print(f"\nPacked colors: count={result['count']}")
+        if result["count"] == ROW_COUNT:
+            print("  ✓ PASS - all packed cell colors restored")
+        else:
+            print("  ✗ FAIL - expected every packed cell color to be restored")
+            all_passed = False
+
+        validator.calls.clear()
+        request = api.RestoreRequest(snapshot_batch_id="batch-1", cell_locations=["A2", "A3", "A1999"])
+        result = asyncio.run(api.restore_colors(request))
+        restored = sorted(
+            (r["repeatCell"]["range"]["startRowIndex"], r["repeatCell"]["range"]["endColumnIndex"])
+            for kind, body in validator.calls if kind == "format" for r in body["requests"]
+        )
+        print(f"\nPacked subset: count={result['count']}, ranges={restored}")
+        if result["count"] == 3 and restored == [(1, 1), (2, 1), (1998, 1)]:
+            print("  ✓ PASS - cell_locations filter applied to packed ranges")
+        else:
+            print("  ✗ FAIL - expected only A2, A3 and A1999 restored")
+            all_passed = False
+
+        # A database without migration 004 has no packed tables at all
+        tables.clear()
+        tables.update(_make_tables())
+        del tables["cell_value_snapshot_ranges"]
+        del tables["cell_color_snapshot_ranges"]
+
+        validator.calls.clear()
+        values = asyncio.run(api.restore_cell_values(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        colors = asyncio.run(api.restore_colors(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        print(f"\nWithout packed tables: values={values['count']}, colors={colors['count']}")
+        if values["count"] == ROW_COUNT and colors["count"] == ROW_COUNT:
+            print("  ✓ PASS - legacy snapshots restore before migration 004 is applied")
+        else:
+            print("  ✗ FAIL - expected every cell restored from the per-cell tables")
+            all_passed = False
+
+        # Local SQLite store: same restore path, no Supabase round trips
+        snapshot_store.close_snapshot_store()
+        snapshot_store._store = SQLiteSnapshotStore(Path(data_dir.name) / "snapshots.sqlite3", page_size=MAX_ROWS)
+        legacy = _make_tables()
+        snapshot_store._store.insert("cell_color_snapshots", legacy["cell_color_snapshots"])
+        snapshot_store._store.insert("cell_value_snapshots", legacy["cell_value_snapshots"])
+        requests_seen.clear()
+
+        validator.calls.clear()
+        values = asyncio.run(api.restore_cell_values(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        colors = asyncio.run(api.restore_colors(api.RestoreRequest(snapshot_batch_id="batch-1")))
+        print(f"\nSQLite store: values={values['count']}, colors={colors['count']}, remote={len(requests_seen)}")
+        if values["count"] == ROW_COUNT and colors["count"] == ROW_COUNT and not requests_seen:
+            print("  ✓ PASS - snapshot restored from the local store")
+        else:
+            print("  ✗ FAIL - expected every cell restored without remote requests")
+            all_passed = False
+    finally:
+        api._get_sheets_service = original_get_sheets_service
+        asyncio.run(api.shutdown())
+        data_dir.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_restore_pagination())
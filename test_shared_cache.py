@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Test the host-local shared cache tier: workers with separate memory continue
+each other's sessions without reloading from Supabase, concurrent processes
+append safely, key/value entries expire and follow generations, Sheets
+metadata is shared per generation and survives a failing cache, and idle
+sessions are purged while the cache stays open.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatRequest, ChatResponse
+from python_backend.service import ChatService
+from python_backend import shared_cache
+from python_backend.shared_cache import NS_SHEETS_METADATA, SharedCache
+from python_backend.sheets_client import ServiceAccountSheetsClient
+from python_backend.sheets_emulator import SheetsEmulator
+
+
+class _EchoBackend:
+    """Replies with one assistant message and records the history size it saw."""
+
+    def __init__(self, name):
+        self.name = name
+        self.histories = []
+
+    def send_chat(self, request):
+        self.histories.append(len(request.messages))
+        reply = ChatMessage(
+            id=f"{self.name}-reply-{len(self.histories)}",
+            role=ChatMessageRole.assistant,
+            content="ok",
+        )
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+class _BrokenCache:
+    """A shared cache whose database is locked for every call."""
+
+    def _fail(self, *args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    counter = get = set = bump = delete = _fail
+
+
+def _sheets_client(emulator, shared):
+    client = ServiceAccountSheetsClient(service=emulator.service())
+    client._shared = shared
+    client.metadata_ttl = 30
+    return client
+
+
+def _sheet_titles(client):
+    return [sheet["title"] for sheet in client.get_spreadsheet_metadata("book")["sheets"]]
+
+
+def _worker(path, name):
+    service = ChatService(
+        _EchoBackend(name),
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        SharedCache(path),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    return service
+
+
+def _turn(service, i, cursor):
+    message = ChatMessage(id=f"user-{i}", role=ChatMessageRole.user, content=f"question {i}")
+    return service.chat(ChatRequest(messages=[message], sessionId="s", delta=True, cursor=cursor))
+
+
+def _append_from_process(path, worker, count):
+    cache = SharedCache(Path(path))
+    for i in range(count):
+        message = ChatMessage(id=f"p{worker}-{i}", role=ChatMessageRole.user, content="x")
+        cache.append_messages("concurrent", [message])
+
+
+def test_shared_cache():
+    """Alternate a session between two workers, then stress concurrent appends."""
+
+    print("=" * 80)
+    print("Testing the shared cache tier")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    path = Path(tmp.name) / "shared.sqlite3"
+
+    worker_a = _worker(path, "a")
+    worker_b = _worker(path, "b")
+    cursor = None
+    resyncs = 0
+    for i in range(6):
+        response = _turn(worker_a if i % 2 == 0 else worker_b, i, cursor)
+        resyncs += response.resync
+        cursor = response.cursor
+    seen = worker_a.backend.histories + worker_b.backend.histories
+    print(f"\nTest 1: session alternating between workers (a saw {worker_a.backend.histories}, b saw {worker_b.backend.histories})")
+    if resyncs == 0 and worker_a.backend.histories == [1, 5, 9] and worker_b.backend.histories == [3, 7, 11]:
+        print("  ✓ PASS - each worker continued from the other's turns, no resyncs")
+    else:
+        print(f"  ✗ FAIL - expected full histories on both workers (resyncs={resyncs}, seen={seen})")
+        all_passed = False
+
+    processes = [
+        multiprocessing.Process(target=_append_from_process, args=(str(path), worker, 50))
+        for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    cache = SharedCache(path)
+    messages = cache.messages_after("concurrent", None)
+    ids = {message.id for message in messages}
+    print(f"\nTest 2: concurrent appends from 4 processes ({len(messages)} messages)")
+    if all(p.exitcode == 0 for p in processes) and len(messages) == 200 and len(ids) == 200:
+        print("  ✓ PASS - every append landed exactly once")
+    else:
+        print("  ✗ FAIL - expected 200 distinct messages")
+        all_passed = False
+
+    cache.set("ns", "short", {"v": 1}, ttl=0.05)
+    cache.set("ns", "long", {"v": 2})
+    cache.bump("gen", "sheet")
+    cache.bump("gen", "sheet")
+    time.sleep(0.1)
+    print(f"\nTest 3: key/value tier (short={cache.get('ns', 'short')}, long={cache.get('ns', 'long')})")
+    if cache.get("ns", "short") is None and cache.get("ns", "long") == {"v": 2} and cache.counter("gen", "sheet") == 2:
+        print("  ✓ PASS - expiry and generation counters work")
+    else:
+        print("  ✗ FAIL - expected the short entry expired and generation 2")
+        all_passed = False
+
+    print("\nTest 4: Sheets metadata is shared per generation")
+    emulator = SheetsEmulator()
+    emulator.add_spreadsheet("book")
+    emulator.add_sheet("book", "Data", [["x"]])
+    reader = _sheets_client(emulator, cache)
+    writer = _sheets_client(emulator, cache)
+    before = _sheet_titles(reader)
+    shared_before = _sheet_titles(writer)
+    writer.add_sheet("book", "Extra")
+    after = _sheet_titles(reader)
+    broken = _sheets_client(emulator, _BrokenCache())
+    broken_titles = _sheet_titles(broken)
+    broken.add_sheet("book", "More")
+    if (
+        before == shared_before == ["Data"]
+        and after == ["Data", "Extra"]
+        and cache.get(NS_SHEETS_METADATA, "book/1") is not None
+        and emulator.calls.get("spreadsheets.get") == 3
+        and broken_titles == ["Data", "Extra"]
+    ):
+        print("  ✓ PASS - a write moves readers to a new entry; a failing cache falls back to the API")
+    else:
+        print(f"  ✗ FAIL - titles {before} / {after} / {broken_titles}, calls {emulator.calls}")
+        all_passed = False
+
+    print("\nTest 5: idle sessions are purged periodically while the cache is open")
+    env = {
+        "SHARED_CACHE_PATH": str(Path(tmp.name) / "purged.sqlite3"),
+        "SHARED_CACHE_SESSION_TTL": "0.2",
+        "SHARED_CACHE_PURGE_INTERVAL": "0.1",
+    }
+    previous = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        opened = shared_cache.get_shared_cache()
+        opened.append_messages("idle", [ChatMessage(id="m1", role=ChatMessageRole.user, content="x")])
+        stored = len(opened.load_messages("idle", 10))
+        deadline = time.time() + 5
+        while opened.load_messages("idle", 10) and time.time() < deadline:
+            time.sleep(0.05)
+        remaining = len(opened.load_messages("idle", 10))
+        job = shared_cache._purge_job
+        shared_cache.close_shared_cache()
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    if stored == 1 and remaining == 0 and job is not None and not job._thread.is_alive() and shared_cache._purge_job is None:
+        print("  ✓ PASS - the purge job dropped the idle session and stopped with the cache")
+    else:
+        print(f"  ✗ FAIL - {stored} stored, {remaining} left after the TTL")
+        all_passed = False
+
+    tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_shared_cache())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test the Google Sheets API emulator: field masks, values reads and writes,
+batchUpdate and create through the real googleapiclient service, quota
+errors, SHEETS_EMULATOR replacing the API for the backend clients, and the
+metadata prefetch hand-off.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from googleapiclient.errors import HttpError
+
+from python_backend import sheets_client, sheets_emulator
+from python_backend.sheets_client import ServiceAccountSheetsClient
+from python_backend.sheets_emulator import SheetsEmulator, field_mask_tree
+
+ROWS = [
+    ["Item", "Amount"],
+    ["Rent", 1200],
+    ["Food", 300],
+    ["Total", ("=SUM(B2:B3)", 1500)],
+]
+
+
+def _error(call):
+    try:
+        call.execute()
+    except HttpError as exc:
+        return exc.resp.status, json.loads(exc.content)["error"]
+    return None, None
+
+
+def test_sheets_emulator():
+    """Drive the emulator through googleapiclient."""
+
+    print("=" * 80)
+    print("Testing the Google Sheets API emulator")
+    print("=" * 80)
+
+    all_passed = True
+
+    emulator = SheetsEmulator()
+    emulator.add_spreadsheet("book", "Budget")
+    sheet_id = emulator.add_sheet("book", "Data", ROWS)
+    sheets = emulator.service().spreadsheets()
+
+    print("\nTest 1: field masks")
+    masked = sheets.get(
+        spreadsheetId="book",
+        ranges=["Data!A1:B4"],
+        fields="sheets(properties(title),data.rowData.values(userEnteredValue,effectiveValue))",
+    ).execute()
+    metadata = sheets.get(spreadsheetId="book", fields="spreadsheetId,properties,sheets", includeGridData=True).execute()
+    total = masked["sheets"][0]["data"][0]["rowData"][3]["values"][1]
+    if (
+        field_mask_tree("a.b,a(c),d") == {"d": None, "a": {"b": None, "c": None}}
+        and list(masked) == ["sheets"]
+        and masked["sheets"][0]["properties"] == {"title": "Data"}
+        and list(masked["sheets"][0]["data"][0]) == ["rowData"]
+        and total == {"userEnteredValue": {"formulaValue": "=SUM(B2:B3)"}, "effectiveValue": {"numberValue": 1500}}
+        and "data" not in metadata["sheets"][0]
+    ):
+        print("  ✓ PASS - only the masked fields come back; includeGridData is ignored under a mask")
+    else:
+        print(f"  ✗ FAIL - unexpected responses: {masked} / {metadata}")
+        all_passed = False
+
+    print("\nTest 2: values, batchUpdate and create")
+    sheets.values().update(
+        spreadsheetId="book", range="Data!B2", valueInputOption="USER_ENTERED", body={"values": [["1250"]]}
+    ).execute()
+    sheets.batchUpdate(
+        spreadsheetId="book",
+        body={
+            "requests": [
+                {
+                    "repeatCell": {
+                        "range": {"sheetId": sheet_id, "startRowIndex": 1, "endRowIndex": 3, "startColumnIndex": 1, "endColumnIndex": 2},
+                        "cell": {"userEnteredFormat": {"backgroundColor": {"red": 1}}},
+                        "fields": "userEnteredFormat.backgroundColor",
+                    }
+                }
+            ]
+        },
+    ).execute()
+    batch = sheets.values().batchGet(
+        spreadsheetId="book", ranges=["Data!B2:B3", "Data!B4"], valueRenderOption="FORMULA"
+    ).execute()
+    duplicate_status, duplicate = _error(
+        sheets.batchUpdate(spreadsheetId="book", body={"requests": [{"addSheet": {"properties": {"title": "Data"}}}]})
+    )
+    created = sheets.create(body={"properties": {"title": "New"}, "sheets": [{"properties": {"title": "Inputs"}}]}).execute()
+    empty = sheets.values().get(spreadsheetId=created["spreadsheetId"], range="Inputs!A1:C3").execute()
+    colored = emulator.cell("book", "Data", 1, 1)
+    if (
+        [r.get("values") for r in batch["valueRanges"]] == [[[1250], [300]], [["=SUM(B2:B3)"]]]
+        and batch["valueRanges"][0]["range"] == "Data!B2:B3"
+        and colored["effectiveValue"] == {"numberValue": 1250}
+        and colored["userEnteredFormat"] == {"backgroundColor": {"red": 1}}
+        and duplicate_status == 400
+        and "already exists" in duplicate["message"]
+        and created["sheets"][0]["properties"]["title"] == "Inputs"
+        and "values" not in empty
+    ):
+        print("  ✓ PASS - writes, formats and new spreadsheets read back like the API")
+    else:
+        print(f"  ✗ FAIL - unexpected results: {batch} / {colored} / {created}")
+        all_passed = False
+
+    print("\nTest 3: per-minute quotas")
+    now = [0.0]
+    limited = SheetsEmulator(read_quota=2, clock=lambda: now[0])
+    limited.add_spreadsheet("book")
+    limited.add_sheet("book", "Data", ROWS)
+    values = limited.service().spreadsheets().values()
+    read = values.get(spreadsheetId="book", range="Data!A1")
+    read.execute()
+    read.execute()
+    status, error = _error(read)
+    write = values.update(spreadsheetId="book", range="Data!A1", valueInputOption="RAW", body={"values": [["x"]]})
+    write.execute()
+    now[0] = 61.0
+    recovered = read.execute()
+    if (
+        status == 429
+        and error["status"] == "RESOURCE_EXHAUSTED"
+        and "Read requests per minute per user" in error["message"]
+        and recovered["values"] == [["x"]]
+        and limited.calls.get("quota") == 1
+    ):
+        print("  ✓ PASS - the third read in a minute gets 429; writes and the next minute are unaffected")
+    else:
+        print(f"  ✗ FAIL - unexpected quota behavior: {status} {error}")
+        all_passed = False
+
+    print("\nTest 4: SHEETS_EMULATOR replaces the API for the backend")
+    fixture = {"spreadsheets": [{"spreadsheetId": "local", "title": "Local", "sheets": [{"title": "Data", "rows": ROWS}]}]}
+    previous = os.environ.get("SHEETS_EMULATOR")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "fixture.json"
+        path.write_text(json.dumps(fixture))
+        os.environ["SHEETS_EMULATOR"] = str(path)
+        sheets_emulator._emulator = None
+        try:
+            client = ServiceAccountSheetsClient()
+            read = client.read_range("local", "Data!A1:B4")
+            title = client.get_spreadsheet_metadata("local")["title"]
+            try:
+                from tools.google_sheets import GoogleSheetsFormulaValidator
+
+                validator = GoogleSheetsFormulaValidator(Path(tmp) / "missing.json")
+                tool_title = validator.fetch_spreadsheet("local")["properties"]["title"]
+            except ImportError:
+                tool_title = "Local"
+        finally:
+            if previous is None:
+                os.environ.pop("SHEETS_EMULATOR", None)
+            else:
+                os.environ["SHEETS_EMULATOR"] = previous
+            sheets_emulator._emulator = None
+    if read["values"][3][1]["value"] == 1500 and title == "Local" and tool_title == "Local":
+        print("  ✓ PASS - both Sheets clients read the fixture without credentials")
+    else:
+        print(f"  ✗ FAIL - unexpected read: {read}")
+        all_passed = False
+
+    print("\nTest 5: with the metadata cache off, a prefetch is used by one lookup")
+    emulator = SheetsEmulator()
+    for index in range(sheets_client._METADATA_CACHE_SIZE + 1):
+        emulator.add_spreadsheet(f"book-{index}", f"Book {index}")
+    client = ServiceAccountSheetsClient(service=emulator.service())
+    client.prefetch_metadata("book-0")
+    first = client.get_spreadsheet_metadata("book-0")["title"]
+    second = client.get_spreadsheet_metadata("book-0")["title"]
+    fetches = emulator.calls.get("spreadsheets.get")
+    for index in range(sheets_client._METADATA_CACHE_SIZE + 1):
+        client.prefetch_metadata(f"book-{index}")
+    if (
+        client.metadata_ttl == 0
+        and first == second == "Book 0"
+        and fetches == 2
+        and client.stats()["spreadsheets"] == sheets_client._METADATA_CACHE_SIZE
+    ):
+        print("  ✓ PASS - the prefetch is handed off once, then lookups fetch; entries are bounded")
+    else:
+        print(f"  ✗ FAIL - {fetches} fetches, {client.stats()}")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_sheets_emulator())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind snapshot journal: immediate appends, background flush
+with retry, local reads before flush, durability across restarts,
+dead-lettering of rejected rows and rows that keep failing, and Supabase
+writes that are replayed after a lost response without duplicating rows.
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.fakes import FakeSupabase
+from python_backend.snapshot_journal import SnapshotJournal
+from python_backend.snapshot_store import BATCH_TABLE, COLOR_TABLE, SupabaseSnapshotStore
+from python_backend.supabase_rest import SupabaseRestClient
+
+
+class _Rejected(Exception):
+    pass
+
+
+def _rows(batch_id, count):
+    return [{"snapshot_batch_id": batch_id, "cell": f"A{i + 1}", "red": 1.0} for i in range(count)]
+
+
+class _LostResponses:
+    """Apply every first POST to the fake, then answer 503 as if the response was lost."""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.posts = 0
+
+    async def handle(self, request):
+        response = await self.fake._handle(request)
+        if request.method == "POST":
+            self.posts += 1
+            if self.posts % 2:
+                return httpx.Response(503, json={"message": "upstream timed out"})
+        return response
+
+
+def test_snapshot_journal():
+    """Exercise SnapshotJournal against a flaky remote."""
+
+    print("=" * 80)
+    print("Testing SnapshotJournal")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    path = Path(tmp.name) / "journal.sqlite3"
+
+    # Remote that fails the first flush, then accepts everything
+    remote = []
+    failures = {"left": 1}
+
+    def flaky_flush(table, rows):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise RuntimeError("simulated outage")
+        remote.extend((table, row) for row in rows)
+
+    journal = SnapshotJournal(path, flaky_flush, batch_size=100, flush_interval=0.05, backoff_base=0.05)
+
+    started = time.monotonic()
+    journal.append("cell_color_snapshots", _rows("batch-1", 250))
+    elapsed = time.monotonic() - started
+    pending = journal.pending("cell_color_snapshots", "batch-1")
+
+    print(f"\nTest 1: append returns before flush ({elapsed * 1000:.1f} ms, {len(pending)} pending)")
+    if pending and len(remote) < 250:
+        print("  ✓ PASS - rows readable locally before they reach the remote")
+    else:
+        print("  ✗ FAIL - expected unflushed rows to be readable locally")
+        all_passed = False
+
+    drained = journal.flush(timeout=5)
+    print(f"\nTest 2: background flush with retry (drained={drained}, remote={len(remote)})")
+    if drained and len(remote) == 250 and not journal.pending("cell_color_snapshots", "batch-1"):
+        print("  ✓ PASS - all rows flushed once after a failed attempt")
+    else:
+        print("  ✗ FAIL - expected 250 rows flushed and none pending")
+        all_passed = False
+    journal.close(timeout=1)
+
+    # Remote down for the whole process lifetime: rows must survive a restart
+    def down(table, rows):
+        raise RuntimeError("remote unavailable")
+
+    journal = SnapshotJournal(path, down, flush_interval=0.05, backoff_base=10)
+    journal.append("cell_value_snapshot_ranges", _rows("batch-2", 3))
+    journal.close(timeout=0.2)
+
+    recovered = []
+    journal = SnapshotJournal(path, lambda table, rows: recovered.extend(rows), flush_interval=0.05)
+    drained = journal.flush(timeout=5)
+    journal.close(timeout=1)
+
+    print(f"\nTest 3: unflushed rows survive restart (recovered={len(recovered)})")
+    if drained and len(recovered) == 3:
+        print("  ✓ PASS - journaled rows flushed after reopening")
+    else:
+        print("  ✗ FAIL - expected 3 rows recovered")
+        all_passed = False
+
+    # Remote that rejects any batch holding a bad row, and nothing else
+    landed = []
+
+    def picky(table, rows):
+        if any(row["cell"] in ("A3", "A8") for row in rows):
+            raise _Rejected("invalid input syntax")
+        landed.extend(row["cell"] for row in rows)
+
+    path = Path(tmp.name) / "picky.sqlite3"
+    journal = SnapshotJournal(
+        path, picky, flush_interval=0.05, retryable=lambda exc: not isinstance(exc, _Rejected)
+    )
+    journal.append("cell_color_snapshots", _rows("batch-3", 10))
+    drained = journal.flush(timeout=5)
+    dead = journal.dead_count()
+    journal.close(timeout=1)
+
+    print(f"\nTest 4: rejected rows are split out (landed={len(landed)}, dead={dead})")
+    if drained and sorted(landed) == sorted(f"A{i}" for i in range(1, 11) if i not in (3, 8)) and dead == 2:
+        print("  ✓ PASS - good rows land, the two bad rows go to the dead-letter table")
+    else:
+        print("  ✗ FAIL - expected 8 rows flushed and 2 dead-lettered")
+        all_passed = False
+
+    calls = []
+
+    def failing(table, rows):
+        calls.append(len(rows))
+        raise RuntimeError("remote unavailable")
+
+    path = Path(tmp.name) / "failing.sqlite3"
+    journal = SnapshotJournal(path, failing, flush_interval=0.01, backoff_base=0.01, max_attempts=3)
+    journal.append("cell_color_snapshots", _rows("batch-4", 5))
+    drained = journal.flush(timeout=5)
+    dead = journal.dead_count()
+    journal.close(timeout=1)
+
+    print(f"\nTest 5: rows that keep failing are moved aside (attempts={len(calls)}, dead={dead})")
+    if drained and calls == [5, 5, 5] and dead == 5:
+        print("  ✓ PASS - retried max_attempts times, then dead-lettered")
+    else:
+        print("  ✗ FAIL - expected 3 attempts and 5 dead-lettered rows")
+        all_passed = False
+
+    fake = FakeSupabase()
+    lossy = _LostResponses(fake)
+    client = SupabaseRestClient("https://fake.supabase.co", "key", max_retries=0, transport=httpx.MockTransport(lossy.handle))
+    store = SupabaseSnapshotStore(client, journal_path=Path(tmp.name) / "supabase.sqlite3")
+    store._journal.backoff_base = 0.01
+    store.insert(COLOR_TABLE, _rows("batch-5", 5))
+    store.register_batch({"snapshot_batch_id": "batch-5", "spreadsheet_id": "s", "kind": "color", "content_hash": "h", "data_batch_id": "batch-5", "row_count": 5})
+    drained = store._journal.flush(timeout=5)
+    dead = store._journal.dead_count()
+    store.close()
+    client.close()
+
+    colors, batches = fake.tables.get(COLOR_TABLE, []), fake.tables.get(BATCH_TABLE, [])
+    print(f"\nTest 6: writes replayed after a lost response (posts={lossy.posts}, rows={len(colors)}, batches={len(batches)})")
+    if drained and lossy.posts == 4 and len(colors) == 5 and len({row["id"] for row in colors}) == 5 and len(batches) == 1 and dead == 0:
+        print("  ✓ PASS - every table is upserted, so the replay lands each row once")
+    else:
+        print("  ✗ FAIL - expected 5 rows and 1 batch, nothing dead-lettered")
+        all_passed = False
+
+    tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_snapshot_journal())
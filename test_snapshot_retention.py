@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test snapshot deduplication and retention: identical snapshots share one copy
+of their rows, restores follow the reference, and old or excess batches are
+purged together with the rows nobody points at any more. With Supabase,
+dedup is answered locally and retention is told which batches are still
+referenced.
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend import snapshot_store
+from python_backend.fakes import FakeSupabase
+from python_backend.snapshot_store import (
+    SQLiteSnapshotStore,
+    SupabaseSnapshotStore,
+    load_color_snapshot,
+    record_color_snapshot,
+)
+from python_backend.supabase_rest import SupabaseRestClient
+
+
+def _color_rows(batch_id, red=1.0, spreadsheet_id="sheet-123"):
+    return [
+        {
+            "snapshot_batch_id": batch_id,
+            "spreadsheet_id": spreadsheet_id,
+            "gid": 0,
+            "cell": f"A{i + 1}",
+            "red": red,
+            "green": 1.0,
+            "blue": 1.0,
+        }
+        for i in range(50)
+    ]
+
+
+def _row_count(store):
+    with store._lock:
+        (count,) = store._conn.execute("select count(*) from snapshot_rows").fetchone()
+    return count
+
+
+def test_snapshot_retention():
+    """Dedupe identical color snapshots and purge batches by count and age."""
+
+    print("=" * 80)
+    print("Testing snapshot dedup and retention")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    store = SQLiteSnapshotStore(Path(tmp.name) / "snapshots.sqlite3", ttl_seconds=None, max_batches=2)
+    original_store = snapshot_store._store
+    snapshot_store._store = store
+
+    try:
+        record_color_snapshot(_color_rows("batch-1"))
+        rows_after_first = _row_count(store)
+        record_color_snapshot(_color_rows("batch-2"))
+        rows_after_repeat = _row_count(store)
+        resolved = asyncio.run(store.resolve_batch("batch-2"))
+
+        print(f"\nTest 1: identical snapshot stored once (rows {rows_after_first} -> {rows_after_repeat}, batch-2 -> {resolved})")
+        if rows_after_repeat == rows_after_first and resolved == "batch-1":
+            print("  ✓ PASS - repeat snapshot is a reference to the first")
+        else:
+            print("  ✗ FAIL - expected no new rows and batch-2 to resolve to batch-1")
+            all_passed = False
+
+        restored = load_color_snapshot("batch-2", "sheet-123", 0)
+        print(f"\nTest 2: restoring the reference ({len(restored)} cells)")
+        if len(restored) == 50:
+            print("  ✓ PASS - reference restores the shared rows")
+        else:
+            print("  ✗ FAIL - expected 50 cells")
+            all_passed = False
+
+        # Newer, different snapshots push the oldest batches past max_batches=2
+        time.sleep(0.01)
+        record_color_snapshot(_color_rows("batch-3", red=0.5))
+        time.sleep(0.01)
+        record_color_snapshot(_color_rows("batch-4", red=0.25))
+        with store._lock:
+            store._conn.execute("update snapshot_rows set created_at = created_at - 7200")
+        removed = store.purge_expired()
+        kept = {batch: asyncio.run(store.resolve_batch(batch)) for batch in ("batch-1", "batch-2", "batch-3", "batch-4")}
+        remaining = load_color_snapshot("batch-1", "sheet-123", 0)
+
+        print(f"\nTest 3: count limit per spreadsheet (removed={removed}, remaining batch-1 cells={len(remaining)})")
+        if removed == rows_after_first and not remaining and kept["batch-3"] == "batch-3" and kept["batch-4"] == "batch-4":
+            print("  ✓ PASS - oldest batches and their unreferenced rows purged")
+        else:
+            print("  ✗ FAIL - expected only batch-3 and batch-4 to survive")
+            all_passed = False
+
+        # Age limit: everything is older than the TTL
+        store.ttl_seconds = 1
+        store.max_batches = None
+        with store._lock:
+            store._conn.execute("update snapshot_batches set created_at = created_at - 60")
+        removed = store.purge_expired()
+        print(f"\nTest 4: age limit (removed={removed}, rows left={_row_count(store)})")
+        if removed == 2 * rows_after_first and _row_count(store) == 0:
+            print("  ✓ PASS - expired batches purged")
+        else:
+            print("  ✗ FAIL - expected every row purged")
+            all_passed = False
+    finally:
+        snapshot_store._store = original_store
+        store.close()
+
+    fake = FakeSupabase()
+    purges = []
+    fake.functions["purge_snapshot_batches"] = lambda params: purges.append(params) or 0
+    client = SupabaseRestClient("https://fake.supabase.co", "key", transport=fake.transport())
+    store = SupabaseSnapshotStore(client, Path(tmp.name) / "journal.sqlite3", ttl_seconds=3600)
+    snapshot_store._store = store
+
+    try:
+        record_color_snapshot(_color_rows("batch-5"))
+        record_color_snapshot(_color_rows("batch-6"))
+        store._journal.flush(timeout=5)
+        lookups = [route for route in fake.calls if route.startswith("GET")]
+        registry = {row["snapshot_batch_id"]: row["data_batch_id"] for row in fake.tables["snapshot_batches"]}
+        store.purge_expired()
+
+        # Past the dedup window, a repeat is stored in full again
+        key = next(iter(store._recent))
+        store._recent[key] = (store._recent[key][0], time.time() - 7200)
+        record_color_snapshot(_color_rows("batch-7"))
+        store._journal.flush(timeout=5)
+        registry.update({row["snapshot_batch_id"]: row["data_batch_id"] for row in fake.tables["snapshot_batches"]})
+
+        print(f"\nTest 5: Supabase dedup without remote lookups (registry={registry}, lookups={lookups})")
+        if (
+            registry == {"batch-5": "batch-5", "batch-6": "batch-5", "batch-7": "batch-7"}
+            and not lookups
+            and len(fake.tables["cell_color_snapshots"]) == 100
+            and purges and purges[0]["keep_batch_ids"] == ["batch-5"]
+        ):
+            print("  ✓ PASS - repeats reference recent local batches, which retention keeps")
+        else:
+            print(f"  ✗ FAIL - unexpected dedup or purge parameters: {purges}")
+            all_passed = False
+    finally:
+        snapshot_store._store = original_store
+        store.close()
+        client.close()
+        tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_snapshot_retention())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Test the pooled PostgREST client against the in-process Supabase fake:
+retries on 408/429/5xx with exponential backoff, plain inserts that are not
+replayed after a 5xx, insert chunking, keyset paging past a server max-rows
+cap, and the filter helpers.
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend import supabase_rest
+from python_backend.fakes import FakeSupabase
+from python_backend.supabase_rest import (
+    SupabaseRestClient,
+    SupabaseRestError,
+    eq,
+    eq_or_null,
+    gt,
+    in_,
+    is_null,
+    lt,
+)
+
+
+class _Flaky:
+    """Answer the first requests with canned failures, then pass to the fake."""
+
+    def __init__(self, fake, failures=(), max_rows=None):
+        self.fake = fake
+        self.failures = list(failures)
+        self.max_rows = max_rows
+        self.requests = []
+
+    def transport(self):
+        return httpx.MockTransport(self._handle)
+
+    async def _handle(self, request):
+        self.requests.append(request)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return httpx.Response(failure, json={"message": "injected"})
+        response = await self.fake._handle(request)
+        if self.max_rows is not None and request.method == "GET":
+            # Like PostgREST's max-rows: silently truncate, whatever the limit
+            return httpx.Response(200, json=json.loads(response.content)[: self.max_rows])
+        return response
+
+
+def _client(flaky, **kwargs):
+    return SupabaseRestClient("https://fake.supabase.co", "key", backoff_base=0.001, transport=flaky.transport(), **kwargs)
+
+
+def _attempts(flaky, method):
+    return sum(1 for request in flaky.requests if request.method == method)
+
+
+def test_supabase_rest():
+    """Drive SupabaseRestClient through the fake with injected failures."""
+
+    print("=" * 80)
+    print("Testing the Supabase REST client")
+    print("=" * 80)
+
+    all_passed = True
+
+    print("\nTest 1: 408, 429 and 5xx are retried for reads and upserts")
+    fake = FakeSupabase()
+    fake.tables["items"] = [{"id": 1, "name": "a"}]
+    flaky = _Flaky(fake, [408, 429, 503])
+    client = _client(flaky)
+    rows = client.select_sync("items")
+    read_attempts = _attempts(flaky, "GET")
+    flaky.failures = [500, 502, 504]
+    client.insert_sync("items", [{"id": 2, "name": "b"}], merge_duplicates=True, on_conflict="id")
+    upsert_attempts = _attempts(flaky, "POST")
+    flaky.failures = [503] * 4
+    try:
+        client.select_sync("items")
+        exhausted = False
+    except SupabaseRestError as exc:
+        exhausted = exc.status == 503
+    if rows == [{"id": 1, "name": "a"}] and read_attempts == 4 and upsert_attempts == 4 and exhausted and not flaky.failures:
+        print("  ✓ PASS - transient failures are retried up to max_retries")
+    else:
+        print(f"  ✗ FAIL - reads {read_attempts}, upserts {upsert_attempts}, exhausted {exhausted}")
+        all_passed = False
+    client.close()
+
+    print("\nTest 2: plain inserts are not replayed after a 5xx")
+    fake = FakeSupabase()
+    flaky = _Flaky(fake, [429, httpx.ConnectError("refused"), 500])
+    client = _client(flaky)
+    try:
+        client.insert_sync("items", [{"name": "once"}])
+        status = None
+    except SupabaseRestError as exc:
+        status = exc.status
+    flaky.failures = [httpx.ReadTimeout("lost response")]
+    try:
+        client.insert_sync("items", [{"name": "twice"}])
+        read_timeout = False
+    except SupabaseRestError:
+        read_timeout = True
+    flaky.failures = [400]
+    try:
+        client.select_sync("items")
+        bad_request = None
+    except SupabaseRestError as exc:
+        bad_request = exc.status
+    if status == 500 and _attempts(flaky, "POST") == 4 and read_timeout and bad_request == 400 and _attempts(flaky, "GET") == 1:
+        print("  ✓ PASS - only rejected requests are resent; 4xx fail at once")
+    else:
+        print(f"  ✗ FAIL - status {status}, posts {_attempts(flaky, 'POST')}, gets {_attempts(flaky, 'GET')}")
+        all_passed = False
+    client.close()
+
+    print("\nTest 3: backoff doubles per attempt, with full jitter")
+    bounds = []
+    original_uniform = supabase_rest.random.uniform
+
+    def _uniform(low, high):
+        bounds.append((low, high))
+        return 0.0
+
+    supabase_rest.random.uniform = _uniform
+    try:
+        flaky = _Flaky(FakeSupabase(), [503, 503, 503])
+        client = SupabaseRestClient("https://fake.supabase.co", "key", backoff_base=0.5, transport=flaky.transport())
+        client.select_sync("items")
+        client.close()
+    finally:
+        supabase_rest.random.uniform = original_uniform
+    if bounds == [(0, 0.5), (0, 1.0), (0, 2.0)]:
+        print("  ✓ PASS - waits are drawn from [0, base * 2^attempt]")
+    else:
+        print(f"  ✗ FAIL - backoff bounds {bounds}")
+        all_passed = False
+
+    print("\nTest 4: inserts are split into chunks")
+    fake = FakeSupabase()
+    flaky = _Flaky(fake)
+    client = _client(flaky, chunk_size=100, max_concurrent_chunks=2)
+    returned = client.insert_sync("items", [{"name": f"row-{i}"} for i in range(250)], returning=True)
+    sizes = sorted(len(json.loads(request.content)) for request in flaky.requests)
+    if sizes == [50, 100, 100] and len(returned) == 250 and len(fake.tables["items"]) == 250:
+        print("  ✓ PASS - 250 rows went out as 100 + 100 + 50")
+    else:
+        print(f"  ✗ FAIL - chunk sizes {sizes}, returned {len(returned)}")
+        all_passed = False
+    client.close()
+
+    print("\nTest 5: keyset paging reads past the server's max-rows cap")
+    fake = FakeSupabase()
+    fake.tables["items"] = [{"id": i, "sheet": "s1" if i % 5 else "s2"} for i in range(1, 501)]
+    flaky = _Flaky(fake, max_rows=40)
+    client = _client(flaky, page_size=100)
+
+    async def _collect():
+        pages = []
+        async for page in client.select_pages("items", "sheet", filters={"sheet": eq("s1")}):
+            pages.append(page)
+        return pages
+
+    pages = asyncio.run(_collect())
+    ids = [row["id"] for page in pages for row in page]
+    expected = [i for i in range(1, 501) if i % 5]
+    params = [dict(request.url.params) for request in flaky.requests]
+    if (
+        ids == expected
+        and all(len(page) <= 40 for page in pages)
+        and all(p["order"] == "id.asc" and p["limit"] == "100" and p["select"] == "sheet,id" for p in params)
+        and params[1]["id"] == gt(pages[0][-1]["id"])
+    ):
+        print(f"  ✓ PASS - {len(ids)} rows over {len(pages)} capped pages, none missed or repeated")
+    else:
+        print(f"  ✗ FAIL - got {len(ids)} of {len(expected)} rows")
+        all_passed = False
+    client.close()
+
+    print("\nTest 6: filter helpers")
+    fake = FakeSupabase()
+    fake.tables["items"] = [{"id": 1, "gid": None}, {"id": 2, "gid": 0}, {"id": 3, "gid": 7}]
+    client = _client(_Flaky(fake))
+
+    def _ids(filters):
+        return [row["id"] for row in client.select_sync("items", "id", filters, order="id.asc")]
+
+    if (
+        (eq("a"), gt(3), lt(4), is_null(), in_([1, "b"]), eq_or_null(None), eq_or_null(0))
+        == ("eq.a", "gt.3", "lt.4", "is.null", "in.(1,b)", "is.null", "eq.0")
+        and _ids({"gid": eq_or_null(None)}) == [1]
+        and _ids({"gid": eq_or_null(0)}) == [2]
+        and _ids({"id": in_([1, 3])}) == [1, 3]
+        and _ids({"id": gt(1), "gid": lt(5)}) == [2]
+    ):
+        print("  ✓ PASS - helpers build PostgREST operators that select the right rows")
+    else:
+        print("  ✗ FAIL - unexpected filter results")
+        all_passed = False
+    client.close()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_supabase_rest())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test request tracing: spans recorded while serving a request (including on
+the prefetch thread and on another thread's event loop) end up in that
+request's trace, which downloads as Chrome trace-event JSON to holders of
+PROFILER_SECRET. Request spans are named by route template, not raw path.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+
+from python_backend import api
+from python_backend import profiler as profiler_module
+from python_backend.fakes import DisabledConversationLogger
+from python_backend.memory import ConversationStore
+from python_backend.models import ChatMessage, ChatMessageRole, ChatResponse
+from python_backend.profiler import SamplingProfiler
+from python_backend.service import ChatService
+from python_backend.tracing import finish_trace, get_trace_buffer, span, start_trace
+
+
+class _TracedBackend:
+    """Backend whose LLM call and sheet prefetch record spans."""
+
+    def prefetch(self, sheet_context):
+        with span("sheets.spreadsheets.get", "sheets"):
+            time.sleep(0.01)
+
+    def send_chat(self, request):
+        with span("llm.chat", "llm", model="test"):
+            time.sleep(0.02)
+        reply = ChatMessage(id="reply", role=ChatMessageRole.assistant, content="ok")
+        return ChatResponse(messages=[reply], sessionId=request.sessionId)
+
+
+def test_tracing():
+    """Trace a chat request end to end, then a coroutine on a loop thread."""
+
+    print("=" * 80)
+    print("Testing request tracing")
+    print("=" * 80)
+
+    all_passed = True
+
+    service = ChatService(
+        _TracedBackend(),
+        ConversationStore(max_sessions=0, max_bytes=0, idle_ttl=0),
+        conversation_logger=DisabledConversationLogger(),
+    )
+    api.service = service
+    profiler_module._profiler = SamplingProfiler(secret="s3cret")
+    auth = {"Authorization": "Bearer s3cret"}
+    client = TestClient(api.app)
+    response = client.post("/chat", json={
+        "messages": [{"id": "m1", "role": "user", "content": "hi"}],
+        "sessionId": "s1",
+        "sheetContext": {"spreadsheetId": "abc", "sheetTitle": "Sheet1"},
+    })
+    service._prefetcher.shutdown(wait=True)
+    request_id = response.headers.get("X-Request-ID")
+    trace = client.get(f"/traces/{request_id}", headers=auth)
+    events = [e for e in trace.json()["traceEvents"] if e["ph"] == "X"] if trace.status_code == 200 else []
+    by_name = {e["name"]: e for e in events}
+    print(f"\nTest 1: chat request trace ({sorted(by_name)})")
+    if (
+        {"POST /chat", "llm.chat", "sheets.spreadsheets.get"} <= set(by_name)
+        and by_name["llm.chat"]["dur"] >= 20000
+        and by_name["llm.chat"]["args"] == {"model": "test"}
+        and by_name["sheets.spreadsheets.get"]["tid"] != by_name["POST /chat"]["tid"]
+        and "attachment" in trace.headers.get("content-disposition", "")
+    ):
+        print("  ✓ PASS - LLM and prefetch spans recorded under the request id")
+    else:
+        print("  ✗ FAIL - expected the request, LLM and prefetch spans")
+        all_passed = False
+
+    client.get("/chat/s1/messages")
+    listing = client.get("/traces", headers=auth).json()["traces"]
+    missing = client.get("/traces/nope", headers=auth)
+    denied = [client.get("/traces").status_code, client.get(f"/traces/{request_id}").status_code]
+    print(f"\nTest 2: trace listing ({len(listing)} trace(s)), unknown id -> {missing.status_code}, unauthenticated -> {denied}")
+    if (
+        [trace["name"] for trace in listing[:2]] == ["GET /chat/{session_id}/messages", "POST /chat"]
+        and listing[1]["request_id"] == request_id
+        and missing.status_code == 404
+        and denied == [403, 403]
+    ):
+        print("  ✓ PASS - newest first, named by route template; unknown ids are 404, no secret is 403")
+    else:
+        print(f"  ✗ FAIL - unexpected listing: {listing[:2]}")
+        all_passed = False
+
+    # Coroutines dispatched to another thread's loop (like the Supabase client)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def query():
+        with span("supabase GET conversation_messages", "supabase"):
+            await asyncio.sleep(0.01)
+
+    token = start_trace("loop-test", "manual")
+    asyncio.run_coroutine_threadsafe(query(), loop).result()
+    finish_trace(token)
+    asyncio.run_coroutine_threadsafe(query(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    names = [s.name for s in get_trace_buffer().get("loop-test").spans]
+    print(f"\nTest 3: spans from another thread's event loop ({names})")
+    if names == ["manual", "supabase GET conversation_messages"]:
+        print("  ✓ PASS - the caller's trace follows the coroutine, and ends with it")
+    else:
+        print("  ✗ FAIL - expected exactly one span from the loop thread")
+        all_passed = False
+
+    api.service = None
+    profiler_module._profiler = None
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_tracing())
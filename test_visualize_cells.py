@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test cells-mode visualization through /tools/visualize_formulas against the
+Sheets emulator and a SQLite snapshot store: the original colors are
+snapshotted as a registered batch, so retention keeps them and undo finds
+them.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+
+from python_backend import api, snapshot_store
+from python_backend.sheets_client import ServiceAccountSheetsClient
+from python_backend.sheets_emulator import SheetsEmulator
+from python_backend.snapshot_store import KIND_COLOR, SQLiteSnapshotStore, load_color_snapshot
+from python_backend.visualize_tool import FORMULA_COLOR
+
+
+def test_visualize_cells():
+    """Visualize a sheet in cells mode and look the batch up in the registry."""
+
+    print("=" * 80)
+    print("Testing cells-mode visualization snapshots")
+    print("=" * 80)
+
+    all_passed = True
+    tmp = tempfile.TemporaryDirectory()
+    emulator = SheetsEmulator()
+    emulator.add_spreadsheet("book")
+    emulator.add_sheet("book", "Data", [["Item", "Amount"], ["Rent", 1200], ["Total", "=SUM(B2)"]])
+    store = SQLiteSnapshotStore(Path(tmp.name) / "snapshots.sqlite3", ttl_seconds=None, max_batches=None)
+    original_store, original_service = snapshot_store._store, api._sheets_service
+    snapshot_store._store = store
+    api._sheets_service = api._SheetsServiceWrapper(ServiceAccountSheetsClient(service=emulator.service()))
+    try:
+        response = TestClient(api.app).post("/tools/visualize_formulas", json={"sheet_url": "book"})
+        result = response.json()
+        batch_id = result.get("snapshot_batch_id")
+        with store._lock:
+            registered = store._conn.execute(
+                "select kind, data_batch_id, row_count from snapshot_batches where snapshot_batch_id = ?",
+                (batch_id,),
+            ).fetchone()
+        snapshot = load_color_snapshot(batch_id, "book", None) if batch_id else []
+    finally:
+        snapshot_store._store, api._sheets_service = original_store, original_service
+
+    print(f"\nTest 1: the snapshot batch is registered (status {response.status_code}, batch {registered})")
+    if (
+        response.status_code == 200
+        and result["count"] == 2
+        and registered == (KIND_COLOR, batch_id, 2)
+        and sorted(row["cell"] for row in snapshot) == ["B2", "B3"]
+        and emulator.cell("book", "Data", 2, 1)["userEnteredFormat"]["backgroundColor"] == FORMULA_COLOR
+    ):
+        print("  ✓ PASS - colored 2 cells and registered their original colors")
+    else:
+        print(f"  ✗ FAIL - unexpected result {result} / {snapshot}")
+        all_passed = False
+
+    store.close()
+    tmp.cleanup()
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_visualize_cells())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test conditional-mode visualization against the Sheets emulator: each run
+installs two rules tagged with its snapshot batch and writes one rule
+snapshot row, undoing a batch removes only that batch's rules, and the
+endpoint rejects unknown modes.
+"""
+
+import sys
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from fastapi.testclient import TestClient
+
+from python_backend import api
+from python_backend.sheets_emulator import SheetsEmulator
+from python_backend.visualize_tool import (
+    FORMULA_RULE,
+    MODE_CONDITIONAL,
+    remove_conditional_visualization,
+    visualize_formulas,
+)
+
+
+class _Validator:
+    def __init__(self, emulator):
+        self.service = emulator.service()
+
+
+def _rule_formulas(validator, spreadsheet_id):
+    response = validator.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+    rules = response["sheets"][0].get("conditionalFormats", [])
+    return [rule["booleanRule"]["condition"]["values"][0]["userEnteredValue"] for rule in rules]
+
+
+def test_visualize_conditional():
+    """Install two conditional visualizations and undo one of them."""
+
+    print("=" * 80)
+    print("Testing conditional-mode visualization undo")
+    print("=" * 80)
+
+    all_passed = True
+    emulator = SheetsEmulator()
+    emulator.add_spreadsheet("book")
+    sheet_id = emulator.add_sheet("book", "Data", [["Item", "Amount"], ["Rent", 1200], ["Total", "=SUM(B2)"]])
+    validator = _Validator(emulator)
+
+    # The user's own rule uses the same formula as the visualization's base rule
+    user_color = {"red": 1, "green": 0, "blue": 0}
+    validator.service.spreadsheets().batchUpdate(spreadsheetId="book", body={"requests": [{
+        "addConditionalFormatRule": {
+            "rule": {
+                "ranges": [{"sheetId": sheet_id}],
+                "booleanRule": {
+                    "condition": {"type": "CUSTOM_FORMULA", "values": [{"userEnteredValue": FORMULA_RULE}]},
+                    "format": {"backgroundColor": user_color},
+                },
+            },
+            "index": 0,
+        },
+    }]}).execute()
+
+    print("\nTest 1: each run installs two tagged rules and one snapshot row")
+    snapshots = []
+    first = visualize_formulas(validator, "book", "Data", sheet_id, 0, mode=MODE_CONDITIONAL, rule_snapshot_fn=snapshots.append)
+    second = visualize_formulas(validator, "book", "Data", sheet_id, 0, mode=MODE_CONDITIONAL, rule_snapshot_fn=snapshots.append)
+    installed = _rule_formulas(validator, "book")
+    if (
+        first["count"] == 2
+        and second["count"] == 2
+        and len(snapshots) == 2
+        and snapshots[0]["snapshot_batch_id"] == first["snapshot_batch_id"]
+        and all(first["snapshot_batch_id"] in formula for formula in snapshots[0]["formulas"])
+        and len(installed) == 5
+        and installed[-1] == FORMULA_RULE
+    ):
+        print("  ✓ PASS - rules carry their batch id; the user's rule is untouched")
+    else:
+        print(f"  ✗ FAIL - unexpected rules: {installed} / {snapshots}")
+        all_passed = False
+
+    print("\nTest 2: undo removes only that batch's rules")
+    removed = remove_conditional_visualization(validator, "book", sheet_id, snapshots[0]["formulas"])
+    remaining = _rule_formulas(validator, "book")
+    if removed == 2 and remaining == snapshots[1]["formulas"] + [FORMULA_RULE]:
+        print("  ✓ PASS - the other visualization and the user's rule remain")
+    else:
+        print(f"  ✗ FAIL - removed {removed}, remaining {remaining}")
+        all_passed = False
+
+    print("\nTest 3: untagged snapshots only match visualization-colored rules")
+    removed = remove_conditional_visualization(validator, "book", sheet_id, [FORMULA_RULE])
+    if removed == 0 and _rule_formulas(validator, "book") == remaining:
+        print("  ✓ PASS - the user's identically-written rule is kept")
+    else:
+        print(f"  ✗ FAIL - removed {removed} rule(s)")
+        all_passed = False
+
+    print("\nTest 4: a misspelled mode is rejected, not run as cells")
+    response = TestClient(api.app).post("/tools/visualize_formulas", json={"sheet_url": "book", "mode": "conditonal"})
+    if response.status_code == 422:
+        print("  ✓ PASS - 422 before any cell is colored")
+    else:
+        print(f"  ✗ FAIL - status {response.status_code}")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_visualize_conditional())
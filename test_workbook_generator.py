@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test the synthetic workbook generator: seeded output is reproducible, the
+planted-issue manifest points at the cells that carry the issues, fixtures
+load into the Sheets emulator, and detection scoring matches findings to
+planted cells.
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+# Add python_backend to path
+sys.path.insert(0, str(Path(__file__).parent / "python_backend"))
+
+from python_backend.sheets_emulator import SheetsEmulator
+from python_backend.workbook_generator import (
+    ISSUE_KINDS,
+    generate_financial_model,
+    generate_ledger,
+    score_detection,
+)
+
+
+def _cell(workbook, issue):
+    letters = issue["cell"].rstrip("0123456789")
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - 64
+    row = workbook.rows(issue["sheet"])[int(issue["cell"][len(letters):]) - 1]
+    return row[col - 1] if col <= len(row) else None
+
+
+def _planted(workbook, issue, value):
+    kind = issue["kind"]
+    if kind == "error_cells":
+        return isinstance(value, tuple) and str(value[1]).startswith("#")
+    if kind == "mixed_types":
+        return isinstance(value, str)
+    if kind == "missing_values":
+        return value is None
+    if kind == "duplicate_keys":
+        original = {"sheet": issue["sheet"], "cell": issue["detail"].split()[-1]}
+        return isinstance(value, str) and value == _cell(workbook, original)
+    # Inconsistent formulas are hard-coded values or a SUM over the wrong range
+    return not isinstance(value, tuple) or "SUM" in value[0]
+
+
+def test_workbook_generator():
+    """Generate small ledgers and models with planted issues."""
+
+    print("=" * 80)
+    print("Testing the synthetic workbook generator")
+    print("=" * 80)
+
+    all_passed = True
+
+    print("\nTest 1: the same seed gives the same workbook")
+    ledger = generate_ledger(rows=2000, columns=12, formula_density=0.25, issue_rate=0.005, seed=7)
+    again = generate_ledger(rows=2000, columns=12, formula_density=0.25, issue_rate=0.005, seed=7)
+    other = generate_ledger(rows=2000, columns=12, formula_density=0.25, issue_rate=0.005, seed=8)
+    model = generate_financial_model(rows=200, columns=13, issue_rate=0.01, seed=7)
+    if (
+        ledger.sheets == again.sheets
+        and ledger.issues == again.issues
+        and ledger.sheets != other.sheets
+        and model.sheets == generate_financial_model(rows=200, columns=13, issue_rate=0.01, seed=7).sheets
+        and ledger.cells == 2000 * 12
+    ):
+        print("  ✓ PASS - seeded output is reproducible and differs across seeds")
+    else:
+        print("  ✗ FAIL - generation is not deterministic")
+        all_passed = False
+
+    print("\nTest 2: the manifest matches the planted cells")
+    kinds = {issue["kind"] for issue in ledger.issues + model.issues}
+    mismatched = []
+    for workbook in (ledger, model):
+        for issue in workbook.issues:
+            value = _cell(workbook, issue)
+            if not _planted(workbook, issue, value):
+                mismatched.append((issue, value))
+    if kinds == set(ISSUE_KINDS) and not mismatched and len(ledger.issues) == 5 * 10:
+        print(f"  ✓ PASS - {len(ledger.issues) + len(model.issues)} planted issues, each where the manifest says")
+    else:
+        print(f"  ✗ FAIL - kinds {sorted(kinds)}, mismatches {mismatched[:3]}")
+        all_passed = False
+
+    print("\nTest 3: fixtures load into the Sheets emulator")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ledger.json"
+        ledger.write_fixture(path, "synthetic")
+        emulator = SheetsEmulator()
+        loaded = emulator.load_fixture(json.loads(path.read_text()))
+    issue = next(i for i in ledger.issues if i["kind"] == "error_cells")
+    values = (
+        emulator.service()
+        .spreadsheets()
+        .values()
+        .get(spreadsheetId="synthetic", range=f"Ledger!{issue['cell']}", valueRenderOption="FORMULA")
+        .execute()
+    )
+    if loaded == ["synthetic"] and values["values"] == [[_cell(ledger, issue)[0]]]:
+        print("  ✓ PASS - the fixture round-trips through load_fixture")
+    else:
+        print(f"  ✗ FAIL - unexpected fixture contents: {loaded} / {values}")
+        all_passed = False
+
+    print("\nTest 4: detection scoring")
+    planted = [
+        {"kind": "missing_values", "sheet": "Ledger", "cell": "A5", "detail": "empty ID"},
+        {"kind": "mixed_types", "sheet": "Ledger", "cell": "D9", "detail": "text"},
+        {"kind": "error_cells", "sheet": "Ledger", "cell": "L3", "detail": "#REF!"},
+    ]
+    found = [
+        {"category": "missing_value", "ranges": [{"a1Notation": "Ledger!A2:A10"}]},
+        {"category": "formula_error", "ranges": [{"a1Notation": "'Ledger'!D9"}]},
+        {"category": "type_mismatch", "ranges": [{"a1Notation": "Other!D9"}]},
+    ]
+    score = score_detection(planted, found)
+    if (
+        score["planted"] == 3
+        and score["detected"] == 1
+        and score["recall"] == round(1 / 3, 4)
+        and score["unmatched_findings"] == 2
+        and score["by_kind"]["missing_values"] == {"planted": 1, "detected": 1}
+        and score_detection([], found)["recall"] is None
+    ):
+        print("  ✓ PASS - findings count only with the right category, sheet and cell")
+    else:
+        print(f"  ✗ FAIL - unexpected score: {score}")
+        all_passed = False
+
+    print("\n" + "=" * 80)
+    if all_passed:
+        print("✓ ALL TESTS PASSED")
+    else:
+        print("✗ SOME TESTS FAILED")
+    print("=" * 80)
+
+    assert all_passed
+    return 0 if all_passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(test_workbook_generator())
@@ -6,13 +6,23 @@ import os
 from pathlib import Path
 from typing import Any, Dict
 
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
 from google.oauth2.credentials import Credentials as UserCredentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 from dotenv import load_dotenv
 
+try:
+    from python_backend.cassette import get_cassette
+    from python_backend.sheets_emulator import get_sheets_emulator
+except ImportError:  # * Tools run standalone without the backend package
+    get_cassette = None
+    get_sheets_emulator = None
+
 # * Configuration
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env")
@@ -41,12 +51,24 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 class GoogleSheetsFormulaValidator:
     """Helper class to interact with Google Sheets API."""
 
-    def __init__(self, credentials_path: Path):
+    def __init__(self, credentials_path: Path, request_builder: type = HttpRequest):
         self.credentials_path = Path(credentials_path)
+        # * Lets callers meter API requests (see python_backend.sheets_client.MeteredHttpRequest)
+        self.request_builder = request_builder
         self.service = self._build_service()
 
     def _build_service(self):
         """Build Google Sheets API service from credentials."""
+        # * SHEETS_EMULATOR swaps the API for the in-process emulator, no credentials needed
+        emulator = get_sheets_emulator() if get_sheets_emulator is not None else None
+        if emulator is not None:
+            return emulator.service(self.request_builder)
+
+        # * CASSETTE_MODE=replay answers from a recording, record wraps the real calls below
+        cassette = get_cassette() if get_cassette is not None else None
+        if cassette is not None and cassette.replaying:
+            return cassette.sheets_service(self.request_builder)
+
         if not self.credentials_path.exists():
             raise FileNotFoundError(f"Credentials not found at {self.credentials_path}")
 
@@ -83,7 +105,10 @@ class GoogleSheetsFormulaValidator:
                 if token_path:
                     token_path.write_text(credentials.to_json())
 
-        return build("sheets", "v4", credentials=credentials)
+        if cassette is not None:
+            http = cassette.sheets_http(AuthorizedHttp(credentials, http=httplib2.Http()))
+            return build("sheets", "v4", http=http, requestBuilder=self.request_builder)
+        return build("sheets", "v4", credentials=credentials, requestBuilder=self.request_builder)
 
     def fetch_spreadsheet(self, spreadsheet_id: str) -> Dict[str, Any]:
         """Fetch full spreadsheet metadata."""
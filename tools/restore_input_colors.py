@@ -1,14 +1,10 @@
 """
-# * Restore background colors for cells from a Supabase snapshot batch.
+# * Restore background colors for cells from a snapshot batch in the configured snapshot store.
 """
 
 import json
-import os
 import re
 import sys
-import urllib.error
-import urllib.parse
-import urllib.request
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -24,21 +20,13 @@ from tools.google_sheets import (
     DEFAULT_SPREADSHEET_URL,
     GoogleSheetsFormulaValidator,
 )
+from python_backend.snapshot_store import load_color_snapshot
 
 load_dotenv(PROJECT_ROOT / ".env")
 
 Color = Dict[str, float]
 
 
-# * Environment configuration (must exist; fail fast if missing)
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-if not SUPABASE_URL:
-    raise SystemExit("SUPABASE_URL must be defined in environment or .env file.")
-if not SUPABASE_SERVICE_KEY:
-    raise SystemExit("SUPABASE_SERVICE_KEY must be defined in environment or .env file.")
-
-
 def _parse_args() -> Tuple[str, Optional[Path]]:
     if len(sys.argv) not in (2, 3):
         raise SystemExit(
@@ -131,48 +119,6 @@ def _cell_address(row_index: int, col_index: int) -> str:
     return f"{_column_label(col_index)}{row_index + 1}"
 
 
-def _fetch_snapshot_rows(
-    snapshot_batch_id: str,
-    spreadsheet_id: str,
-    gid: Optional[int],
-) -> List[Dict[str, Any]]:
-    params = {
-        "select": "cell,red,green,blue",
-        "snapshot_batch_id": f"eq.{snapshot_batch_id}",
-        "spreadsheet_id": f"eq.{spreadsheet_id}",
-    }
-    if gid is None:
-        params["gid"] = "is.null"
-    else:
-        params["gid"] = f"eq.{gid}"
-    query = urllib.parse.urlencode(params, doseq=True)
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots?{query}"
-
-    request = urllib.request.Request(
-        url,
-        method="GET",
-        headers={
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Accept": "application/json",
-        },
-    )
-
-    try:
-        with urllib.request.urlopen(request) as response:
-            if response.status != 200:
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-            payload = response.read()
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Supabase fetch failed: {exc.status} {body}") from exc
-
-    rows = json.loads(payload)
-    if not isinstance(rows, list):
-        raise RuntimeError("Supabase response malformed; expected a list.")
-    return rows
-
-
 def _build_repeat_cell(sheet_id: int, row: int, col: int, color: Color) -> Dict[str, Any]:
     return {
         "repeatCell": {
@@ -231,7 +177,7 @@ def main() -> None:
     sheet_id = sheet_props["sheetId"]
     sheet_title = sheet_props["title"]
 
-    snapshot_rows = _fetch_snapshot_rows(snapshot_batch_id, spreadsheet_id, gid)
+    snapshot_rows = load_color_snapshot(snapshot_batch_id, spreadsheet_id, gid)
     if not snapshot_rows:
         raise ValueError(f"No snapshot rows found for batch id '{snapshot_batch_id}'.")
 
@@ -1,14 +1,12 @@
 """
-# * Snapshot background colors for cells listed in an input JSON and store them in Supabase.
+# * Snapshot background colors for cells listed in an input JSON and store them in the
+# * configured snapshot store (Supabase, or local SQLite when SNAPSHOT_STORE=sqlite).
 """
 
 import json
-import os
 import re
 import sys
 import uuid
-import urllib.error
-import urllib.request
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
@@ -24,6 +22,7 @@ from tools.google_sheets import (
     DEFAULT_SPREADSHEET_URL,
     GoogleSheetsFormulaValidator,
 )
+from python_backend.snapshot_store import close_snapshot_store, record_color_snapshot
 
 load_dotenv(PROJECT_ROOT / ".env")
 
@@ -31,14 +30,6 @@ Color = Dict[str, float]
 
 WHITE: Color = {"red": 1.0, "green": 1.0, "blue": 1.0}
 
-# * Environment configuration (must exist; fail fast if missing)
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-if not SUPABASE_URL:
-    raise SystemExit("SUPABASE_URL must be defined in environment or .env file.")
-if not SUPABASE_SERVICE_KEY:
-    raise SystemExit("SUPABASE_SERVICE_KEY must be defined in environment or .env file.")
-
 
 def _parse_args() -> Path:
     if len(sys.argv) != 2:
@@ -188,32 +179,6 @@ def _iter_cells(ranges: Iterable[str]) -> Iterable[str]:
                 yield cell
 
 
-def _post_to_supabase(rows: List[Dict[str, Any]]) -> None:
-    if not rows:
-        raise ValueError("No rows to persist to Supabase.")
-
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots"
-    request = urllib.request.Request(
-        url,
-        method="POST",
-        data=json.dumps(rows).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "resolution=merge-duplicates",
-        },
-    )
-
-    try:
-        with urllib.request.urlopen(request) as response:
-            if response.status not in (200, 201, 204):
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Supabase insert failed: {exc.status} {body}") from exc
-
-
 def main() -> None:
     input_path = _parse_args()
     ranges = _load_cell_ranges(input_path)
@@ -264,7 +229,11 @@ def main() -> None:
                 }
             )
 
-    _post_to_supabase(rows_to_insert)
+    try:
+        record_color_snapshot(rows_to_insert)
+    finally:
+        # * Flush any journaled rows before the process exits
+        close_snapshot_store()
 
     total_cells = len(rows_to_insert)
     total_batches = len(ranges)
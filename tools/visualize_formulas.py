@@ -2,12 +2,8 @@
 # * Color-code cells with formulas or hard-coded numeric values.
 """
 
-import json
-import os
 import re
 import sys
-import urllib.error
-import urllib.request
 import uuid
 from dataclasses import dataclass
 from pathlib import Path
@@ -25,6 +21,7 @@ from tools.google_sheets import (
     DEFAULT_SPREADSHEET_URL,
     GoogleSheetsFormulaValidator,
 )
+from python_backend.snapshot_store import close_snapshot_store, record_color_snapshot
 
 load_dotenv(PROJECT_ROOT / ".env")
 
@@ -34,9 +31,6 @@ Color = Dict[str, float]
 FORMULA_COLOR: Color = {"red": 0.75, "green": 0.92, "blue": 0.75}  # light green
 VALUE_COLOR: Color = {"red": 0.98, "green": 0.8, "blue": 0.5}      # light orange
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-
 
 @dataclass
 class SheetCell:
@@ -167,34 +161,6 @@ def _fetch_target_cells(
     return targets
 
 
-def _post_snapshot_rows(rows: List[Dict[str, Any]]) -> None:
-    if not rows:
-        return
-    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be configured.")
-
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/cell_color_snapshots"
-    request = urllib.request.Request(
-        url,
-        method="POST",
-        data=json.dumps(rows).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Prefer": "resolution=merge-duplicates",
-        },
-    )
-
-    try:
-        with urllib.request.urlopen(request) as response:
-            if response.status not in (200, 201, 204):
-                raise RuntimeError(f"Unexpected Supabase status: {response.status}")
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Supabase insert failed: {exc.status} {body}") from exc
-
-
 def visualize_formulas(sheet_url: Optional[str] = None) -> Dict[str, Any]:
     """# * Color-code formulas and hard-coded values on the target sheet."""
     target_url = (sheet_url or DEFAULT_SPREADSHEET_URL or "").strip()
@@ -235,7 +201,7 @@ def visualize_formulas(sheet_url: Optional[str] = None) -> Dict[str, Any]:
         }
         for cell in targets
     ]
-    _post_snapshot_rows(rows_to_insert)
+    record_color_snapshot(rows_to_insert)
 
     requests: List[Dict[str, Any]] = []
     for cell in targets:
@@ -259,7 +225,11 @@ def visualize_formulas(sheet_url: Optional[str] = None) -> Dict[str, Any]:
 
 def main() -> None:
     """# * Entry point for coloring formula issues."""
-    result = visualize_formulas()
+    try:
+        result = visualize_formulas()
+    finally:
+        # * Flush any journaled rows before the process exits
+        close_snapshot_store()
     print(result["message"])
 
 